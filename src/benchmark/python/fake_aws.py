@@ -0,0 +1,437 @@
+import base64
+import io
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from botocore.awsrequest import AWSResponse
+from botocore.response import StreamingBody
+
+STACKS_PAGE_SIZE = 100
+STACK_EVENTS_PAGE_SIZE = 100
+
+
+def get_timestamp(seconds):
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+class FakeAwsError(Exception):
+    def __init__(self, code, message, status_code=400):
+        super(FakeAwsError, self).__init__(message)
+        self.code = code
+        self.message = message
+        self.status_code = status_code
+
+
+class FakeStackOperation(object):
+    """
+    Timeline of a stack action: the stack starts, its resources progress one after another and the stack
+    completes after the configured duration
+    """
+
+    def __init__(self, stack, action, start, duration):
+        self.stack = stack
+        self.action = action
+        self.start = start
+        self.duration = duration
+        self.resources = sorted(stack.template.get("Resources", {}).items())
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    def get_status(self, now):
+        if now < self.end:
+            return self.action + "_IN_PROGRESS"
+        return self.action + "_COMPLETE"
+
+    def get_events(self, now):
+        """
+        Get all events of this operation that happened until now, oldest first
+        :param now: float
+        :return: list(dict)
+        """
+        step = self.duration / (len(self.resources) + 1)
+        events = [self.create_event(self.start, self.stack.name, "AWS::CloudFormation::Stack", "_IN_PROGRESS")]
+
+        for index, (logical_id, resource) in enumerate(self.resources):
+            resource_type = resource.get("Type", "AWS::CloudFormation::WaitConditionHandle")
+            events.append(self.create_event(self.start + step * (index + 0.5), logical_id, resource_type,
+                                            "_IN_PROGRESS"))
+            events.append(self.create_event(self.start + step * (index + 1), logical_id, resource_type, "_COMPLETE"))
+
+        events.append(self.create_event(self.end, self.stack.name, "AWS::CloudFormation::Stack", "_COMPLETE"))
+        return [event for event in events if event["Timestamp"] <= get_timestamp(now)]
+
+    def create_event(self, timestamp, logical_id, resource_type, status_suffix):
+        return {"StackId": self.stack.stack_id,
+                "StackName": self.stack.name,
+                "EventId": "{0}-{1}-{2}-{3}".format(self.action, logical_id, status_suffix, timestamp),
+                "LogicalResourceId": logical_id,
+                "PhysicalResourceId": logical_id,
+                "ResourceType": resource_type,
+                "ResourceStatus": self.action + status_suffix,
+                "Timestamp": get_timestamp(timestamp)}
+
+
+class FakeStack(object):
+    def __init__(self, name, stack_id):
+        self.name = name
+        self.stack_id = stack_id
+        self.template_body = None
+        self.template = {}
+        self.parameters = []
+        self.tags = []
+        self.role_arn = None
+        self.stack_policy_body = None
+        self.creation_time = None
+        self.operations = []
+
+    def apply(self, template_body, parameters, tags, role_arn=None, stack_policy_body=None):
+        self.template_body = template_body
+        self.template = json.loads(template_body)
+        self.parameters = self.get_effective_parameters(parameters or [])
+        self.tags = tags or []
+        self.role_arn = role_arn or self.role_arn
+        self.stack_policy_body = stack_policy_body or self.stack_policy_body
+
+    def get_effective_parameters(self, parameters):
+        """
+        Add defaults of parameters not given, like CloudFormation does
+        """
+        given_keys = [parameter["ParameterKey"] for parameter in parameters]
+        defaults = [{"ParameterKey": key, "ParameterValue": str(definition["Default"])}
+                    for key, definition in sorted(self.template.get("Parameters", {}).items())
+                    if key not in given_keys and "Default" in definition]
+        return list(parameters) + defaults
+
+    def get_status(self, now):
+        return self.operations[-1].get_status(now)
+
+    def is_deleted(self, now):
+        return self.get_status(now) == "DELETE_COMPLETE"
+
+    def get_outputs(self):
+        return [{"OutputKey": key, "OutputValue": "{0}-{1}".format(self.name, key)}
+                for key in sorted(self.template.get("Outputs", {}))]
+
+    def describe(self, now):
+        status = self.get_status(now)
+        description = {"StackName": self.name,
+                       "StackId": self.stack_id,
+                       "StackStatus": status,
+                       "CreationTime": get_timestamp(self.creation_time),
+                       "Parameters": self.parameters,
+                       "Tags": self.tags}
+
+        if len(self.operations) > 1:
+            description["LastUpdatedTime"] = get_timestamp(self.operations[-1].start)
+        if self.operations[0].end <= now:
+            description["Outputs"] = self.get_outputs()
+        if self.role_arn:
+            description["RoleARN"] = self.role_arn
+        return description
+
+    def get_events(self, now):
+        return list(itertools.chain.from_iterable(operation.get_events(now) for operation in self.operations))
+
+
+class FakeAwsBackend(object):
+    """
+    In-process fake of the CloudFormation, SSM, KMS and S3 apis. It answers requests of real botocore clients
+    from their before-call event, so paginators, resources and response parsing of the tool are exercised
+    without network access. Every call sleeps its configured latency and stack actions follow event timelines
+    of the configured duration.
+    """
+
+    def __init__(self, region="eu-west-1", default_latency=0.0, latencies=None, stack_action_duration=1.0):
+        """
+        :param region: str
+        :param default_latency: float: seconds per api call
+        :param latencies: dict: seconds per operation, e.g. {"cloudformation.DescribeStackEvents": 0.05}
+        :param stack_action_duration: float: seconds a stack create, update or delete takes
+        """
+        self.region = region
+        self.default_latency = default_latency
+        self.latencies = latencies or {}
+        self.stack_action_duration = stack_action_duration
+        self.stacks = {}
+        self.change_sets = {}
+        self.parameters = {}
+        self.objects = {}
+        self.call_counts = Counter()
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self.handlers = {
+            "cloudformation.DescribeStacks": self.describe_stacks,
+            "cloudformation.DescribeStackEvents": self.describe_stack_events,
+            "cloudformation.CreateStack": self.create_stack,
+            "cloudformation.UpdateStack": self.update_stack,
+            "cloudformation.DeleteStack": self.delete_stack,
+            "cloudformation.GetTemplate": self.get_template,
+            "cloudformation.GetStackPolicy": self.get_stack_policy,
+            "cloudformation.ValidateTemplate": self.validate_template,
+            "cloudformation.CreateChangeSet": self.create_change_set,
+            "cloudformation.DescribeChangeSet": self.describe_change_set,
+            "cloudformation.ExecuteChangeSet": self.execute_change_set,
+            "cloudformation.DeleteChangeSet": self.delete_change_set,
+            "ssm.GetParameter": self.get_parameter,
+            "kms.Encrypt": self.encrypt,
+            "kms.Decrypt": self.decrypt,
+            "s3.HeadObject": self.head_object,
+            "s3.PutObject": self.put_object,
+            "s3.GetObject": self.get_object
+        }
+
+    @staticmethod
+    def now():
+        return time.time()
+
+    def install(self, session):
+        """
+        Answer all requests of clients created from a boto3 session, including resources.
+        Other before-call handlers, e.g. timings, run first.
+        :param session: boto3.session.Session
+        """
+        session.events.register("before-parameter-build", self.capture_parameters)
+        session.events.register_last("before-call", self.handle)
+
+    @staticmethod
+    def capture_parameters(params, context, **kwargs):
+        context["fake_aws_params"] = dict(params)
+
+    def handle(self, model, context, **kwargs):
+        params = context.pop("fake_aws_params", {})
+        operation = "{0}.{1}".format(model.service_model.service_name, model.name)
+
+        with self._lock:
+            self.call_counts[operation] += 1
+
+        latency = self.latencies.get(operation, self.default_latency)
+        if latency:
+            time.sleep(latency)
+
+        handler = self.handlers.get(operation)
+        try:
+            if handler is None:
+                raise FakeAwsError("UnsupportedOperation", "{0} is not supported by the fake backend".format(operation))
+            with self._lock:
+                parsed = handler(**params)
+            parsed.setdefault("ResponseMetadata", {"HTTPStatusCode": 200})
+            return AWSResponse(None, 200, {}, None), parsed
+        except FakeAwsError as e:
+            return AWSResponse(None, e.status_code, {}, None), {
+                "Error": {"Code": e.code, "Message": e.message},
+                "ResponseMetadata": {"HTTPStatusCode": e.status_code}}
+
+    def get_api_call_counts(self):
+        with self._lock:
+            return dict(self.call_counts)
+
+    def reset_api_call_counts(self):
+        with self._lock:
+            self.call_counts = Counter()
+
+    def add_parameter(self, name, value):
+        self.parameters[name] = value
+
+    def add_stack(self, name, template_body, parameters=None, tags=None):
+        """
+        Add a stack that has been created before the benchmark started
+        """
+        stack = self._new_stack(name)
+        stack.apply(template_body, parameters, tags)
+        stack.operations.append(FakeStackOperation(stack, "CREATE", self.now() - self.stack_action_duration,
+                                                   self.stack_action_duration))
+        self.stacks[name] = stack
+
+    def _new_stack(self, name):
+        stack = FakeStack(name, "arn:aws:cloudformation:{0}:123456789012:stack/{1}/{2}".format(
+            self.region, name, next(self._ids)))
+        stack.creation_time = self.now()
+        return stack
+
+    def _get_stack(self, stack_name):
+        now = self.now()
+        for stack in self.stacks.values():
+            if stack_name in [stack.name, stack.stack_id] and not stack.is_deleted(now):
+                return stack
+        raise FakeAwsError("ValidationError", "Stack with id {0} does not exist".format(stack_name))
+
+    def _start_operation(self, stack, action):
+        stack.operations.append(FakeStackOperation(stack, action, self.now(), self.stack_action_duration))
+
+    def _get_template_body(self, TemplateBody=None, TemplateURL=None):
+        if TemplateBody is not None:
+            return TemplateBody
+        _, _, bucket_name, key_name = TemplateURL.split("/", 3)
+        return self.objects[(bucket_name.split(".")[0], key_name)].decode("utf-8")
+
+    def describe_stacks(self, StackName=None, NextToken=None):
+        now = self.now()
+
+        if StackName:
+            return {"Stacks": [self._get_stack(StackName).describe(now)]}
+
+        stacks = [stack.describe(now) for name, stack in sorted(self.stacks.items()) if not stack.is_deleted(now)]
+        start = int(NextToken or 0)
+        response = {"Stacks": stacks[start:start + STACKS_PAGE_SIZE]}
+        if start + STACKS_PAGE_SIZE < len(stacks):
+            response["NextToken"] = str(start + STACKS_PAGE_SIZE)
+        return response
+
+    def describe_stack_events(self, StackName, NextToken=None):
+        events = self._get_stack(StackName).get_events(self.now())
+        events.reverse()
+
+        start = int(NextToken or 0)
+        response = {"StackEvents": events[start:start + STACK_EVENTS_PAGE_SIZE]}
+        if start + STACK_EVENTS_PAGE_SIZE < len(events):
+            response["NextToken"] = str(start + STACK_EVENTS_PAGE_SIZE)
+        return response
+
+    def create_stack(self, StackName, Parameters=None, Tags=None, TemplateBody=None, TemplateURL=None,
+                     RoleARN=None, StackPolicyBody=None, **kwargs):
+        if StackName in self.stacks and not self.stacks[StackName].is_deleted(self.now()):
+            raise FakeAwsError("AlreadyExistsException", "Stack [{0}] already exists".format(StackName))
+
+        stack = self._new_stack(StackName)
+        stack.apply(self._get_template_body(TemplateBody, TemplateURL), Parameters, Tags, RoleARN, StackPolicyBody)
+        self._start_operation(stack, "CREATE")
+        self.stacks[StackName] = stack
+        return {"StackId": stack.stack_id}
+
+    def update_stack(self, StackName, Parameters=None, Tags=None, TemplateBody=None, TemplateURL=None,
+                     RoleARN=None, StackPolicyBody=None, **kwargs):
+        stack = self._get_stack(StackName)
+        status = stack.get_status(self.now())
+        if not status.endswith("_COMPLETE"):
+            raise FakeAwsError("ValidationError",
+                               "Stack:{0} is in {1} state and can not be updated.".format(stack.stack_id, status))
+
+        template_body = self._get_template_body(TemplateBody, TemplateURL)
+        if json.loads(template_body) == stack.template and (Tags or []) == stack.tags and \
+                sorted(stack.get_effective_parameters(Parameters or []), key=str) == sorted(stack.parameters, key=str):
+            raise FakeAwsError("ValidationError", "No updates are to be performed.")
+
+        stack.apply(template_body, Parameters, Tags, RoleARN, StackPolicyBody)
+        self._start_operation(stack, "UPDATE")
+        return {"StackId": stack.stack_id}
+
+    def delete_stack(self, StackName, **kwargs):
+        try:
+            self._start_operation(self._get_stack(StackName), "DELETE")
+        except FakeAwsError:
+            pass
+        return {}
+
+    def get_template(self, StackName, **kwargs):
+        return {"TemplateBody": self._get_stack(StackName).template_body}
+
+    def get_stack_policy(self, StackName):
+        stack = self._get_stack(StackName)
+        return {"StackPolicyBody": stack.stack_policy_body} if stack.stack_policy_body else {}
+
+    @staticmethod
+    def validate_template(TemplateBody=None, TemplateURL=None):
+        return {"Parameters": []}
+
+    def create_change_set(self, StackName, ChangeSetName, ChangeSetType="UPDATE", Parameters=None, Tags=None,
+                          TemplateBody=None, TemplateURL=None, RoleARN=None, **kwargs):
+        change_set_id = "arn:aws:cloudformation:{0}:123456789012:changeSet/{1}/{2}".format(
+            self.region, ChangeSetName, next(self._ids))
+        template_body = self._get_template_body(TemplateBody, TemplateURL)
+        resources = sorted(json.loads(template_body).get("Resources", {}).items())
+
+        self.change_sets[change_set_id] = {
+            "ChangeSetId": change_set_id,
+            "ChangeSetName": ChangeSetName,
+            "StackName": StackName,
+            "Type": ChangeSetType,
+            "Status": "CREATE_COMPLETE",
+            "ExecutionStatus": "AVAILABLE",
+            "Arguments": (template_body, Parameters, Tags, RoleARN),
+            "Changes": [{"Type": "Resource",
+                         "ResourceChange": {"Action": "Add" if ChangeSetType == "CREATE" else "Modify",
+                                            "LogicalResourceId": logical_id,
+                                            "ResourceType": resource.get("Type", "")}}
+                        for logical_id, resource in resources]}
+        return {"Id": change_set_id, "StackId": StackName}
+
+    def _get_change_set(self, ChangeSetName):
+        if ChangeSetName not in self.change_sets:
+            raise FakeAwsError("ChangeSetNotFound", "ChangeSet [{0}] does not exist".format(ChangeSetName))
+        return self.change_sets[ChangeSetName]
+
+    def describe_change_set(self, ChangeSetName, **kwargs):
+        change_set = self._get_change_set(ChangeSetName)
+        return {key: value for key, value in change_set.items() if key != "Arguments"}
+
+    def execute_change_set(self, ChangeSetName, **kwargs):
+        change_set = self._get_change_set(ChangeSetName)
+        template_body, parameters, tags, role_arn = change_set["Arguments"]
+
+        if change_set["Type"] == "CREATE":
+            stack = self._new_stack(change_set["StackName"])
+            self.stacks[stack.name] = stack
+        else:
+            stack = self._get_stack(change_set["StackName"])
+
+        stack.apply(template_body, parameters, tags, role_arn)
+        self._start_operation(stack, change_set["Type"])
+        change_set["ExecutionStatus"] = "EXECUTE_COMPLETE"
+        return {}
+
+    def delete_change_set(self, ChangeSetName, **kwargs):
+        self._get_change_set(ChangeSetName)
+        del self.change_sets[ChangeSetName]
+        return {}
+
+    def get_parameter(self, Name, WithDecryption=False):
+        if Name not in self.parameters:
+            raise FakeAwsError("ParameterNotFound", "Parameter {0} not found".format(Name))
+        return {"Parameter": {"Name": Name, "Type": "SecureString", "Value": self.parameters[Name]}}
+
+    @staticmethod
+    def encrypt(KeyId, Plaintext, **kwargs):
+        if not isinstance(Plaintext, bytes):
+            Plaintext = Plaintext.encode("utf-8")
+        return {"KeyId": KeyId, "CiphertextBlob": b"fake:" + base64.b64encode(Plaintext)}
+
+    @staticmethod
+    def decrypt(CiphertextBlob, **kwargs):
+        if not CiphertextBlob.startswith(b"fake:"):
+            raise FakeAwsError("InvalidCiphertextException", "Ciphertext was not encrypted by the fake backend")
+        return {"Plaintext": base64.b64decode(CiphertextBlob[len(b"fake:"):])}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        if (Bucket, Key) not in self.objects:
+            raise FakeAwsError("404", "Not Found", status_code=404)
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        if not isinstance(Body, bytes):
+            Body = Body.encode("utf-8")
+        self.objects[(Bucket, Key)] = Body
+        return {"ETag": '"{0}"'.format(len(Body))}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if (Bucket, Key) not in self.objects:
+            raise FakeAwsError("NoSuchKey", "The specified key does not exist.", status_code=404)
+        body = self.objects[(Bucket, Key)]
+        return {"Body": StreamingBody(io.BytesIO(body), len(body)), "ContentLength": len(body)}
+
+
+def encrypt(plaintext):
+    """
+    Encrypt a value the way the fake KMS does, base64 encoded like values of |kms| references
+    :param plaintext: str
+    :return: str
+    """
+    ciphertext_blob = FakeAwsBackend.encrypt("benchmark", plaintext)["CiphertextBlob"]
+    return base64.b64encode(ciphertext_blob).decode("utf-8")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the stack dependency graph on synthetic stack configurations.
+
+Every case generates stacks in dependency levels, each stack referencing a few stacks of earlier levels, and times
+building the graph, ordering it, grouping it into levels, finding its critical path and, after adding cycles,
+finding all cycles. If networkx is installed, ordering is also timed with it for comparison.
+
+    python src/benchmark/python/graph_benchmarks.py --stacks 1000,10000 --depth 20 --references 3
+"""
+import json
+import random
+import sys
+import time
+from os.path import dirname, join, realpath
+from types import SimpleNamespace
+
+import click
+
+sys.path.insert(0, join(dirname(dirname(dirname(realpath(__file__)))), "main", "python"))
+
+# needs the source tree on sys.path
+from cfn_sphere.stack_configuration.dependency_resolver import DependencyResolver  # noqa: E402
+
+
+def get_stack_name(index):
+    return "stack-{0:05d}".format(index)
+
+
+def generate_stacks(stack_count, depth, references, cycles=0, seed=0):
+    """
+    Generate stacks as the dependency resolver sees them: names with parameters referencing upstream outputs
+    :param stack_count: int
+    :param depth: int: dependency levels
+    :param references: int: upstream references per stack
+    :param cycles: int: cycles added by referencing downstream stacks
+    :param seed: int
+    :return: dict(str, SimpleNamespace)
+    """
+    generator = random.Random(seed)
+    depth = max(1, min(depth, stack_count))
+    level_by_index = [index * depth // stack_count for index in range(stack_count)]
+    first_index_by_level = {}
+    for index, level in enumerate(level_by_index):
+        first_index_by_level.setdefault(level, index)
+
+    stacks = {}
+    for index in range(stack_count):
+        upstream_count = first_index_by_level[level_by_index[index]]
+        parameters = {"Name": get_stack_name(index)}
+        for reference in range(min(references, upstream_count)):
+            upstream = generator.randrange(upstream_count)
+            parameters["Upstream{0}".format(reference)] = "|ref|{0}.Id".format(get_stack_name(upstream))
+        stacks[get_stack_name(index)] = SimpleNamespace(parameters=parameters)
+
+    for cycle in range(cycles):
+        # the upstream stack of a reference points back to its downstream stack
+        downstream = stack_count - 1 - cycle
+        upstream = stacks[get_stack_name(downstream)].parameters.get("Upstream0")
+        if upstream:
+            upstream_name = DependencyResolver.parse_stack_reference_value(upstream)[0]
+            stacks[upstream_name].parameters["Cycle"] = "|ref|{0}.Id".format(get_stack_name(downstream))
+
+    return stacks
+
+
+def measure(function, repeat):
+    """
+    :return: (float, object): best seconds of all runs and the result of the last run
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return round(best, 4), result
+
+
+def sort_with_networkx(stacks):
+    import networkx
+
+    graph = networkx.DiGraph()
+    graph.add_nodes_from(stacks)
+    stack_graph = DependencyResolver.create_stacks_directed_graph(stacks)
+    for node in stack_graph.nodes:
+        for successor in stack_graph.successors(node):
+            graph.add_edge(node, successor)
+    return list(networkx.topological_sort(graph))
+
+
+def run_case(stack_count, depth, references, cycles, repeat):
+    stacks = generate_stacks(stack_count, depth, references)
+    cyclic_stacks = generate_stacks(stack_count, depth, references, cycles)
+
+    result = {"stacks": stack_count, "depth": depth, "references": references, "seconds": {}}
+    result["seconds"]["build"], graph = measure(lambda: DependencyResolver.create_stacks_directed_graph(stacks),
+                                                repeat)
+    result["seconds"]["order"], _ = measure(lambda: DependencyResolver.get_stack_order(stacks), repeat)
+    result["seconds"]["levels"], levels = measure(lambda: DependencyResolver.get_stack_levels(stacks), repeat)
+    result["seconds"]["critical_path"], (path, _) = measure(lambda: DependencyResolver.get_critical_path(stacks),
+                                                            repeat)
+    result["seconds"]["cycle_report"], found_cycles = measure(
+        lambda: DependencyResolver.create_stacks_directed_graph(cyclic_stacks).get_cycles(), repeat)
+    result["cycles"] = len(found_cycles)
+
+    try:
+        result["seconds"]["networkx_order"], _ = measure(lambda: sort_with_networkx(stacks), repeat)
+    except ImportError:
+        result["seconds"]["networkx_order"] = None
+
+    result["edges"] = sum(len(graph.successors(node)) for node in graph.nodes)
+    result["levels"] = len(levels)
+    result["critical_path"] = len(path)
+    return result
+
+
+def get_results_table(results):
+    from prettytable import PrettyTable
+
+    table = PrettyTable(["Stacks", "Edges", "Levels", "Critical path", "Cycles", "Build s", "Order s", "Levels s",
+                         "Critical path s", "Cycle report s", "networkx order s"])
+    for result in results:
+        seconds = result["seconds"]
+        table.add_row([result["stacks"], result["edges"], result["levels"], result["critical_path"],
+                       result["cycles"], seconds["build"], seconds["order"], seconds["levels"],
+                       seconds["critical_path"], seconds["cycle_report"],
+                       "n/a" if seconds["networkx_order"] is None else seconds["networkx_order"]])
+    return table.get_string()
+
+
+@click.command(help="Benchmark the stack dependency graph on generated stack configurations")
+@click.option('--stacks', default="1000,10000", help="Comma separated stack counts, one case each")
+@click.option('--depth', default=20, type=click.INT, help="Dependency levels of generated stacks")
+@click.option('--references', default=3, type=click.INT, help="Upstream references per generated stack")
+@click.option('--cycles', default=10, type=click.INT, help="Cycles added for the cycle report case")
+@click.option('--repeat', default=5, type=click.INT, help="Runs per measurement, the best run is reported")
+@click.option('--json-out', default=None, type=click.Path(dir_okay=False), help="Write results to a json file")
+def main(stacks, depth, references, cycles, repeat, json_out):
+    results = []
+    for stack_count in [int(count) for count in stacks.split(",")]:
+        click.echo("Running {0} stacks with depth {1}".format(stack_count, depth), err=True)
+        results.append(run_case(stack_count, depth, references, cycles, repeat))
+
+    click.echo(get_results_table(results))
+
+    if json_out:
+        with open(json_out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
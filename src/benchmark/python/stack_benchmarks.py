@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmarks of StackActionHandler against the in-process fake AWS backend.
+
+Every case generates a stack configuration, syncs it into an empty fake account and syncs it again without
+changes. Cases run in their own process, so caches and peak memory of one case don't affect the next one.
+
+    python src/benchmark/python/stack_benchmarks.py --stacks 10,100,500 --depth 5
+"""
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from os.path import dirname, join, realpath
+from unittest.mock import patch
+
+import click
+import yaml
+
+sys.path.insert(0, join(dirname(dirname(dirname(realpath(__file__)))), "main", "python"))
+
+# needs the source tree on sys.path
+from fake_aws import FakeAwsBackend, encrypt  # noqa: E402
+
+REGION = "eu-west-1"
+SSM_PARAMETER_COUNT = 10
+
+
+def get_stack_name(index):
+    return "stack-{0:04d}".format(index)
+
+
+def get_stack_levels(stack_count, depth):
+    """
+    Split stacks into dependency levels of equal size, stacks of a level depend on stacks of the previous level
+    :param stack_count: int
+    :param depth: int
+    :return: list(list(int))
+    """
+    depth = max(1, min(depth, stack_count))
+    levels = [[] for _ in range(depth)]
+    for index in range(stack_count):
+        levels[index * depth // stack_count].append(index)
+    return levels
+
+
+def create_template(resource_count):
+    return {"AWSTemplateFormatVersion": "2010-09-09",
+            "Parameters": {"Upstream": {"Type": "String", "Default": "none"},
+                           "Secret": {"Type": "String", "NoEcho": False},
+                           "Setting": {"Type": "String"},
+                           "Name": {"Type": "String"}},
+            "Resources": {"Handle{0}".format(index): {"Type": "AWS::CloudFormation::WaitConditionHandle"}
+                          for index in range(resource_count)},
+            "Outputs": {"Id": {"Value": {"Ref": "Handle0"}}}}
+
+
+def generate_stacks_config(directory, stack_count, depth, resource_count):
+    """
+    Write templates and a stack configuration referencing upstream stack outputs, ssm and kms values
+    :return: str: config file path
+    """
+    os.makedirs(join(directory, "templates"))
+    stacks = {}
+
+    levels = get_stack_levels(stack_count, depth)
+    for level, indexes in enumerate(levels):
+        for position, index in enumerate(indexes):
+            stack_name = get_stack_name(index)
+            template_url = "templates/{0}.json".format(stack_name)
+            with open(join(directory, template_url), "w") as f:
+                json.dump(create_template(resource_count), f, indent=2)
+
+            parameters = {"Secret": "|kms|{0}".format(encrypt("secret-{0}".format(index))),
+                          "Setting": "|ssm|/benchmark/parameter-{0}".format(index % SSM_PARAMETER_COUNT),
+                          "Name": stack_name}
+            if level > 0:
+                upstream = levels[level - 1][position % len(levels[level - 1])]
+                parameters["Upstream"] = "|ref|{0}.Id".format(get_stack_name(upstream))
+
+            stacks[stack_name] = {"template-url": template_url,
+                                  "parameters": parameters,
+                                  "tags": {"benchmark": "true"}}
+
+    config_file = join(directory, "stacks.yml")
+    with open(config_file, "w") as f:
+        yaml.safe_dump({"region": REGION, "stacks": stacks}, f, default_flow_style=False)
+    return config_file
+
+
+def get_peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return round(peak / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0), 1)
+
+
+def run_case(stack_count, depth, resource_count, latency, stack_action_duration, poll_interval, log_level):
+    """
+    Sync a generated configuration twice, into an empty account and without changes
+    :return: dict: wall time and api calls per phase, peak memory of the process
+    """
+    logging.getLogger("cfn_sphere").setLevel(log_level)
+
+    import boto3
+    from cfn_sphere import StackActionHandler
+    from cfn_sphere.aws import cfn
+    from cfn_sphere.aws.client_factory import CLIENT_FACTORY
+    from cfn_sphere.stack_configuration import Config
+
+    directory = tempfile.mkdtemp()
+    backend = FakeAwsBackend(REGION, default_latency=latency, stack_action_duration=stack_action_duration)
+    for index in range(SSM_PARAMETER_COUNT):
+        backend.add_parameter("/benchmark/parameter-{0}".format(index), "value-{0}".format(index))
+
+    session = boto3.session.Session(aws_access_key_id="benchmark", aws_secret_access_key="benchmark",
+                                    region_name=REGION)
+    backend.install(session)
+    # clients of the default profile are created from boto3's default session
+    boto3.DEFAULT_SESSION = session
+    CLIENT_FACTORY.clear()
+
+    result = {"stacks": stack_count, "depth": depth, "phases": {}}
+    try:
+        config_file = generate_stacks_config(directory, stack_count, depth, resource_count)
+
+        with patch.object(cfn, "STACK_EVENT_POLL_INTERVAL", poll_interval), \
+                patch.object(cfn, "CHANGE_SET_POLL_INTERVAL", poll_interval), \
+                patch.object(cfn, "get_cfn_api_server_time", lambda: datetime.now(timezone.utc)):
+            for phase in ["create", "unchanged"]:
+                backend.reset_api_call_counts()
+                start = time.perf_counter()
+
+                config = Config(config_file=config_file)
+                StackActionHandler(config).create_or_update_stacks()
+
+                api_calls = backend.get_api_call_counts()
+                result["phases"][phase] = {"seconds": round(time.perf_counter() - start, 3),
+                                           "api_calls": sum(api_calls.values()),
+                                           "api_calls_by_operation": api_calls}
+    finally:
+        shutil.rmtree(directory)
+
+    result["peak_memory_mb"] = get_peak_memory_mb()
+    return result
+
+
+def run_case_in_process(*args):
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_case, args)
+
+
+def get_results_table(results):
+    from prettytable import PrettyTable
+
+    table = PrettyTable(["Stacks", "Depth", "Phase", "Seconds", "API calls", "Top operations", "Peak MB"])
+    table.align["Top operations"] = "l"
+    for result in results:
+        for phase, values in result["phases"].items():
+            top_operations = sorted(values["api_calls_by_operation"].items(), key=lambda item: -item[1])[:3]
+            table.add_row([result["stacks"], result["depth"], phase, values["seconds"], values["api_calls"],
+                           ", ".join("{0}={1}".format(*operation) for operation in top_operations),
+                           result["peak_memory_mb"]])
+    return table.get_string()
+
+
+@click.command(help="Benchmark syncs of generated stack configurations against a fake AWS backend")
+@click.option('--stacks', default="10,100,500", help="Comma separated stack counts, one case each")
+@click.option('--depth', default=5, type=click.INT, help="Dependency levels of generated stacks")
+@click.option('--resources', default=5, type=click.INT, help="Resources per generated template")
+@click.option('--latency', default=0.005, type=click.FLOAT, help="Seconds each fake api call takes")
+@click.option('--stack-action-duration', default=0.05, type=click.FLOAT,
+              help="Seconds each fake stack create or update takes")
+@click.option('--poll-interval', default=0.01, type=click.FLOAT, help="Seconds between stack event polls")
+@click.option('--json-out', default=None, type=click.Path(dir_okay=False), help="Write results to a json file")
+@click.option('--debug', '-d', is_flag=True, default=False, help="Log the tools output")
+def main(stacks, depth, resources, latency, stack_action_duration, poll_interval, json_out, debug):
+    results = []
+    for stack_count in [int(count) for count in stacks.split(",")]:
+        click.echo("Running {0} stacks with depth {1}".format(stack_count, depth), err=True)
+        results.append(run_case_in_process(stack_count, depth, resources, latency, stack_action_duration,
+                                           poll_interval, logging.INFO if debug else logging.ERROR))
+
+    click.echo(get_results_table(results))
+
+    if json_out:
+        with open(json_out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
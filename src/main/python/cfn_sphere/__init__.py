@@ -1,44 +1,192 @@
 # Modifications copyright (C) 2017 KCOM
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
 from cfn_sphere.template.template_handler import TemplateHandler
 from cfn_sphere.template.transformer import CloudFormationTemplateTransformer
 from cfn_sphere.stack_configuration.dependency_resolver import DependencyResolver
 from cfn_sphere.stack_configuration.parameter_resolver import ParameterResolver
 from cfn_sphere.exceptions import CfnStackActionFailedException
 from cfn_sphere.aws.cfn import CloudFormation
+from cfn_sphere.aws.api_statistics import API_STATISTICS
+from cfn_sphere.aws.rate_limiter import RATE_LIMITER
 from cfn_sphere.file_loader import FileLoader
+from cfn_sphere.sync_state import get_stack_input_hash
 from cfn_sphere.aws.cfn import CloudFormationStack
+from cfn_sphere.aws.stack_event_watcher import StackEventWatcher
+from cfn_sphere.timings import TIMINGS
 from cfn_sphere.util import get_logger
 
 __version__ = '${version}'
 
 
+DEFAULT_CHANGE_SET_TIMEOUT = 600
+
+
 class StackActionHandler(object):
-    def __init__(self, config, dry_run=False):
+    MAX_CONCURRENT_TEMPLATES = 4
+    MAX_CONCURRENT_STACKS = 4
+
+    def __init__(self, config, dry_run=False, cfn=None, sync_state=None):
+        """
+        :param config: Config
+        :param dry_run: bool
+        :param cfn: CloudFormation: shared api wrapper with its cached stack descriptions, None to create one
+        :param sync_state: SyncState: deploy only stacks whose inputs changed since the recorded sync and their
+                           dependents, None to deploy all stacks
+        """
         self.logger = get_logger(root=True)
         self.config = config
-        self.cfn = CloudFormation(region=self.config.region, dry_run=dry_run)
-        self.parameter_resolver = ParameterResolver(self.cfn, region=self.config.region)
+        self.dry_run = dry_run
+        self.sync_state = sync_state
+        self.cfn = cfn or CloudFormation(region=self.config.region, dry_run=dry_run, profile=self.config.profile)
+        self.parameter_resolver = ParameterResolver(self.cfn, region=self.config.region, profile=self.config.profile)
         self.cli_parameters = config.cli_params
+        RATE_LIMITER.configure(config.api_rate_limits)
+        API_STATISTICS.configure(max_calls=config.max_api_calls)
 
     def execute_change_set(self):
-        print('executing change set')
-        print(self.config.change_set)
-
-        change_set = self.cfn.get_change_set(self.config.change_set)
-        
-        if change_set is None:
-            raise CfnStackActionFailedException("Could not execute change set {0}: Does not exist or is in an invalid state.".format(
-                self.config.change_set))
-
-        stack_name = self.cfn.get_stack_name_by_arn(change_set['StackId'])
-        stack = self.cfn.get_stack(stack_name)
-
-        if not self.cfn.change_set_is_executable(change_set):
-            raise CfnStackActionFailedException("Could not execute change set {0}: Does not exist or is in an invalid state.".format(
-                self.config.change_set))
-        else:
-            self.cfn.execute_change_set(stack, self.config.change_set)
-    
+        self.execute_change_sets([self.config.change_set])
+
+    def describe_change_sets(self, change_set_ids):
+        """
+        Describe change sets concurrently and resolve their stacks from one stack listing
+        :param change_set_ids: list(str)
+        :return: dict(str, (str, str)): change set arn and stack action by stack name, in given order
+        :raise CfnStackActionFailedException: listing all change sets which don't exist, aren't executable or
+                                              change a stack changed by another change set
+        """
+        with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_STACKS) as executor:
+            change_sets = list(executor.map(TIMINGS.bind(self.cfn.get_change_set), change_set_ids))
+
+        invalid_change_sets = [change_set_id for change_set_id, change_set in zip(change_set_ids, change_sets)
+                               if not self.cfn.change_set_is_executable(change_set)]
+        if invalid_change_sets:
+            raise CfnStackActionFailedException(
+                "Could not execute change sets, they do not exist or are in an invalid state: {0}".format(
+                    ", ".join(invalid_change_sets)))
+
+        stack_descriptions = {stack["StackId"]: stack for stack in self.cfn.get_stack_descriptions()}
+        stacks = {}
+        for change_set_id, change_set in zip(change_set_ids, change_sets):
+            stack_description = stack_descriptions.get(change_set["StackId"], {})
+            stack_name = stack_description.get("StackName", change_set.get("StackName"))
+            if stack_name in stacks:
+                raise CfnStackActionFailedException("Change sets {0} and {1} both change stack {2}".format(
+                    stacks[stack_name][0], change_set_id, stack_name))
+
+            # stacks created by a change set wait for its execution in REVIEW_IN_PROGRESS
+            action = "create" if stack_description.get("StackStatus") == "REVIEW_IN_PROGRESS" else "update"
+            stacks[stack_name] = (change_set_id, action)
+        return stacks
+
+    def execute_change_sets(self, change_set_ids, timeout=DEFAULT_CHANGE_SET_TIMEOUT):
+        """
+        Execute change sets, a change set of a stack starts once the change sets of the config's stacks it references
+        are executed. Independent change sets are executed concurrently and their stack events are watched from one
+        thread. After a failure no further change sets are executed, running executions are awaited.
+        :param change_set_ids: list(str): change set arns
+        :param timeout: int: seconds the execution of a change set may take, unless its stack configures a timeout
+        :raise CfnStackActionFailedException:
+        """
+        stacks = self.describe_change_sets(change_set_ids)
+        stack_order = DependencyResolver.get_stack_order(self.config.stacks)
+        graph = DependencyResolver.create_stacks_directed_graph(self.config.stacks)
+        upstream_stacks = {stack_name: set(graph.predecessors(stack_name)).intersection(stacks)
+                           if stack_name in graph else set() for stack_name in stacks}
+
+        pending_stacks = sorted(stacks, key=lambda stack_name: stack_order.index(stack_name)
+                                if stack_name in stack_order else -1)
+        self.logger.info("Will execute change sets of stacks: {0}".format(", ".join(pending_stacks)))
+
+        executed_stacks = set()
+        running = {}
+        failures = []
+        watcher = StackEventWatcher(self.cfn)
+        try:
+            while running or (pending_stacks and not failures):
+                for stack_name in [stack_name for stack_name in pending_stacks if not failures
+                                   and upstream_stacks[stack_name].issubset(executed_stacks)]:
+                    pending_stacks.remove(stack_name)
+                    change_set_id, action = stacks[stack_name]
+                    stack_config = self.config.stacks.get(stack_name)
+                    try:
+                        self.cfn.start_change_set_execution(change_set_id)
+                    except CfnStackActionFailedException as e:
+                        self.logger.error(e)
+                        failures.append(stack_name)
+                        continue
+
+                    future = watcher.watch(stack_name, action, stack_config.timeout if stack_config else timeout)
+                    running[future] = stack_name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stack_name = running.pop(future)
+                    try:
+                        future.result()
+                        self.cfn.log_completed_stack_action(stack_name, stacks[stack_name][1])
+                    except Exception as e:
+                        self.logger.error("Executing change set of {0} failed: {1}".format(stack_name, e))
+                        failures.append(stack_name)
+                        continue
+                    executed_stacks.add(stack_name)
+        finally:
+            watcher.stop()
+
+        self.log_throttling_statistics()
+
+        if failures:
+            raise CfnStackActionFailedException("Executing change sets failed for {0} of {1} stacks: {2}".format(
+                len(failures), len(stacks), ", ".join(failures)))
+
+    @contextmanager
+    def prepare_stacks(self, stack_names):
+        """
+        Load, transform and package the templates and load the stack policies of all given stacks concurrently,
+        so this work overlaps with waiting for CloudFormation. Work not started yet is cancelled on exit.
+        :param stack_names: list(str)
+        :return: dict(str, Future((CloudFormationTemplate, dict))) by stack name
+        """
+        additional_stack_description = TemplateHandler.get_additional_stack_description(self.config.working_dir)
+        executor = ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_TEMPLATES)
+        prepared_stacks = {}
+
+        try:
+            for stack_name in stack_names:
+                prepared_stacks[stack_name] = executor.submit(TIMINGS.bind(self.prepare_stack), stack_name,
+                                                              self.config.stacks.get(stack_name),
+                                                              additional_stack_description)
+            yield prepared_stacks
+        finally:
+            for prepared_stack in prepared_stacks.values():
+                prepared_stack.cancel()
+            executor.shutdown(wait=True)
+
+    def prepare_stack(self, stack_name, stack_config, additional_stack_description):
+        """
+        Get the template and stack policy of a stack
+        :param stack_name: str
+        :param stack_config: cfn_sphere.stack_configuration.StackConfig
+        :param additional_stack_description: str
+        :return: (CloudFormationTemplate, dict)
+        """
+        with TIMINGS.span(stack_name, "prepare", stack=stack_name):
+            if stack_config.stack_policy_url:
+                self.logger.info("Using stack policy from {0}".format(stack_config.stack_policy_url))
+                stack_policy = FileLoader.get_yaml_or_json_file(stack_config.stack_policy_url,
+                                                                stack_config.working_dir)
+            else:
+                stack_policy = None
+
+            template = TemplateHandler.get_template(stack_config.template_url, stack_config.working_dir,
+                                                    self.config.region, stack_config.package_bucket,
+                                                    additional_stack_description, self.config.profile)
+            return template, stack_policy
+
     def create_change_set(self):
         existing_stacks = self.cfn.get_stack_names()
         desired_stacks = self.config.stacks
@@ -48,73 +196,196 @@ class StackActionHandler(object):
             self.logger.info(
                 "Will process stacks in the following order: {0}".format(", ".join(stack_processing_order)))
 
-        for stack_name in stack_processing_order:
-            stack_config = self.config.stacks.get(stack_name)
+        with self.prepare_stacks(stack_processing_order) as prepared_stacks:
+            for stack_name in stack_processing_order:
+                with TIMINGS.span(stack_name, "stack", stack=stack_name):
+                    stack = self.get_cloudformation_stack(stack_name, *prepared_stacks[stack_name].result())
 
-            if stack_config.stack_policy_url:
-                self.logger.info("Using stack policy from {0}".format(stack_config.stack_policy_url))
-                stack_policy = FileLoader.get_yaml_or_json_file(stack_config.stack_policy_url, stack_config.working_dir)
-            else:
-                stack_policy = None
+                    if stack_name in existing_stacks:
+                        self.cfn.create_change_set(stack, 'UPDATE')
+                    else:
+                        self.cfn.create_change_set(stack, 'CREATE')
 
-            template = TemplateHandler.get_template(stack_config.template_url, stack_config.working_dir,
-                                                    self.config.region, stack_config.package_bucket)
-            parameters = self.parameter_resolver.resolve_parameter_values(stack_name, stack_config, self.cli_parameters)
-
-            stack = CloudFormationStack(template=template,
-                                        parameters=parameters,
-                                        tags=stack_config.tags,
-                                        name=stack_name,
-                                        region=self.config.region,
-                                        timeout=stack_config.timeout,
-                                        service_role=stack_config.service_role,
-                                        stack_policy=stack_policy,
-                                        failure_action=stack_config.failure_action)
+        self.log_throttling_statistics()
 
-            if stack_name in existing_stacks:
-                self.cfn.create_change_set(stack, 'UPDATE')
-            else:
-                self.cfn.create_change_set(stack, 'CREATE')
-                        
+    def get_cloudformation_stack(self, stack_name, template, stack_policy):
+        """
+        :param stack_name: str
+        :param template: CloudFormationTemplate
+        :param stack_policy: dict
+        :return: CloudFormationStack
+        """
+        stack_config = self.config.stacks.get(stack_name)
+
+        # parameters may reference outputs of upstream stacks, so they are resolved just in time
+        parameters = self.parameter_resolver.resolve_parameter_values(stack_name, stack_config, self.cli_parameters)
+
+        return CloudFormationStack(template=template,
+                                   parameters=parameters,
+                                   tags=stack_config.tags,
+                                   name=stack_name,
+                                   region=self.config.region,
+                                   timeout=stack_config.timeout,
+                                   service_role=stack_config.service_role,
+                                   stack_policy=stack_policy,
+                                   failure_action=stack_config.failure_action,
+                                   template_bucket=stack_config.template_bucket)
+
+    def get_changed_stacks(self, stack_names, existing_stacks):
+        """
+        Get the stacks an incremental sync deploys: stacks whose inputs changed since their last recorded
+        deployment or which don't exist, and all stacks depending on them
+        :param stack_names: list(str): stacks in processing order
+        :param existing_stacks: list(str)
+        :return: (list(str), dict(str, str)): changed stacks in processing order, input hashes by stack name
+        """
+        input_hashes = {}
+        changed_stacks = []
+
+        for stack_name in stack_names:
+            input_hashes[stack_name] = get_stack_input_hash(self.config.stacks.get(stack_name),
+                                                            self.cli_parameters.get(stack_name))
+            recorded_hash = self.sync_state.get_input_hash(self.config.target_name, stack_name)
+            if stack_name not in existing_stacks or input_hashes[stack_name] != recorded_hash:
+                changed_stacks.append(stack_name)
+
+        stacks_to_deploy = DependencyResolver.get_dependent_stacks(self.config.stacks, changed_stacks)
+        skipped_stacks = [stack_name for stack_name in stack_names if stack_name not in stacks_to_deploy]
+        if skipped_stacks:
+            self.logger.info("Skipping {0} unchanged stacks: {1}".format(len(skipped_stacks),
+                                                                         ", ".join(skipped_stacks)))
+
+        return [stack_name for stack_name in stack_names if stack_name in stacks_to_deploy], input_hashes
 
     def create_or_update_stacks(self):
         existing_stacks = self.cfn.get_stack_names()
         desired_stacks = self.config.stacks
         stack_processing_order = DependencyResolver().get_stack_order(desired_stacks)
+        input_hashes = {}
+
+        if self.sync_state:
+            stack_processing_order, input_hashes = self.get_changed_stacks(stack_processing_order, existing_stacks)
 
         if len(stack_processing_order) > 1:
             self.logger.info(
                 "Will process stacks in the following order: {0}".format(", ".join(stack_processing_order)))
 
-        for stack_name in stack_processing_order:
-            stack_config = self.config.stacks.get(stack_name)
+        with self.prepare_stacks(stack_processing_order) as prepared_stacks:
+            for stack_name in stack_processing_order:
+                with TIMINGS.span(stack_name, "stack", stack=stack_name):
+                    stack = self.get_cloudformation_stack(stack_name, *prepared_stacks[stack_name].result())
 
-            if stack_config.stack_policy_url:
-                self.logger.info("Using stack policy from {0}".format(stack_config.stack_policy_url))
-                stack_policy = FileLoader.get_yaml_or_json_file(stack_config.stack_policy_url, stack_config.working_dir)
-            else:
-                stack_policy = None
+                    if stack_name in existing_stacks:
 
-            template = TemplateHandler.get_template(stack_config.template_url, stack_config.working_dir,
-                                                    self.config.region, stack_config.package_bucket)
-            parameters = self.parameter_resolver.resolve_parameter_values(stack_name, stack_config, self.cli_parameters)
-
-            stack = CloudFormationStack(template=template,
-                                        parameters=parameters,
-                                        tags=stack_config.tags,
-                                        name=stack_name,
-                                        region=self.config.region,
-                                        timeout=stack_config.timeout,
-                                        service_role=stack_config.service_role,
-                                        stack_policy=stack_policy,
-                                        failure_action=stack_config.failure_action)
+                        self.cfn.validate_stack_is_ready_for_action(stack)
+                        self.cfn.update_stack(stack)
+                    else:
+                        self.cfn.create_stack(stack)
 
-            if stack_name in existing_stacks:
+                    if self.sync_state and not self.dry_run:
+                        self.sync_state.record(self.config.target_name, stack_name, input_hashes[stack_name])
+
+        self.log_throttling_statistics()
+
+    def sync_via_change_sets(self):
+        """
+        Deploy stacks through change sets. A stack's change set is created once all its upstream stacks are
+        deployed, so its parameters see their outputs, and executed as soon as it is described. Change sets of
+        independent stacks are created, described and executed concurrently, change sets without changes are deleted
+        instead of executed. After a failure no further change sets are created, running executions are awaited.
+        """
+        if self.dry_run:
+            self.logger.info("Dry run, checking stacks without creating change sets")
+            self.create_or_update_stacks()
+            return
+
+        existing_stacks = self.cfn.get_stack_names()
+        stack_processing_order = DependencyResolver().get_stack_order(self.config.stacks)
+        input_hashes = {}
+
+        if self.sync_state:
+            stack_processing_order, input_hashes = self.get_changed_stacks(stack_processing_order, existing_stacks)
 
+        graph = DependencyResolver.create_stacks_directed_graph(self.config.stacks)
+        upstream_stacks = {stack_name: set(graph.predecessors(stack_name)).intersection(stack_processing_order)
+                           for stack_name in stack_processing_order}
+
+        pending_stacks = list(stack_processing_order)
+        deployed_stacks = set()
+        running = {}
+        failures = []
+
+        with self.prepare_stacks(stack_processing_order) as prepared_stacks, \
+                ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_STACKS) as executor:
+            while running or (pending_stacks and not failures):
+                for stack_name in [stack_name for stack_name in pending_stacks if not failures
+                                   and upstream_stacks[stack_name].issubset(deployed_stacks)]:
+                    pending_stacks.remove(stack_name)
+                    future = executor.submit(TIMINGS.bind(self.create_stack_change_set), stack_name,
+                                             prepared_stacks[stack_name], stack_name in existing_stacks)
+                    running[future] = (stack_name, "create")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stack_name, phase = running.pop(future)
+                    try:
+                        change_set = future.result()
+                    except Exception as e:
+                        self.logger.error("Sync of {0} failed: {1}".format(stack_name, e))
+                        failures.append(stack_name)
+                        continue
+
+                    if phase == "create" and change_set:
+                        future = executor.submit(TIMINGS.bind(self.execute_stack_change_set), stack_name,
+                                                 *change_set)
+                        running[future] = (stack_name, "execute")
+                        continue
+
+                    deployed_stacks.add(stack_name)
+                    if self.sync_state:
+                        self.sync_state.record(self.config.target_name, stack_name, input_hashes[stack_name])
+
+        self.log_throttling_statistics()
+
+        if failures:
+            raise CfnStackActionFailedException("Sync via change sets failed for {0} of {1} stacks: {2}".format(
+                len(failures), len(stack_processing_order), ", ".join(failures)))
+
+    def create_stack_change_set(self, stack_name, prepared_stack, stack_exists):
+        """
+        Create and describe the change set of a stack
+        :param stack_name: str
+        :param prepared_stack: Future((CloudFormationTemplate, dict))
+        :param stack_exists: bool
+        :return: (CloudFormationStack, str, str): stack, change set arn and stack action executing it, None if the
+                 change set contains no changes
+        :raise CfnStackActionFailedException: if the change set could not be created
+        """
+        with TIMINGS.span(stack_name, "stack", stack=stack_name):
+            stack = self.get_cloudformation_stack(stack_name, *prepared_stack.result())
+
+            if stack_exists:
                 self.cfn.validate_stack_is_ready_for_action(stack)
-                self.cfn.update_stack(stack)
-            else:
-                self.cfn.create_stack(stack)
+            change_set = self.cfn.create_change_set(stack, 'UPDATE' if stack_exists else 'CREATE')
+
+            if self.cfn.is_empty_change_set(change_set):
+                self.logger.info("Stack {0} does not need an update".format(stack_name))
+                return None
+            if change_set['Status'] == "FAILED":
+                raise CfnStackActionFailedException("Could not create change set for {0}: {1}".format(
+                    stack_name, change_set.get('StatusReason')))
+
+            return stack, change_set['ChangeSetId'], "update" if stack_exists else "create"
+
+    def execute_stack_change_set(self, stack_name, stack, change_set_id, action):
+        """
+        :param stack_name: str
+        :param stack: CloudFormationStack
+        :param change_set_id: str
+        :param action: str: create or update
+        """
+        with TIMINGS.span(stack_name, "stack", stack=stack_name):
+            self.cfn.execute_change_set(stack, change_set_id, action, stack.timeout)
 
     def delete_stacks(self):
         existing_stacks = self.cfn.get_stack_names()
@@ -134,3 +405,23 @@ class StackActionHandler(object):
                 self.cfn.delete_stack(stack)
             else:
                 self.logger.info("Stack {0} is already deleted".format(stack_name))
+
+        self.log_throttling_statistics()
+
+    @staticmethod
+    def get_api_statistics():
+        """
+        Get the AWS api calls made so far with their retries, throttling errors, transferred bytes and latency
+        percentiles, in total, per operation and per stack
+        :return: dict
+        """
+        return API_STATISTICS.to_dict()
+
+    def log_throttling_statistics(self):
+        statistics = RATE_LIMITER.get_statistics()
+
+        if statistics["throttling_errors"] or statistics["waited_seconds"] >= 1:
+            self.logger.info(
+                "AWS api calls waited {0}s for client side rate limits and {1}s in retries after {2} throttling "
+                "errors".format(statistics["waited_seconds"], statistics["backoff_seconds"],
+                                statistics["throttling_errors"]))
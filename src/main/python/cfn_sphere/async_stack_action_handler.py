@@ -0,0 +1,199 @@
+import asyncio
+
+from cfn_sphere import StackActionHandler
+from cfn_sphere.aws.async_cfn import AsyncCloudFormation
+from cfn_sphere.aws.cfn import CloudFormationStack
+from cfn_sphere.exceptions import CfnStackActionFailedException
+from cfn_sphere.stack_configuration.dependency_resolver import DependencyResolver
+
+
+class AsyncStackActionHandler(StackActionHandler):
+    """
+    StackActionHandler driving all stacks of a run from one asyncio event loop. Every stack is a coroutine which
+    starts as soon as the stacks it references are deployed, so any number of independent stacks are deployed and
+    waited for concurrently without a thread per stack. Templates are prepared and parameters resolved in the thread
+    pools of StackActionHandler. After a failure no further stacks are started, running stack actions are awaited.
+    """
+
+    def __init__(self, config, dry_run=False, cfn=None, sync_state=None, async_cfn=None):
+        """
+        :param config: Config
+        :param dry_run: bool
+        :param cfn: CloudFormation: shared api wrapper for blocking work, None to create one
+        :param sync_state: SyncState: deploy only changed stacks and their dependents, None to deploy all stacks
+        :param async_cfn: AsyncCloudFormation: None to create one sharing cfn
+        """
+        super(AsyncStackActionHandler, self).__init__(config, dry_run, cfn, sync_state)
+        self.async_cfn = async_cfn or AsyncCloudFormation(region=self.config.region, dry_run=dry_run,
+                                                          profile=self.config.profile, cfn=self.cfn)
+
+    def create_or_update_stacks(self):
+        self.run(self.create_or_update_stacks_async())
+
+    def sync_via_change_sets(self):
+        self.run(self.sync_via_change_sets_async())
+
+    def delete_stacks(self):
+        self.run(self.delete_stacks_async())
+
+    def run(self, coroutine):
+        """
+        Run a coroutine of this handler in a new event loop
+        :param coroutine: coroutine
+        """
+        asyncio.run(self._run(coroutine))
+        self.log_throttling_statistics()
+
+    async def _run(self, coroutine):
+        try:
+            await coroutine
+        finally:
+            await self.async_cfn.close()
+
+    async def run_stacks(self, stack_names, upstream_stacks, process_stack, action):
+        """
+        Process every stack in its own task, once all its upstream stacks are processed
+        :param stack_names: list(str)
+        :param upstream_stacks: dict(str, set(str)): stacks to await by stack name
+        :param process_stack: coroutine function taking a stack name
+        :param action: str: action named in failures, e.g. Sync
+        :raise CfnStackActionFailedException: listing all failed stacks
+        """
+        processed = {stack_name: asyncio.Event() for stack_name in stack_names}
+        failures = []
+
+        async def run_stack(stack_name):
+            try:
+                for upstream_stack in upstream_stacks[stack_name]:
+                    await processed[upstream_stack].wait()
+
+                if not failures:
+                    await process_stack(stack_name)
+            except Exception as e:
+                self.logger.error("{0} of {1} failed: {2}".format(action, stack_name, e))
+                failures.append(stack_name)
+            finally:
+                processed[stack_name].set()
+
+        await asyncio.gather(*[run_stack(stack_name) for stack_name in stack_names])
+
+        if failures:
+            raise CfnStackActionFailedException("{0} failed for {1} of {2} stacks: {3}".format(
+                action, len(failures), len(stack_names), ", ".join(failures)))
+
+    def get_upstream_stacks(self, stack_names):
+        """
+        :param stack_names: list(str)
+        :return: dict(str, set(str)): referenced stacks among stack_names by stack name
+        """
+        graph = DependencyResolver.create_stacks_directed_graph(self.config.stacks)
+        return {stack_name: set(graph.predecessors(stack_name)).intersection(stack_names)
+                for stack_name in stack_names}
+
+    async def get_stacks_to_deploy(self):
+        """
+        :return: (list(str), list(str), dict(str, str)): existing stacks, stacks to deploy in processing order and
+                 input hashes of incremental syncs by stack name
+        """
+        existing_stacks = await self.async_cfn.get_stack_names()
+        stack_processing_order = DependencyResolver.get_stack_order(self.config.stacks)
+        input_hashes = {}
+
+        if self.sync_state:
+            stack_processing_order, input_hashes = self.get_changed_stacks(stack_processing_order, existing_stacks)
+
+        if len(stack_processing_order) > 1:
+            self.logger.info("Will process stacks concurrently in dependency order: {0}".format(
+                ", ".join(stack_processing_order)))
+
+        return existing_stacks, stack_processing_order, input_hashes
+
+    async def get_prepared_stack(self, stack_name, prepared_stack):
+        """
+        :param stack_name: str
+        :param prepared_stack: Future((CloudFormationTemplate, dict))
+        :return: CloudFormationStack
+        """
+        template, stack_policy = await asyncio.wrap_future(prepared_stack)
+        # parameters may reference outputs of upstream stacks, so they are resolved just in time
+        return await self.async_cfn.run_blocking(self.get_cloudformation_stack, stack_name, template, stack_policy)
+
+    async def create_or_update_stacks_async(self):
+        existing_stacks, stack_processing_order, input_hashes = await self.get_stacks_to_deploy()
+
+        with self.prepare_stacks(stack_processing_order) as prepared_stacks:
+            async def deploy_stack(stack_name):
+                stack = await self.get_prepared_stack(stack_name, prepared_stacks[stack_name])
+
+                if stack_name in existing_stacks:
+                    await self.async_cfn.validate_stack_is_ready_for_action(stack)
+                    await self.async_cfn.update_stack(stack)
+                else:
+                    await self.async_cfn.create_stack(stack)
+
+                if self.sync_state and not self.dry_run:
+                    self.sync_state.record(self.config.target_name, stack_name, input_hashes[stack_name])
+
+            await self.run_stacks(stack_processing_order, self.get_upstream_stacks(stack_processing_order),
+                                  deploy_stack, "Sync")
+
+    async def sync_via_change_sets_async(self):
+        """
+        Deploy stacks through change sets, a stack's change set is created once all its upstream stacks are deployed
+        and executed as soon as it is described. Change sets without changes are deleted instead of executed.
+        """
+        if self.dry_run:
+            self.logger.info("Dry run, checking stacks without creating change sets")
+            await self.create_or_update_stacks_async()
+            return
+
+        existing_stacks, stack_processing_order, input_hashes = await self.get_stacks_to_deploy()
+
+        with self.prepare_stacks(stack_processing_order) as prepared_stacks:
+            async def deploy_stack(stack_name):
+                stack = await self.get_prepared_stack(stack_name, prepared_stacks[stack_name])
+                stack_exists = stack_name in existing_stacks
+
+                if stack_exists:
+                    await self.async_cfn.validate_stack_is_ready_for_action(stack)
+                change_set = await self.async_cfn.create_change_set(stack, 'UPDATE' if stack_exists else 'CREATE')
+
+                if self.cfn.is_empty_change_set(change_set):
+                    self.logger.info("Stack {0} does not need an update".format(stack_name))
+                elif change_set['Status'] == "FAILED":
+                    raise CfnStackActionFailedException("Could not create change set for {0}: {1}".format(
+                        stack_name, change_set.get('StatusReason')))
+                else:
+                    await self.async_cfn.execute_change_set(stack, change_set['ChangeSetId'],
+                                                            "update" if stack_exists else "create", stack.timeout)
+
+                if self.sync_state:
+                    self.sync_state.record(self.config.target_name, stack_name, input_hashes[stack_name])
+
+            await self.run_stacks(stack_processing_order, self.get_upstream_stacks(stack_processing_order),
+                                  deploy_stack, "Sync via change sets")
+
+    async def delete_stacks_async(self):
+        """
+        Delete stacks concurrently, a stack is deleted once all stacks referencing it are deleted
+        """
+        existing_stacks = await self.async_cfn.get_stack_names()
+        stack_names = DependencyResolver.get_stack_order(self.config.stacks)
+        graph = DependencyResolver.create_stacks_directed_graph(self.config.stacks)
+        downstream_stacks = {stack_name: set(graph.successors(stack_name)).intersection(stack_names)
+                             for stack_name in stack_names}
+
+        self.logger.info("Will delete stacks concurrently in reverse dependency order: {0}".format(
+            ", ".join(reversed(stack_names))))
+
+        async def delete_stack(stack_name):
+            if stack_name not in existing_stacks:
+                self.logger.info("Stack {0} is already deleted".format(stack_name))
+                return
+
+            stack_config = self.config.stacks.get(stack_name)
+            stack = CloudFormationStack(None, None, stack_name, None, None, service_role=stack_config.service_role)
+            await self.async_cfn.validate_stack_is_ready_for_action(stack)
+            await self.async_cfn.delete_stack(stack)
+
+        await self.run_stacks(stack_names, downstream_stacks, delete_stack, "Deletion")
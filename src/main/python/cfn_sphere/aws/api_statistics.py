@@ -0,0 +1,233 @@
+import math
+import threading
+import time
+
+from cfn_sphere.exceptions import THROTTLING_ERROR_CODES, ApiCallBudgetExceededException
+from cfn_sphere.timings import TIMINGS
+
+PERCENTILES = [50, 90, 99]
+
+
+def get_percentile(sorted_values, percentile):
+    """
+    Get a percentile of sorted values using the nearest rank method
+    :param sorted_values: list(float)
+    :param percentile: int
+    :return: float
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(math.ceil(percentile / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def get_content_length(headers):
+    try:
+        return int((headers or {}).get("Content-Length") or (headers or {}).get("content-length") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_body_size(body):
+    if isinstance(body, bytes):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    if isinstance(body, dict):
+        # query protocol bodies are serialized later on, count their url encoded size
+        return sum(len(str(key)) + len(str(value)) + 2 for key, value in body.items())
+    return 0
+
+
+class OperationStatistics(object):
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latencies = []
+
+    def to_dict(self):
+        latencies = sorted(self.latencies)
+        result = {"calls": self.calls,
+                  "errors": self.errors,
+                  "retries": self.retries,
+                  "throttles": self.throttles,
+                  "bytes_sent": self.bytes_sent,
+                  "bytes_received": self.bytes_received}
+        for percentile in PERCENTILES:
+            result["p{0}_seconds".format(percentile)] = round(get_percentile(latencies, percentile), 4)
+        return result
+
+
+class ApiStatistics(object):
+    """
+    Counts api calls, retries, throttling errors, transferred bytes and latencies per operation and per stack.
+    Calls belong to the stack of the current timing span. An optional budget aborts runs exceeding a number of calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._stacks = {}
+        self.max_calls = None
+        self.calls = 0
+
+    def configure(self, max_calls=None):
+        """
+        :param max_calls: int: maximum number of api calls of a run, None for no limit
+        """
+        with self._lock:
+            self.max_calls = max_calls
+
+    def _get_statistics(self, statistics, key):
+        if key not in statistics:
+            statistics[key] = OperationStatistics()
+        return statistics[key]
+
+    def _update(self, operation, stack, update):
+        with self._lock:
+            update(self._get_statistics(self._operations, operation))
+            if stack is not None:
+                update(self._get_statistics(self._stacks, stack))
+
+    def record_call(self, operation, stack):
+        """
+        Count a call, before it is sent
+        :param operation: str: e.g. cloudformation.DescribeStacks
+        :param stack: str
+        :raise ApiCallBudgetExceededException: if the call would exceed the budget
+        """
+        with self._lock:
+            if self.max_calls is not None and self.calls >= self.max_calls:
+                raise ApiCallBudgetExceededException(
+                    "Aborting before {0}: the run exceeded its budget of {1} AWS api calls".format(operation,
+                                                                                                   self.max_calls))
+            self.calls += 1
+
+        def update(statistics):
+            statistics.calls += 1
+
+        self._update(operation, stack, update)
+
+    def record_attempt(self, operation, stack, attempt, error_code, bytes_sent, bytes_received):
+        """
+        Count an http request of a call, each call makes one plus one per retry
+        """
+
+        def update(statistics):
+            statistics.bytes_sent += bytes_sent
+            statistics.bytes_received += bytes_received
+            if attempt > 1:
+                statistics.retries += 1
+            if error_code in THROTTLING_ERROR_CODES:
+                statistics.throttles += 1
+
+        self._update(operation, stack, update)
+
+    def record_result(self, operation, stack, seconds, failed):
+        """
+        Record the latency of a call including its retries
+        """
+
+        def update(statistics):
+            statistics.latencies.append(seconds)
+            if failed:
+                statistics.errors += 1
+
+        self._update(operation, stack, update)
+
+    def get_operation_statistics(self):
+        """
+        :return: dict(str, dict): statistics by operation, e.g. cloudformation.DescribeStacks
+        """
+        with self._lock:
+            return {operation: statistics.to_dict() for operation, statistics in self._operations.items()}
+
+    def get_stack_statistics(self):
+        """
+        :return: dict(str, dict): statistics by stack name
+        """
+        with self._lock:
+            return {stack: statistics.to_dict() for stack, statistics in self._stacks.items()}
+
+    def to_dict(self):
+        operations = self.get_operation_statistics()
+        return {"calls": sum(statistics["calls"] for statistics in operations.values()),
+                "retries": sum(statistics["retries"] for statistics in operations.values()),
+                "throttles": sum(statistics["throttles"] for statistics in operations.values()),
+                "operations": operations,
+                "stacks": self.get_stack_statistics()}
+
+    def get_summary_table(self):
+        """
+        Render statistics per operation as table, most called operations first
+        :return: str
+        """
+        from prettytable import PrettyTable
+
+        table = PrettyTable(["Operation", "Calls", "Errors", "Retries", "Throttles", "Sent (B)", "Received (B)"] +
+                            ["p{0} (ms)".format(percentile) for percentile in PERCENTILES])
+        table.align["Operation"] = "l"
+
+        for operation, statistics in sorted(self.get_operation_statistics().items(),
+                                            key=lambda item: (-item[1]["calls"], item[0])):
+            table.add_row([operation, statistics["calls"], statistics["errors"], statistics["retries"],
+                           statistics["throttles"], statistics["bytes_sent"], statistics["bytes_received"]] +
+                          [int(statistics["p{0}_seconds".format(percentile)] * 1000) for percentile in PERCENTILES])
+        return table.get_string()
+
+    def clear(self):
+        with self._lock:
+            self._operations = {}
+            self._stacks = {}
+            self.calls = 0
+
+    def register(self, client):
+        """
+        Account every api call of a botocore client, also calls answered by other before-call handlers like stubs
+        :param client: botocore.client.BaseClient
+        """
+        client.meta.events.register_first("before-call.*.*", self._before_call)
+        client.meta.events.register("needs-retry", self._needs_retry)
+        client.meta.events.register("after-call", self._after_call)
+        client.meta.events.register("after-call-error", self._after_call_error)
+
+    def _before_call(self, model, context, **kwargs):
+        operation = "{0}.{1}".format(model.service_model.service_name, model.name)
+        current_span = TIMINGS.get_current_span()
+        stack = current_span.stack if current_span else None
+
+        self.record_call(operation, stack)
+        context["api_statistics"] = (operation, stack, time.perf_counter())
+
+    def _needs_retry(self, attempts=1, response=None, request_dict=None, **kwargs):
+        context = (request_dict or {}).get("context", {})
+        if "api_statistics" not in context:
+            return
+
+        operation, stack, _ = context["api_statistics"]
+        error_code = None
+        bytes_received = 0
+        if response is not None:
+            http_response, parsed = response
+            error_code = parsed.get("Error", {}).get("Code")
+            bytes_received = get_content_length(getattr(http_response, "headers", None))
+
+        bytes_sent = get_body_size(request_dict.get("body")) or get_content_length(request_dict.get("headers"))
+        self.record_attempt(operation, stack, attempts, error_code, bytes_sent, bytes_received)
+
+    def _after_call(self, context, parsed=None, **kwargs):
+        if "api_statistics" in context:
+            operation, stack, start = context.pop("api_statistics")
+            self.record_result(operation, stack, time.perf_counter() - start, bool((parsed or {}).get("Error")))
+
+    def _after_call_error(self, context, **kwargs):
+        if "api_statistics" in context:
+            operation, stack, start = context.pop("api_statistics")
+            self.record_result(operation, stack, time.perf_counter() - start, True)
+
+
+API_STATISTICS = ApiStatistics()
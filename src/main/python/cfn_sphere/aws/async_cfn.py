@@ -0,0 +1,439 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from cfn_sphere.aws import cfn as cfn_module
+from cfn_sphere.aws.api_statistics import API_STATISTICS
+from cfn_sphere.aws.cfn import CloudFormation, CloudFormationStack, READY_FOR_ACTION_STATES
+from cfn_sphere.aws.client_factory import CLIENT_FACTORY
+from cfn_sphere.aws.rate_limiter import RATE_LIMITER
+from cfn_sphere.aws.stack_event_watcher import START_TIMEOUT
+from cfn_sphere.exceptions import CfnSphereBotoError, CfnSphereException, CfnStackActionFailedException
+from cfn_sphere.util import get_logger, get_pretty_changeset_string, get_pretty_parameters_string, \
+    get_pretty_stack_outputs
+
+# upper bound of concurrent api requests of one engine, waiting stack actions don't hold a request
+MAX_CONCURRENT_REQUESTS = 20
+# throttled requests are retried here instead of by botocore, so every attempt waits for the rate limiter
+MAX_RETRIES = 3
+PAUSE_TIME_MULTIPLIER = 5
+
+
+def get_api_operation_name(operation_name):
+    """
+    :param operation_name: str: client method name, e.g. describe_stacks
+    :return: str: api operation name, e.g. DescribeStacks
+    """
+    return "".join(part.capitalize() for part in operation_name.split("_"))
+
+
+class AsyncCloudFormation(object):
+    """
+    asyncio counterpart of CloudFormation. Requests are sent through aiobotocore's non-blocking http client and
+    waits poll with asyncio.sleep, so a single event loop drives any number of concurrent stack actions, each
+    costing a coroutine instead of a thread. Request arguments, stack event handling and change set checks are
+    shared with the wrapped CloudFormation. Blocking work done once per stack, the up to date check and template
+    staging, runs in the loop's default executor.
+    """
+
+    def __init__(self, region="eu-west-1", dry_run=False, profile=None, cfn=None, client=None,
+                 max_concurrent_requests=MAX_CONCURRENT_REQUESTS):
+        """
+        :param region: str
+        :param dry_run: bool
+        :param profile: str
+        :param cfn: CloudFormation: synchronous api wrapper for blocking work, None to create one
+        :param client: aiobotocore CloudFormation client, None to create one on first use
+        :param max_concurrent_requests: int
+        """
+        self.logger = get_logger()
+        self.region = region
+        self.dry_run = dry_run
+        self.profile = profile
+        self.cfn = cfn or CloudFormation(region=region, dry_run=dry_run, profile=profile)
+        self.max_concurrent_requests = max_concurrent_requests
+        self._client = client
+        self._client_context = None
+        self._client_lock = None
+        self._request_semaphore = None
+        self._descriptions = None
+        self._describing = None
+        self._clock_offset = None
+
+    async def get_client(self):
+        """
+        aiobotocore CloudFormation client, created on first use within the running event loop
+        :raise CfnSphereException: if aiobotocore is not installed
+        """
+        if self._client is None:
+            if self._client_lock is None:
+                self._client_lock = asyncio.Lock()
+
+            async with self._client_lock:
+                if self._client is None:
+                    try:
+                        from aiobotocore.session import get_session
+                    except ImportError:
+                        raise CfnSphereException(
+                            "The asyncio engine requires aiobotocore, please install it: pip install aiobotocore")
+
+                    session = get_session()
+                    if self.profile:
+                        session.set_config_variable("profile", self.profile)
+
+                    self._client_context = session.create_client("cloudformation", region_name=self.region,
+                                                                 config=CLIENT_FACTORY.get_config(max_attempts=1))
+                    client = await self._client_context.__aenter__()
+                    API_STATISTICS.register(client)
+                    self._client = client
+        return self._client
+
+    async def close(self):
+        """
+        Close the http connections of a client created by this engine
+        """
+        if self._client_context is not None:
+            await self._client_context.__aexit__(None, None, None)
+            self._client_context = None
+            self._client = None
+
+        # locks and pending listings belong to the closed event loop
+        self._client_lock = None
+        self._request_semaphore = None
+        self._describing = None
+
+    async def run_blocking(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, partial(function, *args))
+
+    async def call(self, operation_name, **kwargs):
+        """
+        Send an api request. Requests take their tokens from the shared rate limiter without blocking the event loop,
+        throttled requests are retried with full jitter.
+        :param operation_name: str: client method name, e.g. describe_stacks
+        :return: dict: response
+        :raise CfnSphereBotoError:
+        """
+        client = await self.get_client()
+        api_operation_name = get_api_operation_name(operation_name)
+        scope = (self.region, self.profile)
+        retries = 0
+
+        if self._request_semaphore is None:
+            self._request_semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+        while True:
+            await asyncio.sleep(RATE_LIMITER.reserve("cloudformation", api_operation_name, scope))
+
+            try:
+                async with self._request_semaphore:
+                    response = await getattr(client, operation_name)(**kwargs)
+                RATE_LIMITER.record_response("cloudformation", api_operation_name, None, scope)
+                return response
+            except (BotoCoreError, ClientError) as e:
+                error = CfnSphereBotoError(e)
+                if isinstance(e, ClientError):
+                    RATE_LIMITER.record_response("cloudformation", api_operation_name,
+                                                 e.response["Error"]["Code"], scope)
+
+                if not error.is_throttling_exception or retries >= MAX_RETRIES:
+                    raise error
+
+                sleep_time = random.uniform(0, PAUSE_TIME_MULTIPLIER * (2 ** retries))
+                self.logger.warning("{0} call failed with: '{1}' (Will retry in {2}s)".format(
+                    operation_name, error, round(sleep_time, 1)))
+                RATE_LIMITER.record_backoff(sleep_time)
+                await asyncio.sleep(sleep_time)
+                retries += 1
+
+    def invalidate(self):
+        """
+        Drop the cached stack descriptions of this engine and its CloudFormation
+        """
+        self._descriptions = None
+        self._describing = None
+        self.cfn.invalidate()
+
+    async def _describe_stacks(self):
+        descriptions = []
+        kwargs = {}
+
+        while True:
+            response = await self.call("describe_stacks", **kwargs)
+            descriptions += response["Stacks"]
+            if not response.get("NextToken"):
+                return descriptions
+            kwargs["NextToken"] = response["NextToken"]
+
+    async def get_stack_descriptions(self):
+        """
+        Get all stack descriptions, concurrent callers share one listing
+        :return: list(dict)
+        :raise CfnSphereBotoError:
+        """
+        if self._descriptions is not None:
+            return self._descriptions
+
+        describing = self._describing
+        if describing is None:
+            describing = self._describing = asyncio.ensure_future(self._describe_stacks())
+
+        try:
+            descriptions = await asyncio.shield(describing)
+        except CfnSphereBotoError:
+            if self._describing is describing:
+                self._describing = None
+            raise
+
+        # listings started before the cache was dropped are returned but not cached
+        if self._describing is describing:
+            self._describing = None
+            self._descriptions = descriptions
+        return descriptions
+
+    async def get_stack_description(self, stack_name):
+        """
+        :param stack_name: str: stack name or id
+        :return: dict: empty if the stack does not exist
+        """
+        for stack in await self.get_stack_descriptions():
+            if stack['StackId'] == stack_name or stack['StackName'] == stack_name:
+                return stack
+        return {}
+
+    async def get_stack_names(self):
+        return [stack['StackName'] for stack in await self.get_stack_descriptions()]
+
+    async def get_stacks_outputs(self):
+        """
+        :return: dict(dict(output-key, output-value)) by stack name
+        """
+        return {stack["StackName"]: {output["OutputKey"]: output["OutputValue"] for output in stack["Outputs"]}
+                for stack in await self.get_stack_descriptions() if stack.get("Outputs")}
+
+    async def get_stack_events(self, stack_name):
+        """
+        Get recent stack events for a given stack_name
+        :param stack_name: str
+        :return: list(dict)
+        """
+        response = await self.call("describe_stack_events", StackName=stack_name)
+        return response["StackEvents"]
+
+    async def validate_stack_is_ready_for_action(self, stack):
+        """
+        :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        :raise CfnStackActionFailedException: if the stack is in an invalid state
+        """
+        stack_status = (await self.get_stack_description(stack.name)).get("StackStatus")
+
+        if stack_status not in READY_FOR_ACTION_STATES:
+            raise CfnStackActionFailedException("Stack {0} is in '{1}' state.".format(stack.name, stack_status))
+
+    async def get_server_time(self):
+        # the AWS server time is fetched once, later calls apply its offset to the local clock
+        if self._clock_offset is None:
+            server_time = await self.run_blocking(cfn_module.get_cfn_api_server_time)
+            self._clock_offset = server_time - datetime.now(timezone.utc)
+        return datetime.now(timezone.utc) + self._clock_offset
+
+    async def wait_for_stack_action_to_complete(self, stack_name, action, timeout):
+        allowed_actions = ["create", "update", "delete"]
+        assert action.lower() in allowed_actions, "action argument must be one of {0}".format(allowed_actions)
+
+        minimum_event_timestamp = await self.get_server_time() - timedelta(seconds=10)
+
+        start_event = await self.wait_for_stack_event(stack_name, action.upper() + "_IN_PROGRESS",
+                                                      minimum_event_timestamp, START_TIMEOUT)
+        self.logger.info("Stack {0} of {1} started".format(action, stack_name))
+
+        end_event = await self.wait_for_stack_event(stack_name, action.upper() + "_COMPLETE",
+                                                    start_event["Timestamp"], timeout)
+
+        elapsed = end_event["Timestamp"] - start_event["Timestamp"]
+        self.logger.info("Stack {0} of {1} completed after {2}s".format(action, stack_name, elapsed.seconds))
+
+    async def wait_for_stack_event(self, stack_name, expected_event_status, valid_from_timestamp, timeout):
+        """
+        Wait for a new stack event. Return it if it has the expected status
+        :param stack_name: str
+        :param expected_event_status: str
+        :param valid_from_timestamp: timestamp
+        :param timeout: int
+        :return: boto3 stack event
+        :raise CfnStackActionFailedException:
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        seen_event_ids = set()
+
+        while loop.time() < deadline:
+            events = await self.get_stack_events(stack_name)
+            events.reverse()
+
+            for event in events:
+                if event["EventId"] not in seen_event_ids:
+                    seen_event_ids.add(event["EventId"])
+                    event = self.cfn.handle_stack_event(event, valid_from_timestamp, expected_event_status,
+                                                        stack_name)
+                    if event:
+                        return event
+
+            await asyncio.sleep(cfn_module.STACK_EVENT_POLL_INTERVAL)
+
+        raise CfnStackActionFailedException(
+            "Timeout occurred waiting for '{0}' on stack {1}".format(expected_event_status, stack_name))
+
+    async def log_completed_stack_action(self, stack_name, action):
+        self.invalidate()
+        stack_outputs = get_pretty_stack_outputs((await self.get_stack_description(stack_name)).get("Outputs", []))
+        if stack_outputs:
+            self.logger.info("{0} completed for {1} with outputs: \n{2}".format(action.capitalize(), stack_name,
+                                                                                stack_outputs))
+        else:
+            self.logger.info("{0} completed for {1}".format(action.capitalize(), stack_name))
+
+    async def create_stack(self, stack):
+        self.logger.debug("Creating stack: {0}".format(stack))
+        assert isinstance(stack, CloudFormationStack)
+
+        try:
+            self.logger.info("Creating stack {0} ({1}) with parameters:\n{2}".format(
+                stack.name, stack.template.name, get_pretty_parameters_string(stack)))
+
+            if self.dry_run:
+                self.logger.info('Dry run. Exiting.')
+                return
+
+            kwargs = await self.run_blocking(self.cfn.get_create_stack_kwargs, stack)
+            await self.call("create_stack", **kwargs)
+            self.invalidate()
+
+            await self.wait_for_stack_action_to_complete(stack.name, "create", stack.timeout)
+            await self.log_completed_stack_action(stack.name, "create")
+        except (BotoCoreError, ClientError, CfnSphereBotoError) as e:
+            raise CfnStackActionFailedException("Could not create {0}: {1}".format(stack.name, e))
+
+    async def update_stack(self, stack):
+        self.logger.debug("Updating stack: {0}".format(stack))
+        assert isinstance(stack, CloudFormationStack)
+
+        try:
+            if await self.run_blocking(self.cfn.stack_is_up_to_date, stack):
+                self.logger.info("Stack {0} does not need an update".format(stack.name))
+                return
+
+            self.logger.info("Updating stack {0} ({1}) with parameters:\n{2}".format(
+                stack.name, stack.template.name, get_pretty_parameters_string(stack)))
+
+            if self.dry_run:
+                self.logger.info('Dry run. Exiting.')
+                return
+
+            kwargs = await self.run_blocking(self.cfn.get_update_stack_kwargs, stack)
+            try:
+                await self.call("update_stack", **kwargs)
+            except CfnSphereBotoError as e:
+                if self.cfn.is_boto_no_update_required_exception(e.boto_exception):
+                    self.logger.info("Stack {0} does not need an update".format(stack.name))
+                    return
+                raise
+            self.invalidate()
+
+            await self.wait_for_stack_action_to_complete(stack.name, "update", stack.timeout)
+            await self.log_completed_stack_action(stack.name, "update")
+        except (BotoCoreError, ClientError, CfnSphereBotoError) as e:
+            raise CfnStackActionFailedException("Could not update {0}: {1}".format(stack.name, e))
+
+    async def delete_stack(self, stack):
+        self.logger.debug("Deleting stack: {0}".format(stack))
+        assert isinstance(stack, CloudFormationStack)
+
+        try:
+            self.logger.info("Deleting stack {0}".format(stack.name))
+            await self.call("delete_stack", **CloudFormation.get_delete_stack_kwargs(stack))
+            self.invalidate()
+
+            try:
+                await self.wait_for_stack_action_to_complete(stack.name, "delete", 600)
+            except CfnSphereBotoError as e:
+                if not self.cfn.is_boto_stack_does_not_exist_exception(e.boto_exception):
+                    raise
+
+            self.logger.info("Deletion completed for {0}".format(stack.name))
+        except (BotoCoreError, ClientError, CfnSphereBotoError) as e:
+            raise CfnStackActionFailedException("Could not delete {0}: {1}".format(stack.name, e))
+
+    async def wait_for_change_set(self, change_set_id):
+        """
+        Wait until a change set is created or failed
+        :param change_set_id: str
+        :return: dict: boto3 describe_change_set response
+        """
+        while True:
+            response = await self.call("describe_change_set", ChangeSetName=change_set_id)
+
+            if response['Status'] not in ['CREATE_PENDING', 'CREATE_IN_PROGRESS']:
+                return response
+            await asyncio.sleep(cfn_module.CHANGE_SET_POLL_INTERVAL)
+
+    async def create_change_set(self, stack, change_set_type):
+        """
+        Create a change set and wait until it is described, failed change sets are deleted
+        :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        :param change_set_type: str: CREATE or UPDATE
+        :return: dict: boto3 describe_change_set response
+        :raise CfnStackActionFailedException:
+        """
+        self.logger.debug("Creating stack changeset: {}".format(stack))
+        assert isinstance(stack, CloudFormationStack)
+
+        try:
+            self.logger.info("Creating stack changeset {0} ({1}) with parameters:\n{2}".format(
+                stack.name, stack.template.name, get_pretty_parameters_string(stack)))
+
+            stack_id = None
+            if change_set_type == 'UPDATE':
+                stack_id = (await self.get_stack_description(stack.name))['StackId']
+
+            kwargs = await self.run_blocking(self.cfn.get_change_set_kwargs, stack, change_set_type, stack_id)
+            change_set_id = (await self.call("create_change_set", **kwargs))['Id']
+            change_set = await self.wait_for_change_set(change_set_id)
+
+            if change_set['Status'] != "FAILED":
+                self.logger.info("Stack changeset with changes:\n{}".format(
+                    get_pretty_changeset_string(change_set['Changes'])))
+                return change_set
+
+            if self.cfn.is_empty_change_set(change_set):
+                self.logger.info("Stack changeset {0} contains no changes".format(change_set_id))
+            else:
+                self.logger.error("Changeset failed with reason: {0}".format(change_set.get("StatusReason")))
+
+            self.logger.info("Removing failed changeset {}".format(change_set_id))
+            await self.call("delete_change_set", ChangeSetName=change_set_id)
+            return change_set
+        except (BotoCoreError, ClientError, CfnSphereBotoError) as e:
+            raise CfnStackActionFailedException("Could not create change set {0}: {1}".format(stack.name, e))
+
+    async def execute_change_set(self, stack, change_set, action="update", timeout=600):
+        """
+        Execute a change set and wait until the stack action completed
+        :param stack: stack with a name, like cfn_sphere.aws.cfn.CloudFormationStack
+        :param change_set: str: change set arn
+        :param action: str: create for change sets of new stacks, update otherwise
+        :param timeout: int: seconds the stack action may take
+        :raise CfnStackActionFailedException:
+        """
+        self.logger.debug("Executing stack changeset: {}".format(change_set))
+
+        try:
+            await self.call("execute_change_set", ChangeSetName=change_set)
+            self.invalidate()
+
+            await self.wait_for_stack_action_to_complete(stack.name, action, timeout)
+            await self.log_completed_stack_action(stack.name, action)
+        except (BotoCoreError, ClientError, CfnSphereBotoError) as e:
+            raise CfnStackActionFailedException("Could not execute {0}: {1}".format(change_set, e))
@@ -1,10 +1,16 @@
 # Modifications copyright (C) 2017 KCOM
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
 from datetime import timedelta
 
-import boto3
 from botocore.exceptions import BotoCoreError, ClientError, ValidationError
 
-from cfn_sphere.exceptions import CfnStackActionFailedException
+from cfn_sphere.aws.client_factory import get_client, get_resource
+from cfn_sphere.aws.s3 import S3
+from cfn_sphere.exceptions import CfnSphereBotoError, CfnStackActionFailedException, TemplateErrorException
+from cfn_sphere.timings import TIMINGS
 from cfn_sphere.util import *
 
 import pprint
@@ -17,10 +23,38 @@ logging.getLogger('boto').setLevel(logging.FATAL)
 STACK_DESCRIPTIONS = 'stack_descriptions'
 RESOURCE_ALL_STACKS = 'all_stacks'
 
+# maximum TemplateBody size accepted by the CloudFormation API, larger templates are staged in S3
+TEMPLATE_BODY_SIZE_LIMIT = 51200
+# key prefix of staged templates, use it to configure a lifecycle rule if staged templates should expire
+TEMPLATE_STAGING_PREFIX = 'cfn-square/templates'
+
+# states of stacks whose deployed template reflects their actual state
+UP_TO_DATE_CHECK_STATES = ["CREATE_COMPLETE", "UPDATE_COMPLETE", "UPDATE_ROLLBACK_COMPLETE", "IMPORT_COMPLETE"]
+# resources deploying templates referenced by url, whose content is not part of the parent template
+NESTED_STACK_RESOURCE_TYPES = ["AWS::CloudFormation::Stack", "AWS::Serverless::Application"]
+# the only transform known to expand identical templates to identical stacks
+DETERMINISTIC_TRANSFORMS = ["AWS::Serverless-2016-10-31"]
+
+# states of stacks which can be updated or deleted
+READY_FOR_ACTION_STATES = ["CREATE_COMPLETE", "UPDATE_COMPLETE", "ROLLBACK_COMPLETE", "UPDATE_ROLLBACK_COMPLETE"]
+
+# all stack states but DELETE_COMPLETE, deleted stacks are not part of the stack descriptions
+LISTED_STACK_STATES = ["CREATE_IN_PROGRESS", "CREATE_FAILED", "CREATE_COMPLETE", "ROLLBACK_IN_PROGRESS",
+                       "ROLLBACK_FAILED", "ROLLBACK_COMPLETE", "DELETE_IN_PROGRESS", "DELETE_FAILED",
+                       "UPDATE_IN_PROGRESS", "UPDATE_COMPLETE_CLEANUP_IN_PROGRESS", "UPDATE_COMPLETE",
+                       "UPDATE_FAILED", "UPDATE_ROLLBACK_IN_PROGRESS", "UPDATE_ROLLBACK_FAILED",
+                       "UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS", "UPDATE_ROLLBACK_COMPLETE",
+                       "REVIEW_IN_PROGRESS", "IMPORT_IN_PROGRESS", "IMPORT_COMPLETE", "IMPORT_ROLLBACK_IN_PROGRESS",
+                       "IMPORT_ROLLBACK_FAILED", "IMPORT_ROLLBACK_COMPLETE"]
+
+# seconds between polls of stack events and pending change sets
+STACK_EVENT_POLL_INTERVAL = 10
+CHANGE_SET_POLL_INTERVAL = 5
+
 
 class CloudFormationStack(object):
     def __init__(self, template, parameters, name, region, timeout=600, tags=None, service_role=None,
-                 stack_policy=None, failure_action=None, disable_rollback=False):
+                 stack_policy=None, failure_action=None, disable_rollback=False, template_bucket=None):
         self.template = template
         self.parameters = parameters
         self.tags = {} if tags is None else tags
@@ -31,6 +65,7 @@ class CloudFormationStack(object):
         self.stack_policy = stack_policy
         self.failure_action = failure_action
         self.disable_rollback = disable_rollback
+        self.template_bucket = template_bucket
 
     def __str__(self):
         return str(vars(self))
@@ -43,13 +78,37 @@ class CloudFormationStack(object):
 
 
 class CloudFormation(object):
-    @with_boto_retry()
-    def __init__(self, region="eu-west-1", dry_run=False):
+    def __init__(self, region="eu-west-1", dry_run=False, profile=None):
         self.logger = get_logger()
-        self.client = boto3.client('cloudformation', region_name=region)
-        self.resource = boto3.resource('cloudformation', region_name=region)
+        self.region = region
+        self.profile = profile
         self.dry_run = dry_run
         self.cached = {STACK_DESCRIPTIONS: None, RESOURCE_ALL_STACKS: None}
+        # incremented whenever the cache is dropped, listings started before are not cached
+        self._cache_generation = 0
+        self._cache_lock = threading.Lock()
+        self._client = None
+        self._resource = None
+        self.staged_templates = {}
+        self._staging_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """
+        CloudFormation boto3 client, created on first use
+        """
+        if self._client is None:
+            self._client = get_client('cloudformation', self.region, self.profile)
+        return self._client
+
+    @property
+    def resource(self):
+        """
+        CloudFormation boto3 resource, created on first use
+        """
+        if self._resource is None:
+            self._resource = get_resource('cloudformation', self.region, self.profile)
+        return self._resource
 
     def get_stack(self, stack_name):
         """
@@ -61,8 +120,6 @@ class CloudFormation(object):
         """
         return self.resource.Stack(stack_name)
 
-    @timed
-    @with_boto_retry()
     def get_stacks(self):
         """
         Get all stacks
@@ -70,14 +127,16 @@ class CloudFormation(object):
         :raise CfnSphereBotoError:
         """
         try:
-            if not self.cached[RESOURCE_ALL_STACKS]:
-                self.cached[RESOURCE_ALL_STACKS] = list(self.resource.stacks.all())
+            cached, generation = self.get_cache()
+            stacks = cached[RESOURCE_ALL_STACKS]
+            if not stacks:
+                stacks = list(self.resource.stacks.all())
+                self.set_cached(RESOURCE_ALL_STACKS, stacks, generation)
 
-            return self.cached[RESOURCE_ALL_STACKS]
+            return stacks
         except (BotoCoreError, ClientError) as e:
             raise CfnSphereBotoError(e)
 
-    @with_boto_retry()
     def get_stack_name_by_arn(self, stack_arn):
         """
         Get friendly stack name by stack arn
@@ -85,8 +144,6 @@ class CloudFormation(object):
         """
         return self.get_stack_description(stack_arn)['StackName']
 
-    @timed
-    @with_boto_retry()
     def get_stack_description(self, stack_name):
         """
         Get a stacks descriptions
@@ -95,10 +152,7 @@ class CloudFormation(object):
         :raise CfnSphereBotoError:
         """
         try:
-            if self.cached[STACK_DESCRIPTIONS] is None:
-                self.get_stack_descriptions()
-
-            for stack in self.cached[STACK_DESCRIPTIONS]:
+            for stack in self.get_stack_descriptions():
                 if stack['StackId'] == stack_name or stack['StackName'] == stack_name:
                     return stack
 
@@ -107,8 +161,6 @@ class CloudFormation(object):
         except (BotoCoreError, ClientError) as e:
             raise CfnSphereBotoError(e)
 
-    @timed
-    @with_boto_retry()
     def get_stack_descriptions(self):
         """
         Get all stacks stack descriptions
@@ -116,17 +168,79 @@ class CloudFormation(object):
         :raise CfnSphereBotoError:
         """
         try:
-            if self.cached[STACK_DESCRIPTIONS] is None:
-                self.cached[STACK_DESCRIPTIONS] = []
-
+            # other threads may drop the cache at any time, so descriptions are only published complete
+            cached, generation = self.get_cache()
+            descriptions = cached[STACK_DESCRIPTIONS]
+            if descriptions is None:
+                descriptions = []
                 for page in self.client.get_paginator('describe_stacks').paginate():
-                    self.cached[STACK_DESCRIPTIONS] += page["Stacks"]
+                    descriptions += page["Stacks"]
+                self.set_cached(STACK_DESCRIPTIONS, descriptions, generation)
+
+            return descriptions
+        except (BotoCoreError, ClientError) as e:
+            raise CfnSphereBotoError(e)
+
+    def get_cache(self):
+        """
+        :return: (dict, int): cached stacks and descriptions and the generation of the cache
+        """
+        with self._cache_lock:
+            return self.cached, self._cache_generation
+
+    def set_cached(self, key, value, generation):
+        """
+        Cache a listing unless the cache was dropped since it started, it may miss changes of completed stack actions
+        :param key: str: STACK_DESCRIPTIONS or RESOURCE_ALL_STACKS
+        :param value: list
+        :param generation: int: generation of the cache when the listing started
+        """
+        with self._cache_lock:
+            if generation == self._cache_generation:
+                self.cached[key] = value
+
+    def invalidate(self):
+        """
+        Drop the cached stacks and stack descriptions
+        """
+        with self._cache_lock:
+            self._cache_generation += 1
+            self.cached = {STACK_DESCRIPTIONS: None, RESOURCE_ALL_STACKS: None}
+
+    @staticmethod
+    def get_stack_version(stack):
+        """
+        :param stack: dict: stack description or stack summary
+        :return: (str, datetime, str): stack id, time of the last change and stack status
+        """
+        return stack["StackId"], stack.get("LastUpdatedTime") or stack.get("CreationTime"), stack["StackStatus"]
+
+    def invalidate_changed_stacks(self):
+        """
+        Drop the cached stack descriptions if any stack was created, updated, deleted or changed its state since
+        they were loaded. Changes are detected from the LastUpdatedTime of a stack listing, which is cheaper to load
+        than descriptions with all parameters and outputs.
+        :return: bool: True if the cache was dropped
+        :raise CfnSphereBotoError:
+        """
+        if self.cached[STACK_DESCRIPTIONS] is None:
+            return False
 
-            return self.cached[STACK_DESCRIPTIONS]
+        try:
+            cached_versions = set(self.get_stack_version(stack) for stack in self.cached[STACK_DESCRIPTIONS])
+            current_versions = set()
+            for page in self.client.get_paginator('list_stacks').paginate(StackStatusFilter=LISTED_STACK_STATES):
+                current_versions.update(self.get_stack_version(stack) for stack in page["StackSummaries"])
         except (BotoCoreError, ClientError) as e:
             raise CfnSphereBotoError(e)
 
-    @with_boto_retry()
+        if cached_versions == current_versions:
+            return False
+
+        self.logger.debug("Stacks changed since they were described, dropping cached stack descriptions")
+        self.invalidate()
+        return True
+
     def stack_exists(self, stack_name):
         """
         Check if a stack exists for given stack_name
@@ -145,7 +259,6 @@ class CloudFormation(object):
             else:
                 raise CfnSphereBotoError(e)
 
-    @with_boto_retry()
     def change_set_is_executable(self, change_set):
         """
         Check if a change set is executable
@@ -165,7 +278,6 @@ class CloudFormation(object):
         else:
             return True
 
-    @with_boto_retry()
     def get_change_set(self, change_set_id):
         """
         Get changeset info for a given changeset arn
@@ -177,7 +289,6 @@ class CloudFormation(object):
         except (ValidationError, BotoCoreError, ClientError):
             return None
 
-    @with_boto_retry()
     def get_stack_events(self, stack_name):
         """
         Get recent stack events for a given stack_name
@@ -191,8 +302,6 @@ class CloudFormation(object):
         except (BotoCoreError, ClientError) as e:
             raise CfnSphereBotoError(e)
 
-    @timed
-    @with_boto_retry()
     def get_stack_names(self):
         """
         Get a list of stack names
@@ -200,7 +309,6 @@ class CloudFormation(object):
         """
         return [stack.stack_name for stack in self.get_stacks()]
 
-    @timed
     def get_stacks_dict(self):
         """
         Get a dict containing all stacks with their name as key and {parameters, outputs} as value
@@ -243,7 +351,6 @@ class CloudFormation(object):
 
         return stack_outputs
 
-    @with_boto_retry()
     def validate_stack_is_ready_for_action(self, stack):
         """
         Check if a stack is in a state capable for modification actions
@@ -253,13 +360,10 @@ class CloudFormation(object):
         """
         cfn_stack = self.get_stack(stack.name)
 
-        valid_states = ["CREATE_COMPLETE", "UPDATE_COMPLETE", "ROLLBACK_COMPLETE", "UPDATE_ROLLBACK_COMPLETE"]
-
-        if cfn_stack.stack_status not in valid_states:
+        if cfn_stack.stack_status not in READY_FOR_ACTION_STATES:
             raise CfnStackActionFailedException(
                 "Stack {0} is in '{1}' state.".format(cfn_stack.stack_name, cfn_stack.stack_status))
 
-    @with_boto_retry()
     def get_stack_state(self, stack_name):
         """
         Get stack status
@@ -269,7 +373,6 @@ class CloudFormation(object):
         """
         return self.get_stack(stack_name).stack_status
 
-    @with_boto_retry()
     def get_stack_parameters_dict(self, stack_name):
         """
         Get a stacks parameters
@@ -315,26 +418,184 @@ class CloudFormation(object):
         else:
             return False
 
-    @with_boto_retry()
-    def _create_stack(self, stack):
+    def get_template_location_kwargs(self, stack):
         """
-        Create cloudformation stack
+        Get the template argument for stack api calls. Templates exceeding the TemplateBody size limit
+        are staged in the stacks template bucket and passed as TemplateURL.
         :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        :return: dict
+        :raise TemplateErrorException: if a template is too large and no template bucket is configured
+        """
+        template_body = stack.template.get_template_json()
+
+        if len(template_body.encode('utf-8')) <= TEMPLATE_BODY_SIZE_LIMIT:
+            return {"TemplateBody": template_body}
+
+        if not stack.template_bucket:
+            raise TemplateErrorException(
+                "Template of stack {0} exceeds {1} bytes, please configure a template-bucket to stage it in".format(
+                    stack.name, TEMPLATE_BODY_SIZE_LIMIT))
+
+        return {"TemplateURL": self.stage_template(template_body, stack.template_bucket)}
+
+    def clear_staged_templates(self):
+        """
+        Forget which templates are staged, so they are looked up in S3 again, e.g. after a lifecycle rule expired them
+        """
+        with self._staging_lock:
+            self.staged_templates = {}
+
+    def stage_template(self, template_body, bucket_name):
+        """
+        Upload a template body to S3 under its content hash. Identical templates are uploaded only once.
+        :param template_body: str
+        :param bucket_name: str
+        :return: str: template url
+        """
+        key_name = "{0}/{1}.json".format(TEMPLATE_STAGING_PREFIX,
+                                         hashlib.sha256(template_body.encode('utf-8')).hexdigest())
+
+        staging_key = (bucket_name, key_name)
+
+        # the lock only claims the key, concurrent stacks staging other templates don't wait for this upload
+        with self._staging_lock:
+            staging = self.staged_templates.get(staging_key)
+            is_owner = staging is None
+            if is_owner:
+                staging = Future()
+                self.staged_templates[staging_key] = staging
+
+        if is_owner:
+            try:
+                staging.set_result(self.put_template_if_missing(template_body, bucket_name, key_name))
+            except Exception as e:
+                # forget failed uploads so a later stack may retry them
+                with self._staging_lock:
+                    del self.staged_templates[staging_key]
+                staging.set_exception(e)
+
+        return staging.result()
+
+    def put_template_if_missing(self, template_body, bucket_name, key_name):
+        """
+        :return: str: template url
+        """
+        s3 = S3(self.region, self.profile)
+
+        if s3.object_exists(bucket_name, key_name):
+            self.logger.debug("Template s3://{0}/{1} already staged".format(bucket_name, key_name))
+        else:
+            self.logger.info("Staging template in s3://{0}/{1}".format(bucket_name, key_name))
+            s3.put_object(bucket_name, key_name, template_body)
+
+        return "https://{0}.s3.{1}.amazonaws.com/{2}".format(bucket_name, self.region, key_name)
+
+    def stack_is_up_to_date(self, stack):
+        """
+        Compare the fingerprint of a stacks desired state with the fingerprint of its deployed state,
+        so unchanged stacks can be skipped without an UpdateStack call.
+        Stacks whose update could pick up values resolved by CloudFormation itself (dynamic references,
+        SSM parameter types, macros) or whose parameters can't be compared (NoEcho) are never up to date.
+        :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        :return: bool
+        """
+        description = self.get_stack_description(stack.name)
+        if description.get("StackStatus") not in UP_TO_DATE_CHECK_STATES:
+            return False
+
+        template_body_dict = stack.template.get_template_body_dict()
+        if not template_can_be_compared(template_body_dict):
+            return False
+
+        desired_parameters = get_effective_parameters(template_body_dict, stack.parameters)
+        if desired_parameters is None:
+            return False
+
+        try:
+            deployed_template_body_dict = self.get_deployed_template_body_dict(stack.name)
+            if deployed_template_body_dict is None:
+                return False
+
+            deployed_parameters = {parameter["ParameterKey"]: parameter["ParameterValue"]
+                                   for parameter in description.get("Parameters", [])}
+            deployed_tags = {tag["Key"]: tag["Value"] for tag in description.get("Tags", [])}
+
+            desired_fingerprint = get_stack_fingerprint(template_body_dict, desired_parameters, stack.tags)
+            deployed_fingerprint = get_stack_fingerprint(deployed_template_body_dict, deployed_parameters,
+                                                         deployed_tags)
+            if desired_fingerprint != deployed_fingerprint:
+                return False
+
+            # stacks keep their role and policy if none is given, so only configured values are compared
+            if stack.service_role and stack.service_role != description.get("RoleARN"):
+                return False
+            if stack.stack_policy and stack.stack_policy != self.get_deployed_stack_policy(stack.name):
+                return False
+
+            return True
+        except (BotoCoreError, ClientError) as e:
+            self.logger.debug("Could not compare stack {0} with its deployed state: {1}".format(stack.name, e))
+            return False
+
+    def get_deployed_template_body_dict(self, stack_name):
+        """
+        Get the original template of a deployed stack
+        :param stack_name: str
+        :return: dict or None if the template is no JSON template
+        """
+        template_body = self.client.get_template(StackName=stack_name, TemplateStage="Original")["TemplateBody"]
+
+        if isinstance(template_body, dict):
+            return template_body
+
+        try:
+            return json.loads(template_body)
+        except ValueError:
+            return None
+
+    def get_deployed_stack_policy(self, stack_name):
+        """
+        Get the stack policy of a deployed stack
+        :param stack_name: str
+        :return: dict or None if the stack has no policy
+        """
+        stack_policy_body = self.client.get_stack_policy(StackName=stack_name).get("StackPolicyBody")
+
+        if stack_policy_body:
+            return json.loads(stack_policy_body)
+        return None
+
+    def get_stack_kwargs(self, stack, stack_name=None):
+        """
+        Get the arguments shared by stack and change set api calls
+        :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        :param stack_name: str: stack name or id to address, the stack's name if None
+        :return: dict
         """
         kwargs = {
-            "StackName": stack.name,
-            "TemplateBody": stack.template.get_template_json(),
+            "StackName": stack_name or stack.name,
             "Parameters": stack.get_parameters_list(),
             "Capabilities": [
                 'CAPABILITY_IAM',
                 'CAPABILITY_NAMED_IAM',
                 'CAPABILITY_AUTO_EXPAND'
-            ],
-            "Tags": stack.get_tags_list()
+            ]
         }
+        kwargs.update(self.get_template_location_kwargs(stack))
 
         if stack.service_role:
             kwargs["RoleARN"] = stack.service_role
+
+        return kwargs
+
+    def get_create_stack_kwargs(self, stack):
+        """
+        :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        :return: dict: arguments of the create_stack api call
+        """
+        kwargs = self.get_stack_kwargs(stack)
+        kwargs["Tags"] = stack.get_tags_list()
+
         if stack.stack_policy:
             kwargs["StackPolicyBody"] = json.dumps(stack.stack_policy)
         if stack.failure_action:
@@ -342,57 +603,109 @@ class CloudFormation(object):
         if stack.disable_rollback:
             kwargs["DisableRollback"] = bool(stack.disable_rollback)
 
-        self.client.create_stack(**kwargs)
+        return kwargs
 
-        # Blank it out instead of updating the cache as if it's needed again
-        # the code will automatically populate the describe/stacks cache again.
-        self.cached = {STACK_DESCRIPTIONS: None, RESOURCE_ALL_STACKS: None}
+    def get_update_stack_kwargs(self, stack):
+        """
+        :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        :return: dict: arguments of the update_stack api call
+        """
+        kwargs = self.get_stack_kwargs(stack)
+        kwargs["Tags"] = stack.get_tags_list()
 
+        if stack.stack_policy:
+            kwargs["StackPolicyBody"] = json.dumps(stack.stack_policy)
 
+        return kwargs
 
-    @with_boto_retry()
-    def _update_stack(self, stack):
+    def get_change_set_kwargs(self, stack, change_set_type, stack_id=None):
         """
-        Update cloudformation stack
         :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        :param change_set_type: str: CREATE or UPDATE
+        :param stack_id: str: id of the stack an UPDATE change set changes
+        :return: dict: arguments of the create_change_set api call
+        """
+        kwargs = self.get_stack_kwargs(stack, stack_id)
+        kwargs["ChangeSetName"] = stack.name + ''.join(
+            random.choice(string.ascii_uppercase + string.digits) for _ in range(5))
+        kwargs["ChangeSetType"] = change_set_type
+
+        return kwargs
+
+    @staticmethod
+    def get_delete_stack_kwargs(stack):
+        """
+        :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        :return: dict: arguments of the delete_stack api call
         """
         kwargs = {
-            "StackName": stack.name,
-            "TemplateBody": stack.template.get_template_json(),
-            "Parameters": stack.get_parameters_list(),
-            "Capabilities": [
-                'CAPABILITY_IAM',
-                'CAPABILITY_NAMED_IAM',
-                'CAPABILITY_AUTO_EXPAND'
-            ],
-            "Tags": stack.get_tags_list()
+            "StackName": stack.name
         }
 
         if stack.service_role:
             kwargs["RoleARN"] = stack.service_role
-        if stack.stack_policy:
-            kwargs["StackPolicyBody"] = json.dumps(stack.stack_policy)
 
-        self.client.update_stack(**kwargs)
+        return kwargs
+
+    def _create_stack(self, stack):
+        """
+        Create cloudformation stack
+        :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        """
+        self.client.create_stack(**self.get_create_stack_kwargs(stack))
 
         # Blank it out instead of updating the cache as if it's needed again
         # the code will automatically populate the describe/stacks cache again.
-        self.cached = {STACK_DESCRIPTIONS: None, RESOURCE_ALL_STACKS: None}
+        self.invalidate()
 
-    @with_boto_retry()
-    def _describe_stack_change_set(self, change_set):
+    def _update_stack(self, stack):
+        """
+        Update cloudformation stack
+        :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        """
+        self.client.update_stack(**self.get_update_stack_kwargs(stack))
+
+        # Blank it out instead of updating the cache as if it's needed again
+        # the code will automatically populate the describe/stacks cache again.
+        self.invalidate()
+
+    @TIMINGS.timed("wait")
+    def wait_for_change_set(self, change_set_id):
+        """
+        Wait until a change set is created or failed
+        :param change_set_id: str
+        :return: dict: boto3 describe_change_set response
+        """
         while True:
-            resp = self.client.describe_change_set(ChangeSetName=change_set['Id'])
+            resp = self.client.describe_change_set(ChangeSetName=change_set_id)
 
-            if resp['Status'] == 'CREATE_PENDING':
-                time.sleep(5)
+            if resp['Status'] in ['CREATE_PENDING', 'CREATE_IN_PROGRESS']:
+                time.sleep(CHANGE_SET_POLL_INTERVAL)
             else:
-                break
-        
+                return resp
+
+    @staticmethod
+    def is_empty_change_set(change_set):
+        """
+        Check if a change set failed only because it contains no changes
+        :param change_set: dict: boto3 describe_change_set response
+        :return: bool
+        """
+        reason = change_set.get('StatusReason') or ""
+        return change_set['Status'] == "FAILED" and (
+            "didn't contain changes" in reason or "No updates are to be performed" in reason)
+
+    def _describe_stack_change_set(self, change_set):
+        resp = self.wait_for_change_set(change_set['Id'])
+
         if resp['Status'] == "FAILED":
-            print("Changeset failed with reason:", resp["StatusReason"])
+            if self.is_empty_change_set(resp):
+                self.logger.info("Stack changeset {0} contains no changes".format(change_set['Id']))
+            else:
+                # stdout only carries the arns of created change sets, so they can be piped to execute-change-set
+                self.logger.error("Changeset failed with reason: {0}".format(resp["StatusReason"]))
 
-            return False
+            return resp
 
         changset_string = get_pretty_changeset_string(resp['Changes'])
         self.logger.info(
@@ -400,51 +713,31 @@ class CloudFormation(object):
 
         print(change_set['Id'])
 
-        return True
+        return resp
 
-    @with_boto_retry()
     def _create_stack_change_set(self, stack, change_set_type):
-        stack_name = stack.name
+        stack_id = None
 
         if change_set_type == 'UPDATE':
-            stack_name = self.get_stack_description(stack.name)['StackId']
-
-        kwargs = {
-            "StackName": stack_name,
-            "TemplateBody": stack.template.get_template_json(),
-            "Parameters": stack.get_parameters_list(),
-            "Capabilities": [
-                'CAPABILITY_IAM',
-                'CAPABILITY_NAMED_IAM',
-                'CAPABILITY_AUTO_EXPAND'
-            ],
-            "ChangeSetName": stack.name + ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(5)),
-            "ChangeSetType": change_set_type
-        }
-
-        if stack.service_role:
-            kwargs["RoleARN"] = stack.service_role
+            stack_id = self.get_stack_description(stack.name)['StackId']
 
+        kwargs = self.get_change_set_kwargs(stack, change_set_type, stack_id)
 
         resp = self.client.create_change_set(**kwargs)
 
-        if not self._describe_stack_change_set(resp):
+        change_set = self._describe_stack_change_set(resp)
+        if change_set['Status'] == "FAILED":
             self.logger.info("Removing failed changeset {}".format(resp['Id']))
             self.client.delete_change_set(ChangeSetName=resp['Id'])
 
+        return change_set
 
-    @with_boto_retry()
     def _delete_stack(self, stack):
         """
         Delete cloudformation stack
         :param stack: cfn_sphere.aws.cfn.CloudFormationStack
         """
-        kwargs = {
-            "StackName": stack.name
-        }
-
-        if stack.service_role:
-            kwargs["RoleARN"] = stack.service_role
+        kwargs = self.get_delete_stack_kwargs(stack)
 
         self.cached[RESOURCE_ALL_STACKS] = [
             iter_stack
@@ -462,6 +755,13 @@ class CloudFormation(object):
         self.client.delete_stack(**kwargs)
 
     def create_change_set(self, stack, change_set_type):
+        """
+        Create a change set and wait until it is described, failed change sets are deleted
+        :param stack: cfn_sphere.aws.cfn.CloudFormationStack
+        :param change_set_type: str: CREATE or UPDATE
+        :return: dict: boto3 describe_change_set response
+        :raise CfnStackActionFailedException:
+        """
         self.logger.debug("Creating stack changeset: {}".format(stack))
         assert isinstance(stack, CloudFormationStack)
 
@@ -472,27 +772,49 @@ class CloudFormation(object):
                 "Creating stack changeset {0} ({1}) with parameters:\n{2}".format(stack.name,
                                                                                   stack.template.name,
                                                                                   stack_parameters_string))
-            self._create_stack_change_set(stack, change_set_type)
+            return self._create_stack_change_set(stack, change_set_type)
         except (BotoCoreError, ClientError, CfnSphereBotoError) as e:
             raise CfnStackActionFailedException("Could not create change set {0}: {1}".format(stack.name, e))
 
-    @with_boto_retry()
-    def execute_change_set(self, stack, change_set):
+    def _execute_change_set(self, change_set):
+        self.client.execute_change_set(ChangeSetName=change_set)
+
+    def start_change_set_execution(self, change_set):
+        """
+        Execute a change set without waiting for the stack action
+        :param change_set: str: change set arn
+        :raise CfnStackActionFailedException:
+        """
         self.logger.debug("Executing stack changeset: {}".format(change_set))
         try:
-            response = self.client.execute_change_set(ChangeSetName=change_set)
-            self.wait_for_stack_action_to_complete(stack.name, "update", 120)
-            stack_outputs = get_pretty_stack_outputs(self.get_stack_outputs(stack))
-            if stack_outputs:
-                self.logger.info("Update completed for {0} with outputs: \n{1}".format(stack.name, stack_outputs))
-            else:
-                self.logger.info("Update completed for {0}".format(stack.name))
-
+            self._execute_change_set(change_set)
+        except (BotoCoreError, ClientError, CfnSphereBotoError) as e:
+            raise CfnStackActionFailedException("Could not execute {0}: {1}".format(change_set, e))
 
-            # Blank it out instead of updating the cache as if it's needed again
-            # the code will automatically populate the describe/stacks cache again.
-            self.cached = {STACK_DESCRIPTIONS: None, RESOURCE_ALL_STACKS: None}
+    def log_completed_stack_action(self, stack_name, action):
+        # Blank it out instead of updating the cache as if it's needed again
+        # the code will automatically populate the describe/stacks cache again.
+        self.invalidate()
+        stack_outputs = get_pretty_stack_outputs(self.get_stack_description(stack_name).get("Outputs", []))
+        if stack_outputs:
+            self.logger.info("{0} completed for {1} with outputs: \n{2}".format(action.capitalize(), stack_name,
+                                                                                stack_outputs))
+        else:
+            self.logger.info("{0} completed for {1}".format(action.capitalize(), stack_name))
 
+    def execute_change_set(self, stack, change_set, action="update", timeout=600):
+        """
+        Execute a change set and wait until the stack action completed
+        :param stack: stack with a name, like cfn_sphere.aws.cfn.CloudFormationStack
+        :param change_set: str: change set arn
+        :param action: str: create for change sets of new stacks, update otherwise
+        :param timeout: int: seconds the stack action may take
+        :raise CfnStackActionFailedException:
+        """
+        self.start_change_set_execution(change_set)
+        try:
+            self.wait_for_stack_action_to_complete(stack.name, action, timeout)
+            self.log_completed_stack_action(stack.name, action)
         except (BotoCoreError, ClientError, CfnSphereBotoError) as e:
             raise CfnStackActionFailedException("Could not execute {0}: {1}".format(change_set, e))
 
@@ -532,6 +854,10 @@ class CloudFormation(object):
         assert isinstance(stack, CloudFormationStack)
 
         try:
+            if self.stack_is_up_to_date(stack):
+                self.logger.info("Stack {0} does not need an update".format(stack.name))
+                return
+
             stack_parameters_string = get_pretty_parameters_string(stack)
 
             try:
@@ -588,6 +914,7 @@ class CloudFormation(object):
         except (BotoCoreError, ClientError, CfnSphereBotoError) as e:
             raise CfnStackActionFailedException("Could not delete {0}: {1}".format(stack.name, e))
 
+    @TIMINGS.timed("wait")
     def wait_for_stack_action_to_complete(self, stack_name, action, timeout):
         allowed_actions = ["create", "update", "delete"]
         assert action.lower() in allowed_actions, "action argument must be one of {0}".format(allowed_actions)
@@ -642,7 +969,7 @@ class CloudFormation(object):
                     if event:
                         return event
 
-            time.sleep(10)
+            time.sleep(STACK_EVENT_POLL_INTERVAL)
         raise CfnStackActionFailedException(
             "Timeout occurred waiting for '{0}' on stack {1}".format(expected_event_status, stack_name))
 
@@ -702,6 +1029,74 @@ class CloudFormation(object):
             raise CfnSphereBotoError(e)
 
 
+def template_can_be_compared(template_body_dict):
+    """
+    Check if a template always results in the same stack when deployed with the same parameters
+    :param template_body_dict: dict
+    :return: bool
+    """
+    # nested stacks can change behind an unchanged TemplateURL, only UpdateStack picks that up
+    for resource in template_body_dict.get("Resources", {}).values():
+        if isinstance(resource, dict) and resource.get("Type") in NESTED_STACK_RESOURCE_TYPES:
+            return False
+
+    transform = template_body_dict.get("Transform")
+    transforms = transform if isinstance(transform, list) else [transform] if transform else []
+    if any(name not in DETERMINISTIC_TRANSFORMS for name in transforms):
+        return False
+
+    for parameter in template_body_dict.get("Parameters", {}).values():
+        if str(parameter.get("Type", "")).startswith("AWS::SSM::Parameter::Value"):
+            return False
+        if str(parameter.get("NoEcho")).lower() == "true":
+            return False
+
+    template_json = json.dumps(template_body_dict)
+    return "{{resolve:" not in template_json and '"Fn::Transform"' not in template_json
+
+
+def get_effective_parameters(template_body_dict, parameters):
+    """
+    Get the parameter values a stack would be updated with: given values plus defaults of the template
+    :param template_body_dict: dict
+    :param parameters: dict
+    :return: dict or None if a parameter has neither a value nor a default
+    """
+    effective_parameters = {}
+
+    for key, parameter in template_body_dict.get("Parameters", {}).items():
+        if key in parameters:
+            effective_parameters[key] = str(parameters[key])
+        elif "Default" in parameter:
+            effective_parameters[key] = str(parameter["Default"])
+        else:
+            return None
+
+    for key, value in parameters.items():
+        effective_parameters.setdefault(key, str(value))
+
+    return effective_parameters
+
+
+def get_stack_fingerprint(template_body_dict, parameters, tags):
+    """
+    Hash the canonical form of a stacks template, parameters and tags.
+    Empty template sections and the format version, which has a single valid value, are dropped
+    as they don't change the deployed stack.
+    :param template_body_dict: dict
+    :param parameters: dict
+    :param tags: dict
+    :return: str
+    """
+    canonical_template = {key: value for key, value in template_body_dict.items()
+                          if key != "AWSTemplateFormatVersion" and value not in [None, "", {}, []]}
+    canonical_state = {"template": canonical_template, "parameters": parameters, "tags": tags}
+
+    canonical_json = json.dumps(canonical_state, sort_keys=True, separators=(',', ':'))
+
+    return hashlib.sha256(canonical_json.encode('utf-8')).hexdigest()
+
+
 if __name__ == "__main__":
     cfn = CloudFormation()
     cfn.logger.setLevel(logging.DEBUG)
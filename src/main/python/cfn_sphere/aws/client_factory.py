@@ -0,0 +1,127 @@
+import os
+import threading
+
+from cfn_sphere.aws.api_statistics import API_STATISTICS
+from cfn_sphere.aws.rate_limiter import RATE_LIMITER
+from cfn_sphere.timings import TIMINGS
+
+# upper bound of concurrent requests per client: parallel template packaging and multipart uploads
+MAX_POOL_CONNECTIONS = 50
+# botocore's standard retry mode backs off with full jitter and knows all throttling error codes. It is the only retry
+# layer of all clients, every attempt passes the rate limiter, which slows down on throttling errors.
+MAX_ATTEMPTS = 5
+
+
+class ClientFactory(object):
+    """
+    Run wide cache of boto3 clients and resources per service, region and profile, so endpoint resolution,
+    credential lookups and connection pools are shared by all api wrappers.
+    Clients are thread safe and shared between threads, resources are not and are cached per thread.
+    All requests of created clients pass the shared rate limiter, are timed and accounted.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._sessions = {}
+        self._clients = {}
+        self._resources = threading.local()
+
+    def get_session(self, profile=None):
+        """
+        Get the boto3 session of a profile, None for boto3's default session
+        :param profile: str
+        :return: boto3.session.Session
+        """
+        import boto3
+
+        if profile is None:
+            return boto3
+
+        with self._lock:
+            if profile not in self._sessions:
+                from botocore.credentials import JSONFileCache
+
+                session = boto3.session.Session(profile_name=profile)
+                # share cached assume role credentials with the aws cli, like the --profile option does
+                credential_provider = session._session.get_component("credential_provider")
+                credential_provider.get_provider("assume-role").cache = JSONFileCache(
+                    os.path.expanduser(os.path.join("~", ".aws", "cli", "cache")))
+                self._sessions[profile] = session
+            return self._sessions[profile]
+
+    def get_client(self, service, region=None, profile=None):
+        """
+        Get a cached boto3 client
+        :param service: str
+        :param region: str
+        :param profile: str
+        :return: botocore.client.BaseClient
+        """
+        key = (service, region, profile)
+
+        with self._lock:
+            if key not in self._clients:
+                client = self.get_session(profile).client(service, region_name=region, config=self.get_config())
+                RATE_LIMITER.register(client, scope=(region, profile))
+                TIMINGS.register(client)
+                API_STATISTICS.register(client)
+                self._clients[key] = client
+            return self._clients[key]
+
+    def get_resource(self, service, region=None, profile=None):
+        """
+        Get a boto3 resource cached for the current thread
+        :param service: str
+        :param region: str
+        :param profile: str
+        :return: boto3.resources.base.ServiceResource
+        """
+        key = (service, region, profile)
+        resources = self._resources.__dict__.setdefault("resources", {})
+
+        if key not in resources:
+            with self._lock:
+                resource = self.get_session(profile).resource(service, region_name=region, config=self.get_config())
+                RATE_LIMITER.register(resource.meta.client, scope=(region, profile))
+                TIMINGS.register(resource.meta.client)
+                API_STATISTICS.register(resource.meta.client)
+                resources[key] = resource
+        return resources[key]
+
+    def register_client(self, client, service, region=None, profile=None):
+        """
+        Use the given client for a service, region and profile, e.g. a client backed by a botocore Stubber
+        :param client: botocore.client.BaseClient
+        :param service: str
+        :param region: str
+        :param profile: str
+        """
+        with self._lock:
+            self._clients[(service, region, profile)] = client
+
+    def clear(self):
+        with self._lock:
+            self._sessions = {}
+            self._clients = {}
+            self._resources = threading.local()
+
+    @staticmethod
+    def get_config(max_attempts=MAX_ATTEMPTS):
+        """
+        :param max_attempts: int: attempts per request including retries, 1 for callers retrying themselves
+        :return: botocore.config.Config
+        """
+        from botocore.config import Config
+        return Config(max_pool_connections=MAX_POOL_CONNECTIONS,
+                      retries={"mode": "standard", "max_attempts": max_attempts})
+
+
+CLIENT_FACTORY = ClientFactory()
+
+
+def get_client(service, region=None, profile=None):
+    return CLIENT_FACTORY.get_client(service, region, profile)
+
+
+def get_resource(service, region=None, profile=None):
+    return CLIENT_FACTORY.get_resource(service, region, profile)
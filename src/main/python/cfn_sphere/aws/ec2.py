@@ -1,16 +1,22 @@
-import boto3
 from botocore.exceptions import ClientError, BotoCoreError
 
+from cfn_sphere.aws.client_factory import get_client
 from cfn_sphere.exceptions import CfnSphereBotoError
 from cfn_sphere.exceptions import CfnSphereException
-from cfn_sphere.util import with_boto_retry
 
 
 class Ec2Api(object):
-    def __init__(self, region="eu-west-1"):
-        self.client = boto3.client('ec2', region_name=region)
+    def __init__(self, region="eu-west-1", profile=None):
+        self.region = region
+        self.profile = profile
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client('ec2', self.region, self.profile)
+        return self._client
 
-    @with_boto_retry()
     def get_images(self, name_pattern):
         """
         Return list of AMIs matching the given name_pattern
@@ -48,7 +54,6 @@ class Ec2Api(object):
         creation_dates.sort(reverse=True)
         return images[creation_dates[0]]
 
-    @with_boto_retry()
     def get_latest_taupage_image_id(self):
         """
         Return the image id of the most recent private AMI matching the name pattern 'Taupage-AMI-*'
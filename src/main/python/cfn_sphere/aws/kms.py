@@ -1,29 +1,36 @@
 import base64
 
-import boto3
-from boto3.exceptions import Boto3Error
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
 
+from cfn_sphere.aws.client_factory import get_client
 from cfn_sphere.exceptions import CfnSphereBotoError
 
 
 class KMS(object):
-    def __init__(self, region="eu-west-1"):
-        self.client = boto3.client('kms', region_name=region)
+    def __init__(self, region="eu-west-1", profile=None):
+        self.region = region
+        self.profile = profile
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client('kms', self.region, self.profile)
+        return self._client
 
     def decrypt(self, encrypted_value):
         try:
             ciphertext_blob = base64.b64decode(encrypted_value.encode())
             response = self.client.decrypt(CiphertextBlob=ciphertext_blob)
             return response['Plaintext'].decode('utf-8')
-        except Boto3Error as e:
+        except (BotoCoreError, ClientError) as e:
             raise CfnSphereBotoError(e)
 
     def encrypt(self, key_id, cleartext_string):
         try:
             response = self.client.encrypt(KeyId=key_id, Plaintext=cleartext_string)
             return base64.b64encode(response['CiphertextBlob']).decode('utf-8')
-        except (Boto3Error, ClientError) as e:
+        except (BotoCoreError, ClientError) as e:
             raise CfnSphereBotoError(e)
 
 
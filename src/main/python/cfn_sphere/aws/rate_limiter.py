@@ -0,0 +1,216 @@
+import threading
+import time
+from functools import partial
+
+from cfn_sphere.exceptions import THROTTLING_ERROR_CODES, InvalidConfigException
+
+# requests per second by service and api family, CloudFormation limits apply to the whole account
+DEFAULT_RATES = {
+    "cloudformation": {"read": 8, "write": 2},
+    "ssm": {"read": 20, "write": 5},
+    "kms": {"read": 50, "write": 50},
+    "ec2": {"read": 20, "write": 5},
+    "s3": {"read": 100, "write": 100},
+    "iam": {"read": 5, "write": 2},
+    "sts": {"read": 10, "write": 10}
+}
+DEFAULT_RATE = 10
+API_FAMILIES = ["read", "write"]
+READ_OPERATION_PREFIXES = ("Describe", "List", "Get", "Head", "Validate", "Estimate")
+
+# rates are halved on throttling errors and recover by this share of the configured rate per successful call
+RATE_RECOVERY_STEP = 0.05
+MINIMUM_RATE = 0.5
+# request context key of the time a call's last attempt completed, to measure botocore's retry delays
+ATTEMPT_COMPLETED_KEY = "cfn_sphere_attempt_completed"
+
+
+def get_api_family(operation_name):
+    """
+    Classify an operation as read or write operation
+    :param operation_name: str: e.g. DescribeStacks
+    :return: str
+    """
+    if operation_name.startswith(READ_OPERATION_PREFIXES):
+        return "read"
+    return "write"
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket allowing bursts of up to one second worth of requests.
+    Callers reserve a token and sleep until it becomes available, so waiting callers are served in order.
+    """
+
+    def __init__(self, rate):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token without waiting for it
+        :return: float: seconds until the token is available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self):
+        """
+        Take a token, blocking until it is available
+        :return: float: seconds waited
+        """
+        wait_time = self.reserve()
+        if wait_time:
+            time.sleep(wait_time)
+        return wait_time
+
+    def decrease_rate(self):
+        with self._lock:
+            self.rate = max(MINIMUM_RATE, self.rate / 2)
+
+    def increase_rate(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY_STEP)
+
+
+class RateLimiter(object):
+    """
+    Client side rate limits shared by all threads and clients, with one token bucket per scope, service and api
+    family. Scopes separate accounts and regions, which AWS limits independently.
+    Buckets adapt to throttling errors: their rate is halved on throttling and slowly recovers on success.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rates = {}
+        self._buckets = {}
+        self.waited_seconds = 0.0
+        self.backoff_seconds = 0.0
+        self.throttling_errors = 0
+
+    def configure(self, rates):
+        """
+        Override default rates
+        :param rates: dict: requests per second by "service" or "service.family", e.g. {"cloudformation.read": 5}
+        :raise InvalidConfigException: for invalid keys or rates
+        """
+        parsed_rates = {}
+
+        for key, rate in (rates or {}).items():
+            service, _, family = str(key).lower().partition(".")
+            if family and family not in API_FAMILIES:
+                raise InvalidConfigException(
+                    "Invalid api rate limit {0}, family must be one of {1}".format(key, ", ".join(API_FAMILIES)))
+            if isinstance(rate, bool) or not isinstance(rate, (int, float)) or rate <= 0:
+                raise InvalidConfigException("Invalid api rate limit {0}, rate must be a positive number".format(key))
+
+            for api_family in [family] if family else API_FAMILIES:
+                parsed_rates[(service, api_family)] = rate
+
+        with self._lock:
+            # handlers of concurrent targets configure the same rates, keep their adapted buckets
+            if parsed_rates != self._rates:
+                self._rates = parsed_rates
+                self._buckets = {}
+
+    def get_rate(self, service, family):
+        if (service, family) in self._rates:
+            return self._rates[(service, family)]
+        return DEFAULT_RATES.get(service, {}).get(family, DEFAULT_RATE)
+
+    def get_bucket(self, service, operation_name, scope=None):
+        family = get_api_family(operation_name)
+        key = (scope, service, family)
+
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.get_rate(service, family))
+            return self._buckets[key]
+
+    def acquire(self, service, operation_name, scope=None):
+        wait_time = self.get_bucket(service, operation_name, scope).acquire()
+        if wait_time:
+            with self._lock:
+                self.waited_seconds += wait_time
+
+    def reserve(self, service, operation_name, scope=None):
+        """
+        Take a token for callers which wait on their own, e.g. in an event loop
+        :return: float: seconds the caller has to wait before sending its request
+        """
+        wait_time = self.get_bucket(service, operation_name, scope).reserve()
+        if wait_time:
+            with self._lock:
+                self.waited_seconds += wait_time
+        return wait_time
+
+    def record_response(self, service, operation_name, error_code, scope=None):
+        bucket = self.get_bucket(service, operation_name, scope)
+
+        if error_code in THROTTLING_ERROR_CODES:
+            bucket.decrease_rate()
+            with self._lock:
+                self.throttling_errors += 1
+        elif not error_code:
+            bucket.increase_rate()
+
+    def record_backoff(self, seconds):
+        with self._lock:
+            self.backoff_seconds += seconds
+
+    def get_statistics(self):
+        """
+        Get the time spent throttled
+        :return: dict
+        """
+        with self._lock:
+            return {"waited_seconds": round(self.waited_seconds, 3),
+                    "backoff_seconds": round(self.backoff_seconds, 3),
+                    "throttling_errors": self.throttling_errors}
+
+    def reset_statistics(self):
+        with self._lock:
+            self.waited_seconds = 0.0
+            self.backoff_seconds = 0.0
+            self.throttling_errors = 0
+
+    def register(self, client, scope=None):
+        """
+        Rate limit every http request of a botocore client, including retries, adapt to its responses and count the
+        time botocore backs off before retries
+        :param client: botocore.client.BaseClient
+        :param scope: hashable: clients of the same scope share buckets, e.g. (region, profile)
+        """
+        client.meta.events.register("request-created", self._request_created)
+        client.meta.events.register("before-send", partial(self._before_send, scope=scope))
+        client.meta.events.register("needs-retry", partial(self._needs_retry, scope=scope))
+
+    def _request_created(self, event_name, request=None, **kwargs):
+        # requests of retries are created right after botocore's backoff
+        attempt_completed = getattr(request, "context", {}).pop(ATTEMPT_COMPLETED_KEY, None)
+        if attempt_completed is not None:
+            self.record_backoff(time.monotonic() - attempt_completed)
+
+    def _before_send(self, event_name, scope=None, **kwargs):
+        _, service, operation_name = event_name.split(".", 2)
+        self.acquire(service, operation_name, scope)
+
+    def _needs_retry(self, event_name, response=None, scope=None, request_dict=None, **kwargs):
+        if request_dict is not None:
+            request_dict["context"][ATTEMPT_COMPLETED_KEY] = time.monotonic()
+        if response is None:
+            return
+        _, service, operation_name = event_name.split(".", 2)
+        error_code = response[1].get("Error", {}).get("Code")
+        self.record_response(service, operation_name, error_code, scope)
+
+
+RATE_LIMITER = RateLimiter()
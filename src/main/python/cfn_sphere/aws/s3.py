@@ -1,15 +1,31 @@
-import boto3
-from boto3.exceptions import Boto3Error
 from botocore.exceptions import BotoCoreError, ClientError
 from six.moves.urllib.parse import urlparse
 
+from cfn_sphere.aws.client_factory import get_client, get_resource
 from cfn_sphere.exceptions import CfnSphereBotoError
-from cfn_sphere.util import with_boto_retry
+
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MAX_UPLOAD_CONCURRENCY = 10
 
 
 class S3(object):
-    def __init__(self):
-        self.s3 = boto3.resource('s3')
+    def __init__(self, region=None, profile=None):
+        self.region = region
+        self.profile = profile
+        self._s3 = None
+        self._client = None
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            self._s3 = get_resource('s3', self.region, self.profile)
+        return self._s3
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client('s3', self.region, self.profile)
+        return self._client
 
     @staticmethod
     def _parse_url(url):
@@ -19,11 +35,59 @@ class S3(object):
         key = url_components.path.strip('/')
         return protocol, bucket_name, key
 
-    @with_boto_retry()
     def get_contents_from_url(self, url):
         try:
             (_, bucket_name, key_name) = self._parse_url(url)
             s3_object = self.s3.Object(bucket_name, key_name)
             return s3_object.get(ResponseContentEncoding='utf-8')["Body"].read().decode('utf-8')
-        except (Boto3Error, BotoCoreError, ClientError) as e:
+        except (BotoCoreError, ClientError) as e:
+            raise CfnSphereBotoError(e)
+
+    def object_exists(self, bucket_name, key_name):
+        """
+        Check if an object exists without downloading it
+        :param bucket_name: str
+        :param key_name: str
+        :return: bool
+        :raise CfnSphereBotoError:
+        """
+        try:
+            self.client.head_object(Bucket=bucket_name, Key=key_name)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ["404", "NoSuchKey", "NotFound"]:
+                return False
+            raise CfnSphereBotoError(e)
+        except BotoCoreError as e:
+            raise CfnSphereBotoError(e)
+
+    def upload_file(self, file_path, bucket_name, key_name):
+        """
+        Upload a local file, using concurrent multipart uploads for large files
+        :param file_path: str
+        :param bucket_name: str
+        :param key_name: str
+        :raise CfnSphereBotoError:
+        """
+        from boto3.exceptions import S3UploadFailedError
+        from boto3.s3.transfer import TransferConfig
+
+        transfer_config = TransferConfig(multipart_threshold=MULTIPART_THRESHOLD,
+                                         max_concurrency=MAX_UPLOAD_CONCURRENCY)
+        try:
+            self.client.upload_file(file_path, bucket_name, key_name, Config=transfer_config)
+        except (S3UploadFailedError, BotoCoreError, ClientError) as e:
+            raise CfnSphereBotoError(e)
+
+    def put_object(self, bucket_name, key_name, body):
+        """
+        Upload a string as object
+        :param bucket_name: str
+        :param key_name: str
+        :param body: str
+        :raise CfnSphereBotoError:
+        """
+        try:
+            self.client.put_object(Bucket=bucket_name, Key=key_name, Body=body.encode('utf-8'))
+        except (BotoCoreError, ClientError) as e:
             raise CfnSphereBotoError(e)
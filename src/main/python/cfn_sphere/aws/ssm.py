@@ -1,17 +1,24 @@
-import boto3
-from boto3.exceptions import Boto3Error
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
+from cfn_sphere.aws.client_factory import get_client
 from cfn_sphere.exceptions import CfnSphereBotoError, CfnSphereException
 
 class SSM(object):
     
-    def __init__(self, region='eu-west-1'):
-        self.client = boto3.client('ssm', region_name=region)
+    def __init__(self, region='eu-west-1', profile=None):
+        self.region = region
+        self.profile = profile
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client('ssm', self.region, self.profile)
+        return self._client
 
     def get_parameter(self, name, with_decryption=True):
         try:
             return self.client.get_parameter(Name=name, WithDecryption=with_decryption)['Parameter']['Value']
-        except (Boto3Error, ClientError) as e:
+        except (BotoCoreError, ClientError) as e:
             raise CfnSphereBotoError(e)
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+
+from cfn_sphere.aws import cfn as cfn_module
+from cfn_sphere.exceptions import CfnStackActionFailedException
+from cfn_sphere.util import get_logger
+
+# seconds a stack action may take to emit its first event
+START_TIMEOUT = 120
+
+
+class WatchedStack(object):
+    def __init__(self, stack_name, action, valid_from, timeout):
+        self.stack_name = stack_name
+        self.action = action
+        self.timeout = timeout
+        self.expected_status = action.upper() + "_IN_PROGRESS"
+        self.valid_from = valid_from
+        self.deadline = time.time() + START_TIMEOUT
+        self.seen_event_ids = set()
+        self.started = None
+        self.future = Future()
+
+    def handle_started(self, event):
+        self.started = event
+        self.expected_status = self.action.upper() + "_COMPLETE"
+        self.valid_from = event["Timestamp"]
+        self.deadline = time.time() + self.timeout
+
+
+class StackEventWatcher(object):
+    """
+    Waits for the actions of many stacks from a single thread. Every poll round reads the recent events of all
+    watched stacks, so any number of concurrent stack actions cost one waiting thread and one poll interval.
+    Events are handled like CloudFormation.wait_for_stack_action_to_complete handles them.
+    """
+
+    def __init__(self, cfn):
+        """
+        :param cfn: CloudFormation
+        """
+        self.logger = get_logger()
+        self.cfn = cfn
+        self._watched = []
+        self._lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._clock_offset = None
+
+    def get_server_time(self):
+        # the AWS server time is fetched once, later calls apply its offset to the local clock
+        if self._clock_offset is None:
+            self._clock_offset = cfn_module.get_cfn_api_server_time() - datetime.now(timezone.utc)
+        return datetime.now(timezone.utc) + self._clock_offset
+
+    def watch(self, stack_name, action, timeout):
+        """
+        Watch a stack action started just now
+        :param stack_name: str
+        :param action: str: create, update or delete
+        :param timeout: int: seconds the stack action may take after it started
+        :return: Future: resolves to the completion event, fails with CfnStackActionFailedException
+        """
+        watched_stack = WatchedStack(stack_name, action, self.get_server_time() - timedelta(seconds=10), timeout)
+
+        with self._lock:
+            if self._stopped:
+                raise CfnStackActionFailedException("Stack event watcher is stopped")
+            self._watched.append(watched_stack)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="stack-event-watcher", daemon=True)
+                self._thread.start()
+
+        self._wake_up.set()
+        return watched_stack.future
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            watched = list(self._watched)
+        for watched_stack in watched:
+            watched_stack.future.cancel()
+        self._wake_up.set()
+
+    def run(self):
+        while True:
+            with self._lock:
+                if self._stopped:
+                    return
+                watched = list(self._watched)
+
+            for watched_stack in watched:
+                if watched_stack.future.cancelled():
+                    continue
+
+                try:
+                    event = self.poll(watched_stack)
+                except Exception as e:
+                    self.finish(watched_stack)
+                    watched_stack.future.set_exception(e)
+                    continue
+
+                if event:
+                    elapsed = event["Timestamp"] - watched_stack.started["Timestamp"]
+                    self.logger.info("Stack {0} of {1} completed after {2}s".format(
+                        watched_stack.action, watched_stack.stack_name, elapsed.seconds))
+                    self.finish(watched_stack)
+                    watched_stack.future.set_result(event)
+
+            self._wake_up.wait(cfn_module.STACK_EVENT_POLL_INTERVAL)
+            self._wake_up.clear()
+
+    def finish(self, watched_stack):
+        with self._lock:
+            self._watched.remove(watched_stack)
+
+    def poll(self, watched_stack):
+        """
+        Handle the new events of a watched stack
+        :param watched_stack: WatchedStack
+        :return: dict: completion event, None while the action is in progress
+        :raise CfnStackActionFailedException: if the action failed or timed out
+        """
+        events = self.cfn.get_stack_events(watched_stack.stack_name)
+        events.reverse()
+
+        for event in events:
+            if event["EventId"] in watched_stack.seen_event_ids:
+                continue
+            watched_stack.seen_event_ids.add(event["EventId"])
+
+            event = self.cfn.handle_stack_event(event, watched_stack.valid_from, watched_stack.expected_status,
+                                                watched_stack.stack_name)
+            if event and watched_stack.started is None:
+                self.logger.info("Stack {0} of {1} started".format(watched_stack.action, watched_stack.stack_name))
+                watched_stack.handle_started(event)
+            elif event:
+                return event
+
+        if time.time() > watched_stack.deadline:
+            raise CfnStackActionFailedException("Timeout occurred waiting for '{0}' on stack {1}".format(
+                watched_stack.expected_status, watched_stack.stack_name))
+        return None
@@ -1,22 +1,30 @@
 # Modifications copyright (C) 2017 KCOM
 import logging
 import sys
-import boto3
-import botocore.session
 import click
 import os.path
 import re
-from botocore.credentials import JSONFileCache
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 from botocore.exceptions import ClientError, BotoCoreError
 
-from cfn_sphere import StackActionHandler
+from cfn_sphere import StackActionHandler, DEFAULT_CHANGE_SET_TIMEOUT
 from cfn_sphere import __version__
+from cfn_sphere.aws.api_statistics import API_STATISTICS
 from cfn_sphere.aws.cfn import CloudFormation
+from cfn_sphere.aws.client_factory import get_client
 from cfn_sphere.aws.kms import KMS
 from cfn_sphere.exceptions import CfnSphereException
+from cfn_sphere.fan_out import FanOut
 from cfn_sphere.file_loader import FileLoader
+from cfn_sphere.profiling import Profiler, PROFILE_MODES
 from cfn_sphere.stack_configuration import Config
+from cfn_sphere.stack_configuration.config_cache import CONFIG_CACHE, get_default_cache_directory
+from cfn_sphere.stack_configuration.stack_selector import StackSelector
+from cfn_sphere.stack_configuration.workspace import Workspace, DEFAULT_CONFIG_PATTERN
+from cfn_sphere.sync_state import SyncState
 from cfn_sphere.template.transformer import CloudFormationTemplateTransformer
+from cfn_sphere.timings import TIMINGS
 from cfn_sphere.util import convert_file, get_logger, get_latest_version
 
 LOGGER = get_logger(root=True)
@@ -24,9 +32,9 @@ LOGGER = get_logger(root=True)
 
 def get_first_account_alias_or_account_id():
     try:
-        return boto3.client('iam').list_account_aliases()["AccountAliases"][0]
+        return get_client('iam').list_account_aliases()["AccountAliases"][0]
     except IndexError:
-        return boto3.client('sts').get_caller_identity()["Arn"].split(":")[4]
+        return get_client('sts').get_caller_identity()["Arn"].split(":")[4]
     except (BotoCoreError, ClientError) as e:
         LOGGER.error(e)
         sys.exit(1)
@@ -37,6 +45,76 @@ def get_first_account_alias_or_account_id():
         sys.exit(1)
 
 
+def get_first_account_alias_or_account_id_in_background():
+    """
+    Start the account alias lookup in a background thread so it overlaps with config parsing
+    :return: concurrent.futures.Future
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(get_first_account_alias_or_account_id)
+    executor.shutdown(wait=False)
+    return future
+
+
+def get_stack_action_runner(config, dry_run=False, sync_state=None, use_asyncio=False):
+    """
+    Get a StackActionHandler for configs with a single region and profile, a FanOut running all targets otherwise
+    :param config: Config
+    :param dry_run: bool
+    :param sync_state: SyncState: for incremental syncs
+    :param use_asyncio: bool: drive stacks from an asyncio event loop with AsyncStackActionHandler
+    :return: StackActionHandler or FanOut
+    """
+    if use_asyncio:
+        from cfn_sphere.async_stack_action_handler import AsyncStackActionHandler as handler_class
+    else:
+        handler_class = StackActionHandler
+
+    if len(config.get_targets()) > 1:
+        return FanOut(config, dry_run, sync_state=sync_state, handler_class=handler_class)
+    return handler_class(config, dry_run, sync_state=sync_state)
+
+
+def get_stack_selector(stack_names, tags, include_dependents):
+    """
+    :param stack_names: tuple(str)
+    :param tags: tuple(str): key=value pairs
+    :param include_dependents: bool
+    :return: StackSelector: None to process all stacks
+    """
+    if not stack_names and not tags:
+        return None
+    return StackSelector(stack_names, tags, include_dependents)
+
+
+def get_sync_state(incremental, state_file, default_state_file):
+    """
+    :param incremental: bool
+    :param state_file: str: None for the default state file
+    :param default_state_file: str
+    :return: SyncState: None for full syncs
+    """
+    if not incremental:
+        return None
+
+    state_file = state_file or default_state_file
+    LOGGER.info("Deploying changed stacks only, comparing with {0}".format(state_file))
+    return SyncState(state_file)
+
+
+def get_destination(config, account):
+    """
+    Describe where an action modifies infrastructure for the confirm dialog
+    :param config: Config
+    :param account: Future(str): account alias or id of the default profile
+    :return: str
+    """
+    targets = config.get_targets()
+    if len(targets) > 1:
+        return "targets: {0}".format(", ".join(target.target_name for target in targets))
+    return "account: {0}".format(account.result())
+
+
 def check_update_available():
     latest_version = get_latest_version()
     if latest_version and __version__ != latest_version:
@@ -46,11 +124,66 @@ def check_update_available():
             "Do you want to continue?".format(latest_version), abort=True)
 
 
+def reported_command(function):
+    """
+    Time a command as run span and log the timing and api call summaries afterwards,
+    optionally exporting all spans as json
+    """
+
+    @click.option('--timings-json', default=None, envvar='CFN_SPHERE_TIMINGS_JSON', type=click.Path(dir_okay=False),
+                  help="Write timings of all phases, stacks and api calls to a json file")
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        timings_json = kwargs.pop('timings_json')
+        try:
+            with TIMINGS.span(function.__name__, "run"):
+                return function(*args, **kwargs)
+        finally:
+            log_timings(timings_json)
+            log_api_statistics()
+
+    return wrapper
+
+
+def log_timings(timings_json=None):
+    summary = "Timings:\n{0}".format(TIMINGS.get_summary_table())
+    if timings_json:
+        LOGGER.info(summary)
+        try:
+            TIMINGS.write_json(timings_json)
+        except (IOError, OSError) as e:
+            LOGGER.error("Could not write timings to {0}: {1}".format(timings_json, e))
+    else:
+        LOGGER.debug(summary)
+
+
+def log_api_statistics():
+    statistics = API_STATISTICS.to_dict()
+    if statistics["calls"]:
+        LOGGER.info("Made {0} AWS api calls with {1} retries and {2} throttling errors:\n{3}".format(
+            statistics["calls"], statistics["retries"], statistics["throttles"], API_STATISTICS.get_summary_table()))
+
+
 @click.group(help="This tool manages AWS CloudFormation templates "
                   "and stacks by providing an application scope and useful tooling.")
 @click.version_option(version=__version__)
-def cli():
-    pass
+@click.option('--profile-out', default=None, envvar='CFN_SPHERE_PROFILE_OUT', type=click.Path(dir_okay=False),
+              help="Profile the command, writing <path>.pstats and <path>.collapsed (flamegraph input)")
+@click.option('--profile-mode', default='deterministic', type=click.Choice(PROFILE_MODES),
+              help="deterministic: cProfile of the main thread, sampling: stack samples of all threads")
+@click.option('--config-cache-dir', default=get_default_cache_directory, envvar='CFN_SPHERE_CONFIG_CACHE_DIR',
+              type=click.Path(file_okay=False), help="Directory of compiled configs, reused while their files are "
+                                                     "unchanged")
+@click.option('--no-config-cache', is_flag=True, default=False, envvar='CFN_SPHERE_NO_CONFIG_CACHE',
+              help="Always compile configs from their files")
+@click.pass_context
+def cli(ctx, profile_out, profile_mode, config_cache_dir, no_config_cache):
+    CONFIG_CACHE.configure(None if no_config_cache else config_cache_dir)
+
+    if profile_out:
+        profiler = Profiler(profile_out, profile_mode)
+        profiler.start()
+        ctx.call_on_close(profiler.stop)
 
 @cli.command(help="create change set")
 @click.argument('config', type=click.Path(exists=True))
@@ -67,25 +200,40 @@ def cli():
               help="Override user confirm dialog with yes (alias for -c/--confirm")
 @click.option('--dry_run', '-n', is_flag=True, default=False, envvar='CFN_SPHERE_DRY_RUN',
               help="Dry run.")
-def create_change_set(config, profile, parameter, debug, confirm, yes, context, dry_run):
+@click.option('--stack', 'stack_names', default=None, type=click.STRING, multiple=True,
+              help="Process only this stack, can be given multiple times")
+@click.option('--tag', 'tags', default=None, type=click.STRING, multiple=True,
+              help="Process only stacks with this tag, eg: --tag team=payments")
+@click.option('--with-dependents', is_flag=True, default=False,
+              help="Also process stacks referencing outputs of selected stacks")
+@reported_command
+def create_change_set(config, profile, parameter, debug, confirm, yes, context, dry_run, stack_names, tags,
+                      with_dependents):
     _set_profile(profile)
 
     confirm = confirm or yes
     if debug:
         LOGGER.setLevel(logging.DEBUG)
-        boto3.set_stream_logger(name='boto3', level=logging.DEBUG)
-        boto3.set_stream_logger(name='botocore', level=logging.DEBUG)
+        _enable_boto_debug_logging()
     else:
         LOGGER.setLevel(logging.INFO)
 
     if not confirm:
-        check_update_available()
-        click.confirm('This action will modify AWS infrastructure in account: {0}\nAre you sure?'.format(
-            get_first_account_alias_or_account_id()), abort=True)
+        account = get_first_account_alias_or_account_id_in_background()
 
     try:
-        config = Config(config_file=config, cli_params=parameter, transform_context=context)
-        StackActionHandler(config, dry_run).create_change_set()
+        config = Config(config_file=config, cli_params=parameter, transform_context=context,
+                        stack_selector=get_stack_selector(stack_names, tags, with_dependents))
+        stack_action_handler = get_stack_action_runner(config, dry_run)
+
+        if not confirm:
+            check_update_available()
+            click.confirm('This action will modify AWS infrastructure in {0}\nAre you sure?'.format(
+                get_destination(config, account)), abort=True)
+
+        stack_action_handler.create_change_set()
+    except click.Abort:
+        raise
     except CfnSphereException as e:
         LOGGER.error(e)
         if debug:
@@ -97,8 +245,56 @@ def create_change_set(config, profile, parameter, debug, confirm, yes, context,
         LOGGER.info("Please report at https://github.com/KCOM-Enterprise/cfn-square/issues!")
         sys.exit(1)
 
-@cli.command(help="execute change set")
-@click.argument('change_set')
+def read_change_set_arns(change_sets, change_set_file=None):
+    """
+    :param change_sets: tuple(str): change set arns
+    :param change_set_file: file: one change set arn per line as printed by create-change-set, # starts comments
+    :return: list(str): change set arns without duplicates
+    """
+    arns = list(change_sets)
+    if change_set_file:
+        for line in change_set_file:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                arns.append(line)
+
+    if not arns:
+        raise CfnSphereException("No change sets given, pass change set arns or --change-set-file")
+    return list(dict.fromkeys(arns))
+
+
+def get_change_set_region(change_sets, default_region):
+    """
+    :param change_sets: list(str): change set names or arns
+    :param default_region: str: region of change sets given by name
+    :return: str
+    :raise CfnSphereException: if the arns span several regions
+    """
+    regions = set()
+    for change_set in change_sets:
+        matched = re.match(r'arn:aws:cloudformation:([^:]+):.*', change_set)
+        if matched:
+            regions.add(matched.group(1))
+
+    if len(regions) > 1:
+        raise CfnSphereException("Change sets must be in one region, got {0}".format(", ".join(sorted(regions))))
+    if regions:
+        region = regions.pop()
+        LOGGER.info('ARN detected, setting region to {}'.format(region))
+        return region
+    return default_region
+
+
+@cli.command(help="execute change sets")
+@click.argument('change_sets', nargs=-1)
+@click.option('--change-set-file', '-f', default=None, type=click.File('r'),
+              help="File with one change set ARN per line as printed by create-change-set, - for stdin")
+@click.option('--config', 'config_file', default=None, type=click.Path(exists=True),
+              help="Stack config, change sets of its stacks are executed in dependency order with their timeouts")
+@click.option('--context', '-t', default=None, envvar='CFN_SPHERE_TRANSFORM_CONTEXT', type=click.STRING, multiple=False,
+              help="transform context yaml")
+@click.option('--timeout', default=DEFAULT_CHANGE_SET_TIMEOUT, type=click.INT,
+              help="Seconds each change set execution may take, unless the config sets a timeout for its stack")
 @click.option('--profile', default=None, envvar='AWS_PROFILE', type=click.STRING,
               help='Use a specific profile from your credential file')
 @click.option('--debug', '-d', is_flag=True, default=False, envvar='CFN_SPHERE_DEBUG', help="Debug output")
@@ -107,32 +303,40 @@ def create_change_set(config, profile, parameter, debug, confirm, yes, context,
 @click.option('--yes', '-y', is_flag=True, default=False, envvar='CFN_SPHERE_CONFIRM',
               help="Override user confirm dialog with yes (alias for -c/--confirm")
 @click.option('--region', '-r', default='eu-west-1', type=click.STRING, help="Change set region")
-def execute_change_set(change_set, profile, debug, confirm, yes, region):
+@reported_command
+def execute_change_set(change_sets, change_set_file, config_file, context, timeout, profile, debug, confirm, yes,
+                       region):
     _set_profile(profile)
 
     confirm = confirm or yes
     if debug:
         LOGGER.setLevel(logging.DEBUG)
-        boto3.set_stream_logger(name='boto3', level=logging.DEBUG)
-        boto3.set_stream_logger(name='botocore', level=logging.DEBUG)
+        _enable_boto_debug_logging()
     else:
         LOGGER.setLevel(logging.INFO)
 
     if not confirm:
-        check_update_available()
-        click.confirm('This action will modify AWS infrastructure in account: {0}\nAre you sure?'.format(
-            get_first_account_alias_or_account_id()), abort=True)
+        account = get_first_account_alias_or_account_id_in_background()
 
     try:
-        matched = re.match(r'arn:aws:cloudformation:([^:]+):.*', change_set)
-
-        if matched:
-            LOGGER.info('ARN detected, setting region to {}'.format(matched.group(1)))
-            region = matched.group(1)
-
-        config_dict = {'change_set': change_set, 'region': str(region)}
-        config = Config(config_dict=config_dict)
-        StackActionHandler(config).execute_change_set()
+        change_sets = read_change_set_arns(change_sets, change_set_file)
+        region = get_change_set_region(change_sets, region)
+
+        if config_file:
+            config = Config(config_file=config_file, transform_context=context)
+            config = config.for_target(region, profile if profile in config.profiles else config.profile)
+        else:
+            config = Config(config_dict={'region': str(region)})
+        stack_action_handler = StackActionHandler(config)
+
+        if not confirm:
+            check_update_available()
+            click.confirm('This action will modify AWS infrastructure in account: {0}\nAre you sure?'.format(
+                account.result()), abort=True)
+
+        stack_action_handler.execute_change_sets(change_sets, timeout)
+    except click.Abort:
+        raise
     except CfnSphereException as e:
         LOGGER.error(e)
         if debug:
@@ -160,27 +364,130 @@ def execute_change_set(change_set, profile, debug, confirm, yes, region):
               help="Override user confirm dialog with yes (alias for -c/--confirm")
 @click.option('--dry_run', '-n', is_flag=True, default=False, envvar='CFN_SPHERE_DRY_RUN',
               help="Dry run.")
-def sync(config, profile, parameter, debug, confirm, yes, context, dry_run):
+@click.option('--incremental', '-i', is_flag=True, default=False, envvar='CFN_SPHERE_INCREMENTAL',
+              help="Deploy only stacks whose inputs changed since the last sync, and their dependents")
+@click.option('--state-file', default=None, envvar='CFN_SPHERE_STATE_FILE', type=click.Path(dir_okay=False),
+              help="State of incremental syncs, defaults to <config>.state.json")
+@click.option('--stack', 'stack_names', default=None, type=click.STRING, multiple=True,
+              help="Process only this stack, can be given multiple times")
+@click.option('--tag', 'tags', default=None, type=click.STRING, multiple=True,
+              help="Process only stacks with this tag, eg: --tag team=payments")
+@click.option('--with-dependents', is_flag=True, default=False,
+              help="Also process stacks referencing outputs of selected stacks")
+@click.option('--via-change-sets', is_flag=True, default=False, envvar='CFN_SPHERE_VIA_CHANGE_SETS',
+              help="Deploy through change sets, created and executed as soon as upstream stacks are deployed")
+@click.option('--asyncio', 'use_asyncio', is_flag=True, default=False, envvar='CFN_SPHERE_ASYNCIO',
+              help="Drive all stacks from one asyncio event loop, requires aiobotocore")
+@reported_command
+def sync(config, profile, parameter, debug, confirm, yes, context, dry_run, incremental, state_file, stack_names, tags,
+         with_dependents, via_change_sets, use_asyncio):
     _set_profile(profile)
 
     confirm = confirm or yes or dry_run
 
     if debug:
         LOGGER.setLevel(logging.DEBUG)
-        boto3.set_stream_logger(name='boto3', level=logging.DEBUG)
-        boto3.set_stream_logger(name='botocore', level=logging.DEBUG)
+        _enable_boto_debug_logging()
     else:
         LOGGER.setLevel(logging.INFO)
 
     if not confirm:
-        check_update_available()
-        click.confirm('This action will modify AWS infrastructure in account: {0}\nAre you sure?'.format(
-            get_first_account_alias_or_account_id()), abort=True)
+        account = get_first_account_alias_or_account_id_in_background()
 
     try:
+        config_file = config
+        config = Config(config_file=config_file, cli_params=parameter, transform_context=context,
+                        stack_selector=get_stack_selector(stack_names, tags, with_dependents))
+        sync_state = get_sync_state(incremental, state_file, os.path.splitext(config_file)[0] + ".state.json")
+        stack_action_handler = get_stack_action_runner(config, dry_run, sync_state, use_asyncio)
+
+        if not confirm:
+            check_update_available()
+            click.confirm('This action will modify AWS infrastructure in {0}\nAre you sure?'.format(
+                get_destination(config, account)), abort=True)
+
+        if via_change_sets:
+            stack_action_handler.sync_via_change_sets()
+        else:
+            stack_action_handler.create_or_update_stacks()
+    except click.Abort:
+        raise
+    except CfnSphereException as e:
+        LOGGER.error(e)
+        if debug:
+            LOGGER.exception(e)
+        sys.exit(1)
+    except Exception as e:
+        LOGGER.error("Failed with unexpected error")
+        LOGGER.exception(e)
+        LOGGER.info("Please report at https://github.com/KCOM-Enterprise/cfn-square/issues!")
+        sys.exit(1)
+
 
-        config = Config(config_file=config, cli_params=parameter, transform_context=context)
-        StackActionHandler(config, dry_run).create_or_update_stacks()
+@cli.command(help="Sync all stack configs of a directory as one dependency graph")
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--pattern', default=DEFAULT_CONFIG_PATTERN, envvar='CFN_SPHERE_WORKSPACE_PATTERN', type=click.STRING,
+              help="File name pattern of the stack configs")
+@click.option('--profile', default=None, envvar='AWS_PROFILE', type=click.STRING,
+              help='Use a specific profile from your credential file')
+@click.option('--parameter', '-p', default=None, envvar='CFN_SPHERE_PARAMETERS', type=click.STRING, multiple=True,
+              help="Stack parameter to overwrite, eg: --parameter stack1.p1=v1")
+@click.option('--context', '-t', default=None, envvar='CFN_SPHERE_TRANSFORM_CONTEXT', type=click.STRING, multiple=False,
+              help="transform context yaml")
+@click.option('--debug', '-d', is_flag=True, default=False, envvar='CFN_SPHERE_DEBUG', help="Debug output")
+@click.option('--confirm', '-c', is_flag=True, default=False, envvar='CFN_SPHERE_CONFIRM',
+              help="Override user confirm dialog with yes")
+@click.option('--yes', '-y', is_flag=True, default=False, envvar='CFN_SPHERE_CONFIRM',
+              help="Override user confirm dialog with yes (alias for -c/--confirm")
+@click.option('--dry_run', '-n', is_flag=True, default=False, envvar='CFN_SPHERE_DRY_RUN',
+              help="Dry run.")
+@click.option('--incremental', '-i', is_flag=True, default=False, envvar='CFN_SPHERE_INCREMENTAL',
+              help="Deploy only stacks whose inputs changed since the last sync, and their dependents")
+@click.option('--state-file', default=None, envvar='CFN_SPHERE_STATE_FILE', type=click.Path(dir_okay=False),
+              help="State of incremental syncs, defaults to .cfn-square-state.json in the directory")
+@click.option('--stack', 'stack_names', default=None, type=click.STRING, multiple=True,
+              help="Process only this stack, can be given multiple times")
+@click.option('--tag', 'tags', default=None, type=click.STRING, multiple=True,
+              help="Process only stacks with this tag, eg: --tag team=payments")
+@click.option('--with-dependents', is_flag=True, default=False,
+              help="Also process stacks referencing outputs of selected stacks")
+@click.option('--via-change-sets', is_flag=True, default=False, envvar='CFN_SPHERE_VIA_CHANGE_SETS',
+              help="Deploy through change sets, created and executed as soon as upstream stacks are deployed")
+@click.option('--asyncio', 'use_asyncio', is_flag=True, default=False, envvar='CFN_SPHERE_ASYNCIO',
+              help="Drive all stacks from one asyncio event loop, requires aiobotocore")
+@reported_command
+def workspace(directory, pattern, profile, parameter, debug, confirm, yes, context, dry_run, incremental,
+              state_file, stack_names, tags, with_dependents, via_change_sets, use_asyncio):
+    _set_profile(profile)
+
+    confirm = confirm or yes or dry_run
+
+    if debug:
+        LOGGER.setLevel(logging.DEBUG)
+        _enable_boto_debug_logging()
+    else:
+        LOGGER.setLevel(logging.INFO)
+
+    if not confirm:
+        account = get_first_account_alias_or_account_id_in_background()
+
+    try:
+        config = Workspace(directory, cli_params=parameter, transform_context=context, pattern=pattern,
+                           stack_selector=get_stack_selector(stack_names, tags, with_dependents)).config
+        sync_state = get_sync_state(incremental, state_file, os.path.join(directory, ".cfn-square-state.json"))
+        stack_action_handler = get_stack_action_runner(config, dry_run, sync_state, use_asyncio)
+
+        if not confirm:
+            check_update_available()
+            click.confirm('This action will modify AWS infrastructure in {0}\nAre you sure?'.format(
+                get_destination(config, account)), abort=True)
+
+        if via_change_sets:
+            stack_action_handler.sync_via_change_sets()
+        else:
+            stack_action_handler.create_or_update_stacks()
+    except click.Abort:
+        raise
     except CfnSphereException as e:
         LOGGER.error(e)
         if debug:
@@ -193,6 +500,41 @@ def sync(config, profile, parameter, debug, confirm, yes, context, dry_run):
         sys.exit(1)
 
 
+@cli.command(help="Serve sync, change set, render and status requests with warm caches")
+@click.option('--socket', 'socket_path', default=None, envvar='CFN_SPHERE_DAEMON_SOCKET',
+              type=click.Path(dir_okay=False), help="Unix socket to listen on, defaults to ~/.cfn-square/daemon.sock")
+@click.option('--port', default=None, envvar='CFN_SPHERE_DAEMON_PORT', type=click.INT,
+              help="Listen on a local tcp port instead of a unix socket, any local user may connect to it")
+@click.option('--profile', default=None, envvar='AWS_PROFILE', type=click.STRING,
+              help='Use a specific profile from your credential file')
+@click.option('--debug', '-d', is_flag=True, default=False, envvar='CFN_SPHERE_DEBUG', help="Debug output")
+@click.option('--dry_run', '-n', is_flag=True, default=False, envvar='CFN_SPHERE_DRY_RUN',
+              help="Dry run all requests not asking otherwise.")
+def daemon(socket_path, port, profile, debug, dry_run):
+    from cfn_sphere.daemon import Daemon
+
+    _set_profile(profile)
+
+    if debug:
+        LOGGER.setLevel(logging.DEBUG)
+    else:
+        LOGGER.setLevel(logging.INFO)
+
+    try:
+        Daemon(dry_run).serve(socket_path=socket_path, port=port)
+    except KeyboardInterrupt:
+        LOGGER.info("Stopped serving requests")
+    except CfnSphereException as e:
+        LOGGER.error(e)
+        if debug:
+            LOGGER.exception(e)
+        sys.exit(1)
+    except Exception as e:
+        LOGGER.error("Failed with unexpected error")
+        LOGGER.exception(e)
+        sys.exit(1)
+
+
 @cli.command(help="Delete all stacks in a stack configuration")
 @click.argument('config', type=click.Path(exists=True))
 @click.option('--profile', default=None, envvar='AWS_PROFILE', type=click.STRING,
@@ -204,6 +546,7 @@ def sync(config, profile, parameter, debug, confirm, yes, context, dry_run):
               help="Override user confirm dialog with yes")
 @click.option('--yes', '-y', is_flag=True, default=False, envvar='CFN_SPHERE_CONFIRM',
               help="Override user confirm dialog with yes (alias for -c/--confirm")
+@reported_command
 def delete(config, profile, context, debug, confirm, yes):
     _set_profile(profile)
 
@@ -214,14 +557,21 @@ def delete(config, profile, context, debug, confirm, yes):
         LOGGER.setLevel(logging.INFO)
 
     if not confirm:
-        check_update_available()
-        click.confirm('This action will delete all stacks in {0} from account: {1}\nAre you sure?'.format(
-            config, get_first_account_alias_or_account_id()), abort=True)
+        account = get_first_account_alias_or_account_id_in_background()
 
     try:
-
-        config = Config(config, transform_context=context)
-        StackActionHandler(config).delete_stacks()
+        config_file = config
+        config = Config(config_file, transform_context=context)
+        stack_action_handler = get_stack_action_runner(config)
+
+        if not confirm:
+            check_update_available()
+            click.confirm('This action will delete all stacks in {0} from {1}\nAre you sure?'.format(
+                config_file, get_destination(config, account)), abort=True)
+
+        stack_action_handler.delete_stacks()
+    except click.Abort:
+        raise
     except CfnSphereException as e:
         LOGGER.error(e)
         if debug:
@@ -372,8 +722,18 @@ def decrypt(region, ciphertext, profile, confirm, yes):
         sys.exit(1)
 
 
+def _enable_boto_debug_logging():
+    import boto3
+
+    boto3.set_stream_logger(name='boto3', level=logging.DEBUG)
+    boto3.set_stream_logger(name='botocore', level=logging.DEBUG)
+
+
 def _set_profile(profile_name):
     if profile_name is not None:
+        import boto3
+        from botocore.credentials import JSONFileCache
+
         cache_dir = os.path.expanduser(os.path.join('~', '.aws', 'cli', 'cache'))
         boto3.setup_default_session(profile_name=profile_name)
         cred_chain = boto3.DEFAULT_SESSION._session.get_component("credential_provider")
@@ -0,0 +1,345 @@
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import yaml
+
+from cfn_sphere.aws.api_statistics import API_STATISTICS
+from cfn_sphere.aws.cfn import CloudFormation
+from cfn_sphere.exceptions import CfnSphereException
+from cfn_sphere.fan_out import FanOut
+from cfn_sphere.file_loader import FileLoader
+from cfn_sphere.stack_configuration import Config
+from cfn_sphere.template.sam_packager import ARTIFACT_REGISTRY
+from cfn_sphere.template.transformer import CloudFormationTemplateTransformer
+from cfn_sphere.timings import TIMINGS
+from cfn_sphere.util import get_logger
+
+DEFAULT_HOST = "127.0.0.1"
+# Host headers accepted by the daemon, other names may point to it through dns rebinding only
+ALLOWED_HOSTS = ("localhost", "127.0.0.1")
+# largest accepted request body, requests only carry file paths and parameters
+MAX_REQUEST_SIZE = 1024 * 1024
+
+
+class DaemonRequestException(CfnSphereException):
+    pass
+
+
+def get_default_socket_path():
+    """
+    :return: str: unix socket path in a directory only the current user may access
+    """
+    directory = os.path.join(os.path.expanduser("~"), ".cfn-square")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    return os.path.join(directory, "daemon.sock")
+
+
+def get_file_version(file_path):
+    """
+    :param file_path: str
+    :return: (int, int): modification time and size, None for missing files
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_config_input_files(config_file, transform_context=None):
+    """
+    Get the files a config is loaded from: the config, the transform context and the files it includes
+    :param config_file: str
+    :param transform_context: str
+    :return: list(str)
+    """
+    input_files = [config_file]
+
+    if transform_context:
+        input_files.append(transform_context)
+        with open(transform_context, "r") as f:
+            context = yaml.safe_load(f) or {}
+        if isinstance(context, dict):
+            input_files += [os.path.dirname(transform_context) + "/" + include
+                            for include in context.get("include", [])]
+
+    return input_files
+
+
+class Daemon(object):
+    """
+    Serves stack actions from a long running process, so AWS clients, stack descriptions, parsed templates and
+    configs stay warm between requests. Configs are reloaded when their files change, cached stack descriptions when
+    a stack listing shows changed stacks, templates when their files change.
+    Stack actions run one at a time, render and status requests run concurrently to them.
+    """
+
+    def __init__(self, dry_run=False):
+        self.logger = get_logger(root=True)
+        self.dry_run = dry_run
+        self.started = time.time()
+        self.requests = 0
+        self._configs = {}
+        self._cloudformations = {}
+        self._lock = threading.Lock()
+        self._action_lock = threading.Lock()
+
+    def get_config(self, config_file, parameters=None, transform_context=None):
+        """
+        Get a config, loaded again only if its config, context or include files changed
+        :param config_file: str
+        :param parameters: list(str): stack parameters like stack.key=value
+        :param transform_context: str: transform context file
+        :return: Config
+        """
+        config_file = os.path.realpath(config_file)
+        key = (config_file, tuple(parameters or []), transform_context)
+        versions = [(input_file, get_file_version(input_file))
+                    for input_file in get_config_input_files(config_file, transform_context)]
+
+        with self._lock:
+            cached_versions, config = self._configs.get(key, (None, None))
+
+        if cached_versions != versions:
+            config = Config(config_file=config_file, cli_params=parameters, transform_context=transform_context)
+            with self._lock:
+                self._configs[key] = (versions, config)
+        return config
+
+    def get_cfn(self, config, dry_run=False):
+        """
+        Get the CloudFormation api wrapper of a region and profile, shared by all requests
+        :param config: Config: config of a single target
+        :param dry_run: bool
+        :return: CloudFormation
+        """
+        key = (config.region, config.profile, dry_run)
+        with self._lock:
+            if key not in self._cloudformations:
+                self._cloudformations[key] = CloudFormation(region=config.region, dry_run=dry_run,
+                                                            profile=config.profile)
+            cfn = self._cloudformations[key]
+
+        cfn.invalidate_changed_stacks()
+        return cfn
+
+    def handle(self, path, request):
+        """
+        Handle a request
+        :param path: str: one of /sync, /create-change-set, /render, /status
+        :param request: dict: request parameters
+        :return: dict: response
+        :raise DaemonRequestException: for unknown paths or invalid requests
+        """
+        with self._lock:
+            self.requests += 1
+
+        handlers = {"/sync": self.sync,
+                    "/create-change-set": self.create_change_set,
+                    "/render": self.render,
+                    "/status": self.status}
+        if path not in handlers:
+            raise DaemonRequestException("Unknown request {0}, use one of {1}".format(path, ", ".join(handlers)))
+
+        return handlers[path](request)
+
+    @staticmethod
+    def get_required(request, key):
+        if not request.get(key):
+            raise DaemonRequestException("Missing request parameter {0}".format(key))
+        return request[key]
+
+    def run_action(self, request, action):
+        config = self.get_config(self.get_required(request, "config"), request.get("parameters"),
+                                 request.get("context"))
+        dry_run = bool(request.get("dry_run", self.dry_run))
+
+        with self._action_lock:
+            TIMINGS.clear()
+            API_STATISTICS.clear()
+            self.clear_uploads()
+            fan_out = FanOut(config, dry_run, cfn_factory=self.get_cfn)
+            response = {}
+            try:
+                fan_out.run(action)
+            except CfnSphereException as e:
+                response = {"succeeded": False, "error": str(e)}
+
+            response.update(targets=[result.to_dict() for result in fan_out.results],
+                            api_calls=API_STATISTICS.to_dict()["calls"])
+        return response
+
+    def clear_uploads(self):
+        """
+        Forget staged templates and uploaded artifacts of earlier actions, S3 lifecycle rules may have expired them
+        """
+        ARTIFACT_REGISTRY.clear()
+        with self._lock:
+            cloudformations = list(self._cloudformations.values())
+        for cfn in cloudformations:
+            cfn.clear_staged_templates()
+
+    def sync(self, request):
+        return self.run_action(request, "create_or_update_stacks")
+
+    def create_change_set(self, request):
+        return self.run_action(request, "create_change_set")
+
+    @staticmethod
+    def render(request):
+        template = FileLoader.get_cloudformation_template(Daemon.get_required(request, "template"), None)
+        template = CloudFormationTemplateTransformer.transform_template(template)
+        return {"template": template.get_template_body_dict()}
+
+    def status(self, request):
+        """
+        Report the daemon state and, if a config is given, the state of its stacks
+        """
+        with self._lock:
+            response = {"uptime_seconds": round(time.time() - self.started, 1),
+                        "requests": self.requests,
+                        "cached_configs": len(self._configs),
+                        "busy": self._action_lock.locked()}
+
+        if request.get("config"):
+            config = self.get_config(request["config"], request.get("parameters"), request.get("context"))
+            response["stacks"] = {}
+            for target in config.get_targets():
+                cfn = self.get_cfn(target)
+                for stack_name in config.stacks.keys():
+                    description = cfn.get_stack_description(stack_name)
+                    last_updated = description.get("LastUpdatedTime") or description.get("CreationTime")
+                    response["stacks"].setdefault(target.target_name, {})[stack_name] = {
+                        "status": description.get("StackStatus", "NOT_FOUND"),
+                        "last_updated": last_updated.isoformat() if last_updated else None}
+        return response
+
+    def create_server(self, socket_path=None, host=DEFAULT_HOST, port=None):
+        """
+        Create a http server on a unix socket only the current user may connect to or, if a port is given,
+        on a local tcp port any local user may connect to
+        :param socket_path: str: unix socket path, None for the default path
+        :param host: str
+        :param port: int: tcp port, None to listen on a unix socket
+        :return: socketserver.BaseServer
+        :raise CfnSphereException: if both a socket path and a port are given
+        """
+        handler_class = type("BoundDaemonRequestHandler", (DaemonRequestHandler,), {"daemon": self})
+
+        if port is None:
+            socket_path = socket_path or get_default_socket_path()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            return ThreadingUnixHTTPServer(socket_path, handler_class)
+
+        if socket_path:
+            raise CfnSphereException("Please listen either on a unix socket or on a tcp port")
+        return ThreadingTcpHTTPServer((host, port), handler_class)
+
+    def serve(self, socket_path=None, host=DEFAULT_HOST, port=None):
+        server = self.create_server(socket_path, host, port)
+        is_unix_server = isinstance(server, ThreadingUnixHTTPServer)
+        self.logger.info("Serving requests on {0}".format(
+            server.server_address if is_unix_server else "http://{0}:{1}".format(host, port)))
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if is_unix_server and os.path.exists(server.server_address):
+                os.unlink(server.server_address)
+
+
+class ThreadingTcpHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # the socket is created with 0600 permissions, so no other user can connect in between bind and chmod
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """
+    Passes json requests to the daemon, GET requests have no parameters. Requests for other hosts than localhost,
+    e.g. from web pages through dns rebinding, and POST requests of other content types than json, which browsers
+    send cross origin without preflight, are rejected.
+    """
+    daemon = None
+
+    def do_GET(self):
+        if self.is_allowed_host():
+            self.respond({})
+
+    def do_POST(self):
+        if not self.is_allowed_host():
+            return
+
+        if self.headers.get_content_type() != "application/json":
+            self.send_json(415, {"succeeded": False, "error": "Content-Type must be application/json"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_REQUEST_SIZE:
+                raise DaemonRequestException("Request exceeds {0} bytes".format(MAX_REQUEST_SIZE))
+            request = json.loads(self.rfile.read(length).decode("utf-8")) if length else {}
+            if not isinstance(request, dict):
+                raise DaemonRequestException("Request must be a json object")
+        except (ValueError, DaemonRequestException) as e:
+            self.send_json(400, {"succeeded": False, "error": str(e)})
+            return
+
+        self.respond(request)
+
+    def is_allowed_host(self):
+        """
+        :return: bool: True if the Host header names localhost, otherwise a 403 response is sent
+        """
+        host = (self.headers.get("Host") or "").rsplit(":", 1)[0].lower()
+        if host in ALLOWED_HOSTS:
+            return True
+
+        self.send_json(403, {"succeeded": False, "error": "Host {0} is not allowed, use one of {1}".format(
+            host, ", ".join(ALLOWED_HOSTS))})
+        return False
+
+    def respond(self, request):
+        start = time.perf_counter()
+        try:
+            response = dict(self.daemon.handle(self.path, request))
+            status = 200
+            response.setdefault("succeeded", True)
+        except CfnSphereException as e:
+            status, response = 400, {"succeeded": False, "error": str(e)}
+        except Exception as e:
+            get_logger().exception(e)
+            status, response = 500, {"succeeded": False, "error": str(e)}
+
+        response["seconds"] = round(time.perf_counter() - start, 3)
+        self.send_json(status, response)
+
+    def send_json(self, status, response):
+        body = json.dumps(response, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, message_format, *args):
+        get_logger().debug("{0} {1}".format(self.address_string(), message_format % args))
@@ -1,5 +1,7 @@
 from botocore.exceptions import ClientError
 
+THROTTLING_ERROR_CODES = ["Throttling", "ThrottlingException", "RequestLimitExceeded", "TooManyRequestsException"]
+
 
 class CfnSphereException(Exception):
     def __init__(self, message="", boto_exception=None):
@@ -41,6 +43,10 @@ class InvalidDependencyGraphException(CfnSphereException):
     pass
 
 
+class ApiCallBudgetExceededException(CfnSphereException):
+    pass
+
+
 class CfnSphereBotoError(CfnSphereException):
     def __init__(self, e):
         self.boto_exception = e
@@ -58,7 +64,7 @@ class CfnSphereBotoError(CfnSphereException):
 
         self.pretty_string = "{0}: {1}".format(code, message)
 
-        if code == "Throttling":
+        if code in THROTTLING_ERROR_CODES:
             self.is_throttling_exception = True
 
     def __str__(self):
@@ -0,0 +1,125 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cfn_sphere import StackActionHandler
+from cfn_sphere.aws.rate_limiter import RATE_LIMITER
+from cfn_sphere.exceptions import CfnStackActionFailedException
+from cfn_sphere.timings import TIMINGS
+from cfn_sphere.util import get_logger
+
+
+class TargetResult(object):
+    def __init__(self, target_name, seconds, error=None):
+        self.target_name = target_name
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+    def to_dict(self):
+        return {"target": self.target_name,
+                "succeeded": self.succeeded,
+                "seconds": round(self.seconds, 3),
+                "error": self.error}
+
+
+class FanOut(object):
+    """
+    Runs stack actions for every region and profile of a config. Each target gets its own StackActionHandler,
+    so clients, caches and rate limits are separate per target, while at most max-concurrent-targets run at once.
+    Failing targets don't stop the others, all results are reported in one table at the end.
+    """
+
+    def __init__(self, config, dry_run=False, cfn_factory=None, sync_state=None, handler_class=None):
+        """
+        :param config: Config
+        :param dry_run: bool
+        :param cfn_factory: function(Config, bool) returning the CloudFormation api wrapper of a target,
+                            None to create one per target
+        :param sync_state: SyncState: shared by all targets for incremental syncs
+        :param handler_class: class of the handlers running targets, None for StackActionHandler
+        """
+        self.logger = get_logger(root=True)
+        self.config = config
+        self.dry_run = dry_run
+        self.cfn_factory = cfn_factory
+        self.sync_state = sync_state
+        self.handler_class = handler_class
+        self.targets = config.get_targets()
+        self.results = []
+        RATE_LIMITER.configure(config.api_rate_limits)
+
+    def create_or_update_stacks(self):
+        self.run("create_or_update_stacks")
+
+    def sync_via_change_sets(self):
+        self.run("sync_via_change_sets")
+
+    def create_change_set(self):
+        self.run("create_change_set")
+
+    def delete_stacks(self):
+        self.run("delete_stacks")
+
+    def run(self, action):
+        """
+        Run a StackActionHandler action for all targets
+        :param action: str: name of the StackActionHandler method
+        :return: list(TargetResult) in target order
+        :raise CfnStackActionFailedException: if any target failed
+        """
+        self.logger.info("Running {0} for {1} targets: {2}".format(
+            action, len(self.targets), ", ".join(target.target_name for target in self.targets)))
+
+        max_workers = max(1, min(self.config.max_concurrent_targets, len(self.targets)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(TIMINGS.bind(self.run_target), target, action) for target in self.targets]
+            self.results = [future.result() for future in futures]
+
+        self.logger.info("Results per target:\n" + self.get_report_table(self.results))
+
+        failed_targets = [result.target_name for result in self.results if not result.succeeded]
+        if failed_targets:
+            raise CfnStackActionFailedException(
+                "{0} failed for {1} of {2} targets: {3}".format(action, len(failed_targets), len(self.results),
+                                                                ", ".join(failed_targets)))
+        return self.results
+
+    def run_target(self, target, action):
+        """
+        :param target: Config: config of a single region and profile
+        :param action: str
+        :return: TargetResult
+        """
+        start = time.perf_counter()
+
+        with TIMINGS.span(target.target_name, "target"):
+            try:
+                cfn = self.cfn_factory(target, self.dry_run) if self.cfn_factory else None
+                handler_class = self.handler_class or StackActionHandler
+                getattr(handler_class(target, self.dry_run, cfn, self.sync_state), action)()
+                error = None
+            except Exception as e:
+                self.logger.error("{0} failed for {1}: {2}".format(action, target.target_name, e))
+                self.logger.debug(e, exc_info=True)
+                error = str(e)
+
+        return TargetResult(target.target_name, time.perf_counter() - start, error)
+
+    @staticmethod
+    def get_report_table(results):
+        """
+        :param results: list(TargetResult)
+        :return: str
+        """
+        from prettytable import PrettyTable
+
+        table = PrettyTable(["Target", "Result", "Seconds", "Error"])
+        table.align["Target"] = "l"
+        table.align["Error"] = "l"
+        for result in results:
+            table.add_row([result.target_name, "succeeded" if result.succeeded else "failed",
+                           round(result.seconds, 1), result.error or ""])
+        return table.get_string()
@@ -1,20 +1,26 @@
 import codecs
 import json
 import os
+import pickle
+import threading
 
 import yaml
 
 from cfn_sphere.aws.s3 import S3
 from cfn_sphere.exceptions import TemplateErrorException, CfnSphereException
+from cfn_sphere.profiling import hot_path
 from cfn_sphere.template import CloudFormationTemplate
-
-import urllib.request
-# BeautifulSoup4 used to elegantly handle non-conformant HTML
-from bs4 import BeautifulSoup
+from cfn_sphere.timings import TIMINGS
 
 
 class FileLoader(object):
+    # parsed local files by real path: (path, mtime, size) of the parsed version and the pickled content
+    _parsed_files = {}
+    _parsed_files_lock = threading.Lock()
+
     @classmethod
+    @hot_path("template-load")
+    @TIMINGS.timed("template-load")
     def get_cloudformation_template(cls, url, working_dir):
         """
         Load file content from url and return cfn-sphere CloudFormationTemplate
@@ -23,7 +29,7 @@ class FileLoader(object):
         :return: CloudFormationTemplate
         """
         try:
-            template_body_dict = cls.get_yaml_or_json_file(url, working_dir)
+            template_body_dict = cls.get_cached_yaml_or_json_file(url, working_dir)
             return CloudFormationTemplate(body_dict=template_body_dict, name=os.path.basename(url))
         except Exception as e:
             raise TemplateErrorException("Could not load file from {0}: {1}".format(url, e))
@@ -68,6 +74,7 @@ class FileLoader(object):
         return {function: value_transformer(value)}
 
     @classmethod
+    @hot_path("yaml-json-parse")
     def get_yaml_or_json_file(cls, url, working_dir):
         """
         Load yaml or json from filesystem or s3
@@ -94,6 +101,55 @@ class FileLoader(object):
             raise CfnSphereException(e)
 
     @classmethod
+    def get_cached_yaml_or_json_file(cls, url, working_dir):
+        """
+        Load yaml or json like get_yaml_or_json_file. Local files are parsed once per version, identified by
+        modification time and size, and every call gets its own copy of the parsed content.
+        :param url: str
+        :param working_dir: str
+        :return: dict
+        """
+        file_version = cls.get_local_file_version(url, working_dir)
+        if file_version is None:
+            return cls.get_yaml_or_json_file(url, working_dir)
+
+        with cls._parsed_files_lock:
+            cached_version, content = cls._parsed_files.get(file_version[0], (None, None))
+
+        if cached_version == file_version:
+            return pickle.loads(content)
+
+        parsed_content = cls.get_yaml_or_json_file(url, working_dir)
+        with cls._parsed_files_lock:
+            cls._parsed_files[file_version[0]] = (file_version, pickle.dumps(parsed_content, pickle.HIGHEST_PROTOCOL))
+        return parsed_content
+
+    @staticmethod
+    def get_local_file_version(url, working_dir):
+        """
+        :param url: str
+        :param working_dir: str
+        :return: (str, int, int): real path, modification time and size, None for remote or missing files
+        """
+        if url.lower().startswith("s3://") or url.lower().startswith("https://"):
+            return None
+
+        if not os.path.isabs(url) and working_dir:
+            url = os.path.join(working_dir, url)
+
+        try:
+            stat = os.stat(url)
+        except (OSError, ValueError):
+            return None
+        return os.path.realpath(url), stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._parsed_files_lock:
+            cls._parsed_files = {}
+
+    @classmethod
+    @hot_path("file-read")
     def get_file(cls, url, working_dir):
         """
         Load file from filesystem or s3
@@ -143,6 +199,10 @@ class FileLoader(object):
         :param url: str
         :return: str(utf-8)
         """
+        import urllib.request
+        # BeautifulSoup4 used to elegantly handle non-conformant HTML
+        from bs4 import BeautifulSoup
+
         try:
             with urllib.request.urlopen(url) as response:
                 return BeautifulSoup(response.read(), 'html.parser').prettify()
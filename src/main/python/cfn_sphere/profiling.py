@@ -0,0 +1,199 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from cfn_sphere.util import get_logger
+
+PROFILE_MODES = ["deterministic", "sampling"]
+SAMPLING_INTERVAL = 0.005
+# collapsed stacks of deterministic profiles are weighted in microseconds
+COLLAPSED_TIME_UNIT = 1000000
+MAX_COLLAPSED_DEPTH = 128
+
+
+def hot_path(name):
+    """
+    Decorator marking a function as named phase in profiles: calls get an additional frame named [name],
+    so pstats entries and flamegraphs can be grouped by phase
+    :param name: str
+    """
+
+    def decorator(function):
+        def marker(*args, **kwargs):
+            return function(*args, **kwargs)
+
+        code_name = "[{0}]".format(name)
+        if hasattr(marker.__code__, "co_qualname"):
+            marker.__code__ = marker.__code__.replace(co_name=code_name, co_qualname=code_name)
+        else:
+            marker.__code__ = marker.__code__.replace(co_name=code_name)
+
+        return wraps(function)(marker)
+
+    return decorator
+
+
+def get_frame_label(filename, line_number, function_name):
+    """
+    Render a frame for collapsed stacks, which separate frames by semicolons
+    """
+    if filename == "~":
+        label = function_name
+    else:
+        label = "{0} ({1}:{2})".format(function_name, os.path.basename(filename), line_number)
+    return label.replace(";", ":")
+
+
+def get_collapsed_stacks_from_stats(stats):
+    """
+    Approximate call stacks from the caller/callee edges of a deterministic profile. The time of a function is
+    split between the stacks it is called from in proportion to the time spent in each call edge.
+    :param stats: pstats.Stats
+    :return: Counter(str, int): stack -> microseconds
+    """
+    callees = {}
+    roots = []
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            roots.append(function)
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((function, edge[3]))
+
+    collapsed = Counter()
+
+    def expand(function, path, labels, time_on_path):
+        total_time, cumulative_time = stats.stats[function][2], stats.stats[function][3]
+        share = time_on_path / cumulative_time if cumulative_time else 0.0
+
+        self_time = int(total_time * share * COLLAPSED_TIME_UNIT)
+        if self_time:
+            collapsed[";".join(labels)] += self_time
+
+        if len(path) >= MAX_COLLAPSED_DEPTH:
+            return
+        for callee, edge_time in callees.get(function, []):
+            # recursive calls are included in the cumulative time of their outermost call
+            if callee not in path and edge_time * share * COLLAPSED_TIME_UNIT >= 1:
+                expand(callee, path | {callee}, labels + [get_frame_label(*callee)], edge_time * share)
+
+    for root in sorted(roots):
+        expand(root, {root}, [get_frame_label(*root)], stats.stats[root][3])
+
+    return collapsed
+
+
+def write_collapsed_stacks(collapsed, file_path):
+    with open(file_path, "w") as f:
+        for stack, weight in sorted(collapsed.items()):
+            f.write("{0} {1}\n".format(stack, weight))
+
+
+class StackSampler(object):
+    """
+    Samples the stacks of all threads in regular intervals
+    """
+
+    def __init__(self, interval=SAMPLING_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="cfn-square-profiler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        own_thread_id = threading.current_thread().ident
+
+        while not self._stopped.is_set():
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_thread_id:
+                    self.samples[self.get_stack(thread_names.get(thread_id, thread_id), frame)] += 1
+
+            time.sleep(self.interval)
+
+    @staticmethod
+    def get_stack(thread_name, frame):
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            labels.append(get_frame_label(code.co_filename, frame.f_lineno, code.co_name))
+            frame = frame.f_back
+
+        labels.append(str(thread_name).replace(";", ":"))
+        labels.reverse()
+        return ";".join(labels)
+
+
+class Profiler(object):
+    """
+    Profiles a run and writes the results next to the given path: a deterministic profile writes
+    <path>.pstats and <path>.collapsed, a sampling profile writes <path>.collapsed.
+    Deterministic profiles cover the thread starting the profiler, sampling profiles cover all threads.
+    """
+
+    def __init__(self, path, mode="deterministic", interval=SAMPLING_INTERVAL):
+        assert mode in PROFILE_MODES, "mode must be one of {0}".format(PROFILE_MODES)
+        self.logger = get_logger()
+        self.path = path
+        self.mode = mode
+        self.interval = interval
+        self._profile = None
+        self._sampler = None
+
+    @property
+    def pstats_file(self):
+        return self.path + ".pstats"
+
+    @property
+    def collapsed_file(self):
+        return self.path + ".collapsed"
+
+    def start(self):
+        if self.mode == "sampling":
+            self._sampler = StackSampler(self.interval)
+            self._sampler.start()
+        else:
+            import cProfile
+
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self):
+        """
+        Stop profiling and write the result files
+        :return: list(str): written files
+        """
+        if self._sampler:
+            self._sampler.stop()
+            write_collapsed_stacks(self._sampler.samples, self.collapsed_file)
+            written_files = [self.collapsed_file]
+        else:
+            import pstats
+
+            self._profile.disable()
+            self._profile.dump_stats(self.pstats_file)
+            write_collapsed_stacks(get_collapsed_stacks_from_stats(pstats.Stats(self._profile)),
+                                   self.collapsed_file)
+            written_files = [self.pstats_file, self.collapsed_file]
+
+        self.logger.info("Wrote profile to {0}".format(", ".join(written_files)))
+        return written_files
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
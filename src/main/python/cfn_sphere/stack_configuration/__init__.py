@@ -1,4 +1,5 @@
 # Modifications copyright (C) 2017 KCOM
+import copy
 import os
 from collections import defaultdict
 
@@ -6,19 +7,27 @@ import yaml
 from yaml.scanner import ScannerError
 
 from cfn_sphere.exceptions import InvalidConfigException, CfnSphereException
+from cfn_sphere.stack_configuration.config_cache import CONFIG_CACHE
+from cfn_sphere.timings import TIMINGS
 from cfn_sphere.util import get_logger
 
-from cfn_sphere.transform import TransformDict, merge_includes
+from cfn_sphere.transform import TransformDict, TransformList, merge_includes, transform_dict
 
 ALLOWED_CONFIG_KEYS = ["region", "stacks", "service-role", "stack-policy-url", "timeout", "tags", "on_failure",
-                       "disable_rollback", "change_set", "package-bucket"]
+                       "disable_rollback", "change_set", "package-bucket", "template-bucket", "api-rate-limits",
+                       "max-api-calls", "regions", "profiles", "max-concurrent-targets"]
+
+DEFAULT_MAX_CONCURRENT_TARGETS = 4
 
 
 class Config(object):
-    def __init__(self, config_file=None, config_dict=None, cli_params=None, transform_context=None):
+    @TIMINGS.timed("config", "load config")
+    def __init__(self, config_file=None, config_dict=None, cli_params=None, transform_context=None,
+                 stack_selector=None):
         self.logger = get_logger()
 
         import_path = None
+        transform_context_file = transform_context
 
         if transform_context:
             import_path = os.path.dirname(transform_context)
@@ -28,16 +37,35 @@ class Config(object):
         else:
             transform_context = {}
 
+        cache_key = None
+        if config_file and not isinstance(config_dict, dict):
+            include_files = [import_path + '/' + include for include in transform_context.get('include', {})]
+            cache_key = CONFIG_CACHE.get_key(config_file, transform_context_file, include_files, cli_params,
+                                             stack_selector)
+            cached_attributes = CONFIG_CACHE.load(cache_key)
+            if cached_attributes is not None:
+                self.__dict__.update(cached_attributes)
+                return
+
         if isinstance(config_dict, dict):
             self.working_dir = None
+            config_dict = self._select_stacks(config_dict, stack_selector)
         elif config_file:
-            config_dict = self._read_config_file(config_file, transform_context, import_path)
+            config_dict = self._read_config_file(config_file, transform_context, import_path, stack_selector)
             self.working_dir = os.path.dirname(os.path.realpath(config_file))
         else:
             raise InvalidConfigException("No config_file or valid config_dict provided")
 
         self.cli_params = self._parse_cli_parameters(cli_params)
-        self.region = config_dict.get("region")
+        if stack_selector:
+            # parameters of stacks outside the selection are not used
+            self.cli_params = {stack_name: parameters for stack_name, parameters in self.cli_params.items()
+                               if stack_name in config_dict.get("stacks", {})}
+        self.regions = config_dict.get("regions", [])
+        self.profiles = config_dict.get("profiles", [])
+        self.region = config_dict.get("region") or (self.regions[0] if self.regions else None)
+        self.profile = None
+        self.max_concurrent_targets = config_dict.get("max-concurrent-targets", DEFAULT_MAX_CONCURRENT_TARGETS)
 
         self.change_set = config_dict.get("change_set")
         self.default_service_role = config_dict.get("service-role")
@@ -45,14 +73,19 @@ class Config(object):
         self.default_timeout = config_dict.get("timeout", 600)
         self.default_tags = config_dict.get("tags", {})
         self.default_package_bucket = config_dict.get("package-bucket", None)
+        self.default_template_bucket = config_dict.get("template-bucket", None)
         self.default_failure_action = config_dict.get("on_failure", "ROLLBACK")
         self.default_disable_rollback = config_dict.get("disable_rollback", False)
+        self.api_rate_limits = config_dict.get("api-rate-limits", {})
+        self.max_api_calls = config_dict.get("max-api-calls")
 
         self.stacks = self._parse_stack_configs(config_dict, transform_context)
         self._config_dict = config_dict
 
         self._validate()
 
+        CONFIG_CACHE.store(cache_key, {key: value for key, value in self.__dict__.items() if key != "logger"})
+
     def _validate(self):
         try:
             for key in self._config_dict.keys():
@@ -62,6 +95,18 @@ class Config(object):
             assert self.region, "Please specify region in config file"
             assert isinstance(self.region, str), "Region must be of type str, not {0}".format(
                 type(self.region))
+            for key, values in [("regions", self.regions), ("profiles", self.profiles)]:
+                assert isinstance(values, (list, TransformList)), "{0} must be of type list, not {1}".format(
+                    key, type(values))
+                assert all(isinstance(value, str) for value in values), "{0} must be a list of str".format(key)
+            assert isinstance(self.max_concurrent_targets, int) and self.max_concurrent_targets > 0, \
+                "max-concurrent-targets must be a positive number, not {0}".format(self.max_concurrent_targets)
+            assert isinstance(self.api_rate_limits, (dict, TransformDict)), \
+                "api-rate-limits must be of type dict, not {0}".format(type(self.api_rate_limits))
+            assert self.max_api_calls is None or (isinstance(self.max_api_calls, int) and
+                                                  not isinstance(self.max_api_calls, bool) and
+                                                  self.max_api_calls > 0), \
+                "max-api-calls must be a positive number, not {0}".format(self.max_api_calls)
 
             # stacks config file not required when executing a change set
             if self.change_set is None:
@@ -84,6 +129,7 @@ class Config(object):
                 and self.region == other.region
                 and self.default_tags == other.default_tags
                 and self.default_package_bucket == other.default_package_bucket
+                and self.default_template_bucket == other.default_template_bucket
                 and self.default_service_role == other.default_service_role
                 and self.default_stack_policy_url == other.default_stack_policy_url
                 and self.default_timeout == other.default_timeout
@@ -96,6 +142,35 @@ class Config(object):
     def __ne__(self, other):
         return not self == other
 
+    @property
+    def target_name(self):
+        if self.profile is None:
+            return self.region
+        return "{0}/{1}".format(self.profile, self.region)
+
+    def get_targets(self):
+        """
+        Get a config for each combination of the configured regions and profiles
+        :return: list(Config)
+        """
+        regions = list(self.regions) or [self.region]
+        profiles = list(self.profiles) or [self.profile]
+        return [self.for_target(region, profile) for profile in profiles for region in regions]
+
+    def for_target(self, region, profile=None):
+        """
+        Get a copy of this config deploying to a single region with a profile
+        :param region: str
+        :param profile: str: None for the default profile
+        :return: Config
+        """
+        target = copy.copy(self)
+        target.region = region
+        target.profile = profile
+        target.regions = []
+        target.profiles = []
+        return target
+
     def _parse_stack_configs(self, config_dict, transform_context):
         """
         Create a StackConfig Object for each stack defined in config
@@ -109,6 +184,7 @@ class Config(object):
                                                working_dir=self.working_dir,
                                                default_tags=self.default_tags,
                                                default_package_bucket=self.default_package_bucket,
+                                               default_template_bucket=self.default_template_bucket,
                                                default_timeout=self.default_timeout,
                                                default_service_role=self.default_service_role,
                                                default_stack_policy_url=self.default_stack_policy_url,
@@ -144,11 +220,25 @@ class Config(object):
         return param_dict
 
     @staticmethod
-    def _read_config_file(config_file, transform_context, path):
+    def _select_stacks(config_dict, stack_selector):
+        """
+        Drop stacks outside a selection from a config before it is transformed
+        :param config_dict: dict: config as written in the config file
+        :param stack_selector: StackSelector: None to keep all stacks
+        :return: dict
+        """
+        if not stack_selector or not isinstance(config_dict, dict) or not isinstance(config_dict.get("stacks"), dict):
+            return config_dict
+
+        selected_stacks = stack_selector.filter_stacks(config_dict["stacks"], config_dict.get("tags"))
+        return dict(config_dict, stacks=selected_stacks)
+
+    @classmethod
+    def _read_config_file(cls, config_file, transform_context, path, stack_selector=None):
         try:
             with open(config_file, "r") as f:
                 context = merge_includes(transform_context, path)
-                config_dict = TransformDict(yaml.safe_load(f.read()), context)
+                config_dict = transform_dict(cls._select_stacks(yaml.safe_load(f.read()), stack_selector), context)
 
                 if not isinstance(config_dict, TransformDict):
                     raise InvalidConfigException(
@@ -166,8 +256,8 @@ class StackConfig(object):
     STACK_CONFIG_ALLOWED_CONFIG_KEYS = ALLOWED_CONFIG_KEYS + ["parameters", "template-url"]
 
     def __init__(self, stack_config_dict, working_dir=None, default_tags=None,
-                 default_package_bucket=None, default_timeout=600, default_service_role=None,
-                 default_stack_policy_url=None, default_failure_action="ROLLBACK",
+                 default_package_bucket=None, default_template_bucket=None, default_timeout=600,
+                 default_service_role=None, default_stack_policy_url=None, default_failure_action="ROLLBACK",
                  default_disable_rollback=False):
 
         # unit testing constructs this directly which means we have to wrap it here.
@@ -187,6 +277,7 @@ class StackConfig(object):
         self.tags.update(stack_config_dict.get("tags", {}))
 
         self.package_bucket = stack_config_dict.get("package-bucket", default_package_bucket)
+        self.template_bucket = stack_config_dict.get("template-bucket", default_template_bucket)
         self.service_role = stack_config_dict.get("service-role", default_service_role)
         self.stack_policy_url = stack_config_dict.get("stack-policy-url", default_stack_policy_url)
         self.timeout = stack_config_dict.get("timeout", default_timeout)
@@ -215,6 +306,10 @@ class StackConfig(object):
                 assert isinstance(self.package_bucket, str), \
                     "package-bucket must be of type str, not {0}".format(type(self.package_bucket))
 
+            if self.template_bucket:
+                assert isinstance(self.template_bucket, str), \
+                    "template-bucket must be of type str, not {0}".format(type(self.template_bucket))
+
             if self.service_role:
                 assert isinstance(self.service_role, str), \
                     "service-role must be of type str, not {0}".format(type(self.template_url))
@@ -246,6 +341,7 @@ class StackConfig(object):
             if (self.parameters == other.parameters
                 and self.tags == other.tags
                 and self.package_bucket == other.package_bucket
+                and self.template_bucket == other.template_bucket
                 and self.timeout == other.timeout
                 and self.working_dir == other.working_dir
                 and self.service_role == other.service_role
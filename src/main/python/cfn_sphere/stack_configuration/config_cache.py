@@ -0,0 +1,142 @@
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+
+from cfn_sphere.util import get_logger
+
+CACHE_FORMAT_VERSION = 1
+# configs are compiled by these modules, changing them invalidates all cached configs
+COMPILER_MODULES = ["__init__.py", "stack_selector.py", os.path.join(os.pardir, "transform.py")]
+
+
+def get_default_cache_directory():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "cfn-square", "configs")
+
+
+class ConfigCache(object):
+    """
+    Compiled configs stored as pickle files, keyed by the content hashes of the config file, the transform context and
+    the files it includes, the cli parameters and stack selection. Loading a cached config skips yaml parsing,
+    context substitution and validation. The cache is disabled until a directory is configured.
+    Unpickling runs code, so only files owned by the current user and not writable by others are loaded.
+    """
+
+    def __init__(self, directory=None):
+        self.logger = get_logger()
+        self.directory = directory
+        self._compiler_hash = None
+
+    def configure(self, directory):
+        """
+        :param directory: str: None to disable the cache
+        """
+        self.directory = directory
+
+    def get_compiler_hash(self):
+        if self._compiler_hash is None:
+            sha = hashlib.sha256(str(CACHE_FORMAT_VERSION).encode("utf-8"))
+            for module in COMPILER_MODULES:
+                with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), module), "rb") as f:
+                    sha.update(f.read())
+            self._compiler_hash = sha.hexdigest()
+        return self._compiler_hash
+
+    def get_key(self, config_file, transform_context_file=None, include_files=None, cli_params=None,
+                stack_selector=None):
+        """
+        :param config_file: str
+        :param transform_context_file: str
+        :param include_files: list(str): files included by the transform context
+        :param cli_params: tuple(str)
+        :param stack_selector: StackSelector
+        :return: str: None if the cache is disabled
+        """
+        if not self.directory:
+            return None
+
+        sha = hashlib.sha256(self.get_compiler_hash().encode("utf-8"))
+        sha.update(os.path.realpath(config_file).encode("utf-8"))
+
+        try:
+            for input_file in [config_file, transform_context_file] + list(include_files or []):
+                if input_file:
+                    with open(input_file, "rb") as f:
+                        sha.update(b"\0" + hashlib.sha256(f.read()).digest())
+        except OSError:
+            # unreadable files are reported when the config is loaded
+            return None
+
+        sha.update(repr(sorted(cli_params or [])).encode("utf-8"))
+        if stack_selector:
+            sha.update(repr((sorted(stack_selector.stack_names), sorted(stack_selector.tags.items()),
+                             stack_selector.include_dependents)).encode("utf-8"))
+
+        return sha.hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def load(self, key):
+        """
+        :param key: str
+        :return: dict: attributes of the compiled config, None if not cached
+        """
+        if key is None:
+            return None
+
+        try:
+            with open(self.get_path(key), "rb") as f:
+                self.validate_file_is_private(f.fileno())
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.debug("Ignoring unreadable cached config {0}: {1}".format(self.get_path(key), e))
+            return None
+
+    @staticmethod
+    def validate_file_is_private(file_descriptor):
+        """
+        :param file_descriptor: int: descriptor of the opened file, so the checked file is the file read
+        :raise IOError: if the file is owned by another user or writable by group or others
+        """
+        file_stat = os.fstat(file_descriptor)
+
+        if hasattr(os, "getuid") and file_stat.st_uid != os.getuid():
+            raise IOError("file is owned by another user")
+        if file_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise IOError("file is writable by group or others")
+
+    def store(self, key, attributes):
+        """
+        :param key: str
+        :param attributes: dict: attributes of the compiled config
+        """
+        if key is None:
+            return
+
+        temp_file = None
+        try:
+            # the cache holds pickles, other users must not be able to plant files in it
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            # write and rename, so concurrent runs never read partial files
+            with tempfile.NamedTemporaryFile("wb", dir=self.directory, delete=False) as f:
+                temp_file = f.name
+                pickle.dump(attributes, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, self.get_path(key))
+        except Exception as e:
+            self.logger.debug("Could not cache config: {0}".format(e))
+            if temp_file and os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    def clear(self):
+        if self.directory and os.path.isdir(self.directory):
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith(".pickle"):
+                    os.remove(os.path.join(self.directory, file_name))
+
+
+CONFIG_CACHE = ConfigCache()
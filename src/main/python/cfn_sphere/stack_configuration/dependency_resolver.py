@@ -1,8 +1,8 @@
-import networkx
-from networkx.exception import NetworkXUnfeasible, NetworkXNoCycle
-
-from cfn_sphere.exceptions import CfnSphereException, InvalidDependencyGraphException, CyclicDependencyException
+from cfn_sphere.exceptions import CfnSphereException
+from cfn_sphere.stack_configuration.graph import StackGraph
 from cfn_sphere.transform import TransformList
+from cfn_sphere.util import get_logger
+
 
 class DependencyResolver(object):
     @staticmethod
@@ -40,9 +40,7 @@ class DependencyResolver(object):
 
     @classmethod
     def create_stacks_directed_graph(cls, desired_stacks):
-        graph = networkx.DiGraph()
-        for name in desired_stacks.keys():
-            graph.add_node(name)
+        graph = StackGraph(desired_stacks.keys())
         for name, data in desired_stacks.items():
             if data and data.parameters:
                 for _, value in data.parameters.items():
@@ -63,23 +61,68 @@ class DependencyResolver(object):
 
     @staticmethod
     def analyse_cyclic_dependencies(graph):
-        try:
-            cycle = networkx.find_cycle(graph)
-            dependency_string = ' => '.join("[%s is referenced by %s]" % tup for tup in cycle)
-            raise CyclicDependencyException("Found cyclic dependency between stacks: {0}".format(dependency_string))
-        except NetworkXNoCycle:
-            pass
+        graph.raise_on_cycles()
+
+    @staticmethod
+    def log_dangling_references(graph):
+        dangling_references = graph.get_dangling_references()
+        if dangling_references:
+            get_logger().debug("Outputs of stacks outside the config are read from deployed stacks: {0}".format(
+                ", ".join("{0} (referenced by {1})".format(stack_name, ", ".join(referencing_stacks))
+                          for stack_name, referencing_stacks in dangling_references.items())))
+
+    @classmethod
+    def get_dependent_stacks(cls, desired_stacks, stack_names):
+        """
+        Get stacks together with all stacks referencing their outputs, directly or transitively
+        :param desired_stacks: dict(str, StackConfig)
+        :param stack_names: list(str)
+        :return: set(str)
+        """
+        graph = cls.create_stacks_directed_graph(desired_stacks)
+        dependent_stacks = set(stack_names)
+        for stack_name in stack_names:
+            if stack_name in graph:
+                dependent_stacks.update(graph.descendants(stack_name))
+        return dependent_stacks
 
     @classmethod
     def get_stack_order(cls, desired_stacks):
+        """
+        :param desired_stacks: dict(str, StackConfig)
+        :return: list(str): stacks ordered so every stack follows the stacks it references
+        :raise CyclicDependencyException: listing every cycle between the stacks
+        """
+        graph = cls.create_stacks_directed_graph(desired_stacks)
+        cls.log_dangling_references(graph)
+        return cls.filter_unmanaged_stacks(desired_stacks, graph.topological_sort())
+
+    @classmethod
+    def get_stack_levels(cls, desired_stacks):
+        """
+        :param desired_stacks: dict(str, StackConfig)
+        :return: list(list(str)): stacks grouped into levels, stacks of a level only reference stacks of previous
+        levels or stacks outside the config
+        :raise CyclicDependencyException: listing every cycle between the stacks
+        """
         graph = cls.create_stacks_directed_graph(desired_stacks)
-        try:
-            order = networkx.topological_sort(graph)
-            return cls.filter_unmanaged_stacks(desired_stacks, order)
-        except NetworkXUnfeasible as e:
-            cls.analyse_cyclic_dependencies(graph)
-            raise InvalidDependencyGraphException("Could not define an order of stacks: {0}".format(e))
+        for stack_name in graph.get_dangling_references():
+            # outputs of stacks outside the config are available from the start
+            graph.remove_node(stack_name)
+        return graph.get_levels()
 
+    @classmethod
+    def get_critical_path(cls, desired_stacks, durations=None):
+        """
+        :param desired_stacks: dict(str, StackConfig)
+        :param durations: dict(str, float): expected seconds per stack, 1 for stacks without duration
+        :return: (list(str), float): longest chain of dependent stacks and its total duration
+        :raise CyclicDependencyException: listing every cycle between the stacks
+        """
+        graph = cls.create_stacks_directed_graph(desired_stacks)
+        for stack_name in graph.get_dangling_references():
+            graph.remove_node(stack_name)
+        return graph.get_critical_path(durations)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,242 @@
+from collections import deque
+
+from cfn_sphere.exceptions import CyclicDependencyException
+
+
+class StackGraph(object):
+    """
+    Directed graph of stacks as adjacency lists, edges point from referenced stacks to the stacks referencing them.
+    Nodes keep insertion order, so orders and reports are stable between runs. Nodes only known from references are
+    dangling: they are referenced but not part of the graph's stacks.
+    """
+
+    def __init__(self, nodes=None):
+        self._successors = {}
+        self._predecessors = {}
+        self._dangling = {}
+        for node in nodes or []:
+            self.add_node(node)
+
+    def add_node(self, node):
+        if node not in self._successors:
+            self._successors[node] = []
+            self._predecessors[node] = []
+        self._dangling.pop(node, None)
+
+    def add_edge(self, source, target):
+        """
+        :param source: str: referenced stack
+        :param target: str: referencing stack
+        """
+        for node in [source, target]:
+            if node not in self._successors:
+                self.add_node(node)
+                self._dangling[node] = True
+
+        if target not in self._successors[source]:
+            self._successors[source].append(target)
+            self._predecessors[target].append(source)
+
+    def remove_node(self, node):
+        for successor in self._successors.pop(node):
+            self._predecessors[successor].remove(node)
+        for predecessor in self._predecessors.pop(node):
+            self._successors[predecessor].remove(node)
+        self._dangling.pop(node, None)
+
+    def __contains__(self, node):
+        return node in self._successors
+
+    def __len__(self):
+        return len(self._successors)
+
+    @property
+    def nodes(self):
+        return list(self._successors)
+
+    def successors(self, node):
+        return list(self._successors[node])
+
+    def predecessors(self, node):
+        return list(self._predecessors[node])
+
+    def get_dangling_references(self):
+        """
+        :return: dict(str, list(str)): referencing stacks by referenced stacks which are not part of the graph
+        """
+        return {node: self.successors(node) for node in self._dangling}
+
+    def descendants(self, node):
+        """
+        :param node: str
+        :return: set(str): nodes reachable from node, without node itself unless it is part of a cycle
+        """
+        reached = set()
+        pending = list(self._successors[node])
+        while pending:
+            current = pending.pop()
+            if current not in reached:
+                reached.add(current)
+                pending.extend(self._successors[current])
+        return reached
+
+    def topological_sort(self):
+        """
+        Order nodes so every node follows all nodes it references (Kahn's algorithm)
+        :return: list(str)
+        :raise CyclicDependencyException: listing every cycle of the graph
+        """
+        in_degrees = {node: len(predecessors) for node, predecessors in self._predecessors.items()}
+        ready = deque(node for node, in_degree in in_degrees.items() if in_degree == 0)
+        order = []
+
+        while ready:
+            node = ready.popleft()
+            order.append(node)
+            for successor in self._successors[node]:
+                in_degrees[successor] -= 1
+                if in_degrees[successor] == 0:
+                    ready.append(successor)
+
+        if len(order) < len(self._successors):
+            self.raise_on_cycles()
+        return order
+
+    def get_strongly_connected_components(self):
+        """
+        Tarjan's algorithm, iterative so deep graphs don't hit the recursion limit
+        :return: list(list(str)): components in reverse topological order
+        """
+        index_by_node = {}
+        low_links = {}
+        stack = []
+        on_stack = set()
+        components = []
+
+        for root in self._successors:
+            if root in index_by_node:
+                continue
+
+            index_by_node[root] = low_links[root] = len(index_by_node)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self._successors[root]))]
+
+            while work:
+                node, successors = work[-1]
+                for successor in successors:
+                    if successor not in index_by_node:
+                        index_by_node[successor] = low_links[successor] = len(index_by_node)
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(self._successors[successor])))
+                        break
+                    if successor in on_stack:
+                        low_links[node] = min(low_links[node], index_by_node[successor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low_links[parent] = min(low_links[parent], low_links[node])
+
+                    if low_links[node] == index_by_node[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(component)
+
+        return components
+
+    def get_cycles(self):
+        """
+        Find one cycle through every strongly connected component with more than one node or a self reference
+        :return: list(list(str)): cycles as node paths starting and ending with the same node
+        """
+        position_by_node = {node: position for position, node in enumerate(self._successors)}
+        cycles = []
+        for component in reversed(self.get_strongly_connected_components()):
+            members = set(component)
+            if len(component) == 1 and component[0] not in self._successors[component[0]]:
+                continue
+
+            start = min(component, key=position_by_node.get)
+            # breadth first search for the shortest path back to start within the component
+            previous = {}
+            pending = deque([start])
+            while pending:
+                node = pending.popleft()
+                if start in self._successors[node]:
+                    break
+                for successor in self._successors[node]:
+                    if successor in members and successor not in previous:
+                        previous[successor] = node
+                        pending.append(successor)
+
+            cycle = [start]
+            while node != start:
+                cycle.append(node)
+                node = previous[node]
+            cycles.append([start] + list(reversed(cycle)))
+        return cycles
+
+    def raise_on_cycles(self):
+        """
+        :raise CyclicDependencyException: if the graph has cycles, listing all of them
+        """
+        cycles = self.get_cycles()
+        if cycles:
+            raise CyclicDependencyException("Found {0} cyclic dependencies between stacks: {1}".format(
+                len(cycles), "; ".join(" => ".join("[{0} is referenced by {1}]".format(cycle[i], cycle[i + 1])
+                                                   for i in range(len(cycle) - 1))
+                                       for cycle in cycles)))
+
+    def get_levels(self):
+        """
+        Group nodes into levels, nodes of a level only reference nodes of previous levels, so all nodes of a level
+        can be processed concurrently
+        :return: list(list(str))
+        :raise CyclicDependencyException: listing every cycle of the graph
+        """
+        level_by_node = {}
+        levels = []
+        for node in self.topological_sort():
+            level = max([level_by_node[predecessor] + 1 for predecessor in self._predecessors[node]] or [0])
+            level_by_node[node] = level
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(node)
+        return levels
+
+    def get_critical_path(self, durations=None):
+        """
+        Find the longest chain of dependent nodes, which bounds the time of a fully concurrent run
+        :param durations: dict(str, float): expected duration per node, 1 for nodes without duration
+        :return: (list(str), float): nodes of the critical path in order and its total duration
+        :raise CyclicDependencyException: listing every cycle of the graph
+        """
+        durations = durations or {}
+        finish_by_node = {}
+        previous = {}
+
+        for node in self.topological_sort():
+            start = 0
+            for predecessor in self._predecessors[node]:
+                if finish_by_node[predecessor] > start:
+                    start = finish_by_node[predecessor]
+                    previous[node] = predecessor
+            finish_by_node[node] = start + durations.get(node, 1)
+
+        if not finish_by_node:
+            return [], 0
+
+        node = max(finish_by_node, key=finish_by_node.get)
+        total = finish_by_node[node]
+        path = [node]
+        while node in previous:
+            node = previous[node]
+            path.append(node)
+        return list(reversed(path)), total
@@ -1,6 +1,4 @@
-import jmespath
 from six import string_types
-from jmespath.exceptions import JMESPathError
 
 from cfn_sphere.file_loader import FileLoader
 from cfn_sphere.aws.cfn import CloudFormation
@@ -9,6 +7,7 @@ from cfn_sphere.aws.kms import KMS
 from cfn_sphere.aws.ssm import SSM
 from cfn_sphere.exceptions import CfnSphereException
 from cfn_sphere.stack_configuration.dependency_resolver import DependencyResolver
+from cfn_sphere.timings import TIMINGS
 from cfn_sphere.util import get_logger
 from cfn_sphere.util import kv_list_string_to_dict
 
@@ -20,12 +19,12 @@ class ParameterResolver(object):
     """
     DEFAULT_REGION = 'eu-west-1'
 
-    def __init__(self, cfn, region=DEFAULT_REGION):
+    def __init__(self, cfn, region=DEFAULT_REGION, profile=None):
         self.logger = get_logger()
         self.cfn = cfn
-        self.ec2 = Ec2Api(region)
-        self.kms = KMS(region)
-        self.ssm = SSM(region)
+        self.ec2 = Ec2Api(region, profile)
+        self.kms = KMS(region, profile)
+        self.ssm = SSM(region, profile)
 
     @staticmethod
     def convert_list_to_string(value):
@@ -92,12 +91,38 @@ class ParameterResolver(object):
         except Exception as e:
             raise CfnSphereException("Could not get latest value for {0}: {1}".format(key, e))
 
+    def get_macro_type(self, value):
+        """
+        Get the kind of macro a parameter value uses, e.g. to time the resolution per macro type
+        :param value: parameter value
+        :return: str
+        """
+        if isinstance(value, TransformList):
+            return "list"
+        if not isinstance(value, string_types):
+            return "plain"
+        if DependencyResolver.is_parameter_reference(value):
+            return "ref"
+        if self.is_keep_value(value):
+            return "keeporuse"
+        if self.is_taupage_ami_reference(value):
+            return "taupage"
+        if self.is_kms(value):
+            return "kms"
+        if self.is_ssm(value):
+            return "ssm"
+        if self.is_file(value):
+            return "file"
+        return "plain"
+
     def resolve_parameter_values(self, stack_name, stack_config, cli_parameters=None):
         resolved_parameters = {}
         stack_outputs = self.cfn.get_stacks_outputs()
 
         for key, value in stack_config.parameters.items():
-            resolved_parameters[key] = self.resolve_parameter_value(key, value, stack_name, stack_config, stack_outputs)
+            with TIMINGS.span(key, "parameter {0}".format(self.get_macro_type(value))):
+                resolved_parameters[key] = self.resolve_parameter_value(key, value, stack_name, stack_config,
+                                                                        stack_outputs)
 
         if cli_parameters:
             return self.update_parameters_with_cli_parameters(resolved_parameters, cli_parameters, stack_name)
@@ -166,6 +191,9 @@ class ParameterResolver(object):
 
     @staticmethod
     def handle_file_value(value, working_dir):
+        import jmespath
+        from jmespath.exceptions import JMESPathError
+
         components = value.split('|', 3)
 
         if len(components) == 3:
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+from cfn_sphere.exceptions import CfnSphereException, InvalidConfigException
+from cfn_sphere.stack_configuration.dependency_resolver import DependencyResolver
+
+
+class StackSelector(object):
+    """
+    Selects the stacks of a config to process by name or tags before the stacks are parsed, so templates and
+    parameters of other stacks are never loaded. Stacks are matched as written in the config, before transform
+    context values are substituted. Outputs of upstream stacks are read from the deployed stacks, stacks depending on
+    selected stacks are only included if requested.
+    """
+
+    def __init__(self, stack_names=None, tags=None, include_dependents=False):
+        """
+        :param stack_names: list(str): stacks to select
+        :param tags: list(str): key=value pairs, stacks carrying all of them are selected
+        :param include_dependents: bool: also select stacks referencing outputs of selected stacks
+        """
+        self.stack_names = list(stack_names or [])
+        self.tags = self.parse_tags(tags)
+        self.include_dependents = include_dependents
+
+    @staticmethod
+    def parse_tags(tags):
+        """
+        :param tags: list(str): key=value pairs
+        :return: dict
+        """
+        parsed_tags = {}
+        for tag in tags or []:
+            key, separator, value = tag.partition("=")
+            if not separator or not key.strip():
+                raise CfnSphereException("Format of tag selector {0} is faulty, use key=value".format(tag))
+            parsed_tags[key.strip()] = value.strip()
+        return parsed_tags
+
+    def matches(self, stack_name, tags):
+        if stack_name in self.stack_names:
+            return True
+        return bool(self.tags) and all(str(tags.get(key)) == value for key, value in self.tags.items())
+
+    def get_selected_stacks(self, stacks, default_tags=None):
+        """
+        :param stacks: dict(str, dict): stack configs by name as written in the config
+        :param default_tags: dict: tags of all stacks
+        :return: list(str): selected stacks in config order
+        :raise InvalidConfigException: for unknown stack names or if no stack matches
+        """
+        unknown_stacks = [stack_name for stack_name in self.stack_names if stack_name not in stacks]
+        if unknown_stacks:
+            raise InvalidConfigException("Selected stacks do not exist in config: {0}".format(
+                ", ".join(unknown_stacks)))
+
+        selected_stacks = set()
+        for stack_name, stack in stacks.items():
+            tags = dict(default_tags or {})
+            tags.update((stack or {}).get("tags") or {})
+            if self.matches(stack_name, tags):
+                selected_stacks.add(stack_name)
+
+        if self.include_dependents:
+            stacks_with_parameters = {stack_name: SimpleNamespace(parameters=(stack or {}).get("parameters"))
+                                      for stack_name, stack in stacks.items()}
+            selected_stacks = DependencyResolver.get_dependent_stacks(stacks_with_parameters, selected_stacks)
+
+        if not selected_stacks:
+            raise InvalidConfigException("No stacks match the selection")
+
+        return [stack_name for stack_name in stacks if stack_name in selected_stacks]
+
+    def filter_stacks(self, stacks, default_tags=None):
+        """
+        :param stacks: dict(str, dict): stack configs by name as written in the config
+        :param default_tags: dict: tags of all stacks
+        :return: dict(str, dict): selected stack configs
+        """
+        return {stack_name: stacks[stack_name] for stack_name in self.get_selected_stacks(stacks, default_tags)}
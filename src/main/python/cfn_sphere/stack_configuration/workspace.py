@@ -0,0 +1,143 @@
+import copy
+import fnmatch
+import os
+import re
+
+import yaml
+
+from cfn_sphere.exceptions import InvalidConfigException
+from cfn_sphere.stack_configuration import Config
+from cfn_sphere.stack_configuration.stack_selector import StackSelector
+from cfn_sphere.transform import TransformDict
+from cfn_sphere.util import get_logger
+
+DEFAULT_CONFIG_PATTERN = "*.yml"
+STACKS_KEY_PATTERN = re.compile(r"^stacks\s*:", re.MULTILINE)
+
+
+class Workspace(object):
+    """
+    All stack configs of a directory combined into a single config. Stacks may reference outputs of stacks in other
+    configs, all stacks are ordered in one dependency graph and processed by one StackActionHandler, which shares the
+    stack listing, template and parameter caches and AWS clients between all configs.
+    Run wide settings like region, rate limits and api call budget are taken from the first config by file name.
+    """
+
+    def __init__(self, directory, cli_params=None, transform_context=None, pattern=DEFAULT_CONFIG_PATTERN,
+                 stack_selector=None):
+        self.logger = get_logger()
+        self.directory = os.path.realpath(directory)
+        self.config_files = self.find_config_files(self.directory, pattern)
+
+        if not self.config_files:
+            raise InvalidConfigException("Found no stack configs matching {0} in {1}".format(pattern, directory))
+
+        stack_selectors = {config_file: None for config_file in self.config_files}
+        if stack_selector:
+            stack_selectors = self.get_stack_selectors(self.config_files, stack_selector)
+            self.config_files = [config_file for config_file in self.config_files if config_file in stack_selectors]
+
+        self.logger.info("Loading {0} stack configs from {1}".format(len(self.config_files), directory))
+        configs = [Config(config_file=config_file, transform_context=transform_context,
+                          stack_selector=stack_selectors[config_file])
+                   for config_file in self.config_files]
+
+        self.config_file_by_stack = {}
+        self.config = self.merge_configs(self.config_files, configs, None if stack_selector else cli_params)
+
+        if stack_selector:
+            # parameters of stacks outside the selection are not used
+            self.config.cli_params = {stack_name: parameters for stack_name, parameters in
+                                      Config._parse_cli_parameters(cli_params).items()
+                                      if stack_name in self.config.stacks}
+
+    @staticmethod
+    def find_config_files(directory, pattern=DEFAULT_CONFIG_PATTERN):
+        """
+        Find the stack configs of a directory: files matching the pattern with a top level stacks key, so transform
+        contexts and other yaml files next to them are ignored
+        :param directory: str
+        :param pattern: str: file name pattern
+        :return: list(str): config file paths sorted by name
+        """
+        config_files = []
+        for file_name in sorted(fnmatch.filter(os.listdir(directory), pattern)):
+            file_path = os.path.join(directory, file_name)
+            if not os.path.isfile(file_path):
+                continue
+
+            with open(file_path, "r") as f:
+                if STACKS_KEY_PATTERN.search(f.read()):
+                    config_files.append(file_path)
+        return config_files
+
+    @staticmethod
+    def get_stack_selectors(config_files, stack_selector):
+        """
+        Apply a selection to the stacks of all configs, so dependents in other configs are selected as well
+        :param config_files: list(str)
+        :param stack_selector: StackSelector
+        :return: dict(str, StackSelector): selectors of the config files with selected stacks
+        """
+        stacks = {}
+        config_file_by_stack = {}
+        for config_file in config_files:
+            with open(config_file, "r") as f:
+                config_dict = yaml.safe_load(f) or {}
+
+            for stack_name, stack in (config_dict.get("stacks") or {}).items():
+                if stack_name in config_file_by_stack:
+                    raise InvalidConfigException("Stack {0} is defined in {1} and {2}".format(
+                        stack_name, config_file_by_stack[stack_name], config_file))
+
+                tags = dict(config_dict.get("tags") or {})
+                tags.update((stack or {}).get("tags") or {})
+                stacks[stack_name] = dict(stack or {}, tags=tags)
+                config_file_by_stack[stack_name] = config_file
+
+        selected_stacks = stack_selector.get_selected_stacks(stacks)
+
+        stack_selectors = {}
+        for config_file in config_files:
+            stack_names = [stack_name for stack_name in selected_stacks
+                           if config_file_by_stack[stack_name] == config_file]
+            if stack_names:
+                stack_selectors[config_file] = StackSelector(stack_names=stack_names)
+        return stack_selectors
+
+    def merge_configs(self, config_files, configs, cli_params=None):
+        """
+        Combine configs into one config with the stacks of all configs
+        :param config_files: list(str)
+        :param configs: list(Config)
+        :param cli_params: tuple(str): stack parameters like stack.key=value
+        :return: Config
+        :raise InvalidConfigException: if stack names clash or configs deploy to different regions or profiles
+        """
+        merged_config = copy.copy(configs[0])
+        merged_config.working_dir = self.directory
+        merged_config.stacks = TransformDict({}, {})
+
+        targets = [target.target_name for target in configs[0].get_targets()]
+
+        for config_file, config in zip(config_files, configs):
+            if [target.target_name for target in config.get_targets()] != targets:
+                raise InvalidConfigException(
+                    "All configs of a workspace must deploy to the same regions and profiles, {0} deploys to {1} "
+                    "instead of {2}".format(config_file, [target.target_name for target in config.get_targets()],
+                                            targets))
+
+            for stack_name, stack_config in config.stacks.items():
+                if stack_name in self.config_file_by_stack:
+                    raise InvalidConfigException("Stack {0} is defined in {1} and {2}".format(
+                        stack_name, self.config_file_by_stack[stack_name], config_file))
+
+                merged_config.stacks[stack_name] = stack_config
+                self.config_file_by_stack[stack_name] = config_file
+
+        merged_config.cli_params = Config._parse_cli_parameters(cli_params)
+        for stack_name in merged_config.cli_params.keys():
+            if stack_name not in merged_config.stacks:
+                raise InvalidConfigException("Stack '{0}' does not exist in workspace".format(stack_name))
+
+        return merged_config
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import UserDict, UserList
+
+from cfn_sphere.exceptions import CfnSphereException
+from cfn_sphere.file_loader import FileLoader
+from cfn_sphere.util import get_logger
+
+STATE_FILE_VERSION = 1
+
+
+def to_plain(value):
+    """
+    Convert transformed config values to plain dicts and lists, so they can be serialized
+    """
+    if isinstance(value, (dict, UserDict)):
+        return {str(key): to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, UserList)):
+        return [to_plain(item) for item in value]
+    return value
+
+
+def get_file_references(parameters):
+    """
+    Get the urls of files read by |file| parameter values
+    :param parameters: dict
+    :return: list(str)
+    """
+    urls = []
+    for value in (parameters or {}).values():
+        for item in value if isinstance(value, (list, UserList)) else [value]:
+            if isinstance(item, str) and item.lower().startswith("|file|"):
+                urls.append(item.split("|", 3)[2])
+    return urls
+
+
+def get_stack_input_hash(stack_config, cli_parameters=None):
+    """
+    Hash everything a stack is deployed from: its effective configuration and cli parameters, the contents of its
+    template and stack policy, files read by |file| parameters and local artifacts packaged with the template,
+    including included files, nested templates and their artifacts.
+    Values resolved from AWS (|ref|, |ssm|, |kms|, ...) are not part of the hash.
+    :param stack_config: StackConfig
+    :param cli_parameters: dict: cli parameters of the stack
+    :return: str
+    """
+    from cfn_sphere.template.sam_packager import CloudFormationSamPackager, get_artifact_md5
+
+    working_dir = stack_config.working_dir
+    sha = hashlib.sha256()
+
+    settings = {"parameters": stack_config.parameters,
+                "cli-parameters": cli_parameters or {},
+                "template-url": stack_config.template_url,
+                "tags": stack_config.tags,
+                "package-bucket": stack_config.package_bucket,
+                "template-bucket": stack_config.template_bucket,
+                "service-role": stack_config.service_role,
+                "stack-policy-url": stack_config.stack_policy_url,
+                "timeout": stack_config.timeout,
+                "on_failure": stack_config.failure_action,
+                "disable_rollback": stack_config.disable_rollback}
+    sha.update(json.dumps(to_plain(settings), sort_keys=True, default=str).encode("utf-8"))
+
+    referenced_files = [stack_config.template_url] + get_file_references(stack_config.parameters)
+    if stack_config.stack_policy_url:
+        referenced_files.append(stack_config.stack_policy_url)
+    for url in referenced_files:
+        sha.update(b"\0" + url.encode("utf-8") + b"\0")
+        sha.update(FileLoader.get_file(url, working_dir).encode("utf-8"))
+
+    template_url = stack_config.template_url
+    if stack_config.package_bucket and not template_url.lower().startswith(("s3://", "https://")):
+        template_body_dict = FileLoader.get_cached_yaml_or_json_file(template_url, working_dir)
+        template_path = os.path.realpath(os.path.join(working_dir or "", template_url))
+        for artifact in CloudFormationSamPackager.find_all_local_artifacts(
+                template_body_dict, os.path.dirname(template_path), (template_path,)):
+            sha.update(get_artifact_md5(artifact.local_path, artifact.needs_zip).encode("utf-8"))
+
+    return sha.hexdigest()
+
+
+class SyncState(object):
+    """
+    Input hashes of the stacks deployed by previous incremental syncs per target, stored in a json file.
+    A stack's hash is only recorded after it was deployed successfully.
+    """
+
+    def __init__(self, file_path):
+        self.logger = get_logger()
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._targets = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.file_path):
+            return {}
+
+        try:
+            with open(self.file_path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CfnSphereException("Could not read sync state {0}: {1}".format(self.file_path, e))
+
+        if state.get("version") != STATE_FILE_VERSION:
+            self.logger.warning("Ignoring sync state {0} of unknown version {1}".format(self.file_path,
+                                                                                        state.get("version")))
+            return {}
+        return state.get("targets", {})
+
+    def get_input_hash(self, target_name, stack_name):
+        """
+        :param target_name: str
+        :param stack_name: str
+        :return: str: input hash of the last successful deployment, None if unknown
+        """
+        with self._lock:
+            return self._targets.get(target_name, {}).get(stack_name)
+
+    def record(self, target_name, stack_name, input_hash):
+        """
+        Record a successful deployment and save the state
+        :param target_name: str
+        :param stack_name: str
+        :param input_hash: str
+        """
+        with self._lock:
+            self._targets.setdefault(target_name, {})[stack_name] = input_hash
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        # write and rename, so an interrupted run never leaves a truncated state behind
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as f:
+            json.dump({"version": STATE_FILE_VERSION, "targets": self._targets}, f, indent=2, sort_keys=True)
+        os.replace(f.name, self.file_path)
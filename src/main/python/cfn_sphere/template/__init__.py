@@ -1,8 +1,20 @@
+import hashlib
 import json
 
+# attributes making up the template body, assigning one of them invalidates the serialization cache
+TEMPLATE_BODY_ATTRIBUTES = ['template_format_version', 'description', 'metadata', 'parameters', 'mappings',
+                            'conditions', 'transform', 'resources', 'outputs']
+
 
 class CloudFormationTemplate(object):
+    """
+    A CloudFormation template. Its JSON serialization and content hash are cached until one of the template
+    sections is assigned, so sections must be replaced instead of modified in place.
+    """
+
     def __init__(self, body_dict, name):
+        self._template_json = None
+        self._content_hash = None
         self.name = name
         self.template_format_version = body_dict.get('AWSTemplateFormatVersion', '2010-09-09')
         self.description = body_dict.get('Description', '')
@@ -14,6 +26,12 @@ class CloudFormationTemplate(object):
         self.resources = body_dict.get('Resources', {})
         self.outputs = body_dict.get('Outputs', {})
 
+    def __setattr__(self, name, value):
+        if name in TEMPLATE_BODY_ATTRIBUTES:
+            self._template_json = None
+            self._content_hash = None
+        object.__setattr__(self, name, value)
+
     def get_no_echo_parameter_keys(self):
         if self.parameters:
             return [key for key, value in self.parameters.items() if str(value.get('NoEcho')).lower() == 'true']
@@ -41,4 +59,19 @@ class CloudFormationTemplate(object):
         return json.dumps(self.get_template_body_dict(), indent=2)
 
     def get_template_json(self):
-        return json.dumps(self.get_template_body_dict())
+        """
+        Get the compact template JSON with sorted keys, so equal templates always serialize equally
+        :return: str
+        """
+        if self._template_json is None:
+            self._template_json = json.dumps(self.get_template_body_dict(), sort_keys=True, separators=(',', ':'))
+        return self._template_json
+
+    def get_content_hash(self):
+        """
+        Get the sha256 hash of the template JSON
+        :return: str
+        """
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.get_template_json().encode('utf-8')).hexdigest()
+        return self._content_hash
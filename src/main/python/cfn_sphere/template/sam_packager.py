@@ -1,71 +1,477 @@
-import json
+import copy
+import hashlib
 import os.path
-import subprocess
-import sys
+import shutil
 import tempfile
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
 
-import boto3
-
+from cfn_sphere.aws.s3 import S3
+from cfn_sphere.exceptions import TemplateErrorException
+from cfn_sphere.file_loader import FileLoader
 from cfn_sphere.template import CloudFormationTemplate
+from cfn_sphere.timings import TIMINGS
 from cfn_sphere.util import get_logger
 
+ZIP_ENTRY_TIMESTAMP = (1980, 1, 1, 0, 0, 0)
+REMOTE_URL_PREFIXES = ("s3://", "https://", "http://")
+
+
+class PackageableProperty(object):
+    """
+    A resource property which may point to a local file or directory that has to be uploaded to S3.
+    The property is replaced by a s3://bucket/key url or, if bucket_property and key_property are set,
+    by a dict referencing bucket and key. Nested templates are packaged themselves before their upload
+    and referenced by https url.
+    """
+
+    def __init__(self, resource_type, property_path, package_null_property=True, force_zip=False,
+                 bucket_property=None, key_property=None, nested_template=False):
+        self.resource_type = resource_type
+        self.property_path = property_path.split(".")
+        self.package_null_property = package_null_property
+        self.force_zip = force_zip
+        self.bucket_property = bucket_property
+        self.key_property = key_property
+        self.nested_template = nested_template
+
+    def get_value(self, properties):
+        value = properties
+        for key in self.property_path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+    def set_value(self, properties, value):
+        for key in self.property_path[:-1]:
+            properties = properties.setdefault(key, {})
+        properties[self.property_path[-1]] = value
+
+    def get_packaged_value(self, bucket_name, key_name, region):
+        if self.nested_template:
+            return "https://{0}.s3.{1}.amazonaws.com/{2}".format(bucket_name, region, key_name)
+        elif self.bucket_property and self.key_property:
+            return {self.bucket_property: bucket_name, self.key_property: key_name}
+        else:
+            return "s3://{0}/{1}".format(bucket_name, key_name)
+
+
+# resource properties handled by `aws cloudformation package`
+PACKAGEABLE_PROPERTIES = [
+    PackageableProperty("AWS::CloudFormation::Stack", "TemplateURL", package_null_property=False,
+                        nested_template=True),
+    PackageableProperty("AWS::Serverless::Application", "Location", package_null_property=False,
+                        nested_template=True),
+    PackageableProperty("AWS::Serverless::Function", "CodeUri", force_zip=True),
+    PackageableProperty("AWS::Serverless::LayerVersion", "ContentUri", force_zip=True),
+    PackageableProperty("AWS::Serverless::Api", "DefinitionUri", package_null_property=False),
+    PackageableProperty("AWS::Serverless::HttpApi", "DefinitionUri", package_null_property=False),
+    PackageableProperty("AWS::Serverless::StateMachine", "DefinitionUri", package_null_property=False),
+    PackageableProperty("AWS::AppSync::GraphQLSchema", "DefinitionS3Location", package_null_property=False),
+    PackageableProperty("AWS::AppSync::Resolver", "RequestMappingTemplateS3Location", package_null_property=False),
+    PackageableProperty("AWS::AppSync::Resolver", "ResponseMappingTemplateS3Location", package_null_property=False),
+    PackageableProperty("AWS::AppSync::FunctionConfiguration", "RequestMappingTemplateS3Location",
+                        package_null_property=False),
+    PackageableProperty("AWS::AppSync::FunctionConfiguration", "ResponseMappingTemplateS3Location",
+                        package_null_property=False),
+    PackageableProperty("AWS::Glue::Job", "Command.ScriptLocation", package_null_property=False),
+    PackageableProperty("AWS::Lambda::Function", "Code", force_zip=True,
+                        bucket_property="S3Bucket", key_property="S3Key"),
+    PackageableProperty("AWS::Lambda::LayerVersion", "Content", force_zip=True,
+                        bucket_property="S3Bucket", key_property="S3Key"),
+    PackageableProperty("AWS::ApiGateway::RestApi", "BodyS3Location", package_null_property=False,
+                        bucket_property="Bucket", key_property="Key"),
+    PackageableProperty("AWS::ElasticBeanstalk::ApplicationVersion", "SourceBundle",
+                        bucket_property="S3Bucket", key_property="S3Key"),
+    PackageableProperty("AWS::StepFunctions::StateMachine", "DefinitionS3Location", package_null_property=False,
+                        bucket_property="Bucket", key_property="Key"),
+    PackageableProperty("AWS::CodeCommit::Repository", "Code.S3", package_null_property=False,
+                        bucket_property="Bucket", key_property="Key")
+]
+
+# Location parameter of AWS::Include transforms, which may appear anywhere in a template
+INCLUDE_TRANSFORM_PROPERTY = PackageableProperty("AWS::Include", "Location", package_null_property=False)
+
+
+class LocalArtifact(object):
+    def __init__(self, resource_name, properties, packageable_property, local_path):
+        self.resource_name = resource_name
+        self.properties = properties
+        self.packageable_property = packageable_property
+        self.local_path = local_path
+
+    @property
+    def needs_zip(self):
+        if os.path.isdir(self.local_path):
+            return True
+        return self.packageable_property.force_zip and not zipfile.is_zipfile(self.local_path)
+
+    def set_location(self, bucket_name, key_name, region):
+        self.packageable_property.set_value(
+            self.properties, self.packageable_property.get_packaged_value(bucket_name, key_name, region))
+
+
 class CloudFormationSamPackager:
     """
-    Run `aws cloudformation package` to upload SAM package artifacts to S3 and
-    replace values in template.
+    Upload local artifacts referenced by a template to S3 and replace their references in the template,
+    like `aws cloudformation package` does.
     """
+    MAX_CONCURRENT_ARTIFACTS = 4
 
     @classmethod
-    def package(cls, template_url, working_dir, template, region, package_bucket):
+    @TIMINGS.timed("package")
+    def package(cls, template_url, working_dir, template, region, package_bucket, profile=None,
+                parent_templates=()):
+        """
+        :param parent_templates: tuple(str): real paths of the templates nesting this template
+        :raise TemplateErrorException: for missing artifacts, cyclic nested templates and, without package_bucket,
+                                       nested templates or includes referenced by local path
+        """
         logger = get_logger()
 
         if not package_bucket:
+            cls.validate_remote_templates(template.get_template_body_dict())
             return template
 
-        if template_url.lower().startswith("s3://") or  template_url.lower().startswith("https://"):
+        if template_url.lower().startswith("s3://") or template_url.lower().startswith("https://"):
             raise Exception("SAM packaging is only supported for local templates (not S3/HTTPS)")
 
-        template_body_dict = template.get_template_body_dict()
-
-        # Save template to a temporary file in the original template's
-        # directory. Call `aws cloudformation package` to upload artifacts
-        # to S3.
-        aws_credentials = boto3.DEFAULT_SESSION.get_credentials()
-        with tempfile.NamedTemporaryFile(mode="w",
-                                         dir=os.path.dirname(os.path.join(working_dir, template_url)),
-                                         suffix=".json") as src_fp:
-            # Save the template. Ensure the buffer's flushed to disk before
-            # calling `aws cloudformation package`.
-            json.dump(template_body_dict, src_fp)
-            src_fp.flush()
-
-            # Open temporary file for the packaged template.
-            # We'd previously used stdout, but the packaging process also
-            # wrote status to stdout when the source artifact changed, causing
-            # malformed JSON.
-            with tempfile.NamedTemporaryFile(mode="r") as dst_fp:
-                logger.info("Packaging {}".format(template_url))
-                result = subprocess.check_call(
-                    args=[
-                        "aws", "cloudformation", "package",
-                        "--template-file", src_fp.name,
-                        "--s3-bucket", package_bucket,
-                        "--output-template-file", dst_fp.name,
-                        "--use-json"
-                    ],
-                    env=dict(
-                        os.environ,
-                        AWS_REGION=region,
-                        AWS_ACCESS_KEY_ID=aws_credentials.access_key,
-                        AWS_SECRET_ACCESS_KEY=aws_credentials.secret_key,
-                        AWS_SESSION_TOKEN=aws_credentials.token or ''
-                    ),
-                    stdout=subprocess.DEVNULL,
-                    stderr=sys.stderr
-                )
-
-                result = dst_fp.read()
-
-        template_body_dict = json.loads(result)
-        template = CloudFormationTemplate(template_body_dict, template.name)
-        return template
+        template_path = os.path.realpath(os.path.join(working_dir, template_url))
+        template_dir = os.path.dirname(template_path)
+        template_body_dict = copy.deepcopy(template.get_template_body_dict())
+        artifacts = cls.find_local_artifacts(template_body_dict.get("Resources", {}), template_dir)
+        artifacts += cls.find_include_artifacts(template_body_dict, template_dir)
+
+        if not artifacts:
+            return template
+
+        logger.info("Packaging {}".format(template_url))
+        s3 = S3(region, profile)
+        parent_templates = parent_templates + (template_path,)
+
+        with ThreadPoolExecutor(max_workers=cls.MAX_CONCURRENT_ARTIFACTS) as executor:
+            upload_artifact = TIMINGS.bind(lambda artifact: cls.upload_artifact(
+                s3, package_bucket, artifact, region, profile, parent_templates))
+            key_names = list(executor.map(upload_artifact, artifacts))
+
+        for artifact, key_name in zip(artifacts, key_names):
+            artifact.set_location(package_bucket, key_name, region)
+
+        return CloudFormationTemplate(template_body_dict, template.name)
+
+    @staticmethod
+    def get_local_template_references(template_body_dict):
+        """
+        Find nested templates and includes referenced by local path
+        :param template_body_dict: dict
+        :return: list((str, PackageableProperty, dict)): resource names or Fn::Transform for includes, properties
+                 and the property dicts holding them
+        """
+        references = []
+
+        for resource_name, resource in template_body_dict.get("Resources", {}).items():
+            if not isinstance(resource, dict):
+                continue
+            for packageable_property in PACKAGEABLE_PROPERTIES:
+                if packageable_property.nested_template and resource.get("Type") == packageable_property.resource_type:
+                    references.append((resource_name, packageable_property, resource.setdefault("Properties", {})))
+
+        pending = [template_body_dict]
+        while pending:
+            value = pending.pop()
+            if isinstance(value, list):
+                pending.extend(value)
+            elif isinstance(value, dict):
+                transform = value.get("Fn::Transform")
+                if isinstance(transform, dict) and transform.get("Name") == "AWS::Include" \
+                        and isinstance(transform.get("Parameters"), dict):
+                    references.append(("Fn::Transform", INCLUDE_TRANSFORM_PROPERTY, transform["Parameters"]))
+                pending.extend(value.values())
+
+        return [(name, packageable_property, properties) for name, packageable_property, properties in references
+                if is_local_path(packageable_property.get_value(properties))]
+
+    @classmethod
+    def validate_remote_templates(cls, template_body_dict):
+        """
+        :raise TemplateErrorException: if a nested template or include is referenced by local path, which
+                                       CloudFormation can't read
+        """
+        for name, packageable_property, properties in cls.get_local_template_references(template_body_dict):
+            raise TemplateErrorException(
+                "Property {0} of {1} refers to local file {2}, please configure a package-bucket to package it".format(
+                    ".".join(packageable_property.property_path), name, packageable_property.get_value(properties)))
+
+    @classmethod
+    def find_all_local_artifacts(cls, template_body_dict, template_dir, parent_templates=()):
+        """
+        Find all local artifacts package uploads for a template: artifacts of its resources, included files, nested
+        templates and, recursively, the artifacts of nested templates
+        :param template_body_dict: dict
+        :param template_dir: str: directory relative paths are resolved against
+        :param parent_templates: tuple(str): real paths of the templates nesting this template
+        :return: list(LocalArtifact)
+        :raise TemplateErrorException: for missing artifacts and cyclic nested templates
+        """
+        artifacts = cls.find_local_artifacts(template_body_dict.get("Resources", {}), template_dir)
+        artifacts += cls.find_include_artifacts(template_body_dict, template_dir)
+
+        for artifact in list(artifacts):
+            if artifact.packageable_property.nested_template:
+                local_path = artifact.local_path
+                cls.validate_template_does_not_nest_itself(local_path, parent_templates)
+                artifacts += cls.find_all_local_artifacts(
+                    FileLoader.get_cached_yaml_or_json_file(local_path, None),
+                    os.path.dirname(local_path), parent_templates + (os.path.realpath(local_path),))
+
+        return artifacts
+
+    @staticmethod
+    def validate_template_does_not_nest_itself(local_path, parent_templates):
+        """
+        :param local_path: str: nested template
+        :param parent_templates: tuple(str): real paths of the templates nesting it
+        :raise TemplateErrorException: if the template nests itself
+        """
+        if os.path.realpath(local_path) in parent_templates:
+            raise TemplateErrorException("Template {0} nests itself".format(local_path))
+
+    @classmethod
+    def find_include_artifacts(cls, template_body_dict, template_dir):
+        """
+        Find all AWS::Include transforms pointing to local files
+        :param template_body_dict: dict
+        :param template_dir: str: directory relative paths are resolved against
+        :return: list(LocalArtifact)
+        """
+        artifacts = []
+
+        for name, packageable_property, properties in cls.get_local_template_references(template_body_dict):
+            if packageable_property is not INCLUDE_TRANSFORM_PROPERTY:
+                continue
+
+            local_path = os.path.join(template_dir, packageable_property.get_value(properties))
+            if not os.path.isfile(local_path):
+                raise TemplateErrorException(
+                    "Location of an AWS::Include transform refers to a file that does not exist: {0}".format(
+                        local_path))
+
+            artifacts.append(LocalArtifact(name, properties, packageable_property, local_path))
+
+        return artifacts
+
+    @staticmethod
+    def find_local_artifacts(resources, template_dir):
+        """
+        Find all resource properties pointing to local files or directories
+        :param resources: dict: template resources
+        :param template_dir: str: directory relative paths are resolved against
+        :return: list(LocalArtifact)
+        """
+        artifacts = []
+
+        for resource_name, resource in resources.items():
+            if not isinstance(resource, dict):
+                continue
+
+            for packageable_property in PACKAGEABLE_PROPERTIES:
+                if resource.get("Type") != packageable_property.resource_type:
+                    continue
+
+                properties = resource.setdefault("Properties", {})
+                value = packageable_property.get_value(properties)
+
+                if not value and not packageable_property.package_null_property:
+                    continue
+                if isinstance(value, dict) or (value and not is_local_path(value)):
+                    continue
+
+                local_path = os.path.join(template_dir, value) if value else template_dir
+                if not os.path.exists(local_path):
+                    raise TemplateErrorException(
+                        "Property {0} of resource {1} refers to a file or directory that does not exist: {2}".format(
+                            ".".join(packageable_property.property_path), resource_name, local_path))
+
+                artifacts.append(LocalArtifact(resource_name, properties, packageable_property, local_path))
+
+        return artifacts
+
+    @classmethod
+    def upload_artifact(cls, s3, bucket_name, artifact, region=None, profile=None, parent_templates=()):
+        """
+        Upload an artifact (zipped if necessary) using the hash of its contents as key.
+        Each artifact is uploaded at most once per run and not at all if the bucket already holds it.
+        Nested templates are packaged first and uploaded with their packaged contents.
+        :return: str: key name
+        """
+        if artifact.packageable_property.nested_template:
+            template_body = cls.package_nested_template(artifact.local_path, region, bucket_name, profile,
+                                                        parent_templates).get_template_json()
+            key_name = hashlib.md5(template_body.encode("utf-8")).hexdigest() + ".template"
+            return ARTIFACT_REGISTRY.get_key_name(
+                bucket_name, key_name, lambda: cls.put_template_if_missing(s3, bucket_name, key_name, template_body))
+
+        key_name = get_artifact_md5(artifact.local_path, artifact.needs_zip)
+        return ARTIFACT_REGISTRY.get_key_name(
+            bucket_name, key_name, lambda: cls.upload_artifact_if_missing(s3, bucket_name, key_name, artifact))
+
+    @classmethod
+    def package_nested_template(cls, local_path, region, bucket_name, profile, parent_templates):
+        """
+        Load and package a nested template like its parent
+        :param local_path: str
+        :param parent_templates: tuple(str): real paths of the templates nesting it
+        :return: CloudFormationTemplate
+        :raise TemplateErrorException: if the template nests itself
+        """
+        cls.validate_template_does_not_nest_itself(local_path, parent_templates)
+
+        template = FileLoader.get_cloudformation_template(local_path, os.path.dirname(local_path))
+        return cls.package(local_path, os.path.dirname(local_path), template, region, bucket_name, profile,
+                           parent_templates)
+
+    @staticmethod
+    def put_template_if_missing(s3, bucket_name, key_name, template_body):
+        logger = get_logger()
+
+        if s3.object_exists(bucket_name, key_name):
+            logger.debug("Template s3://{0}/{1} already exists, skipping upload".format(bucket_name, key_name))
+        else:
+            logger.info("Uploading nested template to s3://{0}/{1}".format(bucket_name, key_name))
+            s3.put_object(bucket_name, key_name, template_body)
+
+        return key_name
+
+    @classmethod
+    def upload_artifact_if_missing(cls, s3, bucket_name, key_name, artifact):
+        logger = get_logger()
+
+        if s3.object_exists(bucket_name, key_name):
+            logger.debug("Artifact s3://{0}/{1} already exists, skipping upload".format(bucket_name, key_name))
+            return key_name
+
+        logger.info("Uploading {0} to s3://{1}/{2}".format(artifact.local_path, bucket_name, key_name))
+        if artifact.needs_zip:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                zip_file = os.path.join(temp_dir, "artifact.zip")
+                cls.zip_artifact(artifact.local_path, zip_file)
+                s3.upload_file(zip_file, bucket_name, key_name)
+        else:
+            s3.upload_file(artifact.local_path, bucket_name, key_name)
+
+        return key_name
+
+    @staticmethod
+    def zip_artifact(local_path, zip_file):
+        """
+        Create a reproducible zip file: entries are sorted and carry fixed timestamps and permissions,
+        so identical contents always result in identical zip files.
+        """
+        with zipfile.ZipFile(zip_file, "w", zipfile.ZIP_DEFLATED) as zf:
+            for arcname, file_path in get_zip_entries(local_path):
+                zip_info = zipfile.ZipInfo(arcname, date_time=ZIP_ENTRY_TIMESTAMP)
+                zip_info.compress_type = zipfile.ZIP_DEFLATED
+                zip_info.external_attr = get_zip_entry_mode(file_path) << 16
+
+                with open(file_path, "rb") as source, zf.open(zip_info, "w") as target:
+                    shutil.copyfileobj(source, target)
+
+
+class ArtifactRegistry(object):
+    """
+    Run wide registry of artifacts keyed by bucket and content hash.
+    Concurrent requests for the same artifact wait for the first upload instead of repeating it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._uploads = {}
+
+    def get_key_name(self, bucket_name, content_hash, upload_function):
+        registry_key = (bucket_name, content_hash)
+
+        with self._lock:
+            upload = self._uploads.get(registry_key)
+            is_owner = upload is None
+            if is_owner:
+                upload = Future()
+                self._uploads[registry_key] = upload
+
+        if is_owner:
+            try:
+                upload.set_result(upload_function())
+            except Exception as e:
+                # forget failed uploads so a later stack may retry them
+                with self._lock:
+                    del self._uploads[registry_key]
+                upload.set_exception(e)
+
+        return upload.result()
+
+    def clear(self):
+        with self._lock:
+            self._uploads = {}
+
+
+ARTIFACT_REGISTRY = ArtifactRegistry()
+
+
+def is_local_path(value):
+    """
+    :param value: property value
+    :return: bool: True for strings which are no s3 or http urls
+    """
+    return isinstance(value, str) and bool(value) and not value.lower().startswith(REMOTE_URL_PREFIXES)
+
+
+def get_zip_entries(local_path):
+    """
+    Return the sorted (arcname, file path) pairs a zip of local_path consists of
+    :param local_path: str: file or directory
+    :return: list(tuple(str, str))
+    """
+    if not os.path.isdir(local_path):
+        return [(os.path.basename(local_path), local_path)]
+
+    entries = []
+    for root, dirs, files in os.walk(local_path, followlinks=True):
+        dirs.sort()
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            entries.append((os.path.relpath(file_path, local_path).replace(os.sep, "/"), file_path))
+
+    return sorted(entries)
+
+
+def get_zip_entry_mode(file_path):
+    if os.access(file_path, os.X_OK):
+        return 0o100755
+    else:
+        return 0o100644
+
+
+def get_artifact_md5(local_path, needs_zip):
+    """
+    Hash an artifact's contents. Zipped artifacts are hashed from their entries without building the zip.
+    :param local_path: str: file or directory
+    :param needs_zip: bool
+    :return: str
+    """
+    if not needs_zip:
+        return get_file_md5(local_path)
+
+    md5 = hashlib.md5()
+    for arcname, file_path in get_zip_entries(local_path):
+        md5.update("{0}\0{1:o}\0".format(arcname, get_zip_entry_mode(file_path)).encode("utf-8"))
+        md5.update(get_file_md5(file_path).encode("utf-8"))
+    return md5.hexdigest()
+
+
+def get_file_md5(file_path):
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
@@ -6,9 +6,21 @@ from cfn_sphere.util import get_git_repository_remote_url
 
 class TemplateHandler(object):
     @staticmethod
-    def get_template(template_url, working_dir, region, package_bucket):
+    def get_template(template_url, working_dir, region, package_bucket, additional_stack_description=None,
+                     profile=None):
         template = FileLoader.get_cloudformation_template(template_url, working_dir)
-        additional_stack_description = "Config repo url: {0}".format(get_git_repository_remote_url(working_dir))
+        if additional_stack_description is None:
+            additional_stack_description = TemplateHandler.get_additional_stack_description(working_dir)
         template = CloudFormationTemplateTransformer.transform_template(template, additional_stack_description)
-        template = CloudFormationSamPackager.package(template_url, working_dir, template, region, package_bucket)
+        template = CloudFormationSamPackager.package(template_url, working_dir, template, region, package_bucket,
+                                                     profile)
         return template
+
+    @staticmethod
+    def get_additional_stack_description(working_dir):
+        """
+        Get the suffix appended to the descriptions of all stacks of a config
+        :param working_dir: str: config directory
+        :return: str
+        """
+        return "Config repo url: {0}".format(get_git_repository_remote_url(working_dir))
@@ -2,10 +2,14 @@ import re
 from six import string_types
 
 from cfn_sphere.exceptions import TemplateErrorException
+from cfn_sphere.profiling import hot_path
+from cfn_sphere.timings import TIMINGS
 
 
 class CloudFormationTemplateTransformer(object):
     @classmethod
+    @hot_path("template-transform")
+    @TIMINGS.timed("transform")
     def transform_template(cls, template, additional_stack_description=None):
         description = template.description
         conditions = template.conditions
@@ -0,0 +1,224 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+class Span(object):
+    """
+    A timed phase of a run. Spans form a tree and belong to the stack of their closest ancestor naming one.
+    """
+
+    def __init__(self, name, category, stack=None, parent=None):
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.stack = stack if stack is not None else (parent.stack if parent else None)
+        self.children = []
+        self.error = None
+        self.start = time.time()
+        self._start_counter = time.perf_counter()
+        self.duration = None
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self._start_counter
+        self.error = error
+
+    def to_dict(self):
+        return {"name": self.name,
+                "category": self.category,
+                "stack": self.stack,
+                "start": round(self.start, 6),
+                "duration": round(self.duration or 0.0, 6),
+                "error": self.error,
+                "children": [child.to_dict() for child in list(self.children)]}
+
+
+class Timings(object):
+    """
+    Collects spans of all threads. Each thread has its own current span; work handed over to other threads keeps
+    its parent when wrapped with bind().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.spans = []
+
+    def get_current_span(self):
+        return getattr(self._local, "current_span", None)
+
+    def start_span(self, name, category, stack=None, parent=None):
+        """
+        Start a span without making it the current span, e.g. for api calls tracked by callbacks
+        :return: Span
+        """
+        span = Span(name, category, stack, parent or self.get_current_span())
+
+        with self._lock:
+            if span.parent:
+                span.parent.children.append(span)
+            else:
+                self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name, category, stack=None, parent=None):
+        """
+        Time the enclosed block as current span of this thread
+        :param name: str
+        :param category: str: phase, e.g. template-load
+        :param stack: str: stack the span belongs to, inherited from the parent if not given
+        :param parent: Span: parent span, defaults to the current span of this thread
+        """
+        span = self.start_span(name, category, stack, parent)
+        previous_span = self.get_current_span()
+        self._local.current_span = span
+
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(error=type(e).__name__)
+            raise
+        else:
+            span.finish()
+        finally:
+            self._local.current_span = previous_span
+
+    def timed(self, category, name=None):
+        """
+        Decorator timing each call of a function as span
+        :param category: str
+        :param name: str: span name, defaults to the functions qualified name
+        """
+
+        def decorator(function):
+            span_name = name or function.__qualname__
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, category):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def bind(self, function):
+        """
+        Wrap a function handed to another thread, so its spans become children of the current span
+        :param function: callable
+        :return: callable
+        """
+        parent = self.get_current_span()
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            previous_span = self.get_current_span()
+            self._local.current_span = parent
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._local.current_span = previous_span
+
+        return wrapper
+
+    def iter_spans(self):
+        with self._lock:
+            pending = list(self.spans)
+
+        while pending:
+            span = pending.pop()
+            if span.duration is not None:
+                yield span
+            pending.extend(span.children)
+
+    def get_category_totals(self):
+        """
+        Get count, total and maximum duration per category. Nested spans are included in their parents totals.
+        :return: dict(str, dict)
+        """
+        totals = {}
+
+        for span in self.iter_spans():
+            total = totals.setdefault(span.category, {"count": 0, "total": 0.0, "max": 0.0})
+            total["count"] += 1
+            total["total"] += span.duration
+            total["max"] = max(total["max"], span.duration)
+
+        return totals
+
+    def get_stack_totals(self):
+        """
+        Get the time spent per stack and category
+        :return: dict(str, dict(str, float))
+        """
+        totals = {}
+
+        for span in self.iter_spans():
+            if span.stack is not None:
+                stack_totals = totals.setdefault(span.stack, {})
+                stack_totals[span.category] = stack_totals.get(span.category, 0.0) + span.duration
+
+        return totals
+
+    def get_summary_table(self):
+        """
+        Render category and per stack totals as tables
+        :return: str
+        """
+        from prettytable import PrettyTable
+
+        category_table = PrettyTable(["Phase", "Count", "Total (s)", "Max (s)"])
+        category_table.align["Phase"] = "l"
+        for category, total in sorted(self.get_category_totals().items(), key=lambda item: -item[1]["total"]):
+            category_table.add_row([category, total["count"], round(total["total"], 2), round(total["max"], 2)])
+
+        stack_totals = self.get_stack_totals()
+        categories = sorted(set(category for totals in stack_totals.values() for category in totals))
+        stack_table = PrettyTable(["Stack"] + categories)
+        stack_table.align["Stack"] = "l"
+        for stack_name in sorted(stack_totals):
+            stack_table.add_row([stack_name] + [round(stack_totals[stack_name].get(category, 0.0), 2)
+                                                for category in categories])
+
+        return "{0}\n{1}".format(category_table, stack_table)
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+
+        return {"spans": [span.to_dict() for span in spans if span.duration is not None],
+                "categories": self.get_category_totals(),
+                "stacks": self.get_stack_totals()}
+
+    def write_json(self, file_path):
+        with open(file_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def register(self, client):
+        """
+        Time every api call of a botocore client, including its retries
+        :param client: botocore.client.BaseClient
+        """
+        client.meta.events.register("before-call", self._before_call)
+        client.meta.events.register("after-call", self._after_call)
+        client.meta.events.register("after-call-error", self._after_call)
+
+    def _before_call(self, model, context, **kwargs):
+        context["timing_span"] = self.start_span(
+            "{0}.{1}".format(model.service_model.service_name, model.name), "aws")
+
+    @staticmethod
+    def _after_call(context, exception=None, **kwargs):
+        span = context.pop("timing_span", None)
+        if span:
+            span.finish(error=type(exception).__name__ if exception else None)
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+
+TIMINGS = Timings()
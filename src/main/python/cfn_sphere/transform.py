@@ -6,6 +6,8 @@ import re
 
 from future.moves.collections import UserDict, UserList
 
+from cfn_sphere.profiling import hot_path
+
 
 class OldStyle:
     pass
@@ -18,6 +20,7 @@ def merge_two_dicts(x, y):
     return z
 
 
+@hot_path("context-includes")
 def merge_includes(data, path):
     merged_dict = {}
 
@@ -80,6 +83,17 @@ class TransformList(UserList):
         self.data[index] = transmute(item, self.transform)
 
 
+@hot_path("context-transform")
+def transform_dict(data, context):
+    """
+    Replace the [key] tokens of the context in all keys and values of a dict and its nested dicts and lists
+    :param data: dict
+    :param context: dict
+    :return: TransformDict
+    """
+    return TransformDict(data, context)
+
+
 class TransformDict(UserDict):
     def __init__(self, data, context):
         super(TransformDict, self).__init__()
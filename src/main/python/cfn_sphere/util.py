@@ -2,31 +2,24 @@
 import json
 import logging
 import os
+import tempfile
+import threading
 import time
-from functools import wraps
+from functools import lru_cache
 
 import yaml
-from botocore.exceptions import BotoCoreError, ClientError
-from dateutil import parser
-from git import Repo, InvalidGitRepositoryError
-from prettytable import PrettyTable
 from six.moves.urllib import request as urllib2
 
-from cfn_sphere.exceptions import CfnSphereException, CfnSphereBotoError
+from cfn_sphere.exceptions import CfnSphereException
 
+LATEST_VERSION_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cfn-square", "latest-version.json")
+LATEST_VERSION_CACHE_TTL = 24 * 60 * 60
 
-def timed(function):
-    logger = logging.getLogger(__name__)
 
-    @wraps(function)
-    def wrapper(*args, **kwds):
-        start = time.time()
-        result = function(*args, **kwds)
-        elapsed = time.time() - start
-        logger.debug("Execution of {0} required {1}s".format(function.__name__, round(elapsed, 2)))
-        return result
-
-    return wrapper
+class _UnsupportedGitConfigError(Exception):
+    """
+    A git config read_git_config_remote_url can't read, left to GitPython
+    """
 
 
 def get_logger(root=False):
@@ -80,6 +73,8 @@ def kv_list_string_to_dict(value):
 
 
 def get_pretty_parameters_string(stack):
+    from prettytable import PrettyTable
+
     table = PrettyTable(["Parameter", "Value"])
 
     parameters = stack.parameters
@@ -95,6 +90,8 @@ def get_pretty_parameters_string(stack):
 
 
 def get_pretty_changeset_string(change_set):
+    from prettytable import PrettyTable
+
     table = PrettyTable(["Action", "Logical ID", "PhysicalID", "ResourceType", "Replacement"])
     for change in change_set:
         detail = change['ResourceChange']
@@ -105,6 +102,8 @@ def get_pretty_changeset_string(change_set):
 
 
 def get_pretty_stack_outputs(stack_outputs):
+    from prettytable import PrettyTable
+
     table = PrettyTable(["Output", "Value"])
     table_has_entries = False
 
@@ -139,6 +138,8 @@ def convert_dict_to_json_string(data):
 
 
 def get_cfn_api_server_time():
+    from dateutil import parser
+
     url = "https://aws.amazon.com"
 
     try:
@@ -150,13 +151,54 @@ def get_cfn_api_server_time():
 
 
 def get_latest_version():
+    """
+    Return the latest released version known from the on disk cache without blocking on the network.
+    A missing or outdated cache gets refreshed in a background thread for subsequent runs.
+    :return: str or None
+    """
+    cache = read_latest_version_cache()
+
+    if not cache or time.time() - cache.get("timestamp", 0) > LATEST_VERSION_CACHE_TTL:
+        refresh_latest_version_cache_in_background()
+
+    if cache:
+        return cache.get("version")
+    else:
+        return None
+
+
+def read_latest_version_cache(cache_file=LATEST_VERSION_CACHE_FILE):
     try:
-        package_info = get_pypi_package_description()
-        return package_info["info"]["version"]
+        with open(cache_file, "r") as f:
+            return json.load(f)
     except Exception:
         return None
 
 
+def refresh_latest_version_cache(cache_file=LATEST_VERSION_CACHE_FILE):
+    try:
+        package_info = get_pypi_package_description()
+        cache = {"version": package_info["info"]["version"], "timestamp": time.time()}
+
+        cache_dir = os.path.dirname(cache_file)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        # write to a temporary file first so concurrent runs never read a partial cache file
+        with tempfile.NamedTemporaryFile(mode="w", dir=cache_dir, delete=False) as f:
+            json.dump(cache, f)
+        os.replace(f.name, cache_file)
+    except Exception:
+        pass
+
+
+def refresh_latest_version_cache_in_background(cache_file=LATEST_VERSION_CACHE_FILE):
+    thread = threading.Thread(target=refresh_latest_version_cache, args=(cache_file,), name="update-check")
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
 def get_pypi_package_description():
     url = "https://pypi.python.org/pypi/cfn-sphere/json"
 
@@ -164,59 +206,65 @@ def get_pypi_package_description():
     return json.load(response)
 
 
-def with_boto_retry(max_retries=3, pause_time_multiplier=5):
+def get_git_repository_remote_url(working_dir):
     """
-    Annotation retrying a wrapped function call if it raises a CfnSphereBotoError
-    with is_throttling_exception=True
-    :param max_retries:
-    :param pause_time_multiplier:
-    :return: :raise e:
+    Get the origin url of the git repository containing working_dir. Lookups are memoized per resolved directory.
+    :param working_dir: str
+    :return: str or None if working_dir is not part of a repository
     """
-    logger = get_logger()
+    if not working_dir:
+        return None
 
-    def decorator(function):
-        @wraps(function)
-        def wrapper(*args, **kwds):
-            retries = 0
+    return _get_git_repository_remote_url(os.path.realpath(working_dir))
 
-            while True:
-                try:
-                    return function(*args, **kwds)
-                except (CfnSphereBotoError, BotoCoreError, ClientError) as e:
-                    if isinstance(e, (BotoCoreError, ClientError)):
-                        # Wrap Boto exception in CfnSphereBotoError so we can
-                        # use it's `is_throttling_exception` attribute.
-                        is_throttling_exception = CfnSphereBotoError(e).is_throttling_exception
-                    else:
-                        is_throttling_exception = e.is_throttling_exception
 
-                    if not is_throttling_exception or retries >= max_retries:
-                        raise e
+@lru_cache(maxsize=None)
+def _get_git_repository_remote_url(directory):
+    git_path = os.path.join(directory, ".git")
 
-                    sleep_time = pause_time_multiplier * (2 ** retries)
-                    logger.warn(
-                        "{0} call failed with: '{1}' (Will retry in {2}s)".format(function.__name__, e, sleep_time))
-                    time.sleep(sleep_time)
-                    retries += 1
+    if os.path.isdir(git_path):
+        try:
+            return read_git_config_remote_url(os.path.join(git_path, "config"))
+        except _UnsupportedGitConfigError:
+            pass
 
-        return wrapper
+    if os.path.exists(git_path):
+        # worktrees, submodules and git configs using includes are left to GitPython
+        from git import Repo, InvalidGitRepositoryError
+        try:
+            return Repo(directory).remotes.origin.url
+        except InvalidGitRepositoryError:
+            pass
 
-    return decorator
+    (head, tail) = os.path.split(directory)
+    if tail:
+        return _get_git_repository_remote_url(head)
+    else:
+        return None
 
 
-def get_git_repository_remote_url(working_dir):
-    if not working_dir:
-        return None
+def read_git_config_remote_url(config_file):
+    """
+    Read the origin url from a git config file without loading GitPython
+    :param config_file: str
+    :return: str, None if there is no origin
+    :raise _UnsupportedGitConfigError: if the config is missing, invalid or uses includes
+    """
+    from configparser import RawConfigParser, Error as ConfigParserError
 
+    parser = RawConfigParser(strict=False)
     try:
-        repo = Repo(working_dir)
-        return repo.remotes.origin.url
-    except InvalidGitRepositoryError:
-        (head, tail) = os.path.split(working_dir)
-        if tail:
-            return get_git_repository_remote_url(head)
-        else:
-            return None
+        if not parser.read(config_file):
+            raise _UnsupportedGitConfigError("Missing git config {0}".format(config_file))
+    except ConfigParserError as e:
+        raise _UnsupportedGitConfigError(e)
+
+    if any(section == "include" or section.startswith("includeIf") for section in parser.sections()):
+        raise _UnsupportedGitConfigError("Git config {0} uses includes".format(config_file))
+
+    if parser.has_option('remote "origin"', "url"):
+        return parser.get('remote "origin"', "url")
+    return None
 
 
 def get_resources_dir():
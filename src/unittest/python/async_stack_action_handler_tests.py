@@ -0,0 +1,119 @@
+try:
+    from unittest2 import TestCase
+    from mock import patch, Mock, AsyncMock
+except ImportError:
+    from unittest import TestCase
+    from mock import patch, Mock, AsyncMock
+
+import asyncio
+
+from cfn_sphere.async_stack_action_handler import AsyncStackActionHandler
+from cfn_sphere.aws.cfn import CloudFormation
+from cfn_sphere.exceptions import CfnStackActionFailedException
+from cfn_sphere.stack_configuration import StackConfig
+
+
+def create_async_cfn(existing_stacks):
+    async_cfn = Mock()
+    async_cfn.get_stack_names = AsyncMock(return_value=existing_stacks)
+    async_cfn.run_blocking = AsyncMock(side_effect=lambda function, *args: function(*args))
+    for method in ["validate_stack_is_ready_for_action", "create_stack", "update_stack", "delete_stack",
+                   "create_change_set", "execute_change_set", "close"]:
+        setattr(async_cfn, method, AsyncMock())
+    return async_cfn
+
+
+@patch('cfn_sphere.CloudFormation')
+@patch('cfn_sphere.ParameterResolver')
+@patch('cfn_sphere.TemplateHandler')
+class AsyncStackActionHandlerTests(TestCase):
+    def create_config(self):
+        config = Mock(api_rate_limits={}, max_api_calls=None, target_name='eu-west-1', cli_params={})
+        config.stacks = {'vpc': StackConfig({'template-url': 'vpc.yml'}),
+                         'app': StackConfig({'template-url': 'app.yml', 'parameters': {'vpc': '|ref|vpc.id'}}),
+                         'other': StackConfig({'template-url': 'other.yml'})}
+        return config
+
+    def test_create_or_update_stacks_starts_stacks_once_their_upstream_stacks_are_deployed(
+            self, template_handler_mock, parameter_resolver_mock, cfn_mock):
+        template_handler_mock.get_template.return_value = Mock()
+        parameter_resolver_mock.return_value.resolve_parameter_values.return_value = {}
+        async_cfn = create_async_cfn(['vpc'])
+        events = []
+
+        async def update_stack(stack):
+            events.append("start " + stack.name)
+            # the independent stack starts while vpc is still being updated
+            while "start other" not in events:
+                await asyncio.sleep(0)
+            events.append("done " + stack.name)
+
+        async def create_stack(stack):
+            events.append("start " + stack.name)
+            await asyncio.sleep(0)
+            events.append("done " + stack.name)
+
+        async_cfn.update_stack.side_effect = update_stack
+        async_cfn.create_stack.side_effect = create_stack
+
+        AsyncStackActionHandler(self.create_config(), async_cfn=async_cfn).create_or_update_stacks()
+
+        self.assertLess(events.index("start other"), events.index("done vpc"))
+        self.assertLess(events.index("done vpc"), events.index("start app"))
+        async_cfn.validate_stack_is_ready_for_action.assert_awaited_once()
+        self.assertEqual({'app', 'other'}, set(args[0].name for args, _ in async_cfn.create_stack.await_args_list))
+        async_cfn.close.assert_awaited_once()
+
+    def test_create_or_update_stacks_skips_dependents_of_failed_stacks(
+            self, template_handler_mock, parameter_resolver_mock, cfn_mock):
+        parameter_resolver_mock.return_value.resolve_parameter_values.return_value = {}
+        async_cfn = create_async_cfn([])
+
+        async def create_stack(stack):
+            if stack.name == 'vpc':
+                raise CfnStackActionFailedException("Rollback occured")
+
+        async_cfn.create_stack.side_effect = create_stack
+
+        with self.assertRaisesRegex(CfnStackActionFailedException, "Sync failed for 1 of 3 stacks: vpc"):
+            AsyncStackActionHandler(self.create_config(), async_cfn=async_cfn).create_or_update_stacks()
+
+        self.assertNotIn('app', [args[0].name for args, _ in async_cfn.create_stack.await_args_list])
+
+    def test_sync_via_change_sets_executes_change_sets_with_changes(self, template_handler_mock,
+                                                                    parameter_resolver_mock, cfn_mock):
+        cfn_mock.return_value.is_empty_change_set.side_effect = CloudFormation.is_empty_change_set
+        parameter_resolver_mock.return_value.resolve_parameter_values.return_value = {}
+        async_cfn = create_async_cfn(['vpc', 'other'])
+
+        async def create_change_set(stack, change_set_type):
+            if stack.name == 'other':
+                return {'Status': 'FAILED', 'StatusReason': "The submitted information didn't contain changes."}
+            return {'Status': 'CREATE_COMPLETE', 'ChangeSetId': 'arn-' + stack.name}
+
+        async_cfn.create_change_set.side_effect = create_change_set
+        sync_state = Mock()
+        sync_state.get_input_hash.return_value = None
+
+        with patch('cfn_sphere.get_stack_input_hash', return_value="hash"):
+            AsyncStackActionHandler(self.create_config(), sync_state=sync_state,
+                                    async_cfn=async_cfn).sync_via_change_sets()
+
+        self.assertEqual({('vpc', 'arn-vpc', 'update', 600), ('app', 'arn-app', 'create', 600)},
+                         set((args[0].name,) + args[1:] for args, _ in async_cfn.execute_change_set.await_args_list))
+        self.assertEqual({'vpc', 'app', 'other'}, set(args[1] for args, _ in sync_state.record.call_args_list))
+
+    def test_delete_stacks_deletes_stacks_after_their_dependents(self, template_handler_mock,
+                                                                 parameter_resolver_mock, cfn_mock):
+        async_cfn = create_async_cfn(['vpc', 'app'])
+        deleted = []
+
+        async def delete_stack(stack):
+            await asyncio.sleep(0)
+            deleted.append(stack.name)
+
+        async_cfn.delete_stack.side_effect = delete_stack
+
+        AsyncStackActionHandler(self.create_config(), async_cfn=async_cfn).delete_stacks()
+
+        self.assertEqual(['app', 'vpc'], deleted)
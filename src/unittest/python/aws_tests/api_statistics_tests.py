@@ -0,0 +1,106 @@
+try:
+    from unittest2 import TestCase
+    from mock import Mock
+except ImportError:
+    from unittest import TestCase
+    from mock import Mock
+
+import botocore.session
+from botocore.stub import Stubber
+
+from cfn_sphere.aws.api_statistics import ApiStatistics, get_percentile
+from cfn_sphere.exceptions import ApiCallBudgetExceededException
+from cfn_sphere.timings import TIMINGS
+
+
+def create_model(service_name, operation_name):
+    model = Mock()
+    model.name = operation_name
+    model.service_model.service_name = service_name
+    return model
+
+
+class ApiStatisticsTests(TestCase):
+    def test_get_percentile(self):
+        values = [float(value) for value in range(1, 101)]
+
+        self.assertEqual(50.0, get_percentile(values, 50))
+        self.assertEqual(99.0, get_percentile(values, 99))
+        self.assertEqual(0.0, get_percentile([], 50))
+
+    def test_calls_are_counted_per_operation_and_stack(self):
+        statistics = ApiStatistics()
+
+        statistics.record_call("cloudformation.DescribeStacks", "stack1")
+        statistics.record_call("cloudformation.DescribeStacks", None)
+        statistics.record_call("ssm.GetParameter", "stack1")
+
+        self.assertEqual(2, statistics.get_operation_statistics()["cloudformation.DescribeStacks"]["calls"])
+        self.assertEqual(2, statistics.get_stack_statistics()["stack1"]["calls"])
+        self.assertEqual(3, statistics.to_dict()["calls"])
+
+    def test_attempts_count_retries_throttles_and_bytes(self):
+        statistics = ApiStatistics()
+
+        statistics.record_attempt("ssm.GetParameter", "stack1", 1, "ThrottlingException", 100, 50)
+        statistics.record_attempt("ssm.GetParameter", "stack1", 2, None, 100, 200)
+
+        result = statistics.get_operation_statistics()["ssm.GetParameter"]
+        self.assertEqual(1, result["retries"])
+        self.assertEqual(1, result["throttles"])
+        self.assertEqual(200, result["bytes_sent"])
+        self.assertEqual(250, result["bytes_received"])
+
+    def test_results_record_latency_percentiles_and_errors(self):
+        statistics = ApiStatistics()
+
+        for seconds in [0.1, 0.2, 0.3, 0.4]:
+            statistics.record_result("kms.Decrypt", None, seconds, failed=False)
+        statistics.record_result("kms.Decrypt", None, 1.0, failed=True)
+
+        result = statistics.get_operation_statistics()["kms.Decrypt"]
+        self.assertEqual(0.3, result["p50_seconds"])
+        self.assertEqual(1.0, result["p99_seconds"])
+        self.assertEqual(1, result["errors"])
+
+    def test_budget_aborts_calls_exceeding_it(self):
+        statistics = ApiStatistics()
+        statistics.configure(max_calls=2)
+
+        statistics.record_call("cloudformation.DescribeStacks", None)
+        statistics.record_call("cloudformation.DescribeStacks", None)
+
+        with self.assertRaises(ApiCallBudgetExceededException):
+            statistics.record_call("cloudformation.DescribeStacks", None)
+
+    def test_calls_belong_to_the_stack_of_the_current_span(self):
+        statistics = ApiStatistics()
+        context = {}
+
+        with TIMINGS.span("stack1", "stack", stack="stack1"):
+            statistics._before_call(model=create_model("cloudformation", "DescribeStacks"), context=context)
+        statistics._after_call(context=context, parsed={})
+
+        self.assertEqual(1, statistics.get_stack_statistics()["stack1"]["calls"])
+        self.assertEqual(0, statistics.get_stack_statistics()["stack1"]["errors"])
+
+    def test_registered_client_calls_are_accounted(self):
+        statistics = ApiStatistics()
+        client = botocore.session.get_session().create_client('ec2', region_name='eu-west-1',
+                                                              aws_access_key_id='key', aws_secret_access_key='secret')
+        statistics.register(client)
+        stubber = Stubber(client)
+        stubber.add_response('describe_images', {'Images': []})
+
+        with stubber:
+            client.describe_images()
+
+        result = statistics.get_operation_statistics()["ec2.DescribeImages"]
+        self.assertEqual(1, result["calls"])
+        self.assertEqual(0, result["errors"])
+
+    def test_get_summary_table_lists_operations(self):
+        statistics = ApiStatistics()
+        statistics.record_call("cloudformation.DescribeStacks", None)
+
+        self.assertIn("cloudformation.DescribeStacks", statistics.get_summary_table())
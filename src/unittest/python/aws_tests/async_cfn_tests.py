@@ -0,0 +1,149 @@
+try:
+    from unittest2 import TestCase
+    from mock import patch, Mock, AsyncMock
+except ImportError:
+    from unittest import TestCase
+    from mock import patch, Mock, AsyncMock
+
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from cfn_sphere.aws.async_cfn import AsyncCloudFormation, get_api_operation_name
+from cfn_sphere.aws.cfn import CloudFormation, CloudFormationStack
+from cfn_sphere.aws.rate_limiter import RATE_LIMITER
+from cfn_sphere.exceptions import CfnSphereBotoError, CfnSphereException, CfnStackActionFailedException
+
+
+def get_client_error(code, message, operation_name):
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation_name)
+
+
+def get_stack_event(stack_name, status, timestamp):
+    return {"EventId": stack_name + status, "StackName": stack_name, "LogicalResourceId": stack_name,
+            "ResourceType": "AWS::CloudFormation::Stack", "ResourceStatus": status, "Timestamp": timestamp}
+
+
+@patch("cfn_sphere.aws.cfn.STACK_EVENT_POLL_INTERVAL", 0)
+@patch("cfn_sphere.aws.cfn.CHANGE_SET_POLL_INTERVAL", 0)
+class AsyncCloudFormationTests(TestCase):
+    def setUp(self):
+        RATE_LIMITER.configure({"cloudformation": 1000})
+        self.client = AsyncMock()
+        self.cfn = CloudFormation()
+        self.async_cfn = AsyncCloudFormation(cfn=self.cfn, client=self.client)
+        self.async_cfn._clock_offset = timedelta(0)
+        self.stack = CloudFormationStack(Mock(), {}, "stack", "eu-west-1")
+
+    def tearDown(self):
+        RATE_LIMITER.configure({})
+
+    def test_get_api_operation_name(self):
+        self.assertEqual("DescribeStackEvents", get_api_operation_name("describe_stack_events"))
+
+    @patch("cfn_sphere.aws.async_cfn.random.uniform", return_value=0)
+    def test_call_retries_throttled_requests(self, _):
+        self.client.describe_stacks.side_effect = [get_client_error("Throttling", "Rate exceeded", "DescribeStacks"),
+                                                   {"Stacks": []}]
+
+        self.assertEqual({"Stacks": []}, asyncio.run(self.async_cfn.call("describe_stacks")))
+        self.assertEqual(2, self.client.describe_stacks.await_count)
+
+    def test_call_raises_other_errors(self):
+        self.client.describe_stacks.side_effect = get_client_error("ValidationError", "Invalid", "DescribeStacks")
+
+        with self.assertRaisesRegex(CfnSphereBotoError, "ValidationError: Invalid"):
+            asyncio.run(self.async_cfn.call("describe_stacks"))
+        self.assertEqual(1, self.client.describe_stacks.await_count)
+
+    def test_get_client_raises_exception_without_aiobotocore(self):
+        with patch.dict(sys.modules, {"aiobotocore": None, "aiobotocore.session": None}):
+            with self.assertRaisesRegex(CfnSphereException, "requires aiobotocore"):
+                asyncio.run(AsyncCloudFormation(cfn=self.cfn).get_client())
+
+    def test_concurrent_callers_share_one_paginated_stack_listing(self):
+        self.client.describe_stacks.side_effect = [
+            {"Stacks": [{"StackName": "a", "StackId": "id-a"}], "NextToken": "next"},
+            {"Stacks": [{"StackName": "b", "StackId": "id-b", "Outputs": [{"OutputKey": "k", "OutputValue": "v"}]}]}]
+
+        async def describe():
+            return await asyncio.gather(self.async_cfn.get_stack_names(), self.async_cfn.get_stacks_outputs(),
+                                        self.async_cfn.get_stack_description("id-b"))
+
+        names, outputs, description = asyncio.run(describe())
+
+        self.assertEqual(["a", "b"], names)
+        self.assertEqual({"b": {"k": "v"}}, outputs)
+        self.assertEqual("b", description["StackName"])
+        self.assertEqual(2, self.client.describe_stacks.await_count)
+
+    def test_validate_stack_is_ready_for_action_raises_exception_for_busy_stacks(self):
+        self.client.describe_stacks.return_value = {"Stacks": [
+            {"StackName": "stack", "StackId": "id", "StackStatus": "UPDATE_IN_PROGRESS"}]}
+
+        with self.assertRaisesRegex(CfnStackActionFailedException, "'UPDATE_IN_PROGRESS'"):
+            asyncio.run(self.async_cfn.validate_stack_is_ready_for_action(self.stack))
+
+    def test_create_stack_waits_for_completion_without_blocking(self):
+        now = datetime.now(timezone.utc)
+        started = get_stack_event("stack", "CREATE_IN_PROGRESS", now + timedelta(seconds=1))
+        completed = get_stack_event("stack", "CREATE_COMPLETE", now + timedelta(seconds=2))
+        self.client.describe_stack_events.side_effect = [{"StackEvents": []}, {"StackEvents": [started]},
+                                                         {"StackEvents": [completed, started]}]
+        self.client.describe_stacks.return_value = {"Stacks": [{"StackName": "stack", "StackId": "id"}]}
+        self.cfn.get_create_stack_kwargs = Mock(return_value={"StackName": "stack", "TemplateBody": "{}"})
+
+        asyncio.run(self.async_cfn.create_stack(self.stack))
+
+        self.client.create_stack.assert_awaited_once_with(StackName="stack", TemplateBody="{}")
+        self.assertEqual(3, self.client.describe_stack_events.await_count)
+
+    def test_create_stack_raises_exception_on_rollback(self):
+        now = datetime.now(timezone.utc)
+        started = get_stack_event("stack", "CREATE_IN_PROGRESS", now + timedelta(seconds=1))
+        rolled_back = get_stack_event("stack", "ROLLBACK_COMPLETE", now + timedelta(seconds=2))
+        self.client.describe_stack_events.return_value = {"StackEvents": [rolled_back, started]}
+        self.cfn.get_create_stack_kwargs = Mock(return_value={"StackName": "stack"})
+
+        with self.assertRaisesRegex(CfnStackActionFailedException, "Rollback occured"):
+            asyncio.run(self.async_cfn.create_stack(self.stack))
+
+    def test_update_stack_skips_stacks_without_updates(self):
+        self.cfn.stack_is_up_to_date = Mock(return_value=False)
+        self.cfn.get_update_stack_kwargs = Mock(return_value={"StackName": "stack"})
+        self.client.update_stack.side_effect = get_client_error("ValidationError", "No updates are to be performed.",
+                                                                "UpdateStack")
+
+        asyncio.run(self.async_cfn.update_stack(self.stack))
+
+        self.client.describe_stack_events.assert_not_awaited()
+
+    def test_update_stack_does_nothing_in_dry_run(self):
+        async_cfn = AsyncCloudFormation(dry_run=True, cfn=self.cfn, client=self.client)
+        self.cfn.stack_is_up_to_date = Mock(return_value=False)
+
+        asyncio.run(async_cfn.update_stack(self.stack))
+
+        self.client.update_stack.assert_not_awaited()
+
+    def test_create_change_set_deletes_change_sets_without_changes(self):
+        self.cfn.get_change_set_kwargs = Mock(return_value={"StackName": "stack"})
+        self.client.create_change_set.return_value = {"Id": "arn"}
+        self.client.describe_change_set.side_effect = [
+            {"Status": "CREATE_PENDING"},
+            {"Status": "FAILED", "StatusReason": "The submitted information didn't contain changes."}]
+
+        change_set = asyncio.run(self.async_cfn.create_change_set(self.stack, "CREATE"))
+
+        self.assertEqual("FAILED", change_set["Status"])
+        self.cfn.get_change_set_kwargs.assert_called_once_with(self.stack, "CREATE", None)
+        self.client.delete_change_set.assert_awaited_once_with(ChangeSetName="arn")
+
+    def test_execute_change_set_raises_exception_if_execution_fails(self):
+        self.client.execute_change_set.side_effect = get_client_error("InvalidChangeSetStatus", "Obsolete",
+                                                                      "ExecuteChangeSet")
+
+        with self.assertRaisesRegex(CfnStackActionFailedException, "Could not execute arn"):
+            asyncio.run(self.async_cfn.execute_change_set(self.stack, "arn"))
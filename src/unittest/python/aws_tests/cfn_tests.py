@@ -12,20 +12,28 @@ import logging
 from botocore.exceptions import ClientError
 from dateutil.tz import tzutc
 
-from cfn_sphere.aws.cfn import CloudFormation
-from cfn_sphere.aws.cfn import CloudFormationStack
-from cfn_sphere.exceptions import CfnStackActionFailedException, CfnSphereBotoError
+from cfn_sphere.aws.cfn import CloudFormation, TEMPLATE_BODY_SIZE_LIMIT, TEMPLATE_STAGING_PREFIX
+from cfn_sphere.aws.cfn import CloudFormationStack, get_effective_parameters, get_stack_fingerprint, \
+    template_can_be_compared
+from cfn_sphere.exceptions import CfnStackActionFailedException, CfnSphereBotoError, TemplateErrorException
+from cfn_sphere.aws.client_factory import CLIENT_FACTORY
 from cfn_sphere.template import CloudFormationTemplate
 
 logging.getLogger('cfn_sphere').setLevel(logging.DEBUG)
 
 class CloudFormationApiTests(TestCase):
-    @patch('cfn_sphere.aws.cfn.boto3.resource')
+    def setUp(self):
+        CLIENT_FACTORY.clear()
+
+    def tearDown(self):
+        CLIENT_FACTORY.clear()
+
+    @patch('boto3.resource')
     def test_get_stack_properly_calls_boto(self, boto_mock):
         CloudFormation().get_stack("Foo")
         boto_mock.return_value.Stack.assert_called_once_with("Foo")
 
-    @patch('cfn_sphere.aws.cfn.boto3.resource')
+    @patch('boto3.resource')
     def test_get_stacks_properly_calls_boto(self, boto_mock):
         CloudFormation().get_stacks()
         boto_mock.return_value.stacks.all.assert_called_once_with()
@@ -55,7 +63,7 @@ class CloudFormationApiTests(TestCase):
         get_stack_descriptions_mock.return_value = [{"StackName": "Foo"}]
         self.assertEqual({'Foo': {'outputs': [], 'parameters': []}}, CloudFormation().get_stacks_dict())
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     def test_handle_stack_event_returns_expected_event(self, _):
         event = {
             'PhysicalResourceId': 'arn:aws:cloudformation:eu-west-1:1234567890:stack/my-stack/my-stack-id',
@@ -73,7 +81,7 @@ class CloudFormationApiTests(TestCase):
         result = cfn.handle_stack_event(event, valid_from_timestamp, "CREATE_COMPLETE", "my-stack")
         self.assertDictEqual(event, result)
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     def test_handle_stack_event_returns_none_if_event_appears_to_early(self, _):
         event = {
             'PhysicalResourceId': 'arn:aws:cloudformation:eu-west-1:1234567890:stack/my-stack/my-stack-id',
@@ -91,7 +99,7 @@ class CloudFormationApiTests(TestCase):
         result = cfn.handle_stack_event(event, valid_from_timestamp, "CREATE_COMPLETE", "my-stack")
         self.assertIsNone(result)
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     def test_handle_stack_event_returns_none_if_event_has_not_expected_state(self, _):
         event = {
             'PhysicalResourceId': 'arn:aws:cloudformation:eu-west-1:1234567890:stack/my-stack/my-stack-id',
@@ -109,7 +117,7 @@ class CloudFormationApiTests(TestCase):
         result = cfn.handle_stack_event(event, valid_from_timestamp, "CREATE_COMPLETE", "my-stack")
         self.assertIsNone(result)
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     def test_handle_stack_event_returns_none_if_event_is_no_stack_event(self, _):
         event = {
             'PhysicalResourceId': 'arn:aws:sns:eu-west-1:1234567890:my-topic',
@@ -127,7 +135,7 @@ class CloudFormationApiTests(TestCase):
         result = cfn.handle_stack_event(event, valid_from_timestamp, "CREATE_COMPLETE", "my-stack")
         self.assertIsNone(result)
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     def test_handle_stack_event_raises_exception_on_error_event(self, _):
         event = {
             'PhysicalResourceId': 'arn:aws:sns:eu-west-1:1234567890:my-topic',
@@ -145,7 +153,7 @@ class CloudFormationApiTests(TestCase):
         with self.assertRaises(CfnStackActionFailedException):
             cfn.handle_stack_event(event, valid_from_timestamp, "CREATE_COMPLETE", "my-stack")
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     def test_handle_stack_event_returns_none_on_rollback_in_progress_state(self, _):
         event = {
             'PhysicalResourceId': 'arn:aws:sns:eu-west-1:1234567890:my-topic',
@@ -164,7 +172,7 @@ class CloudFormationApiTests(TestCase):
         result = cfn.handle_stack_event(event, valid_from_timestamp, "CREATE_COMPLETE", "my-stack")
         self.assertIsNone(result)
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     def test_handle_stack_event_raises_exception_on_rollback_complete(self, _):
         event = {
             'PhysicalResourceId': 'arn:aws:sns:eu-west-1:1234567890:my-topic',
@@ -182,7 +190,7 @@ class CloudFormationApiTests(TestCase):
         with self.assertRaises(CfnStackActionFailedException):
             cfn.handle_stack_event(event, valid_from_timestamp, "CREATE_COMPLETE", "my-stack")
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     def test_handle_stack_event_returns_none_for_nested_stack_events(self, _):
         event = {
             'PhysicalResourceId': 'arn:aws:sns:eu-west-1:1234567890:my-topic',
@@ -200,7 +208,7 @@ class CloudFormationApiTests(TestCase):
         result = cfn.handle_stack_event(event, valid_from_timestamp, "CREATE_COMPLETE", "my-stack")
         self.assertIsNone(result)
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
     def test_create_stack_calls_cloudformation_api_properly(self, _, cloudformation_mock):
         stack = Mock(spec=CloudFormationStack)
@@ -210,8 +218,9 @@ class CloudFormationApiTests(TestCase):
         stack.parameters = {}
         stack.template = Mock(spec=CloudFormationTemplate)
         stack.template.name = "template-name"
-        stack.template.get_template_json.return_value = {'key': 'value'}
+        stack.template.get_template_json.return_value = '{"key": "value"}'
         stack.service_role = None
+        stack.template_bucket = None
         stack.stack_policy = None
         stack.failure_action = None
         stack.disable_rollback = False
@@ -225,10 +234,10 @@ class CloudFormationApiTests(TestCase):
             Parameters=[('a', 'b')],
             StackName='stack-name',
             Tags=[('any-tag', 'any-tag-value')],
-            TemplateBody={'key': 'value'}
+            TemplateBody='{"key": "value"}'
         )
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
     def test_create_stack_calls_cloudformation_api_properly_with_service_role(self, _, cloudformation_mock):
         stack = Mock(spec=CloudFormationStack)
@@ -238,8 +247,9 @@ class CloudFormationApiTests(TestCase):
         stack.parameters = {}
         stack.template = Mock(spec=CloudFormationTemplate)
         stack.template.name = "template-name"
-        stack.template.get_template_json.return_value = {'key': 'value'}
+        stack.template.get_template_json.return_value = '{"key": "value"}'
         stack.service_role = "arn:aws:iam::1234567890:role/my-role"
+        stack.template_bucket = None
         stack.stack_policy = None
         stack.failure_action = None
         stack.disable_rollback = False
@@ -253,11 +263,11 @@ class CloudFormationApiTests(TestCase):
             Parameters=[('a', 'b')],
             StackName='stack-name',
             Tags=[('any-tag', 'any-tag-value')],
-            TemplateBody={'key': 'value'},
+            TemplateBody='{"key": "value"}',
             RoleARN="arn:aws:iam::1234567890:role/my-role"
         )
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
     def test_create_stack_calls_cloudformation_api_properly_with_stack_policy(self, _, cloudformation_mock):
         stack = Mock(spec=CloudFormationStack)
@@ -267,8 +277,9 @@ class CloudFormationApiTests(TestCase):
         stack.parameters = {}
         stack.template = Mock(spec=CloudFormationTemplate)
         stack.template.name = "template-name"
-        stack.template.get_template_json.return_value = {'key': 'value'}
+        stack.template.get_template_json.return_value = '{"key": "value"}'
         stack.service_role = None
+        stack.template_bucket = None
         stack.stack_policy = "{foo:baa}"
         stack.failure_action = None
         stack.disable_rollback = False
@@ -282,11 +293,11 @@ class CloudFormationApiTests(TestCase):
             Parameters=[('a', 'b')],
             StackName='stack-name',
             Tags=[('any-tag', 'any-tag-value')],
-            TemplateBody={'key': 'value'},
+            TemplateBody='{"key": "value"}',
             StackPolicyBody='"{foo:baa}"'
         )
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
     def test_create_stack_calls_cloudformation_api_properly_with_defined_failure_action(self, _, cloudformation_mock):
         stack = Mock(spec=CloudFormationStack)
@@ -296,8 +307,9 @@ class CloudFormationApiTests(TestCase):
         stack.parameters = {}
         stack.template = Mock(spec=CloudFormationTemplate)
         stack.template.name = "template-name"
-        stack.template.get_template_json.return_value = {'key': 'value'}
+        stack.template.get_template_json.return_value = '{"key": "value"}'
         stack.service_role = None
+        stack.template_bucket = None
         stack.stack_policy = "{foo:baa}"
         stack.failure_action = "DO_NOTHING"
         stack.disable_rollback = False
@@ -312,11 +324,11 @@ class CloudFormationApiTests(TestCase):
             Parameters=[('a', 'b')],
             StackName='stack-name',
             Tags=[('any-tag', 'any-tag-value')],
-            TemplateBody={'key': 'value'},
+            TemplateBody='{"key": "value"}',
             StackPolicyBody='"{foo:baa}"'
         )
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
     def test_create_stack_calls_cloudformation_api_properly_with_disable_rollback_true(self, _, cloudformation_mock):
         stack = Mock(spec=CloudFormationStack)
@@ -326,8 +338,9 @@ class CloudFormationApiTests(TestCase):
         stack.parameters = {}
         stack.template = Mock(spec=CloudFormationTemplate)
         stack.template.name = "template-name"
-        stack.template.get_template_json.return_value = {'key': 'value'}
+        stack.template.get_template_json.return_value = '{"key": "value"}'
         stack.service_role = None
+        stack.template_bucket = None
         stack.stack_policy = "{foo:baa}"
         stack.failure_action = "DO_NOTHING"
         stack.disable_rollback = "True"
@@ -343,11 +356,11 @@ class CloudFormationApiTests(TestCase):
             Parameters=[('a', 'b')],
             StackName='stack-name',
             Tags=[('any-tag', 'any-tag-value')],
-            TemplateBody={'key': 'value'},
+            TemplateBody='{"key": "value"}',
             StackPolicyBody='"{foo:baa}"'
         )
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
     def test_update_stack_calls_cloudformation_api_properly(self, _, cloudformation_mock):
         stack = Mock(spec=CloudFormationStack)
@@ -357,8 +370,9 @@ class CloudFormationApiTests(TestCase):
         stack.parameters = {}
         stack.template = Mock(spec=CloudFormationTemplate)
         stack.template.name = "template-name"
-        stack.template.get_template_json.return_value = {'key': 'value'}
+        stack.template.get_template_json.return_value = '{"key": "value"}'
         stack.service_role = None
+        stack.template_bucket = None
         stack.stack_policy = None
         stack.disable_rollback = False
         stack.timeout = 42
@@ -371,10 +385,10 @@ class CloudFormationApiTests(TestCase):
             Parameters=[('a', 'b')],
             StackName='stack-name',
             Tags=[('any-tag', 'any-tag-value')],
-            TemplateBody={'key': 'value'}
+            TemplateBody='{"key": "value"}'
         )
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
     def test_update_stack_calls_cloudformation_api_properly_with_service_role(self, _, cloudformation_mock):
         stack = Mock(spec=CloudFormationStack)
@@ -384,8 +398,9 @@ class CloudFormationApiTests(TestCase):
         stack.parameters = {}
         stack.template = Mock(spec=CloudFormationTemplate)
         stack.template.name = "template-name"
-        stack.template.get_template_json.return_value = {'key': 'value'}
+        stack.template.get_template_json.return_value = '{"key": "value"}'
         stack.service_role = "arn:aws:iam::1234567890:role/my-role"
+        stack.template_bucket = None
         stack.stack_policy = None
         stack.timeout = 42
 
@@ -397,11 +412,11 @@ class CloudFormationApiTests(TestCase):
             Parameters=[('a', 'b')],
             StackName='stack-name',
             Tags=[('any-tag', 'any-tag-value')],
-            TemplateBody={'key': 'value'},
+            TemplateBody='{"key": "value"}',
             RoleARN='arn:aws:iam::1234567890:role/my-role'
         )
 
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
     def test_update_stack_calls_cloudformation_api_properly_with_stack_policy(self, _, cloudformation_mock):
         stack = Mock(spec=CloudFormationStack)
@@ -411,8 +426,9 @@ class CloudFormationApiTests(TestCase):
         stack.parameters = {}
         stack.template = Mock(spec=CloudFormationTemplate)
         stack.template.name = "template-name"
-        stack.template.get_template_json.return_value = {'key': 'value'}
+        stack.template.get_template_json.return_value = '{"key": "value"}'
         stack.service_role = None
+        stack.template_bucket = None
         stack.stack_policy = "{foo:baa}"
         stack.timeout = 42
 
@@ -424,10 +440,200 @@ class CloudFormationApiTests(TestCase):
             Parameters=[('a', 'b')],
             StackName='stack-name',
             Tags=[('any-tag', 'any-tag-value')],
-            TemplateBody={'key': 'value'},
+            TemplateBody='{"key": "value"}',
             StackPolicyBody='"{foo:baa}"'
         )
 
+    def test_get_stack_descriptions_does_not_cache_listings_started_before_a_stack_action_completed(self):
+        cfn = CloudFormation()
+        cfn._client = Mock()
+        stale_listing = {"Stacks": [{"StackName": "vpc", "StackStatus": "UPDATE_IN_PROGRESS"}]}
+        current_listing = {"Stacks": [{"StackName": "vpc", "StackStatus": "UPDATE_COMPLETE"}]}
+
+        def list_while_another_thread_completes_a_stack_action():
+            yield stale_listing
+            # another thread completes the update of vpc while this thread still paginates
+            cfn.invalidate()
+
+        cfn._client.get_paginator.return_value.paginate.side_effect = [
+            list_while_another_thread_completes_a_stack_action(), [current_listing]]
+
+        self.assertEqual(stale_listing["Stacks"], cfn.get_stack_descriptions())
+        self.assertIsNone(cfn.cached["stack_descriptions"])
+        self.assertEqual(current_listing["Stacks"], cfn.get_stack_descriptions())
+        self.assertEqual(current_listing["Stacks"], cfn.cached["stack_descriptions"])
+
+    def test_invalidate_changed_stacks_keeps_descriptions_of_unchanged_stacks(self):
+        created = datetime.datetime(2020, 1, 1, tzinfo=tzutc())
+        cfn = CloudFormation()
+        cfn._client = Mock()
+        cfn.cached["stack_descriptions"] = [{"StackId": "id", "StackStatus": "CREATE_COMPLETE",
+                                             "CreationTime": created, "Outputs": []}]
+        cfn._client.get_paginator.return_value.paginate.return_value = [{"StackSummaries": [
+            {"StackId": "id", "StackStatus": "CREATE_COMPLETE", "CreationTime": created}]}]
+
+        self.assertFalse(cfn.invalidate_changed_stacks())
+        self.assertIsNotNone(cfn.cached["stack_descriptions"])
+        cfn._client.get_paginator.assert_called_once_with("list_stacks")
+
+    def test_invalidate_changed_stacks_drops_descriptions_if_a_stack_was_updated(self):
+        created = datetime.datetime(2020, 1, 1, tzinfo=tzutc())
+        cfn = CloudFormation()
+        cfn._client = Mock()
+        cfn.cached["stack_descriptions"] = [{"StackId": "id", "StackStatus": "CREATE_COMPLETE",
+                                             "CreationTime": created}]
+        cfn._client.get_paginator.return_value.paginate.return_value = [{"StackSummaries": [
+            {"StackId": "id", "StackStatus": "UPDATE_COMPLETE", "CreationTime": created,
+             "LastUpdatedTime": created + datetime.timedelta(minutes=5)}]}]
+
+        self.assertTrue(cfn.invalidate_changed_stacks())
+        self.assertIsNone(cfn.cached["stack_descriptions"])
+
+    def test_invalidate_changed_stacks_does_not_list_stacks_without_cached_descriptions(self):
+        cfn = CloudFormation()
+        cfn._client = Mock()
+
+        self.assertFalse(cfn.invalidate_changed_stacks())
+        cfn._client.get_paginator.assert_not_called()
+
+    @patch('cfn_sphere.aws.cfn.CHANGE_SET_POLL_INTERVAL', 0)
+    def test_wait_for_change_set_waits_while_change_set_is_created(self):
+        cfn = CloudFormation()
+        cfn._client = Mock()
+        cfn._client.describe_change_set.side_effect = [{"Status": "CREATE_PENDING"},
+                                                       {"Status": "CREATE_IN_PROGRESS"},
+                                                       {"Status": "CREATE_COMPLETE", "Changes": []}]
+
+        self.assertEqual("CREATE_COMPLETE", cfn.wait_for_change_set("arn")["Status"])
+        self.assertEqual(3, cfn._client.describe_change_set.call_count)
+
+    def test_is_empty_change_set(self):
+        self.assertTrue(CloudFormation.is_empty_change_set(
+            {"Status": "FAILED", "StatusReason": "The submitted information didn't contain changes."}))
+        self.assertFalse(CloudFormation.is_empty_change_set({"Status": "FAILED", "StatusReason": "Template error"}))
+        self.assertFalse(CloudFormation.is_empty_change_set({"Status": "CREATE_COMPLETE"}))
+
+    @patch('cfn_sphere.aws.cfn.CHANGE_SET_POLL_INTERVAL', 0)
+    def test_create_change_set_deletes_empty_change_sets(self):
+        cfn = CloudFormation()
+        cfn._client = Mock()
+        cfn._client.create_change_set.return_value = {"Id": "arn"}
+        cfn._client.describe_change_set.return_value = {
+            "Status": "FAILED", "StatusReason": "The submitted information didn't contain changes."}
+        stack = CloudFormationStack(CloudFormationTemplate({}, "template"), {}, "stack", "eu-west-1")
+
+        change_set = cfn.create_change_set(stack, "CREATE")
+
+        self.assertTrue(cfn.is_empty_change_set(change_set))
+        cfn._client.delete_change_set.assert_called_once_with(ChangeSetName="arn")
+
+    @staticmethod
+    def create_deployed_stack(cloudformation_mock, template_body_dict, parameters, tags):
+        cloudformation_mock.return_value.get_paginator.return_value.paginate.return_value = [{"Stacks": [{
+            "StackName": "stack-name",
+            "StackId": "stack-id",
+            "StackStatus": "UPDATE_COMPLETE",
+            "Parameters": [{"ParameterKey": k, "ParameterValue": v} for k, v in parameters.items()],
+            "Tags": [{"Key": k, "Value": v} for k, v in tags.items()]
+        }]}]
+        cloudformation_mock.return_value.get_template.return_value = {"TemplateBody": template_body_dict}
+
+    @patch('boto3.client')
+    @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
+    def test_update_stack_skips_update_of_unchanged_stack(self, wait_mock, cloudformation_mock):
+        template = CloudFormationTemplate({"Parameters": {"a": {"Type": "String"}, "b": {"Default": "c"}},
+                                           "Resources": {"r": {"Type": "AWS::SNS::Topic"}}}, "template-name")
+        self.create_deployed_stack(cloudformation_mock,
+                                   {"Parameters": {"a": {"Type": "String"}, "b": {"Default": "c"}},
+                                    "Resources": {"r": {"Type": "AWS::SNS::Topic"}}},
+                                   {"a": "1", "b": "c"}, {"tag": "value"})
+        stack = CloudFormationStack(template, {"a": 1}, "stack-name", "eu-west-1", tags={"tag": "value"})
+
+        CloudFormation().update_stack(stack)
+
+        cloudformation_mock.return_value.get_template.assert_called_once_with(StackName="stack-name",
+                                                                              TemplateStage="Original")
+        cloudformation_mock.return_value.update_stack.assert_not_called()
+        wait_mock.assert_not_called()
+
+    @patch('boto3.client')
+    @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
+    def test_update_stack_updates_stack_with_changed_parameters(self, _, cloudformation_mock):
+        template_body_dict = {"Parameters": {"a": {"Type": "String"}}, "Resources": {"r": {"Type": "AWS::SNS::Topic"}}}
+        self.create_deployed_stack(cloudformation_mock, template_body_dict, {"a": "1"}, {})
+        stack = CloudFormationStack(CloudFormationTemplate(template_body_dict, "template-name"), {"a": "2"},
+                                    "stack-name", "eu-west-1")
+
+        CloudFormation().update_stack(stack)
+
+        cloudformation_mock.return_value.update_stack.assert_called_once()
+
+    @patch('boto3.client')
+    @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
+    def test_update_stack_updates_stack_with_changed_stack_policy(self, _, cloudformation_mock):
+        template_body_dict = {"Resources": {"r": {"Type": "AWS::SNS::Topic"}}}
+        self.create_deployed_stack(cloudformation_mock, template_body_dict, {}, {})
+        cloudformation_mock.return_value.get_stack_policy.return_value = {"StackPolicyBody": '{"Statement": []}'}
+        stack = CloudFormationStack(CloudFormationTemplate(template_body_dict, "template-name"), {},
+                                    "stack-name", "eu-west-1", stack_policy={"Statement": [{"Effect": "Deny"}]})
+
+        CloudFormation().update_stack(stack)
+
+        cloudformation_mock.return_value.update_stack.assert_called_once()
+
+    @patch('boto3.client')
+    @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
+    def test_update_stack_always_updates_stacks_with_dynamic_references(self, _, cloudformation_mock):
+        template_body_dict = {"Resources": {"r": {"Type": "AWS::SNS::Topic",
+                                                  "Properties": {"TopicName": "{{resolve:ssm:name}}"}}}}
+        self.create_deployed_stack(cloudformation_mock, template_body_dict, {}, {})
+        stack = CloudFormationStack(CloudFormationTemplate(template_body_dict, "template-name"), {},
+                                    "stack-name", "eu-west-1")
+
+        CloudFormation().update_stack(stack)
+
+        cloudformation_mock.return_value.get_template.assert_not_called()
+        cloudformation_mock.return_value.update_stack.assert_called_once()
+
+    @patch('boto3.client')
+    @patch('cfn_sphere.aws.cfn.CloudFormation.wait_for_stack_action_to_complete')
+    def test_update_stack_always_updates_stacks_with_nested_stacks(self, _, cloudformation_mock):
+        template_body_dict = {"Resources": {"r": {"Type": "AWS::CloudFormation::Stack",
+                                                  "Properties": {"TemplateURL": "https://bucket/nested.json"}}}}
+        self.create_deployed_stack(cloudformation_mock, template_body_dict, {}, {})
+        stack = CloudFormationStack(CloudFormationTemplate(template_body_dict, "template-name"), {},
+                                    "stack-name", "eu-west-1")
+
+        CloudFormation().update_stack(stack)
+
+        cloudformation_mock.return_value.get_template.assert_not_called()
+        cloudformation_mock.return_value.update_stack.assert_called_once()
+
+    def test_template_can_be_compared_returns_false_for_nested_stacks(self):
+        self.assertFalse(template_can_be_compared(
+            {"Resources": {"r": {"Type": "AWS::CloudFormation::Stack", "Properties": {"TemplateURL": "url"}}}}))
+        self.assertFalse(template_can_be_compared(
+            {"Resources": {"r": {"Type": "AWS::Serverless::Application", "Properties": {"Location": "url"}}}}))
+
+    def test_template_can_be_compared_returns_false_for_macros_and_ssm_parameters(self):
+        self.assertTrue(template_can_be_compared({"Transform": "AWS::Serverless-2016-10-31"}))
+        self.assertFalse(template_can_be_compared({"Transform": ["AWS::Serverless-2016-10-31", "MyMacro"]}))
+        self.assertFalse(template_can_be_compared(
+            {"Parameters": {"a": {"Type": "AWS::SSM::Parameter::Value<String>"}}}))
+        self.assertFalse(template_can_be_compared({"Parameters": {"a": {"Type": "String", "NoEcho": True}}}))
+
+    def test_get_effective_parameters_adds_template_defaults(self):
+        template_body_dict = {"Parameters": {"a": {"Type": "String"}, "b": {"Type": "Number", "Default": 1}}}
+
+        self.assertEqual({"a": "x", "b": "1"}, get_effective_parameters(template_body_dict, {"a": "x"}))
+
+    def test_get_effective_parameters_returns_none_for_missing_values(self):
+        self.assertIsNone(get_effective_parameters({"Parameters": {"a": {"Type": "String"}}}, {}))
+
+    def test_get_stack_fingerprint_ignores_empty_template_sections_and_key_order(self):
+        self.assertEqual(get_stack_fingerprint({"Resources": {"a": 1, "b": 2}, "Mappings": {}}, {}, {}),
+                         get_stack_fingerprint({"Resources": {"b": 2, "a": 1}}, {}, {}))
+
     @patch('cfn_sphere.aws.cfn.CloudFormation.get_stack')
     def test_validate_stack_is_ready_for_action_raises_exception_on_unknown_stack_state(self, get_stack_mock):
         stack_mock = Mock()
@@ -532,7 +738,7 @@ class CloudFormationApiTests(TestCase):
         cfn.validate_stack_is_ready_for_action(stack)
 
     @patch('cfn_sphere.aws.cfn.CloudFormation.get_stack')
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     def test_get_stack_parameters_dict_returns_proper_dict(self, _, get_stack_mock):
         cfn = CloudFormation()
 
@@ -546,7 +752,7 @@ class CloudFormationApiTests(TestCase):
         self.assertDictEqual({'myKey1': 'myValue1', 'myKey2': 'myValue2'}, result)
 
     @patch('cfn_sphere.aws.cfn.CloudFormation.get_stack')
-    @patch('cfn_sphere.aws.cfn.boto3.client')
+    @patch('boto3.client')
     def test_get_stack_parameters_dict_returns_empty_dict_for_empty_parameters(self, _, get_stack_mock):
         cfn = CloudFormation()
 
@@ -558,6 +764,83 @@ class CloudFormationApiTests(TestCase):
 
         self.assertDictEqual({}, result)
 
+    @staticmethod
+    def create_stack_with_template_body(template_body, template_bucket=None):
+        stack = CloudFormationStack(Mock(spec=CloudFormationTemplate), {}, "stack-name", "eu-west-1",
+                                    template_bucket=template_bucket)
+        stack.template.get_template_json.return_value = template_body
+        return stack
+
+    def test_get_template_location_kwargs_returns_template_body_for_small_templates(self):
+        stack = self.create_stack_with_template_body('{"key": "value"}', template_bucket="my-bucket")
+
+        self.assertEqual({"TemplateBody": '{"key": "value"}'}, CloudFormation().get_template_location_kwargs(stack))
+
+    @patch('cfn_sphere.aws.cfn.S3')
+    def test_get_template_location_kwargs_stages_large_templates(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = False
+        template_body = '{"key": "' + 'x' * TEMPLATE_BODY_SIZE_LIMIT + '"}'
+        stack = self.create_stack_with_template_body(template_body, template_bucket="my-bucket")
+
+        result = CloudFormation(region="eu-west-1").get_template_location_kwargs(stack)
+
+        key_name = s3_mock.return_value.put_object.call_args[0][1]
+        self.assertTrue(key_name.startswith(TEMPLATE_STAGING_PREFIX))
+        s3_mock.return_value.put_object.assert_called_once_with("my-bucket", key_name, template_body)
+        self.assertEqual({"TemplateURL": "https://my-bucket.s3.eu-west-1.amazonaws.com/" + key_name}, result)
+
+    @patch('cfn_sphere.aws.cfn.S3')
+    def test_get_template_location_kwargs_stages_identical_templates_once(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = False
+        template_body = '{"key": "' + 'x' * TEMPLATE_BODY_SIZE_LIMIT + '"}'
+        cfn = CloudFormation()
+
+        first = cfn.get_template_location_kwargs(self.create_stack_with_template_body(template_body, "my-bucket"))
+        second = cfn.get_template_location_kwargs(self.create_stack_with_template_body(template_body, "my-bucket"))
+
+        self.assertEqual(first, second)
+        s3_mock.return_value.object_exists.assert_called_once()
+        s3_mock.return_value.put_object.assert_called_once()
+
+    @patch('cfn_sphere.aws.cfn.S3')
+    def test_get_template_location_kwargs_does_not_upload_already_staged_templates(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = True
+        stack = self.create_stack_with_template_body('{"key": "' + 'x' * TEMPLATE_BODY_SIZE_LIMIT + '"}', "my-bucket")
+
+        self.assertIn("TemplateURL", CloudFormation().get_template_location_kwargs(stack))
+        s3_mock.return_value.put_object.assert_not_called()
+
+    @patch('cfn_sphere.aws.cfn.S3')
+    def test_clear_staged_templates_looks_up_staged_templates_again(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = True
+        stack = self.create_stack_with_template_body('{"key": "' + 'x' * TEMPLATE_BODY_SIZE_LIMIT + '"}', "my-bucket")
+        cfn = CloudFormation()
+
+        cfn.get_template_location_kwargs(stack)
+        cfn.clear_staged_templates()
+        cfn.get_template_location_kwargs(stack)
+
+        self.assertEqual(2, s3_mock.return_value.object_exists.call_count)
+
+    @patch('cfn_sphere.aws.cfn.S3')
+    def test_get_template_location_kwargs_retries_failed_staging(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = False
+        s3_mock.return_value.put_object.side_effect = [Exception("Upload failed"), None]
+        stack = self.create_stack_with_template_body('{"key": "' + 'x' * TEMPLATE_BODY_SIZE_LIMIT + '"}', "my-bucket")
+        cfn = CloudFormation()
+
+        with self.assertRaisesRegex(Exception, "Upload failed"):
+            cfn.get_template_location_kwargs(stack)
+
+        self.assertIn("TemplateURL", cfn.get_template_location_kwargs(stack))
+        self.assertEqual(2, s3_mock.return_value.put_object.call_count)
+
+    def test_get_template_location_kwargs_raises_exception_for_large_templates_without_bucket(self):
+        stack = self.create_stack_with_template_body('{"key": "' + 'x' * TEMPLATE_BODY_SIZE_LIMIT + '"}')
+
+        with self.assertRaises(TemplateErrorException):
+            CloudFormation().get_template_location_kwargs(stack)
+
     def test_is_boto_no_update_required_exception_returns_false_with_other_exception(self):
         exception = Mock(spec=Exception)
         exception.message = "No updates are to be performed."
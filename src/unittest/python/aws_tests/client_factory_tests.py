@@ -0,0 +1,96 @@
+import threading
+
+try:
+    from unittest2 import TestCase
+    from mock import patch, Mock
+except ImportError:
+    from unittest import TestCase
+    from mock import patch, Mock
+
+import botocore.session
+from botocore.stub import Stubber
+
+from cfn_sphere.aws.client_factory import ClientFactory, CLIENT_FACTORY, MAX_ATTEMPTS, MAX_POOL_CONNECTIONS
+from cfn_sphere.aws.ec2 import Ec2Api
+
+
+class ClientFactoryTests(TestCase):
+    def tearDown(self):
+        CLIENT_FACTORY.clear()
+
+    @patch('boto3.client')
+    def test_get_client_caches_clients_per_service_and_region(self, client_mock):
+        client_mock.side_effect = lambda *args, **kwargs: Mock()
+        factory = ClientFactory()
+
+        self.assertIs(factory.get_client('ec2', 'eu-west-1'), factory.get_client('ec2', 'eu-west-1'))
+        self.assertIsNot(factory.get_client('ec2', 'eu-west-1'), factory.get_client('ec2', 'us-east-1'))
+        self.assertIsNot(factory.get_client('ec2', 'eu-west-1'), factory.get_client('s3', 'eu-west-1'))
+        self.assertEqual(3, client_mock.call_count)
+
+    @patch('boto3.client')
+    def test_get_client_configures_connection_pool(self, client_mock):
+        ClientFactory().get_client('s3', 'eu-west-1')
+
+        self.assertEqual(MAX_POOL_CONNECTIONS, client_mock.call_args[1]['config'].max_pool_connections)
+
+    @patch('boto3.client')
+    def test_get_client_configures_standard_retries(self, client_mock):
+        ClientFactory().get_client('s3', 'eu-west-1')
+
+        self.assertEqual({"mode": "standard", "max_attempts": MAX_ATTEMPTS},
+                         client_mock.call_args[1]['config'].retries)
+
+    def test_get_config_disables_retries_for_callers_retrying_themselves(self):
+        self.assertEqual(1, ClientFactory.get_config(max_attempts=1).retries["max_attempts"])
+
+    @patch('boto3.session.Session')
+    def test_get_client_uses_one_session_per_profile(self, session_mock):
+        factory = ClientFactory()
+
+        factory.get_client('ec2', 'eu-west-1', 'my-profile')
+        factory.get_client('s3', 'eu-west-1', 'my-profile')
+
+        session_mock.assert_called_once_with(profile_name='my-profile')
+        self.assertEqual(2, session_mock.return_value.client.call_count)
+
+    @patch('boto3.client')
+    def test_get_client_creates_one_client_for_concurrent_requests(self, client_mock):
+        client_mock.side_effect = lambda *args, **kwargs: Mock()
+        factory = ClientFactory()
+        clients = []
+
+        threads = [threading.Thread(target=lambda: clients.append(factory.get_client('ec2', 'eu-west-1')))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, client_mock.call_count)
+        self.assertEqual(1, len(set(id(client) for client in clients)))
+
+    @patch('boto3.resource')
+    def test_get_resource_caches_resources_per_thread(self, resource_mock):
+        resource_mock.side_effect = lambda *args, **kwargs: Mock()
+        factory = ClientFactory()
+        other_thread_resources = []
+
+        resource = factory.get_resource('s3', 'eu-west-1')
+        thread = threading.Thread(target=lambda: other_thread_resources.append(factory.get_resource('s3', 'eu-west-1')))
+        thread.start()
+        thread.join()
+
+        self.assertIs(resource, factory.get_resource('s3', 'eu-west-1'))
+        self.assertIsNot(resource, other_thread_resources[0])
+
+    def test_registered_stubbed_clients_are_used_by_api_wrappers(self):
+        client = botocore.session.get_session().create_client('ec2', region_name='eu-west-1',
+                                                              aws_access_key_id='key', aws_secret_access_key='secret')
+        stubber = Stubber(client)
+        stubber.add_response('describe_images', {'Images': [{'ImageId': 'ami-1', 'CreationDate': '2020-01-01'}]})
+        CLIENT_FACTORY.register_client(client, 'ec2', 'eu-west-1')
+
+        with stubber:
+            self.assertEqual('ami-1', Ec2Api('eu-west-1').get_latest_taupage_image_id())
+        stubber.assert_no_pending_responses()
@@ -8,11 +8,18 @@ except ImportError:
 import datetime
 
 from cfn_sphere.aws.ec2 import Ec2Api
+from cfn_sphere.aws.client_factory import CLIENT_FACTORY
 from cfn_sphere.exceptions import CfnSphereException
 
 
 class Ec2ApiTests(TestCase):
-    @patch("cfn_sphere.aws.ec2.boto3.client")
+    def setUp(self):
+        CLIENT_FACTORY.clear()
+
+    def tearDown(self):
+        CLIENT_FACTORY.clear()
+
+    @patch("boto3.client")
     def test_get_images_raises_exception_on_empty_response(self, boto_client):
         boto_client.return_value.describe_images.return_value = {'Images': []}
 
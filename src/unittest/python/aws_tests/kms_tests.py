@@ -7,18 +7,25 @@ except ImportError:
 
 import base64
 
+from cfn_sphere.aws.client_factory import CLIENT_FACTORY
 from cfn_sphere.aws.kms import KMS
 
 
 class KMSTests(TestCase):
-    @patch('cfn_sphere.aws.kms.boto3.client')
+    def setUp(self):
+        CLIENT_FACTORY.clear()
+
+    def tearDown(self):
+        CLIENT_FACTORY.clear()
+
+    @patch('boto3.client')
     def test_decrypt_value(self, boto_mock):
         boto_mock.return_value.decrypt.return_value = {'Plaintext': b'decryptedValue'}
 
         self.assertEqual('decryptedValue', KMS().decrypt("ZW5jcnlwdGVkVmFsdWU="))
         boto_mock.return_value.decrypt.assert_called_once_with(CiphertextBlob=b'encryptedValue')
 
-    @patch('cfn_sphere.aws.kms.boto3.client')
+    @patch('boto3.client')
     def test_decrypt_value_with_unicode_char(self, boto_mock):
         boto_mock.return_value.decrypt.return_value = {
             'Plaintext': b'(\xe2\x95\xaf\xc2\xb0\xe2\x96\xa1\xc2\xb0\xef\xbc\x89\xe2\x95\xaf\xef\xb8\xb5 \xe2\x94\xbb\xe2\x94\x81\xe2\x94\xbb'}
@@ -0,0 +1,172 @@
+try:
+    from unittest2 import TestCase
+    from mock import patch, Mock
+except ImportError:
+    from unittest import TestCase
+    from mock import patch, Mock
+
+from cfn_sphere.aws.rate_limiter import RateLimiter, TokenBucket, get_api_family, ATTEMPT_COMPLETED_KEY, DEFAULT_RATES, \
+    MINIMUM_RATE
+from cfn_sphere.exceptions import InvalidConfigException
+
+
+class TokenBucketTests(TestCase):
+    @patch('cfn_sphere.aws.rate_limiter.time.sleep')
+    def test_acquire_does_not_wait_within_burst_capacity(self, sleep_mock):
+        bucket = TokenBucket(5)
+
+        for _ in range(5):
+            self.assertEqual(0.0, bucket.acquire())
+        sleep_mock.assert_not_called()
+
+    @patch('cfn_sphere.aws.rate_limiter.time.sleep')
+    def test_acquire_waits_for_reserved_tokens_in_order(self, sleep_mock):
+        bucket = TokenBucket(2)
+        bucket.acquire()
+        bucket.acquire()
+
+        first_wait = bucket.acquire()
+        second_wait = bucket.acquire()
+
+        self.assertAlmostEqual(0.5, first_wait, places=1)
+        self.assertAlmostEqual(1.0, second_wait, places=1)
+        self.assertEqual(2, sleep_mock.call_count)
+
+    @patch('cfn_sphere.aws.rate_limiter.time.sleep')
+    def test_reserve_returns_wait_time_without_sleeping(self, sleep_mock):
+        bucket = TokenBucket(2)
+        bucket.reserve()
+        bucket.reserve()
+
+        self.assertAlmostEqual(0.5, bucket.reserve(), places=1)
+        sleep_mock.assert_not_called()
+
+    def test_decrease_rate_halves_rate_down_to_minimum(self):
+        bucket = TokenBucket(2)
+
+        bucket.decrease_rate()
+        self.assertEqual(1, bucket.rate)
+        for _ in range(5):
+            bucket.decrease_rate()
+        self.assertEqual(MINIMUM_RATE, bucket.rate)
+
+    def test_increase_rate_recovers_up_to_configured_rate(self):
+        bucket = TokenBucket(2)
+        bucket.decrease_rate()
+
+        for _ in range(100):
+            bucket.increase_rate()
+
+        self.assertEqual(2, bucket.rate)
+
+
+class RateLimiterTests(TestCase):
+    def test_get_api_family(self):
+        self.assertEqual("read", get_api_family("DescribeStacks"))
+        self.assertEqual("read", get_api_family("GetParameter"))
+        self.assertEqual("write", get_api_family("UpdateStack"))
+
+    def test_get_rate_uses_defaults_per_service_and_family(self):
+        limiter = RateLimiter()
+
+        self.assertEqual(DEFAULT_RATES["cloudformation"]["write"], limiter.get_rate("cloudformation", "write"))
+
+    def test_configure_overrides_rates_per_service_or_family(self):
+        limiter = RateLimiter()
+
+        limiter.configure({"ssm": 3, "cloudformation.read": 4})
+
+        self.assertEqual(3, limiter.get_rate("ssm", "read"))
+        self.assertEqual(3, limiter.get_rate("ssm", "write"))
+        self.assertEqual(4, limiter.get_rate("cloudformation", "read"))
+        self.assertEqual(DEFAULT_RATES["cloudformation"]["write"], limiter.get_rate("cloudformation", "write"))
+
+    def test_configure_raises_exception_for_invalid_family(self):
+        with self.assertRaises(InvalidConfigException):
+            RateLimiter().configure({"ssm.delete": 3})
+
+    def test_configure_raises_exception_for_invalid_rate(self):
+        with self.assertRaises(InvalidConfigException):
+            RateLimiter().configure({"ssm": "fast"})
+
+    def test_buckets_are_shared_per_service_and_family(self):
+        limiter = RateLimiter()
+
+        self.assertIs(limiter.get_bucket("cloudformation", "DescribeStacks"),
+                      limiter.get_bucket("cloudformation", "DescribeStackEvents"))
+        self.assertIsNot(limiter.get_bucket("cloudformation", "DescribeStacks"),
+                         limiter.get_bucket("cloudformation", "UpdateStack"))
+
+    def test_buckets_are_separate_per_scope(self):
+        limiter = RateLimiter()
+
+        self.assertIsNot(limiter.get_bucket("cloudformation", "DescribeStacks", scope=("eu-west-1", None)),
+                         limiter.get_bucket("cloudformation", "DescribeStacks", scope=("us-east-1", None)))
+
+    def test_configure_keeps_buckets_for_unchanged_rates(self):
+        limiter = RateLimiter()
+        limiter.configure({"ssm": 3})
+        bucket = limiter.get_bucket("ssm", "GetParameters")
+
+        limiter.configure({"ssm": 3})
+        self.assertIs(bucket, limiter.get_bucket("ssm", "GetParameters"))
+
+        limiter.configure({"ssm": 4})
+        self.assertIsNot(bucket, limiter.get_bucket("ssm", "GetParameters"))
+
+    def test_throttling_responses_are_counted_and_slow_down_the_bucket(self):
+        limiter = RateLimiter()
+
+        limiter._needs_retry(event_name="needs-retry.cloudformation.DescribeStacks",
+                             response=(Mock(), {"Error": {"Code": "ThrottlingException"}}))
+
+        self.assertEqual(1, limiter.get_statistics()["throttling_errors"])
+        self.assertEqual(DEFAULT_RATES["cloudformation"]["read"] / 2,
+                         limiter.get_bucket("cloudformation", "DescribeStacks").rate)
+
+    def test_other_errors_are_not_counted_as_throttling(self):
+        limiter = RateLimiter()
+
+        limiter._needs_retry(event_name="needs-retry.cloudformation.DescribeStacks",
+                             response=(Mock(), {"Error": {"Code": "ValidationError"}}))
+
+        self.assertEqual(0, limiter.get_statistics()["throttling_errors"])
+
+    @patch('cfn_sphere.aws.rate_limiter.time.sleep')
+    def test_before_send_counts_time_spent_waiting(self, _):
+        limiter = RateLimiter()
+        limiter.configure({"cloudformation": 1})
+
+        limiter._before_send(event_name="before-send.cloudformation.UpdateStack")
+        limiter._before_send(event_name="before-send.cloudformation.UpdateStack")
+
+        self.assertAlmostEqual(1.0, limiter.get_statistics()["waited_seconds"], places=1)
+
+    def test_register_hooks_into_client_events(self):
+        client = Mock()
+
+        RateLimiter().register(client)
+
+        registered_events = [args[0] for args, _ in client.meta.events.register.call_args_list]
+        self.assertEqual(["request-created", "before-send", "needs-retry"], registered_events)
+
+    def test_retry_delays_are_counted_as_backoff(self):
+        limiter = RateLimiter()
+        request_dict = {"context": {}}
+
+        limiter._needs_retry(event_name="needs-retry.cloudformation.DescribeStacks", request_dict=request_dict,
+                             response=(Mock(), {"Error": {"Code": "ThrottlingException"}}))
+        # botocore backs off 2.5 seconds
+        request_dict["context"][ATTEMPT_COMPLETED_KEY] -= 2.5
+        limiter._request_created(event_name="request-created.cloudformation.DescribeStacks",
+                                 request=Mock(context=request_dict["context"]))
+
+        self.assertAlmostEqual(2.5, limiter.get_statistics()["backoff_seconds"], places=1)
+
+    def test_first_attempts_are_not_counted_as_backoff(self):
+        limiter = RateLimiter()
+
+        limiter._request_created(event_name="request-created.cloudformation.DescribeStacks",
+                                 request=Mock(context={}))
+
+        self.assertEqual(0, limiter.get_statistics()["backoff_seconds"])
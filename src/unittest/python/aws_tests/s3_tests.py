@@ -9,17 +9,27 @@ except ImportError:
     from unittest import TestCase
     from mock import Mock, patch
 
+from botocore.exceptions import ClientError
+
 from cfn_sphere.aws.s3 import S3
+from cfn_sphere.aws.client_factory import CLIENT_FACTORY
+from cfn_sphere.exceptions import CfnSphereBotoError
 
 
 class S3Tests(unittest2.TestCase):
+    def setUp(self):
+        CLIENT_FACTORY.clear()
+
+    def tearDown(self):
+        CLIENT_FACTORY.clear()
+
     def test_parse_url_properly_parses_s3_url(self):
         (protocol, bucket_name, key_name) = S3._parse_url('s3://my-bucket/my/key/file.json')
         self.assertEqual('s3', protocol)
         self.assertEqual('my-bucket', bucket_name)
         self.assertEqual('my/key/file.json', key_name)
 
-    @patch('cfn_sphere.aws.s3.boto3.resource')
+    @patch('boto3.resource')
     def test_get_contents_from_url_returns_string_content(self, resource_mock):
         body_mock = Mock(spec=StreamingBody)
         body_mock.read.return_value = b'Foo'
@@ -28,3 +38,31 @@ class S3Tests(unittest2.TestCase):
 
         result = S3().get_contents_from_url('s3://my-bucket/my/key/file.json')
         self.assertEqual("Foo", result)
+
+    @patch('boto3.client')
+    def test_object_exists_returns_true_for_existing_object(self, client_mock):
+        self.assertTrue(S3().object_exists('my-bucket', 'my-key'))
+        client_mock.return_value.head_object.assert_called_once_with(Bucket='my-bucket', Key='my-key')
+
+    @patch('boto3.client')
+    def test_object_exists_returns_false_for_missing_object(self, client_mock):
+        client_mock.return_value.head_object.side_effect = ClientError({"Error": {"Code": "404", "Message": ""}},
+                                                                        "HeadObject")
+        self.assertFalse(S3().object_exists('my-bucket', 'my-key'))
+
+    @patch('boto3.client')
+    def test_object_exists_raises_exception_on_access_denied(self, client_mock):
+        client_mock.return_value.head_object.side_effect = ClientError({"Error": {"Code": "403", "Message": ""}},
+                                                                        "HeadObject")
+        with self.assertRaises(CfnSphereBotoError):
+            S3().object_exists('my-bucket', 'my-key')
+
+    @patch('boto3.client')
+    def test_upload_file_uses_transfer_config(self, client_mock):
+        S3('eu-west-1').upload_file('/tmp/file', 'my-bucket', 'my-key')
+
+        self.assertEqual(('s3',), client_mock.call_args[0])
+        self.assertEqual('eu-west-1', client_mock.call_args[1]['region_name'])
+        args, kwargs = client_mock.return_value.upload_file.call_args
+        self.assertEqual(('/tmp/file', 'my-bucket', 'my-key'), args)
+        self.assertIn('Config', kwargs)
@@ -4,9 +4,16 @@ try:
 except ImportError:
     from unittest import TestCase
     from mock import patch
+from cfn_sphere.aws.client_factory import CLIENT_FACTORY
 from cfn_sphere.aws.ssm import SSM
 class SSMTests(TestCase):
-    @patch('cfn_sphere.aws.ssm.boto3.client')
+    def setUp(self):
+        CLIENT_FACTORY.clear()
+
+    def tearDown(self):
+        CLIENT_FACTORY.clear()
+
+    @patch('boto3.client')
     def test_decrypt_value(self, boto_mock):
         boto_mock.return_value.get_parameter.return_value = {'Parameter': { 'Value': 'decryptedValue'} }
         self.assertEqual('decryptedValue', SSM().get_parameter('/test'))
@@ -0,0 +1,79 @@
+try:
+    from unittest2 import TestCase
+    from mock import Mock, patch
+except ImportError:
+    from unittest import TestCase
+    from mock import Mock, patch
+
+from datetime import datetime, timedelta, timezone
+
+from cfn_sphere.aws.cfn import CloudFormation
+from cfn_sphere.aws.stack_event_watcher import StackEventWatcher
+from cfn_sphere.exceptions import CfnStackActionFailedException
+
+NOW = datetime.now(timezone.utc)
+
+
+def create_event(stack_name, status, seconds):
+    return {"EventId": "{0}-{1}".format(stack_name, status), "Timestamp": NOW + timedelta(seconds=seconds),
+            "StackName": stack_name, "LogicalResourceId": stack_name, "ResourceType": "AWS::CloudFormation::Stack",
+            "ResourceStatus": status, "ResourceStatusReason": None}
+
+
+@patch('cfn_sphere.aws.cfn.STACK_EVENT_POLL_INTERVAL', 0.01)
+@patch('cfn_sphere.aws.cfn.get_cfn_api_server_time', Mock(return_value=NOW))
+class StackEventWatcherTests(TestCase):
+    def setUp(self):
+        self.cfn = CloudFormation()
+        self.events = {}
+        self.cfn.get_stack_events = Mock(side_effect=lambda stack_name: list(reversed(self.events[stack_name])))
+        self.watcher = StackEventWatcher(self.cfn)
+
+    def tearDown(self):
+        self.watcher.stop()
+
+    def test_watch_resolves_actions_of_all_stacks_from_one_thread(self):
+        self.events["vpc"] = [create_event("vpc", "UPDATE_IN_PROGRESS", 1), create_event("vpc", "UPDATE_COMPLETE", 2)]
+        self.events["app"] = [create_event("app", "CREATE_IN_PROGRESS", 1)]
+
+        vpc = self.watcher.watch("vpc", "update", 60)
+        app = self.watcher.watch("app", "create", 60)
+
+        self.assertEqual("UPDATE_COMPLETE", vpc.result(5)["ResourceStatus"])
+        self.assertFalse(app.done())
+
+        self.events["app"].append(create_event("app", "CREATE_COMPLETE", 3))
+        self.assertEqual("CREATE_COMPLETE", app.result(5)["ResourceStatus"])
+
+    def test_watch_fails_on_failed_stack_actions(self):
+        self.events["vpc"] = [create_event("vpc", "UPDATE_IN_PROGRESS", 1), create_event("vpc", "UPDATE_FAILED", 2)]
+
+        with self.assertRaisesRegex(CfnStackActionFailedException, "UPDATE_FAILED"):
+            self.watcher.watch("vpc", "update", 60).result(5)
+
+    def test_watch_fails_after_timeout(self):
+        self.events["vpc"] = [create_event("vpc", "UPDATE_IN_PROGRESS", 1)]
+
+        with self.assertRaisesRegex(CfnStackActionFailedException, "Timeout occurred waiting for 'UPDATE_COMPLETE'"):
+            self.watcher.watch("vpc", "update", 0).result(5)
+
+    def test_watch_ignores_events_of_previous_actions(self):
+        self.events["vpc"] = [create_event("vpc", "UPDATE_IN_PROGRESS", -60),
+                              create_event("vpc", "UPDATE_COMPLETE", -50)]
+
+        future = self.watcher.watch("vpc", "update", 60)
+        self.events["vpc"] += [create_event("vpc", "UPDATE_IN_PROGRESS", 1), create_event("vpc", "UPDATE_COMPLETE", 2)]
+        self.events["vpc"][-2]["EventId"] = "second-start"
+        self.events["vpc"][-1]["EventId"] = "second-complete"
+
+        self.assertEqual("second-complete", future.result(5)["EventId"])
+
+    def test_stop_cancels_watched_actions(self):
+        self.events["vpc"] = []
+        future = self.watcher.watch("vpc", "update", 60)
+
+        self.watcher.stop()
+
+        self.assertTrue(future.cancelled())
+        with self.assertRaises(CfnStackActionFailedException):
+            self.watcher.watch("app", "update", 60)
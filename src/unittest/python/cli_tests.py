@@ -1,4 +1,10 @@
-from cfn_sphere.cli import get_first_account_alias_or_account_id
+import json
+import os
+
+from cfn_sphere.aws.client_factory import CLIENT_FACTORY
+from cfn_sphere.cli import get_first_account_alias_or_account_id, get_first_account_alias_or_account_id_in_background
+from cfn_sphere.cli import get_change_set_region, read_change_set_arns
+from cfn_sphere.exceptions import CfnSphereException
 
 try:
     from unittest2 import TestCase
@@ -9,6 +15,12 @@ except ImportError:
 
 
 class CliTests(TestCase):
+    def setUp(self):
+        CLIENT_FACTORY.clear()
+
+    def tearDown(self):
+        CLIENT_FACTORY.clear()
+
     @patch("boto3.client")
     def test_get_first_account_alias_or_account_id_returns_first_account_alias(self, boto_mock):
         boto_mock.return_value.list_account_aliases.return_value = {"AccountAliases": ["a", "b", "c"]}
@@ -23,3 +35,70 @@ class CliTests(TestCase):
 
         result = get_first_account_alias_or_account_id()
         self.assertEqual("ACCOUNT_ID", result)
+
+    @patch("boto3.client")
+    def test_get_first_account_alias_or_account_id_in_background_returns_future_with_alias(self, boto_mock):
+        boto_mock.return_value.list_account_aliases.return_value = {"AccountAliases": ["a"]}
+
+        future = get_first_account_alias_or_account_id_in_background()
+        self.assertEqual("a", future.result(timeout=10))
+
+    @patch("cfn_sphere.cli.StackActionHandler")
+    @patch("cfn_sphere.cli.Config")
+    def test_sync_writes_timings_json(self, config_mock, stack_action_handler_mock):
+        from click.testing import CliRunner
+        from cfn_sphere.cli import sync
+        from cfn_sphere.timings import TIMINGS
+        TIMINGS.clear()
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open("stacks.yml", "w") as f:
+                f.write("region: eu-west-1")
+
+            result = runner.invoke(sync, ["stacks.yml", "--yes", "--timings-json", "timings.json"])
+
+            with open("timings.json") as f:
+                timings = json.load(f)
+
+        self.assertEqual(0, result.exit_code, result.output)
+        stack_action_handler_mock.return_value.create_or_update_stacks.assert_called_once_with()
+        self.assertEqual("sync", timings["spans"][-1]["name"])
+        self.assertEqual(1, timings["categories"]["run"]["count"])
+
+    def test_read_change_set_arns_from_arguments_and_file(self):
+        change_set_file = ["arn:aws:cloudformation:eu-west-1:1:changeSet/b/2\n", "\n", "# created today\n",
+                           "arn:aws:cloudformation:eu-west-1:1:changeSet/a/1  # duplicate\n"]
+
+        self.assertEqual(["arn:aws:cloudformation:eu-west-1:1:changeSet/a/1",
+                          "arn:aws:cloudformation:eu-west-1:1:changeSet/b/2"],
+                         read_change_set_arns(("arn:aws:cloudformation:eu-west-1:1:changeSet/a/1",), change_set_file))
+
+    def test_read_change_set_arns_raises_exception_without_change_sets(self):
+        with self.assertRaises(CfnSphereException):
+            read_change_set_arns((), [])
+
+    def test_get_change_set_region(self):
+        self.assertEqual("us-east-1", get_change_set_region(["arn:aws:cloudformation:us-east-1:1:changeSet/a/1",
+                                                             "name"], "eu-west-1"))
+        self.assertEqual("eu-west-1", get_change_set_region(["name"], "eu-west-1"))
+
+        with self.assertRaises(CfnSphereException):
+            get_change_set_region(["arn:aws:cloudformation:us-east-1:1:changeSet/a/1",
+                                   "arn:aws:cloudformation:eu-west-1:1:changeSet/b/2"], "eu-west-1")
+
+    def test_profile_out_writes_profile_of_command(self):
+        from click.testing import CliRunner
+        from cfn_sphere.cli import cli
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open("template.json", "w") as f:
+                json.dump({"Resources": {"Handle": {"Type": "AWS::CloudFormation::WaitConditionHandle"}}}, f)
+
+            result = runner.invoke(cli, ["--profile-out", "run", "render-template", "template.json", "--yes"])
+
+            self.assertEqual(0, result.exit_code, result.output)
+            self.assertTrue(os.path.isfile("run.pstats"))
+            with open("run.collapsed") as f:
+                self.assertIn("[template-load]", f.read())
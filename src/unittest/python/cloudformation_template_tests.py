@@ -82,3 +82,29 @@ class TestCloudFormationTemplateTests(TestCase):
         }
         template = CloudFormationTemplate(template_body, 'some name')
         six.assertCountEqual(self, [], template.get_no_echo_parameter_keys())
+
+    def test_get_template_json_returns_compact_json_with_sorted_keys(self):
+        template = CloudFormationTemplate({'Resources': {'b': 1, 'a': 2}}, 'some name')
+
+        self.assertEqual('{"AWSTemplateFormatVersion":"2010-09-09","Conditions":{},"Description":"","Mappings":{},'
+                         '"Metadata":{},"Outputs":{},"Parameters":{},"Resources":{"a":2,"b":1}}',
+                         template.get_template_json())
+
+    def test_get_template_json_is_cached(self):
+        template = CloudFormationTemplate({'Resources': {'a': 1}}, 'some name')
+
+        self.assertIs(template.get_template_json(), template.get_template_json())
+
+    def test_assigning_a_template_section_invalidates_cached_json_and_hash(self):
+        template = CloudFormationTemplate({'Resources': {'a': 1}}, 'some name')
+        template_json = template.get_template_json()
+        content_hash = template.get_content_hash()
+
+        template.resources = {'b': 1}
+
+        self.assertNotEqual(template_json, template.get_template_json())
+        self.assertNotEqual(content_hash, template.get_content_hash())
+
+    def test_get_content_hash_is_equal_for_equal_templates(self):
+        self.assertEqual(CloudFormationTemplate({'Resources': {'a': 1, 'b': 2}}, 'some name').get_content_hash(),
+                         CloudFormationTemplate({'Resources': {'b': 2, 'a': 1}}, 'other name').get_content_hash())
@@ -0,0 +1,181 @@
+try:
+    from unittest2 import TestCase
+    from mock import patch, Mock
+except ImportError:
+    from unittest import TestCase
+    from mock import patch, Mock
+
+import http.client
+import json
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import threading
+from urllib.error import HTTPError
+from urllib.request import urlopen, Request
+
+from cfn_sphere.daemon import Daemon, DaemonRequestException, get_config_input_files
+from cfn_sphere.exceptions import CfnSphereException, CfnStackActionFailedException
+
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path):
+        http.client.HTTPConnection.__init__(self, "localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+class DaemonTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_file(self, file_name, content):
+        file_path = os.path.join(self.directory, file_name)
+        with open(file_path, "w") as f:
+            f.write(content)
+        return file_path
+
+    def test_get_config_input_files_contains_context_includes(self):
+        config_file = self.write_file("stacks.yml", "region: eu-west-1")
+        context_file = self.write_file("context.yml", "include: [common.yml]\nfoo: bar")
+
+        self.assertEqual([config_file, context_file, os.path.join(self.directory, "common.yml")],
+                         get_config_input_files(config_file, context_file))
+
+    @patch("cfn_sphere.daemon.Config")
+    def test_get_config_loads_configs_again_only_after_changes(self, config_mock):
+        config_file = self.write_file("stacks.yml", "region: eu-west-1")
+        daemon = Daemon()
+
+        self.assertIs(daemon.get_config(config_file), daemon.get_config(config_file))
+        self.assertEqual(1, config_mock.call_count)
+
+        self.write_file("stacks.yml", "region: eu-central-1")
+        daemon.get_config(config_file)
+        self.assertEqual(2, config_mock.call_count)
+
+    @patch("cfn_sphere.daemon.CloudFormation")
+    def test_get_cfn_shares_cloudformation_per_target_and_invalidates_changed_stacks(self, cloudformation_mock):
+        daemon = Daemon()
+        target = Mock(region="eu-west-1", profile=None)
+
+        self.assertIs(daemon.get_cfn(target), daemon.get_cfn(target))
+        self.assertEqual(1, cloudformation_mock.call_count)
+        self.assertEqual(2, cloudformation_mock.return_value.invalidate_changed_stacks.call_count)
+
+    def test_handle_raises_exception_for_unknown_requests(self):
+        with self.assertRaises(DaemonRequestException):
+            Daemon().handle("/unknown", {})
+
+    def test_handle_raises_exception_for_missing_config(self):
+        with self.assertRaises(DaemonRequestException):
+            Daemon().handle("/sync", {})
+
+    @patch("cfn_sphere.daemon.FanOut")
+    @patch("cfn_sphere.daemon.Config")
+    def test_sync_reports_failed_targets(self, config_mock, fan_out_mock):
+        config_file = self.write_file("stacks.yml", "region: eu-west-1")
+        fan_out_mock.return_value.run.side_effect = CfnStackActionFailedException("failed for 1 of 1 targets")
+        fan_out_mock.return_value.results = [Mock(to_dict=Mock(return_value={"target": "eu-west-1"}))]
+
+        response = Daemon().handle("/sync", {"config": config_file, "dry_run": True})
+
+        self.assertFalse(response["succeeded"])
+        self.assertEqual([{"target": "eu-west-1"}], response["targets"])
+        self.assertEqual((config_mock.return_value, True), fan_out_mock.call_args[0])
+        fan_out_mock.return_value.run.assert_called_once_with("create_or_update_stacks")
+
+    @patch("cfn_sphere.daemon.ARTIFACT_REGISTRY")
+    @patch("cfn_sphere.daemon.FanOut")
+    @patch("cfn_sphere.daemon.Config")
+    @patch("cfn_sphere.daemon.CloudFormation")
+    def test_actions_forget_staged_templates_and_artifacts_of_earlier_actions(self, cloudformation_mock, config_mock,
+                                                                               fan_out_mock, artifact_registry_mock):
+        config_file = self.write_file("stacks.yml", "region: eu-west-1")
+        fan_out_mock.return_value.results = []
+        daemon = Daemon()
+        daemon.get_cfn(Mock(region="eu-west-1", profile=None))
+
+        daemon.handle("/sync", {"config": config_file})
+
+        artifact_registry_mock.clear.assert_called_once_with()
+        cloudformation_mock.return_value.clear_staged_templates.assert_called_once_with()
+
+    def test_server_answers_json_requests(self):
+        server = Daemon().create_server(port=0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = "http://127.0.0.1:{0}".format(server.server_address[1])
+
+            status = json.loads(urlopen(url + "/status").read().decode("utf-8"))
+            self.assertTrue(status["succeeded"])
+            self.assertEqual(1, status["requests"])
+
+            template_file = self.write_file("template.json", '{"Resources": {"Topic": {"Type": "AWS::SNS::Topic"}}}')
+            rendered = json.loads(urlopen(Request(url + "/render", data=json.dumps(
+                {"template": template_file}).encode("utf-8"), headers=JSON_HEADERS)).read().decode("utf-8"))
+            self.assertEqual({"Topic": {"Type": "AWS::SNS::Topic"}}, rendered["template"]["Resources"])
+
+            with self.assertRaises(HTTPError) as context:
+                urlopen(Request(url + "/sync", data=b"not json", headers=JSON_HEADERS))
+            self.assertEqual(400, context.exception.code)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_server_rejects_other_content_types_and_hosts(self):
+        server = Daemon().create_server(port=0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = "http://127.0.0.1:{0}".format(server.server_address[1])
+
+            with self.assertRaises(HTTPError) as context:
+                urlopen(Request(url + "/render", data=b'{"template": "template.json"}',
+                                headers={"Content-Type": "text/plain"}))
+            self.assertEqual(415, context.exception.code)
+
+            with self.assertRaises(HTTPError) as context:
+                urlopen(Request(url + "/status", headers={"Host": "attacker.example.com"}))
+            self.assertEqual(403, context.exception.code)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    @patch("cfn_sphere.daemon.get_default_socket_path")
+    def test_server_listens_on_unix_socket_only_the_owner_may_access_by_default(self, get_default_socket_path_mock):
+        socket_path = os.path.join(self.directory, "daemon.sock")
+        get_default_socket_path_mock.return_value = socket_path
+        server = Daemon().create_server()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            self.assertEqual(0o600, stat.S_IMODE(os.stat(socket_path).st_mode))
+
+            connection = UnixHTTPConnection(socket_path)
+            connection.request("GET", "/status")
+            self.assertEqual(200, connection.getresponse().status)
+            connection.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_create_server_raises_exception_for_socket_and_port(self):
+        with self.assertRaises(CfnSphereException):
+            Daemon().create_server(socket_path=os.path.join(self.directory, "daemon.sock"), port=0)
+
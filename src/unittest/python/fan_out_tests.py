@@ -0,0 +1,88 @@
+try:
+    from unittest2 import TestCase
+    from mock import patch, Mock
+except ImportError:
+    from unittest import TestCase
+    from mock import patch, Mock
+
+import threading
+import time
+
+from cfn_sphere.exceptions import CfnStackActionFailedException
+from cfn_sphere.fan_out import FanOut, TargetResult
+from cfn_sphere.stack_configuration import Config
+
+
+class FanOutTests(TestCase):
+    def create_config(self, **kwargs):
+        config_dict = {'regions': ['eu-west-1', 'us-east-1', 'ap-southeast-2'],
+                       'stacks': {'any-stack': {'template-url': 'foo.json'}}}
+        config_dict.update(kwargs)
+        return Config(config_dict=config_dict)
+
+    @patch('cfn_sphere.fan_out.StackActionHandler')
+    def test_run_creates_a_handler_per_target(self, stack_action_handler_mock):
+        config = self.create_config(profiles=['dev', 'prod'])
+
+        results = FanOut(config).run("create_or_update_stacks")
+
+        self.assertEqual(6, stack_action_handler_mock.call_count)
+        self.assertEqual({('dev', 'eu-west-1'), ('dev', 'us-east-1'), ('dev', 'ap-southeast-2'),
+                          ('prod', 'eu-west-1'), ('prod', 'us-east-1'), ('prod', 'ap-southeast-2')},
+                         {(args[0].profile, args[0].region) for args, _ in stack_action_handler_mock.call_args_list})
+        self.assertEqual(6, stack_action_handler_mock.return_value.create_or_update_stacks.call_count)
+        self.assertTrue(all(result.succeeded for result in results))
+
+    @patch('cfn_sphere.fan_out.StackActionHandler')
+    def test_run_limits_concurrent_targets(self, stack_action_handler_mock):
+        lock = threading.Lock()
+        running = []
+        max_running = []
+
+        def action():
+            with lock:
+                running.append(1)
+                max_running.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+
+        stack_action_handler_mock.return_value.delete_stacks.side_effect = action
+
+        FanOut(self.create_config(**{'max-concurrent-targets': 2})).delete_stacks()
+
+        self.assertEqual(3, len(max_running))
+        self.assertEqual(2, max(max_running))
+
+    @patch('cfn_sphere.fan_out.StackActionHandler')
+    def test_run_continues_other_targets_and_raises_for_failed_targets(self, stack_action_handler_mock):
+        def create_handler(config, dry_run, cfn=None, sync_state=None):
+            handler = Mock()
+            if config.region == 'us-east-1':
+                handler.create_change_set.side_effect = CfnStackActionFailedException("boom")
+            return handler
+
+        stack_action_handler_mock.side_effect = create_handler
+        fan_out = FanOut(self.create_config())
+
+        with self.assertRaises(CfnStackActionFailedException) as context:
+            fan_out.create_change_set()
+
+        self.assertIn("1 of 3 targets: us-east-1", str(context.exception))
+        self.assertEqual([True, False, True], [result.succeeded for result in fan_out.results])
+        self.assertEqual("boom", fan_out.results[1].error)
+
+    def test_run_uses_given_handler_class(self):
+        handler_class = Mock()
+
+        FanOut(self.create_config(), handler_class=handler_class).sync_via_change_sets()
+
+        self.assertEqual(3, handler_class.return_value.sync_via_change_sets.call_count)
+
+    def test_get_report_table_lists_all_targets(self):
+        table = FanOut.get_report_table([TargetResult("eu-west-1", 1.0), TargetResult("prod/us-east-1", 2.0, "boom")])
+
+        self.assertIn("eu-west-1", table)
+        self.assertIn("prod/us-east-1", table)
+        self.assertIn("failed", table)
+        self.assertIn("boom", table)
@@ -1,3 +1,7 @@
+import os
+import shutil
+import tempfile
+
 import yaml
 import unittest2
 
@@ -305,6 +309,37 @@ class FileLoaderTests(TestCase):
         with self.assertRaises(CfnSphereException):
             FileLoader.handle_yaml_constructors(loader_mock, "!anyTag", node_mock)
 
+    def test_get_cached_yaml_or_json_file_parses_local_files_once_per_version(self):
+        FileLoader.clear_cache()
+        directory = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(directory, "template.yml")
+            with open(file_path, "w") as f:
+                f.write("Resources: {}")
+
+            with patch.object(FileLoader, "get_yaml_or_json_file", wraps=FileLoader.get_yaml_or_json_file) as parse:
+                first = FileLoader.get_cached_yaml_or_json_file("template.yml", directory)
+                first["Resources"]["Changed"] = True
+                second = FileLoader.get_cached_yaml_or_json_file("template.yml", directory)
+
+                self.assertEqual({"Resources": {}}, second)
+                self.assertEqual(1, parse.call_count)
+
+                with open(file_path, "w") as f:
+                    f.write("Resources: {Foo: bar}")
+                os.utime(file_path, ns=(0, os.stat(file_path).st_mtime_ns + 1000000))
+
+                self.assertEqual({"Resources": {"Foo": "bar"}},
+                                 FileLoader.get_cached_yaml_or_json_file("template.yml", directory))
+                self.assertEqual(2, parse.call_count)
+        finally:
+            shutil.rmtree(directory)
+            FileLoader.clear_cache()
+
+    def test_get_local_file_version_is_none_for_remote_and_missing_files(self):
+        self.assertIsNone(FileLoader.get_local_file_version("s3://my-bucket/template.yml", None))
+        self.assertIsNone(FileLoader.get_local_file_version("does-not-exist.yml", "/does/not/exist"))
+
 
 if __name__ == "__main__":
     unittest2.main()
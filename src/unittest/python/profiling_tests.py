@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+from cfn_sphere.profiling import hot_path, get_collapsed_stacks_from_stats, Profiler, StackSampler
+
+
+@hot_path("my-phase")
+def marked_function(value):
+    return value * 2
+
+
+def busy_function(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hot_path_adds_named_frame_and_keeps_function_behaviour(self):
+        self.assertEqual(4, marked_function(2))
+        self.assertEqual("marked_function", marked_function.__name__)
+        self.assertEqual("[my-phase]", marked_function.__code__.co_name)
+
+    def test_deterministic_profile_writes_pstats_and_collapsed_stacks(self):
+        path = os.path.join(self.directory, "profile")
+
+        with Profiler(path) as profiler:
+            marked_function(2)
+            busy_function(0.01)
+
+        self.assertTrue(os.path.isfile(profiler.pstats_file))
+        with open(profiler.collapsed_file) as f:
+            collapsed = f.read()
+        self.assertIn("busy_function", collapsed)
+
+    def test_collapsed_stacks_from_stats_contain_markers(self):
+        import cProfile
+        import pstats
+
+        profile = cProfile.Profile()
+        profile.enable()
+        for _ in range(1000):
+            marked_function(2)
+        profile.disable()
+
+        collapsed = get_collapsed_stacks_from_stats(pstats.Stats(profile))
+
+        self.assertTrue(any("[my-phase]" in stack for stack in collapsed))
+        self.assertTrue(all(weight > 0 for weight in collapsed.values()))
+
+    def test_stack_sampler_samples_other_threads(self):
+        sampler = StackSampler(interval=0.001)
+        thread = threading.Thread(target=busy_function, args=(0.2,), name="worker")
+
+        sampler.start()
+        thread.start()
+        thread.join()
+        sampler.stop()
+
+        self.assertTrue(any(stack.startswith("worker;") and "busy_function" in stack for stack in sampler.samples))
+
+    def test_sampling_profile_writes_collapsed_stacks(self):
+        path = os.path.join(self.directory, "profile")
+
+        with Profiler(path, mode="sampling", interval=0.001) as profiler:
+            busy_function(0.05)
+
+        self.assertFalse(os.path.exists(profiler.pstats_file))
+        with open(profiler.collapsed_file) as f:
+            self.assertIn("busy_function", f.read())
@@ -5,10 +5,15 @@ except ImportError:
     from unittest import TestCase
     from mock import patch, Mock, call
 
+import threading
+from concurrent.futures import Future
+
 import six
 
 from cfn_sphere import StackActionHandler
-from cfn_sphere.aws.cfn import CloudFormationStack
+from cfn_sphere.aws.cfn import CloudFormation, CloudFormationStack
+from cfn_sphere.exceptions import CfnStackActionFailedException
+from cfn_sphere.stack_configuration import StackConfig
 
 
 class StackActionHandlerTests(TestCase):
@@ -39,7 +44,7 @@ class StackActionHandlerTests(TestCase):
 
         stack_mock.side_effect = stack_side_effect
 
-        handler = StackActionHandler(Mock())
+        handler = StackActionHandler(Mock(api_rate_limits={}, max_api_calls=None))
         handler.delete_stacks()
 
         cfn_mock.return_value.delete_stack.assert_called_once_with(stack_a)
@@ -71,8 +76,244 @@ class StackActionHandlerTests(TestCase):
 
         stack_mock.side_effect = stack_side_effect
 
-        handler = StackActionHandler(Mock())
+        handler = StackActionHandler(Mock(api_rate_limits={}, max_api_calls=None))
         handler.delete_stacks()
 
         expected_calls = [call(stack_c), call(stack_a)]
         six.assertCountEqual(self, expected_calls, cfn_mock.return_value.delete_stack.mock_calls)
+
+    @patch('cfn_sphere.CloudFormation')
+    @patch('cfn_sphere.ParameterResolver')
+    @patch('cfn_sphere.DependencyResolver')
+    @patch('cfn_sphere.TemplateHandler')
+    def test_create_or_update_stacks_prepares_templates_while_upstream_stacks_deploy(self,
+                                                                                     template_handler_mock,
+                                                                                     dependency_resolver_mock,
+                                                                                     parameter_resolver_mock,
+                                                                                     cfn_mock):
+        dependency_resolver_mock.return_value.get_stack_order.return_value = ['a', 'b']
+        cfn_mock.return_value.get_stack_names.return_value = ['a']
+        config = Mock(api_rate_limits={}, max_api_calls=None)
+        config.stacks = {'a': Mock(stack_policy_url=None, template_url='a.yml'),
+                         'b': Mock(stack_policy_url=None, template_url='b.yml')}
+        template_b_loaded = threading.Event()
+
+        def get_template(template_url, *args):
+            if template_url == 'b.yml':
+                template_b_loaded.set()
+            return Mock()
+
+        template_handler_mock.get_template.side_effect = get_template
+        cfn_mock.return_value.update_stack.side_effect = lambda stack: self.assertTrue(template_b_loaded.wait(5))
+        parameter_resolver_mock.return_value.resolve_parameter_values.return_value = {}
+
+        handler = StackActionHandler(config)
+        handler.create_or_update_stacks()
+
+        cfn_mock.return_value.update_stack.assert_called_once()
+        cfn_mock.return_value.create_stack.assert_called_once()
+
+    @patch('cfn_sphere.CloudFormation')
+    @patch('cfn_sphere.ParameterResolver')
+    @patch('cfn_sphere.DependencyResolver')
+    @patch('cfn_sphere.TemplateHandler')
+    def test_create_or_update_stacks_raises_template_errors_of_a_stack_when_it_is_processed(self,
+                                                                                           template_handler_mock,
+                                                                                           dependency_resolver_mock,
+                                                                                           parameter_resolver_mock,
+                                                                                           cfn_mock):
+        dependency_resolver_mock.return_value.get_stack_order.return_value = ['a', 'b']
+        cfn_mock.return_value.get_stack_names.return_value = []
+        config = Mock(api_rate_limits={}, max_api_calls=None)
+        config.stacks = {'a': Mock(stack_policy_url=None, template_url='a.yml'),
+                         'b': Mock(stack_policy_url=None, template_url='b.yml')}
+
+        def get_template(template_url, *args):
+            if template_url == 'b.yml':
+                raise Exception("invalid template")
+            return Mock()
+
+        template_handler_mock.get_template.side_effect = get_template
+        parameter_resolver_mock.return_value.resolve_parameter_values.return_value = {}
+
+        handler = StackActionHandler(config)
+        with self.assertRaises(Exception):
+            handler.create_or_update_stacks()
+
+        cfn_mock.return_value.create_stack.assert_called_once()
+
+    @patch('cfn_sphere.get_stack_input_hash')
+    @patch('cfn_sphere.CloudFormation')
+    @patch('cfn_sphere.ParameterResolver')
+    @patch('cfn_sphere.TemplateHandler')
+    def test_create_or_update_stacks_with_sync_state_deploys_changed_stacks_and_dependents(self,
+                                                                                         template_handler_mock,
+                                                                                         parameter_resolver_mock,
+                                                                                         cfn_mock,
+                                                                                         get_stack_input_hash_mock):
+        cfn_mock.return_value.get_stack_names.return_value = ['vpc', 'app', 'other', 'new']
+        config = Mock(api_rate_limits={}, max_api_calls=None, target_name='eu-west-1', cli_params={})
+        config.stacks = {'vpc': StackConfig({'template-url': 'vpc.yml'}),
+                         'app': StackConfig({'template-url': 'app.yml', 'parameters': {'vpc': '|ref|vpc.id'}}),
+                         'other': StackConfig({'template-url': 'other.yml'})}
+        get_stack_input_hash_mock.side_effect = lambda stack_config, cli_parameters: \
+            "new-hash" if stack_config.template_url == 'vpc.yml' else "old-hash"
+        sync_state = Mock()
+        sync_state.get_input_hash.return_value = "old-hash"
+        parameter_resolver_mock.return_value.resolve_parameter_values.return_value = {}
+
+        StackActionHandler(config, sync_state=sync_state).create_or_update_stacks()
+
+        self.assertEqual(['vpc', 'app'], [args[0].name for args, _ in cfn_mock.return_value.update_stack.call_args_list])
+        self.assertEqual(['vpc.yml', 'app.yml'],
+                         [args[0] for args, _ in template_handler_mock.get_template.call_args_list])
+        sync_state.record.assert_has_calls([call('eu-west-1', 'vpc', 'new-hash'), call('eu-west-1', 'app', 'old-hash')])
+
+    @patch('cfn_sphere.CloudFormation')
+    @patch('cfn_sphere.ParameterResolver')
+    @patch('cfn_sphere.TemplateHandler')
+    def test_sync_via_change_sets_creates_change_sets_of_independent_stacks_while_upstream_stacks_execute(
+            self, template_handler_mock, parameter_resolver_mock, cfn_mock):
+        cfn = cfn_mock.return_value
+        cfn.get_stack_names.return_value = ['vpc', 'other']
+        cfn.is_empty_change_set.side_effect = CloudFormation.is_empty_change_set
+        config = Mock(api_rate_limits={}, max_api_calls=None, target_name='eu-west-1', cli_params={})
+        config.stacks = {'vpc': StackConfig({'template-url': 'vpc.yml'}),
+                         'app': StackConfig({'template-url': 'app.yml', 'parameters': {'vpc': '|ref|vpc.id'}}),
+                         'other': StackConfig({'template-url': 'other.yml'})}
+        parameter_resolver_mock.return_value.resolve_parameter_values.return_value = {}
+        other_change_set_created = threading.Event()
+        events = []
+
+        def create_change_set(stack, change_set_type):
+            events.append("create " + stack.name)
+            if stack.name == 'other':
+                other_change_set_created.set()
+                return {'Status': 'FAILED', 'StatusReason': "The submitted information didn't contain changes."}
+            return {'Status': 'CREATE_COMPLETE', 'ChangeSetId': 'arn-' + stack.name}
+
+        def execute_change_set(stack, change_set_id, action, timeout):
+            if stack.name == 'vpc':
+                self.assertTrue(other_change_set_created.wait(5))
+            events.append("execute {0} {1} {2}".format(change_set_id, action, timeout))
+
+        cfn.create_change_set.side_effect = create_change_set
+        cfn.execute_change_set.side_effect = execute_change_set
+        sync_state = Mock()
+        sync_state.get_input_hash.return_value = None
+
+        with patch('cfn_sphere.get_stack_input_hash', return_value="hash"):
+            StackActionHandler(config, sync_state=sync_state).sync_via_change_sets()
+
+        self.assertLess(events.index("execute arn-vpc update 600"), events.index("create app"))
+        self.assertIn("execute arn-app create 600", events)
+        self.assertEqual(2, cfn.execute_change_set.call_count)
+        self.assertEqual({'vpc', 'app', 'other'}, set(args[1] for args, _ in sync_state.record.call_args_list))
+
+    @patch('cfn_sphere.CloudFormation')
+    @patch('cfn_sphere.ParameterResolver')
+    @patch('cfn_sphere.TemplateHandler')
+    def test_sync_via_change_sets_stops_creating_change_sets_after_failures(self, template_handler_mock,
+                                                                           parameter_resolver_mock, cfn_mock):
+        cfn = cfn_mock.return_value
+        cfn.get_stack_names.return_value = []
+        cfn.is_empty_change_set.side_effect = CloudFormation.is_empty_change_set
+        cfn.create_change_set.return_value = {'Status': 'FAILED', 'StatusReason': 'Template error'}
+        config = Mock(api_rate_limits={}, max_api_calls=None, cli_params={})
+        config.stacks = {'vpc': StackConfig({'template-url': 'vpc.yml'}),
+                         'app': StackConfig({'template-url': 'app.yml', 'parameters': {'vpc': '|ref|vpc.id'}})}
+        parameter_resolver_mock.return_value.resolve_parameter_values.return_value = {}
+
+        with self.assertRaisesRegex(CfnStackActionFailedException, "failed for 1 of 2 stacks: vpc"):
+            StackActionHandler(config).sync_via_change_sets()
+
+        cfn.create_change_set.assert_called_once()
+        cfn.execute_change_set.assert_not_called()
+
+    @patch('cfn_sphere.StackEventWatcher')
+    @patch('cfn_sphere.CloudFormation')
+    @patch('cfn_sphere.ParameterResolver')
+    def test_execute_change_sets_in_dependency_order_with_stack_timeouts(self, parameter_resolver_mock, cfn_mock,
+                                                                         watcher_mock):
+        cfn = cfn_mock.return_value
+        cfn.get_change_set.side_effect = lambda arn: {'StackId': arn.replace('change-set', 'stack')}
+        cfn.change_set_is_executable.return_value = True
+        cfn.get_stack_descriptions.return_value = [
+            {'StackId': 'stack-vpc', 'StackName': 'vpc', 'StackStatus': 'UPDATE_COMPLETE'},
+            {'StackId': 'stack-app', 'StackName': 'app', 'StackStatus': 'REVIEW_IN_PROGRESS'},
+            {'StackId': 'stack-unmanaged', 'StackName': 'unmanaged', 'StackStatus': 'CREATE_COMPLETE'}]
+        config = Mock(api_rate_limits={}, max_api_calls=None, cli_params={})
+        config.stacks = {'app': StackConfig({'template-url': 'app.yml', 'parameters': {'vpc': '|ref|vpc.id'}}),
+                         'vpc': StackConfig({'template-url': 'vpc.yml', 'timeout': 1200})}
+        futures = {}
+        started = []
+
+        def watch(stack_name, action, timeout):
+            futures[stack_name] = Future()
+            started.append((stack_name, action, timeout))
+            if stack_name == 'vpc':
+                # the app change set waits for vpc, the unmanaged one doesn't
+                self.assertNotIn('app', futures)
+            futures[stack_name].set_result({})
+            return futures[stack_name]
+
+        watcher_mock.return_value.watch.side_effect = watch
+
+        StackActionHandler(config).execute_change_sets(['change-set-app', 'change-set-unmanaged', 'change-set-vpc'],
+                                                       300)
+
+        self.assertEqual([('unmanaged', 'update', 300), ('vpc', 'update', 1200), ('app', 'create', 600)],
+                         started)
+        self.assertEqual(['change-set-unmanaged', 'change-set-vpc', 'change-set-app'],
+                         [args[0] for args, _ in cfn.start_change_set_execution.call_args_list])
+        watcher_mock.return_value.stop.assert_called_once_with()
+
+    @patch('cfn_sphere.StackEventWatcher')
+    @patch('cfn_sphere.CloudFormation')
+    @patch('cfn_sphere.ParameterResolver')
+    def test_execute_change_sets_validates_all_change_sets_before_executing(self, parameter_resolver_mock, cfn_mock,
+                                                                            watcher_mock):
+        cfn = cfn_mock.return_value
+        cfn.get_change_set.side_effect = lambda arn: {'StackId': arn} if arn == 'valid' else None
+        cfn.change_set_is_executable.side_effect = lambda change_set: change_set is not None
+        config = Mock(api_rate_limits={}, max_api_calls=None, stacks={})
+
+        with self.assertRaisesRegex(CfnStackActionFailedException, "invalid state: missing-1, missing-2"):
+            StackActionHandler(config).execute_change_sets(['valid', 'missing-1', 'missing-2'])
+
+        cfn.start_change_set_execution.assert_not_called()
+
+    @patch('cfn_sphere.StackEventWatcher')
+    @patch('cfn_sphere.CloudFormation')
+    @patch('cfn_sphere.ParameterResolver')
+    def test_execute_change_sets_reports_failed_executions(self, parameter_resolver_mock, cfn_mock, watcher_mock):
+        cfn = cfn_mock.return_value
+        cfn.get_change_set.side_effect = lambda arn: {'StackId': arn, 'StackName': arn}
+        cfn.change_set_is_executable.return_value = True
+        cfn.get_stack_descriptions.return_value = []
+        failed = Future()
+        failed.set_exception(CfnStackActionFailedException("Stack is in UPDATE_FAILED state"))
+        succeeded = Future()
+        succeeded.set_result({})
+        watcher_mock.return_value.watch.side_effect = lambda stack_name, action, timeout: \
+            failed if stack_name == 'a' else succeeded
+        config = Mock(api_rate_limits={}, max_api_calls=None, stacks={})
+
+        with self.assertRaisesRegex(CfnStackActionFailedException, "failed for 1 of 2 stacks: a"):
+            StackActionHandler(config).execute_change_sets(['a', 'b'])
+
+        cfn.log_completed_stack_action.assert_called_once_with('b', 'update')
+
+    @patch('cfn_sphere.API_STATISTICS')
+    @patch('cfn_sphere.CloudFormation')
+    @patch('cfn_sphere.ParameterResolver')
+    def test_api_call_budget_is_configured_and_statistics_are_exposed(self,
+                                                                      parameter_resolver_mock,
+                                                                      cfn_mock,
+                                                                      api_statistics_mock):
+        api_statistics_mock.to_dict.return_value = {"calls": 3}
+
+        handler = StackActionHandler(Mock(api_rate_limits={}, max_api_calls=100))
+
+        api_statistics_mock.configure.assert_called_once_with(max_calls=100)
+        self.assertEqual({"calls": 3}, handler.get_api_statistics())
@@ -0,0 +1,133 @@
+import os
+import shutil
+import stat
+import tempfile
+
+try:
+    from unittest2 import TestCase
+    from mock import patch
+except ImportError:
+    from unittest import TestCase
+    from mock import patch
+
+from cfn_sphere.stack_configuration import Config
+from cfn_sphere.stack_configuration.config_cache import CONFIG_CACHE, ConfigCache
+from cfn_sphere.stack_configuration.stack_selector import StackSelector
+
+
+class ConfigCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_directory = os.path.join(self.directory, "cache")
+        self.config_file = self.write_file("config.yml", "region: eu-west-1\nstacks:\n"
+                                                         "  app:\n    template-url: app.json\n"
+                                                         "    parameters:\n      env: '[environment]'\n")
+        self.context_file = self.write_file("context.yml", "environment: dev\ninclude:\n  - shared.yml\n")
+        self.write_file("shared.yml", "owner: team\n")
+        CONFIG_CACHE.configure(self.cache_directory)
+
+    def tearDown(self):
+        CONFIG_CACHE.configure(None)
+        shutil.rmtree(self.directory)
+
+    def write_file(self, file_name, content):
+        file_path = os.path.join(self.directory, file_name)
+        with open(file_path, "w") as f:
+            f.write(content)
+        return file_path
+
+    def get_key(self, cli_params=None, stack_selector=None):
+        return CONFIG_CACHE.get_key(self.config_file, self.context_file, [os.path.join(self.directory, "shared.yml")],
+                                    cli_params, stack_selector)
+
+    def test_cached_config_is_loaded_without_parsing_the_config(self):
+        config = Config(self.config_file, cli_params=("app.foo=bar",), transform_context=self.context_file)
+
+        with patch("cfn_sphere.stack_configuration.Config._read_config_file") as read_config_file_mock:
+            cached_config = Config(self.config_file, cli_params=("app.foo=bar",),
+                                   transform_context=self.context_file)
+
+        read_config_file_mock.assert_not_called()
+        self.assertEqual("dev", cached_config.stacks["app"].parameters["env"])
+        self.assertEqual({"foo": "bar"}, cached_config.cli_params["app"])
+        self.assertEqual(config.working_dir, cached_config.working_dir)
+        self.assertIsNotNone(cached_config.logger)
+
+    def test_config_is_parsed_again_after_changes(self):
+        Config(self.config_file, transform_context=self.context_file)
+        self.write_file("context.yml", "environment: prod\ninclude:\n  - shared.yml\n")
+
+        config = Config(self.config_file, transform_context=self.context_file)
+
+        self.assertEqual("prod", config.stacks["app"].parameters["env"])
+
+    def test_key_changes_with_any_input_file(self):
+        key = self.get_key()
+
+        for file_name in ["config.yml", "context.yml", "shared.yml"]:
+            with open(os.path.join(self.directory, file_name), "a") as f:
+                f.write("# changed\n")
+            changed_key = self.get_key()
+            self.assertNotEqual(key, changed_key)
+            key = changed_key
+
+    def test_key_changes_with_cli_params_and_selection(self):
+        key = self.get_key()
+
+        self.assertNotEqual(key, self.get_key(cli_params=("app.foo=bar",)))
+        self.assertNotEqual(key, self.get_key(stack_selector=StackSelector(stack_names=["app"])))
+        self.assertEqual(self.get_key(cli_params=("a.b=c", "d.e=f")), self.get_key(cli_params=("d.e=f", "a.b=c")))
+
+    def test_key_is_none_for_missing_input_files(self):
+        os.remove(os.path.join(self.directory, "shared.yml"))
+
+        self.assertIsNone(self.get_key())
+
+    def test_cache_is_disabled_without_directory(self):
+        cache = ConfigCache()
+
+        self.assertIsNone(cache.get_key(self.config_file))
+        cache.store(None, {"region": "eu-west-1"})
+        self.assertIsNone(cache.load(None))
+
+    def test_unreadable_cache_files_are_ignored(self):
+        key = self.get_key()
+        os.makedirs(self.cache_directory)
+        with open(CONFIG_CACHE.get_path(key), "wb") as f:
+            f.write(b"not a pickle")
+
+        self.assertIsNone(CONFIG_CACHE.load(key))
+
+    def test_store_and_load(self):
+        CONFIG_CACHE.store("key", {"region": "eu-west-1"})
+
+        self.assertEqual({"region": "eu-west-1"}, CONFIG_CACHE.load("key"))
+        self.assertEqual(["key.pickle"], os.listdir(self.cache_directory))
+
+        CONFIG_CACHE.clear()
+        self.assertIsNone(CONFIG_CACHE.load("key"))
+
+    def test_store_creates_cache_directory_only_the_owner_may_access(self):
+        CONFIG_CACHE.store("key", {"region": "eu-west-1"})
+
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(self.cache_directory).st_mode))
+
+    def test_cache_files_writable_by_others_are_ignored(self):
+        CONFIG_CACHE.store("key", {"region": "eu-west-1"})
+        os.chmod(CONFIG_CACHE.get_path("key"), 0o666)
+
+        self.assertIsNone(CONFIG_CACHE.load("key"))
+
+    @patch("cfn_sphere.stack_configuration.config_cache.os.getuid", return_value=12345)
+    def test_cache_files_of_other_users_are_ignored(self, _):
+        CONFIG_CACHE.store("key", {"region": "eu-west-1"})
+
+        self.assertIsNone(CONFIG_CACHE.load("key"))
+
+    def test_invalid_configs_are_not_cached(self):
+        self.write_file("config.yml", "region: eu-west-1\nstacks:\n  app:\n    unknown-key: foo\n")
+
+        with self.assertRaises(Exception):
+            Config(self.config_file)
+
+        self.assertFalse(os.path.isdir(self.cache_directory) and os.listdir(self.cache_directory))
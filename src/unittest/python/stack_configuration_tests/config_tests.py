@@ -169,6 +169,86 @@ class ConfigTests(TestCase):
         )
         self.assertTrue(isinstance(config.stacks["any-stack"].timeout, int))
 
+    def test_default_template_bucket_is_overwritten_by_stack_config(self):
+        config = Config(
+            config_dict={
+                'region': 'eu-west-1',
+                'template-bucket': 'default-bucket',
+                'stacks': {
+                    'any-stack': {
+                        'template-url': 'foo.json'
+                    },
+                    'other-stack': {
+                        'template-url': 'foo.json',
+                        'template-bucket': 'other-bucket'
+                    }
+                }
+            }
+        )
+        self.assertEqual('default-bucket', config.stacks["any-stack"].template_bucket)
+        self.assertEqual('other-bucket', config.stacks["other-stack"].template_bucket)
+
+    def test_validate_raises_exception_on_invalid_template_bucket_value(self):
+        with self.assertRaises(InvalidConfigException):
+            StackConfig({'template-url': 'foo.json', 'template-bucket': ['my-bucket']})
+
+    def test_api_rate_limits_are_parsed(self):
+        config = Config(config_dict={'region': 'eu-west-1',
+                                     'api-rate-limits': {'cloudformation.read': 4},
+                                     'stacks': {'any-stack': {'template-url': 'foo.json'}}})
+        self.assertEqual({'cloudformation.read': 4}, config.api_rate_limits)
+
+    def test_validate_raises_exception_on_invalid_api_rate_limits_value(self):
+        with self.assertRaises(InvalidConfigException):
+            Config(config_dict={'region': 'eu-west-1',
+                                'api-rate-limits': 5,
+                                'stacks': {'any-stack': {'template-url': 'foo.json'}}})
+
+    def test_max_api_calls_is_parsed(self):
+        config = Config(config_dict={'region': 'eu-west-1',
+                                     'max-api-calls': 500,
+                                     'stacks': {'any-stack': {'template-url': 'foo.json'}}})
+        self.assertEqual(500, config.max_api_calls)
+
+    def test_validate_raises_exception_on_invalid_max_api_calls_value(self):
+        with self.assertRaises(InvalidConfigException):
+            Config(config_dict={'region': 'eu-west-1',
+                                'max-api-calls': 0,
+                                'stacks': {'any-stack': {'template-url': 'foo.json'}}})
+
+    def test_get_targets_returns_config_per_profile_and_region(self):
+        config = Config(config_dict={'regions': ['eu-west-1', 'us-east-1'],
+                                     'profiles': ['dev', 'prod'],
+                                     'stacks': {'any-stack': {'template-url': 'foo.json'}}})
+
+        targets = config.get_targets()
+
+        self.assertEqual('eu-west-1', config.region)
+        self.assertEqual(['dev/eu-west-1', 'dev/us-east-1', 'prod/eu-west-1', 'prod/us-east-1'],
+                         [target.target_name for target in targets])
+        self.assertEqual([['any-stack']] * 4, [list(target.stacks.keys()) for target in targets])
+        self.assertEqual(['prod/us-east-1'], [target.target_name for target in targets[3].get_targets()])
+
+    def test_get_targets_returns_single_target_without_regions_and_profiles(self):
+        config = Config(config_dict={'region': 'eu-west-1',
+                                     'stacks': {'any-stack': {'template-url': 'foo.json'}}})
+
+        targets = config.get_targets()
+
+        self.assertEqual(['eu-west-1'], [target.target_name for target in targets])
+        self.assertIsNone(targets[0].profile)
+
+    def test_validate_raises_exception_on_invalid_regions_value(self):
+        with self.assertRaises(InvalidConfigException):
+            Config(config_dict={'regions': 'eu-west-1',
+                                'stacks': {'any-stack': {'template-url': 'foo.json'}}})
+
+    def test_validate_raises_exception_on_invalid_max_concurrent_targets_value(self):
+        with self.assertRaises(InvalidConfigException):
+            Config(config_dict={'region': 'eu-west-1',
+                                'max-concurrent-targets': 0,
+                                'stacks': {'any-stack': {'template-url': 'foo.json'}}})
+
     def test_validate_raises_exception_on_invalid_service_role_value(self):
         with self.assertRaises(InvalidConfigException):
             Config(config_dict={'region': 'eu-west-q',
@@ -80,6 +80,16 @@ class DependencyResolverTests(TestCase):
 
         self.assertEqual(result, len(DependencyResolver.get_stack_order(stacks)))
 
+    def test_get_dependent_stacks_returns_stacks_with_transitive_dependents(self):
+        stacks = {'vpc': StackConfig({'template-url': 'horst.yml'}),
+                  'sg': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': '|Ref|vpc.id'}}),
+                  'app': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': ['|Ref|sg.id']}}),
+                  'other': StackConfig({'template-url': 'horst.yml'})}
+
+        self.assertEqual({'vpc', 'sg', 'app'}, DependencyResolver.get_dependent_stacks(stacks, ['vpc']))
+        self.assertEqual({'app'}, DependencyResolver.get_dependent_stacks(stacks, ['app']))
+        self.assertEqual(set(), DependencyResolver.get_dependent_stacks(stacks, []))
+
     def test_get_stack_order_accepts_stacks_without_parameters_key(self):
         stacks = {'default-sg': {},
                   'app1': None,
@@ -101,6 +111,38 @@ class DependencyResolverTests(TestCase):
         with self.assertRaises(CyclicDependencyException):
             DependencyResolver.get_stack_order(stacks)
 
+    def test_get_stack_order_raises_exception_listing_all_cycles(self):
+        stacks = {
+            'app1': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': '|Ref|app2.id'}}),
+            'app2': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': '|Ref|app1.id'}}),
+            'app3': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': '|Ref|app4.id'}}),
+            'app4': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': ['|Ref|app3.id']}})
+        }
+
+        with self.assertRaisesRegex(CyclicDependencyException, "Found 2 cyclic dependencies"):
+            DependencyResolver.get_stack_order(stacks)
+
+    def test_get_stack_order_ignores_stacks_outside_the_config(self):
+        stacks = {'app': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': '|Ref|vpc.id'}}),
+                  'sg': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': '|Ref|vpc.id'}})}
+
+        self.assertEqual(['app', 'sg'], DependencyResolver.get_stack_order(stacks))
+
+    def test_get_stack_levels(self):
+        stacks = {'app': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': '|Ref|sg.id'}}),
+                  'sg': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': '|Ref|vpc.id'}}),
+                  'tools': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': '|Ref|external.id'}})}
+
+        self.assertEqual([['sg', 'tools'], ['app']], DependencyResolver.get_stack_levels(stacks))
+
+    def test_get_critical_path(self):
+        stacks = {'app': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': '|Ref|sg.id'}}),
+                  'sg': StackConfig({'template-url': 'horst.yml', 'parameters': {'a': '|Ref|vpc.id'}}),
+                  'tools': StackConfig({'template-url': 'horst.yml'})}
+
+        self.assertEqual((['tools'], 100), DependencyResolver.get_critical_path(stacks, {'tools': 100}))
+        self.assertEqual((['sg', 'app'], 2), DependencyResolver.get_critical_path(stacks))
+
     def test_filter_unmanaged_stacks(self):
         stacks = ['a', 'b', 'c']
         managed_stacks = ['a', 'c']
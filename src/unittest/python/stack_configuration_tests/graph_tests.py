@@ -0,0 +1,88 @@
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+from cfn_sphere.exceptions import CyclicDependencyException
+from cfn_sphere.stack_configuration.graph import StackGraph
+
+
+def create_graph(nodes, edges):
+    graph = StackGraph(nodes)
+    for source, target in edges:
+        graph.add_edge(source, target)
+    return graph
+
+
+class StackGraphTests(TestCase):
+    def test_topological_sort_keeps_insertion_order_of_independent_nodes(self):
+        graph = create_graph(["app", "db", "vpc", "tools"], [("vpc", "db"), ("db", "app"), ("vpc", "app")])
+
+        self.assertEqual(["vpc", "tools", "db", "app"], graph.topological_sort())
+
+    def test_topological_sort_raises_exception_listing_all_cycles(self):
+        graph = create_graph(["a", "b", "c", "d", "e", "f"],
+                             [("a", "b"), ("b", "a"), ("c", "d"), ("d", "e"), ("e", "c"), ("f", "f")])
+
+        with self.assertRaises(CyclicDependencyException) as context:
+            graph.topological_sort()
+
+        message = str(context.exception)
+        self.assertIn("Found 3 cyclic dependencies", message)
+        self.assertIn("[a is referenced by b] => [b is referenced by a]", message)
+        self.assertIn("[c is referenced by d] => [d is referenced by e] => [e is referenced by c]", message)
+        self.assertIn("[f is referenced by f]", message)
+
+    def test_get_cycles(self):
+        graph = create_graph(["a", "b", "c", "d"], [("a", "b"), ("b", "c"), ("c", "b"), ("c", "d")])
+
+        self.assertEqual([["b", "c", "b"]], graph.get_cycles())
+        self.assertEqual([], create_graph(["a", "b"], [("a", "b")]).get_cycles())
+
+    def test_get_strongly_connected_components_handles_deep_graphs(self):
+        nodes = ["stack-{0}".format(index) for index in range(5000)]
+        graph = create_graph(nodes, zip(nodes, nodes[1:] + nodes[:1]))
+
+        self.assertEqual([sorted(nodes)], [sorted(component) for component in
+                                           graph.get_strongly_connected_components()])
+
+    def test_get_dangling_references(self):
+        graph = create_graph(["app", "db"], [("vpc", "app"), ("vpc", "db"), ("db", "app")])
+
+        self.assertEqual({"vpc": ["app", "db"]}, graph.get_dangling_references())
+        self.assertEqual({}, create_graph(["vpc", "app"], [("vpc", "app")]).get_dangling_references())
+
+    def test_add_node_resolves_dangling_reference(self):
+        graph = create_graph(["app"], [("vpc", "app")])
+        graph.add_node("vpc")
+
+        self.assertEqual({}, graph.get_dangling_references())
+
+    def test_remove_node(self):
+        graph = create_graph(["vpc", "db", "app"], [("vpc", "db"), ("db", "app")])
+        graph.remove_node("db")
+
+        self.assertEqual(["vpc", "app"], graph.nodes)
+        self.assertEqual([], graph.successors("vpc"))
+        self.assertEqual([], graph.predecessors("app"))
+
+    def test_descendants(self):
+        graph = create_graph(["vpc", "db", "app", "tools"], [("vpc", "db"), ("db", "app")])
+
+        self.assertEqual({"db", "app"}, graph.descendants("vpc"))
+        self.assertEqual(set(), graph.descendants("tools"))
+
+    def test_get_levels(self):
+        graph = create_graph(["vpc", "sg", "db", "app", "tools"],
+                             [("vpc", "sg"), ("vpc", "db"), ("sg", "db"), ("db", "app"), ("sg", "app")])
+
+        self.assertEqual([["vpc", "tools"], ["sg"], ["db"], ["app"]], graph.get_levels())
+
+    def test_get_critical_path(self):
+        graph = create_graph(["vpc", "sg", "db", "app"], [("vpc", "sg"), ("vpc", "db"), ("sg", "app"), ("db", "app")])
+
+        self.assertEqual((["vpc", "sg", "app"], 3), graph.get_critical_path())
+        self.assertEqual((["vpc", "db", "app"], 17), graph.get_critical_path({"db": 15}))
+
+    def test_get_critical_path_of_empty_graph(self):
+        self.assertEqual(([], 0), StackGraph().get_critical_path())
@@ -226,7 +226,7 @@ class ParameterResolverTests(TestCase):
         get_yaml_or_json_file_mock.assert_called_once_with("s3://myBucket/myAwsAccounts.json", None)
         self.assertEqual([1, 2, 3], result)
 
-    @patch("cfn_sphere.stack_configuration.parameter_resolver.jmespath.search")
+    @patch("jmespath.search")
     @patch("cfn_sphere.stack_configuration.parameter_resolver.FileLoader.get_yaml_or_json_file")
     def test_handle_file_value_loads_file_for_reference_with_pattern_containing_pipe(self, f, jmespath_search_mock):
         f.return_value = {"a": "b"}
@@ -0,0 +1,52 @@
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+from cfn_sphere.exceptions import CfnSphereException, InvalidConfigException
+from cfn_sphere.stack_configuration import Config
+from cfn_sphere.stack_configuration.stack_selector import StackSelector
+
+
+class StackSelectorTests(TestCase):
+    def setUp(self):
+        self.stacks = {'vpc': {'template-url': 'vpc.yml', 'tags': {'team': 'network'}},
+                       'sg': {'template-url': 'sg.yml', 'parameters': {'vpc': '|ref|vpc.id'}},
+                       'app': {'template-url': 'app.yml', 'parameters': {'sg': ['|Ref|sg.id']},
+                               'tags': {'team': 'payments'}},
+                       'other': {'template-url': 'other.yml'}}
+
+    def test_get_selected_stacks_selects_stacks_by_name(self):
+        self.assertEqual(['sg'], StackSelector(stack_names=['sg']).get_selected_stacks(self.stacks))
+
+    def test_get_selected_stacks_selects_stacks_by_tags_including_default_tags(self):
+        self.assertEqual(['app'], StackSelector(tags=['team=payments']).get_selected_stacks(self.stacks))
+        self.assertEqual(['sg', 'app', 'other'], StackSelector(tags=['env=dev']).get_selected_stacks(
+            dict(self.stacks, vpc={'template-url': 'vpc.yml', 'tags': {'env': 'prod'}}), {'env': 'dev'}))
+
+    def test_get_selected_stacks_includes_dependents_only_when_requested(self):
+        self.assertEqual(['vpc'], StackSelector(stack_names=['vpc']).get_selected_stacks(self.stacks))
+        self.assertEqual(['vpc', 'sg', 'app'],
+                         StackSelector(stack_names=['vpc'], include_dependents=True).get_selected_stacks(self.stacks))
+
+    def test_get_selected_stacks_raises_exception_for_unknown_stacks(self):
+        with self.assertRaises(InvalidConfigException):
+            StackSelector(stack_names=['unknown']).get_selected_stacks(self.stacks)
+
+    def test_get_selected_stacks_raises_exception_if_nothing_matches(self):
+        with self.assertRaises(InvalidConfigException):
+            StackSelector(tags=['team=unknown']).get_selected_stacks(self.stacks)
+
+    def test_parse_tags_raises_exception_for_invalid_format(self):
+        with self.assertRaises(CfnSphereException):
+            StackSelector(tags=['team'])
+
+    def test_config_does_not_parse_stacks_outside_the_selection(self):
+        config = Config(config_dict={'region': 'eu-west-1',
+                                     'stacks': {'app': {'template-url': 'app.yml'},
+                                                'broken': {'unknown-key': 'would fail validation'}}},
+                        cli_params=('app.a=1', 'broken.b=2'),
+                        stack_selector=StackSelector(stack_names=['app']))
+
+        self.assertEqual(['app'], list(config.stacks.keys()))
+        self.assertEqual({'app': {'a': '1'}}, dict(config.cli_params))
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+from cfn_sphere.exceptions import InvalidConfigException
+from cfn_sphere.stack_configuration.dependency_resolver import DependencyResolver
+from cfn_sphere.stack_configuration.stack_selector import StackSelector
+from cfn_sphere.stack_configuration.workspace import Workspace
+
+
+class WorkspaceTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_file(self, file_name, content):
+        with open(os.path.join(self.directory, file_name), "w") as f:
+            f.write(content)
+
+    def test_find_config_files_ignores_files_without_stacks(self):
+        self.write_file("b-app.yml", "region: eu-west-1\nstacks:\n  app:\n    template-url: app.json\n")
+        self.write_file("a-network.yml", "region: eu-west-1\nstacks:\n  vpc:\n    template-url: vpc.json\n")
+        self.write_file("context.yml", "environment: dev\n")
+        self.write_file("notes.txt", "stacks: none\n")
+
+        self.assertEqual([os.path.join(self.directory, "a-network.yml"), os.path.join(self.directory, "b-app.yml")],
+                         Workspace.find_config_files(self.directory))
+
+    def test_workspace_orders_stacks_of_all_configs_in_one_graph(self):
+        self.write_file("app.yml", "region: eu-west-1\nstacks:\n  app:\n    template-url: app.json\n"
+                                   "    parameters:\n      vpcId: '|ref|vpc.id'\n")
+        self.write_file("network.yml", "region: eu-west-1\nstacks:\n  vpc:\n    template-url: vpc.json\n")
+
+        workspace = Workspace(self.directory, cli_params=("app.foo=bar",))
+
+        self.assertEqual(["vpc", "app"], DependencyResolver.get_stack_order(workspace.config.stacks))
+        self.assertEqual(os.path.join(self.directory, "network.yml"), workspace.config_file_by_stack["vpc"])
+        self.assertEqual({"foo": "bar"}, workspace.config.cli_params["app"])
+        self.assertEqual("eu-west-1", workspace.config.region)
+
+    def test_workspace_selects_dependents_in_other_configs(self):
+        self.write_file("app.yml", "region: eu-west-1\nstacks:\n  app:\n    template-url: app.json\n"
+                                   "    parameters:\n      vpcId: '|ref|vpc.id'\n")
+        self.write_file("network.yml", "region: eu-west-1\nstacks:\n  vpc:\n    template-url: vpc.json\n"
+                                       "  subnets:\n    template-url: subnets.json\n")
+        self.write_file("tools.yml", "region: eu-west-1\nstacks:\n  tools:\n    template-url: tools.json\n")
+
+        workspace = Workspace(self.directory,
+                              stack_selector=StackSelector(stack_names=["vpc"], include_dependents=True))
+
+        self.assertEqual(["app", "vpc"], sorted(workspace.config.stacks.keys()))
+        self.assertEqual([os.path.join(self.directory, "app.yml"), os.path.join(self.directory, "network.yml")],
+                         workspace.config_files)
+
+    def test_workspace_raises_exception_for_stacks_defined_twice(self):
+        self.write_file("a.yml", "region: eu-west-1\nstacks:\n  app:\n    template-url: app.json\n")
+        self.write_file("b.yml", "region: eu-west-1\nstacks:\n  app:\n    template-url: other.json\n")
+
+        with self.assertRaises(InvalidConfigException):
+            Workspace(self.directory)
+
+    def test_workspace_raises_exception_for_configs_with_different_regions(self):
+        self.write_file("a.yml", "region: eu-west-1\nstacks:\n  app:\n    template-url: app.json\n")
+        self.write_file("b.yml", "region: us-east-1\nstacks:\n  vpc:\n    template-url: vpc.json\n")
+
+        with self.assertRaises(InvalidConfigException):
+            Workspace(self.directory)
+
+    def test_workspace_raises_exception_for_unknown_cli_parameter_stack(self):
+        self.write_file("a.yml", "region: eu-west-1\nstacks:\n  app:\n    template-url: app.json\n")
+
+        with self.assertRaises(InvalidConfigException):
+            Workspace(self.directory, cli_params=("unknown.foo=bar",))
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+# modules which must only be imported by the commands actually using them
+HEAVY_MODULES = ["boto3", "botocore.session", "networkx", "git", "bs4", "prettytable", "jmespath", "dateutil"]
+
+# cumulative import time budget for cfn_sphere.cli in microseconds
+STARTUP_IMPORT_TIME_BUDGET = 400000
+
+
+def run_python(code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+class StartupTests(TestCase):
+    def test_importing_cli_does_not_import_heavy_modules(self):
+        result = run_python("import sys, cfn_sphere.cli; print(','.join(sorted(sys.modules)))")
+        loaded_modules = result.stdout.strip().split(",")
+
+        self.assertEqual([], [module for module in HEAVY_MODULES if module in loaded_modules])
+
+    def test_importing_cli_stays_within_import_time_budget(self):
+        result = run_python("import cfn_sphere.cli")
+
+        cli_import_line = [line for line in result.stderr.splitlines() if line.strip().endswith("| cfn_sphere.cli")][0]
+        cumulative_import_time = int(cli_import_line.split("|")[1])
+
+        self.assertLess(cumulative_import_time, STARTUP_IMPORT_TIME_BUDGET,
+                        "Importing cfn_sphere.cli took {0}us".format(cumulative_import_time))
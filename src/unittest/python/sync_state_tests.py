@@ -0,0 +1,89 @@
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+import json
+import os
+import shutil
+import tempfile
+
+from cfn_sphere.stack_configuration import StackConfig
+from cfn_sphere.sync_state import SyncState, get_file_references, get_stack_input_hash
+
+
+class SyncStateTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_file(self, file_name, content):
+        with open(os.path.join(self.directory, file_name), "w") as f:
+            f.write(content)
+
+    def create_stack_config(self, parameters=None):
+        return StackConfig({"template-url": "template.json", "parameters": parameters or {}},
+                           working_dir=self.directory)
+
+    def test_get_file_references_returns_file_parameter_urls(self):
+        self.assertEqual(["a.txt", "b.json"],
+                         get_file_references({"a": "|file|a.txt", "b": ["|File|b.json|key"], "c": "|ref|x.y"}))
+
+    def test_get_stack_input_hash_changes_with_template_parameters_and_referenced_files(self):
+        self.write_file("template.json", '{"Resources": {}}')
+        self.write_file("user-data.txt", "echo 1")
+        stack_config = self.create_stack_config({"a": "1", "b": "|file|user-data.txt"})
+        original_hash = get_stack_input_hash(stack_config)
+
+        self.assertEqual(original_hash, get_stack_input_hash(self.create_stack_config({"a": "1",
+                                                                                       "b": "|file|user-data.txt"})))
+        self.assertNotEqual(original_hash, get_stack_input_hash(stack_config, {"a": "2"}))
+        self.assertNotEqual(original_hash, get_stack_input_hash(
+            self.create_stack_config({"a": "2", "b": "|file|user-data.txt"})))
+
+        self.write_file("user-data.txt", "echo 2")
+        file_changed_hash = get_stack_input_hash(stack_config)
+        self.assertNotEqual(original_hash, file_changed_hash)
+
+        self.write_file("template.json", '{"Resources": {"Topic": {"Type": "AWS::SNS::Topic"}}}')
+        self.assertNotEqual(file_changed_hash, get_stack_input_hash(stack_config))
+
+    def test_get_stack_input_hash_changes_with_nested_artifacts_and_included_files(self):
+        os.makedirs(os.path.join(self.directory, "nested", "code"))
+        self.write_file("template.json", json.dumps({"Resources": {
+            "Child": {"Type": "AWS::CloudFormation::Stack", "Properties": {"TemplateURL": "nested/child.json"}},
+            "Api": {"Type": "AWS::Serverless::Api", "Properties": {"DefinitionBody": {"Fn::Transform": {
+                "Name": "AWS::Include", "Parameters": {"Location": "api.yml"}}}}}}}))
+        self.write_file(os.path.join("nested", "child.json"), json.dumps({"Resources": {
+            "Function": {"Type": "AWS::Serverless::Function", "Properties": {"CodeUri": "code"}}}}))
+        self.write_file(os.path.join("nested", "code", "a.py"), "print(1)")
+        self.write_file("api.yml", "swagger: '2.0'")
+        stack_config = StackConfig({"template-url": "template.json", "package-bucket": "bucket"},
+                                   working_dir=self.directory)
+        original_hash = get_stack_input_hash(stack_config)
+
+        self.write_file(os.path.join("nested", "code", "a.py"), "print(2)")
+        artifact_changed_hash = get_stack_input_hash(stack_config)
+        self.assertNotEqual(original_hash, artifact_changed_hash)
+
+        self.write_file("api.yml", "swagger: '2.0'\ninfo: {}")
+        self.assertNotEqual(artifact_changed_hash, get_stack_input_hash(stack_config))
+
+    def test_record_persists_hashes_per_target(self):
+        state_file = os.path.join(self.directory, "state.json")
+
+        SyncState(state_file).record("eu-west-1", "app", "hash")
+
+        state = SyncState(state_file)
+        self.assertEqual("hash", state.get_input_hash("eu-west-1", "app"))
+        self.assertIsNone(state.get_input_hash("us-east-1", "app"))
+        self.assertEqual(["state.json"], os.listdir(self.directory))
+
+    def test_state_of_unknown_version_is_ignored(self):
+        state_file = os.path.join(self.directory, "state.json")
+        with open(state_file, "w") as f:
+            json.dump({"version": 0, "targets": {"eu-west-1": {"app": "hash"}}}, f)
+
+        self.assertIsNone(SyncState(state_file).get_input_hash("eu-west-1", "app"))
@@ -0,0 +1,258 @@
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+try:
+    from unittest2 import TestCase
+    from mock import patch, Mock
+except ImportError:
+    from unittest import TestCase
+    from mock import patch, Mock
+
+from cfn_sphere.exceptions import TemplateErrorException
+from cfn_sphere.template import CloudFormationTemplate
+from cfn_sphere.template.sam_packager import CloudFormationSamPackager, ARTIFACT_REGISTRY, ArtifactRegistry, \
+    get_file_md5, get_artifact_md5
+
+
+class CloudFormationSamPackagerTests(TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.working_dir, "src"))
+        with open(os.path.join(self.working_dir, "src", "index.py"), "w") as f:
+            f.write("def handler(event, context): pass")
+        with open(os.path.join(self.working_dir, "api.yml"), "w") as f:
+            f.write("swagger: '2.0'")
+        ARTIFACT_REGISTRY.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+        ARTIFACT_REGISTRY.clear()
+
+    @staticmethod
+    def create_template(resources):
+        return CloudFormationTemplate({"Resources": resources}, "template.yml")
+
+    def test_package_returns_template_unchanged_without_package_bucket(self):
+        template = self.create_template({"Function": {"Type": "AWS::Serverless::Function"}})
+
+        result = CloudFormationSamPackager.package("template.yml", self.working_dir, template, "eu-west-1", None)
+
+        self.assertIs(template, result)
+
+    def test_package_raises_exception_for_s3_templates(self):
+        template = self.create_template({})
+
+        with self.assertRaises(Exception):
+            CloudFormationSamPackager.package("s3://bucket/template.yml", self.working_dir, template, "eu-west-1",
+                                              "bucket")
+
+    @patch("cfn_sphere.template.sam_packager.S3")
+    def test_package_replaces_code_uri_with_s3_url(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = False
+        template = self.create_template({"Function": {"Type": "AWS::Serverless::Function",
+                                                      "Properties": {"CodeUri": "src"}}})
+
+        result = CloudFormationSamPackager.package("template.yml", self.working_dir, template, "eu-west-1",
+                                                   "bucket")
+
+        code_uri = result.resources["Function"]["Properties"]["CodeUri"]
+        self.assertTrue(code_uri.startswith("s3://bucket/"))
+        s3_mock.return_value.upload_file.assert_called_once()
+        self.assertEqual("src", template.resources["Function"]["Properties"]["CodeUri"])
+
+    @patch("cfn_sphere.template.sam_packager.S3")
+    def test_package_replaces_lambda_code_with_bucket_and_key_dict(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = False
+        template = self.create_template({"Function": {"Type": "AWS::Lambda::Function",
+                                                      "Properties": {"Code": "src/index.py"}}})
+
+        result = CloudFormationSamPackager.package("template.yml", self.working_dir, template, "eu-west-1",
+                                                   "bucket")
+
+        code = result.resources["Function"]["Properties"]["Code"]
+        self.assertEqual("bucket", code["S3Bucket"])
+        self.assertEqual(s3_mock.return_value.upload_file.call_args[0][2], code["S3Key"])
+
+    @patch("cfn_sphere.template.sam_packager.S3")
+    def test_package_uploads_plain_files_without_zipping(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = False
+        template = self.create_template({"Api": {"Type": "AWS::Serverless::Api",
+                                                 "Properties": {"DefinitionUri": "api.yml"}}})
+
+        result = CloudFormationSamPackager.package("template.yml", self.working_dir, template, "eu-west-1",
+                                                   "bucket")
+
+        expected_key = get_file_md5(os.path.join(self.working_dir, "api.yml"))
+        self.assertEqual("s3://bucket/" + expected_key, result.resources["Api"]["Properties"]["DefinitionUri"])
+        s3_mock.return_value.upload_file.assert_called_once_with(os.path.join(self.working_dir, "api.yml"),
+                                                                 "bucket", expected_key)
+
+    @patch("cfn_sphere.template.sam_packager.S3")
+    def test_package_skips_upload_of_existing_artifacts(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = True
+        template = self.create_template({"Api": {"Type": "AWS::Serverless::Api",
+                                                 "Properties": {"DefinitionUri": "api.yml"}}})
+
+        CloudFormationSamPackager.package("template.yml", self.working_dir, template, "eu-west-1", "bucket")
+
+        s3_mock.return_value.upload_file.assert_not_called()
+
+    @patch("cfn_sphere.template.sam_packager.S3")
+    def test_package_ignores_s3_urls_and_inline_code(self, s3_mock):
+        template = self.create_template({
+            "Function": {"Type": "AWS::Serverless::Function", "Properties": {"CodeUri": "s3://other/code.zip"}},
+            "Lambda": {"Type": "AWS::Lambda::Function", "Properties": {"Code": {"ZipFile": "print(1)"}}},
+            "Api": {"Type": "AWS::Serverless::Api", "Properties": {}}
+        })
+
+        result = CloudFormationSamPackager.package("template.yml", self.working_dir, template, "eu-west-1",
+                                                   "bucket")
+
+        self.assertIs(template, result)
+        s3_mock.return_value.upload_file.assert_not_called()
+
+    @patch("cfn_sphere.template.sam_packager.S3")
+    def test_package_packages_nested_stacks_recursively(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = False
+        os.makedirs(os.path.join(self.working_dir, "nested", "src"))
+        with open(os.path.join(self.working_dir, "nested", "src", "index.py"), "w") as f:
+            f.write("def handler(event, context): pass")
+        with open(os.path.join(self.working_dir, "nested", "child.yml"), "w") as f:
+            f.write("Resources:\n  Function:\n    Type: AWS::Serverless::Function\n    Properties:\n"
+                    "      CodeUri: src\n")
+        template = self.create_template({"Child": {"Type": "AWS::CloudFormation::Stack",
+                                                   "Properties": {"TemplateURL": "nested/child.yml"}}})
+
+        result = CloudFormationSamPackager.package("template.yml", self.working_dir, template, "eu-west-1",
+                                                   "bucket")
+
+        bucket, key, body = s3_mock.return_value.put_object.call_args[0]
+        self.assertEqual("https://bucket.s3.eu-west-1.amazonaws.com/" + key,
+                         result.resources["Child"]["Properties"]["TemplateURL"])
+        self.assertIn('"CodeUri":"s3://bucket/', body)
+        s3_mock.return_value.upload_file.assert_called_once()
+
+    def test_package_raises_exception_for_self_nesting_templates(self):
+        with open(os.path.join(self.working_dir, "template.yml"), "w") as f:
+            f.write("Resources:\n  Self:\n    Type: AWS::CloudFormation::Stack\n    Properties:\n"
+                    "      TemplateURL: template.yml\n")
+        template = self.create_template({"Self": {"Type": "AWS::CloudFormation::Stack",
+                                                  "Properties": {"TemplateURL": "template.yml"}}})
+
+        with patch("cfn_sphere.template.sam_packager.S3"):
+            with self.assertRaisesRegex(TemplateErrorException, "nests itself"):
+                CloudFormationSamPackager.package("template.yml", self.working_dir, template, "eu-west-1",
+                                                  "bucket")
+
+    @patch("cfn_sphere.template.sam_packager.S3")
+    def test_package_replaces_include_transform_locations(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = False
+        template = self.create_template({"Api": {"Type": "AWS::Serverless::Api", "Properties": {
+            "DefinitionBody": {"Fn::Transform": {"Name": "AWS::Include", "Parameters": {"Location": "api.yml"}}}}}})
+
+        result = CloudFormationSamPackager.package("template.yml", self.working_dir, template, "eu-west-1",
+                                                   "bucket")
+
+        location = result.resources["Api"]["Properties"]["DefinitionBody"]["Fn::Transform"]["Parameters"]["Location"]
+        self.assertEqual("s3://bucket/" + s3_mock.return_value.upload_file.call_args[0][2], location)
+
+    def test_package_raises_exception_for_local_nested_templates_without_package_bucket(self):
+        template = self.create_template({"Child": {"Type": "AWS::Serverless::Application",
+                                                   "Properties": {"Location": "nested/child.yml"}}})
+
+        with self.assertRaisesRegex(TemplateErrorException, "package-bucket"):
+            CloudFormationSamPackager.package("template.yml", self.working_dir, template, "eu-west-1", None)
+
+    def test_package_accepts_remote_nested_templates_without_package_bucket(self):
+        template = self.create_template({
+            "Child": {"Type": "AWS::CloudFormation::Stack",
+                      "Properties": {"TemplateURL": "https://bucket.s3.amazonaws.com/child.yml"}},
+            "App": {"Type": "AWS::Serverless::Application",
+                    "Properties": {"Location": {"ApplicationId": "arn", "SemanticVersion": "1.0.0"}}}})
+
+        result = CloudFormationSamPackager.package("template.yml", self.working_dir, template, "eu-west-1", None)
+
+        self.assertIs(template, result)
+
+    def test_find_local_artifacts_raises_exception_for_missing_path(self):
+        resources = {"Function": {"Type": "AWS::Serverless::Function", "Properties": {"CodeUri": "missing"}}}
+
+        with self.assertRaises(TemplateErrorException):
+            CloudFormationSamPackager.find_local_artifacts(resources, self.working_dir)
+
+    def test_find_local_artifacts_uses_template_dir_for_missing_code_uri(self):
+        resources = {"Function": {"Type": "AWS::Serverless::Function"}}
+
+        artifacts = CloudFormationSamPackager.find_local_artifacts(resources, self.working_dir)
+
+        self.assertEqual([self.working_dir], [artifact.local_path for artifact in artifacts])
+
+    def test_zip_artifact_zips_directory_with_relative_paths(self):
+        zip_file = os.path.join(self.working_dir, "artifact.zip")
+
+        CloudFormationSamPackager.zip_artifact(os.path.join(self.working_dir, "src"), zip_file)
+
+        with zipfile.ZipFile(zip_file) as zf:
+            self.assertEqual(["index.py"], zf.namelist())
+
+    def test_zip_artifact_creates_identical_zips_for_identical_contents(self):
+        source_dir = os.path.join(self.working_dir, "src")
+        first_zip = os.path.join(self.working_dir, "first.zip")
+        second_zip = os.path.join(self.working_dir, "second.zip")
+
+        CloudFormationSamPackager.zip_artifact(source_dir, first_zip)
+        later = time.time() + 3600
+        os.utime(os.path.join(source_dir, "index.py"), (later, later))
+        CloudFormationSamPackager.zip_artifact(source_dir, second_zip)
+
+        self.assertEqual(get_file_md5(first_zip), get_file_md5(second_zip))
+
+    def test_get_artifact_md5_is_equal_for_directories_with_equal_contents(self):
+        copied_dir = os.path.join(self.working_dir, "copy")
+        shutil.copytree(os.path.join(self.working_dir, "src"), copied_dir)
+
+        self.assertEqual(get_artifact_md5(os.path.join(self.working_dir, "src"), True),
+                         get_artifact_md5(copied_dir, True))
+
+    def test_get_artifact_md5_differs_for_zipped_and_plain_file(self):
+        file_path = os.path.join(self.working_dir, "api.yml")
+
+        self.assertNotEqual(get_artifact_md5(file_path, True), get_artifact_md5(file_path, False))
+
+    @patch("cfn_sphere.template.sam_packager.S3")
+    def test_package_uploads_shared_artifacts_once_per_run(self, s3_mock):
+        s3_mock.return_value.object_exists.return_value = False
+        resources = {"Function": {"Type": "AWS::Serverless::Function", "Properties": {"CodeUri": "src"}},
+                     "OtherFunction": {"Type": "AWS::Serverless::Function", "Properties": {"CodeUri": "src"}}}
+
+        first = CloudFormationSamPackager.package("template.yml", self.working_dir, self.create_template(resources),
+                                                  "eu-west-1", "bucket")
+        second = CloudFormationSamPackager.package("template.yml", self.working_dir, self.create_template(resources),
+                                                   "eu-west-1", "bucket")
+
+        s3_mock.return_value.upload_file.assert_called_once()
+        s3_mock.return_value.object_exists.assert_called_once()
+        self.assertEqual(first.resources["Function"]["Properties"]["CodeUri"],
+                         second.resources["OtherFunction"]["Properties"]["CodeUri"])
+
+
+class ArtifactRegistryTests(TestCase):
+    def test_get_key_name_calls_upload_function_once(self):
+        registry = ArtifactRegistry()
+        upload_function = Mock(return_value="key")
+
+        self.assertEqual("key", registry.get_key_name("bucket", "hash", upload_function))
+        self.assertEqual("key", registry.get_key_name("bucket", "hash", upload_function))
+        upload_function.assert_called_once_with()
+
+    def test_get_key_name_retries_failed_uploads(self):
+        registry = ArtifactRegistry()
+        upload_function = Mock(side_effect=[Exception("failed"), "key"])
+
+        with self.assertRaises(Exception):
+            registry.get_key_name("bucket", "hash", upload_function)
+
+        self.assertEqual("key", registry.get_key_name("bucket", "hash", upload_function))
@@ -27,3 +27,18 @@ class TemplateHandlerTests(TestCase):
         get_git_repository_remote_url_mock.assert_called_once_with("my-working-directory")
         template_transformer_mock.transform_template.assert_called_once_with(template,
                                                                              "Config repo url: my-repository-url")
+
+    @patch("cfn_sphere.template.template_handler.FileLoader")
+    @patch("cfn_sphere.template.template_handler.CloudFormationTemplateTransformer")
+    @patch("cfn_sphere.template.template_handler.get_git_repository_remote_url")
+    def test_get_template_uses_given_additional_stack_description(self, get_git_repository_remote_url_mock,
+                                                                  template_transformer_mock, file_loader_mock):
+        template = CloudFormationTemplate({}, "my-template")
+        file_loader_mock.get_cloudformation_template.return_value = template
+
+        TemplateHandler.get_template("my-template-url", "my-working-directory", "eu-west-1", None,
+                                     "Config repo url: my-repository-url")
+
+        get_git_repository_remote_url_mock.assert_not_called()
+        template_transformer_mock.transform_template.assert_called_once_with(template,
+                                                                             "Config repo url: my-repository-url")
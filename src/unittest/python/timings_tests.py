@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    from unittest2 import TestCase
+    from mock import Mock
+except ImportError:
+    from unittest import TestCase
+    from mock import Mock
+
+from cfn_sphere.timings import Timings
+
+
+class TimingsTests(TestCase):
+    def test_span_records_duration(self):
+        timings = Timings()
+
+        with timings.span("load", "template-load") as span:
+            pass
+
+        self.assertIsNotNone(span.duration)
+        self.assertEqual([span], timings.spans)
+
+    def test_nested_spans_are_children_and_inherit_the_stack(self):
+        timings = Timings()
+
+        with timings.span("stack1", "stack", stack="stack1") as parent:
+            with timings.span("template.yml", "template-load") as child:
+                pass
+
+        self.assertEqual([child], parent.children)
+        self.assertEqual("stack1", child.stack)
+        self.assertEqual([parent], timings.spans)
+
+    def test_span_records_errors(self):
+        timings = Timings()
+
+        with self.assertRaises(ValueError):
+            with timings.span("load", "template-load"):
+                raise ValueError()
+
+        self.assertEqual("ValueError", timings.spans[0].error)
+        self.assertIsNone(timings.get_current_span())
+
+    def test_timed_decorator_creates_span_per_call(self):
+        timings = Timings()
+
+        @timings.timed("transform", "my-transform")
+        def transform(value):
+            return value
+
+        self.assertEqual(1, transform(1))
+        self.assertEqual(2, transform(2))
+        self.assertEqual(2, timings.get_category_totals()["transform"]["count"])
+
+    def test_bind_keeps_parent_span_in_other_threads(self):
+        timings = Timings()
+
+        def work():
+            with timings.span("template.yml", "template-load"):
+                pass
+
+        with timings.span("stack1", "stack", stack="stack1") as parent:
+            thread = threading.Thread(target=timings.bind(work))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(1, len(parent.children))
+        self.assertEqual("stack1", parent.children[0].stack)
+
+    def test_get_stack_totals_sums_categories_per_stack(self):
+        timings = Timings()
+
+        with timings.span("stack1", "stack", stack="stack1"):
+            with timings.span("p1", "parameter ssm"):
+                pass
+            with timings.span("p2", "parameter ssm"):
+                pass
+        with timings.span("stack2", "stack", stack="stack2"):
+            pass
+
+        totals = timings.get_stack_totals()
+
+        self.assertEqual(["stack1", "stack2"], sorted(totals))
+        self.assertEqual(["parameter ssm", "stack"], sorted(totals["stack1"]))
+
+    def test_get_summary_table_lists_categories_and_stacks(self):
+        timings = Timings()
+
+        with timings.span("stack1", "stack", stack="stack1"):
+            pass
+
+        table = timings.get_summary_table()
+
+        self.assertIn("stack1", table)
+        self.assertIn("Phase", table)
+
+    def test_api_calls_are_timed_as_children_of_the_current_span(self):
+        timings = Timings()
+        model = Mock()
+        model.name = "DescribeStacks"
+        model.service_model.service_name = "cloudformation"
+        context = {}
+
+        with timings.span("stack1", "stack", stack="stack1") as parent:
+            timings._before_call(model=model, context=context)
+            timings._after_call(context=context, exception=None)
+
+        self.assertEqual("cloudformation.DescribeStacks", parent.children[0].name)
+        self.assertEqual("aws", parent.children[0].category)
+        self.assertIsNotNone(parent.children[0].duration)
+
+    def test_write_json(self):
+        timings = Timings()
+        directory = tempfile.mkdtemp()
+        file_path = os.path.join(directory, "timings.json")
+
+        try:
+            with timings.span("stack1", "stack", stack="stack1"):
+                pass
+            timings.write_json(file_path)
+
+            with open(file_path) as f:
+                result = json.load(f)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual("stack1", result["spans"][0]["name"])
+        self.assertIn("stack1", result["stacks"])
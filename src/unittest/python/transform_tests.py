@@ -1,7 +1,7 @@
 import unittest
 
 from copy import deepcopy
-from cfn_sphere.transform import TransformDict
+from cfn_sphere.transform import TransformDict, transform_dict
 
 
 class TestTransform(unittest.TestCase):
@@ -50,6 +50,13 @@ class TestTransform(unittest.TestCase):
         with self.assertRaises(ValueError):
             TransformDict(data=data, context=context)
 
+    def test_transform_dict_function_marks_the_context_transform_once_per_config(self):
+        result = transform_dict({'stacks': {'app': {'name': '[ABC]'}}}, {'ABC': 'XXX'})
+
+        self.assertEqual({'stacks': {'app': {'name': 'XXX'}}}, result)
+        self.assertEqual("[context-transform]", transform_dict.__code__.co_name)
+        self.assertEqual("__init__", TransformDict.__init__.__code__.co_name)
+
 
 if __name__ == '__main__':
     unittest.main(buffer=False)
@@ -1,4 +1,6 @@
+import os
 import tempfile
+import time
 
 from git import InvalidGitRepositoryError
 
@@ -14,11 +16,10 @@ except ImportError:
 import textwrap
 from datetime import datetime
 
-from botocore.exceptions import ClientError
 from dateutil.tz import tzutc
 
 from cfn_sphere import util, CloudFormationStack
-from cfn_sphere.exceptions import CfnSphereException, CfnSphereBotoError
+from cfn_sphere.exceptions import CfnSphereException
 from cfn_sphere.template import CloudFormationTemplate
 
 
@@ -62,60 +63,47 @@ class StackConfigTests(TestCase):
         with self.assertRaises(CfnSphereException):
             util.get_cfn_api_server_time()
 
-    def test_with_boto_retry_retries_method_call_for_throttling_exception(self):
-        count_func = Mock()
+    @patch("cfn_sphere.util.refresh_latest_version_cache_in_background")
+    @patch("cfn_sphere.util.read_latest_version_cache")
+    def test_get_latest_version_returns_cached_version_without_refresh(self, read_cache_mock, refresh_mock):
+        read_cache_mock.return_value = {"version": "1.2.3", "timestamp": time.time()}
 
-        @util.with_boto_retry(max_retries=1, pause_time_multiplier=1)
-        def my_retried_method(count_func):
-            count_func()
-            exception = CfnSphereBotoError(
-                ClientError(error_response={"Error": {"Code": "Throttling", "Message": "Rate exceeded"}},
-                            operation_name="DescribeStacks"))
-            raise exception
+        self.assertEqual("1.2.3", util.get_latest_version())
+        refresh_mock.assert_not_called()
 
-        with self.assertRaises(CfnSphereBotoError):
-            my_retried_method(count_func)
+    @patch("cfn_sphere.util.refresh_latest_version_cache_in_background")
+    @patch("cfn_sphere.util.read_latest_version_cache")
+    def test_get_latest_version_refreshes_outdated_cache_in_background(self, read_cache_mock, refresh_mock):
+        read_cache_mock.return_value = {"version": "1.2.3", "timestamp": time.time() - 2 * util.LATEST_VERSION_CACHE_TTL}
 
-        self.assertEqual(2, count_func.call_count)
+        self.assertEqual("1.2.3", util.get_latest_version())
+        refresh_mock.assert_called_once_with()
 
-    def test_with_boto_retry_does_not_retry_for_simple_exception(self):
-        count_func = Mock()
+    @patch("cfn_sphere.util.refresh_latest_version_cache_in_background")
+    @patch("cfn_sphere.util.read_latest_version_cache")
+    def test_get_latest_version_returns_none_without_cache(self, read_cache_mock, refresh_mock):
+        read_cache_mock.return_value = None
 
-        @util.with_boto_retry(max_retries=1, pause_time_multiplier=1)
-        def my_retried_method(count_func):
-            count_func()
-            raise Exception
+        self.assertIsNone(util.get_latest_version())
+        refresh_mock.assert_called_once_with()
 
-        with self.assertRaises(Exception):
-            my_retried_method(count_func)
+    @patch("cfn_sphere.util.get_pypi_package_description")
+    def test_refresh_latest_version_cache_writes_cache_file(self, get_pypi_package_description_mock):
+        get_pypi_package_description_mock.return_value = {"info": {"version": "1.2.3"}}
+        cache_file = os.path.join(tempfile.mkdtemp(), "cache", "latest-version.json")
 
-        self.assertEqual(1, count_func.call_count)
+        util.refresh_latest_version_cache(cache_file)
 
-    def test_with_boto_retry_does_not_retry_for_another_boto_client_error(self):
-        count_func = Mock()
+        self.assertEqual("1.2.3", util.read_latest_version_cache(cache_file)["version"])
 
-        @util.with_boto_retry(max_retries=1, pause_time_multiplier=1)
-        def my_retried_method(count_func):
-            count_func()
-            exception = ClientError(error_response={"Error": {"Code": "Another Error", "Message": "Foo"}},
-                                    operation_name="DescribeStacks")
-            raise exception
+    @patch("cfn_sphere.util.get_pypi_package_description")
+    def test_refresh_latest_version_cache_ignores_network_errors(self, get_pypi_package_description_mock):
+        get_pypi_package_description_mock.side_effect = IOError
+        cache_file = os.path.join(tempfile.mkdtemp(), "latest-version.json")
 
-        with self.assertRaises(ClientError):
-            my_retried_method(count_func)
+        util.refresh_latest_version_cache(cache_file)
 
-        self.assertEqual(1, count_func.call_count)
-
-    def test_with_boto_retry_does_not_retry_without_exception(self):
-        count_func = Mock()
-
-        @util.with_boto_retry(max_retries=1, pause_time_multiplier=1)
-        def my_retried_method(count_func):
-            count_func()
-            return "foo"
-
-        self.assertEqual("foo", my_retried_method(count_func))
-        self.assertEqual(1, count_func.call_count)
+        self.assertIsNone(util.read_latest_version_cache(cache_file))
 
     def test_get_pretty_parameters_string(self):
         template_body = {
@@ -205,25 +193,82 @@ class StackConfigTests(TestCase):
         result = util.strip_string(s)
         self.assertEqual("my-short-string...", result)
 
-    @patch("cfn_sphere.util.Repo")
+    @staticmethod
+    def create_git_dir(parent_dir, config=None):
+        """
+        Create a .git directory with the given config or, without config, a .git file like worktrees have
+        """
+        git_path = os.path.join(parent_dir, ".git")
+        if not os.path.isdir(parent_dir):
+            os.makedirs(parent_dir)
+
+        if config is None:
+            with open(git_path, "w") as f:
+                f.write("gitdir: /somewhere/else")
+        else:
+            os.makedirs(git_path)
+            with open(os.path.join(git_path, "config"), "w") as f:
+                f.write(textwrap.dedent(config))
+        return parent_dir
+
+    @patch("git.Repo")
     def test_get_git_repository_remote_url_returns_none_if_no_repository_present(self, repo_mock):
         repo_mock.side_effect = InvalidGitRepositoryError
         self.assertEqual(None, get_git_repository_remote_url(tempfile.mkdtemp()))
 
-    @patch("cfn_sphere.util.Repo")
+    @patch("git.Repo")
     def test_get_git_repository_remote_url_returns_repo_url(self, repo_mock):
         url = "http://config.repo.git"
         repo_mock.return_value.remotes.origin.url = url
-        self.assertEqual(url, get_git_repository_remote_url(tempfile.mkdtemp()))
+        self.assertEqual(url, get_git_repository_remote_url(self.create_git_dir(tempfile.mkdtemp())))
 
-    @patch("cfn_sphere.util.Repo")
+    @patch("git.Repo")
     def test_get_git_repository_remote_url_returns_repo_url_from_parent_dir(self, repo_mock):
         url = "http://config.repo.git"
         repo_object_mock = Mock()
         repo_object_mock.remotes.origin.url = url
         repo_mock.side_effect = [InvalidGitRepositoryError, repo_object_mock]
-
-        self.assertEqual(url, get_git_repository_remote_url(tempfile.mkdtemp()))
+        parent_dir = self.create_git_dir(tempfile.mkdtemp())
+        working_dir = self.create_git_dir(os.path.join(parent_dir, "configs"))
+
+        self.assertEqual(url, get_git_repository_remote_url(working_dir))
+
+    @patch("git.Repo")
+    def test_get_git_repository_remote_url_reads_git_config_without_gitpython(self, repo_mock):
+        working_dir = self.create_git_dir(tempfile.mkdtemp(), """
+            [core]
+            \tbare = false
+            [remote "upstream"]
+            \turl = http://upstream.repo.git
+            [remote "origin"]
+            \turl = http://config.repo.git
+            \tfetch = +refs/heads/*:refs/remotes/origin/*
+            """)
+        os.makedirs(os.path.join(working_dir, "configs"))
+
+        self.assertEqual("http://config.repo.git",
+                         get_git_repository_remote_url(os.path.join(working_dir, "configs")))
+        repo_mock.assert_not_called()
+
+    @patch("git.Repo")
+    def test_get_git_repository_remote_url_uses_gitpython_for_configs_with_includes(self, repo_mock):
+        repo_mock.return_value.remotes.origin.url = "http://config.repo.git"
+        working_dir = self.create_git_dir(tempfile.mkdtemp(), """
+            [include]
+            \tpath = other.config
+            """)
+
+        self.assertEqual("http://config.repo.git", get_git_repository_remote_url(working_dir))
+
+    @patch("cfn_sphere.util.read_git_config_remote_url")
+    def test_get_git_repository_remote_url_is_memoized_per_directory(self, read_git_config_mock):
+        read_git_config_mock.return_value = "http://config.repo.git"
+        working_dir = self.create_git_dir(tempfile.mkdtemp(), "")
+
+        get_git_repository_remote_url(working_dir)
+        get_git_repository_remote_url(working_dir + "/.")
+
+        read_git_config_mock.assert_called_once_with(os.path.join(os.path.realpath(working_dir), ".git", "config"))
 
     def test_get_git_repository_remote_url_returns_none_for_none_working_dir(self):
         self.assertEqual(None, get_git_repository_remote_url(None))